@@ -0,0 +1,300 @@
+"""
+Cached ERC20 allowances for the NFT Position Manager (and the SwapRouter), and the approvals or permits that top them up.
+
+Every mint/increase used to read both allowances and approve exactly the amount it needed, so nearly
+every rebalance paid for (and waited on) two approval transactions. `AllowanceManager` instead:
+- keeps the allowances in memory and in ALLOWANCE_CACHE_FILE, reading a token's allowance from the
+  chain only the first time it is used (and again after a transaction spending it failed),
+- catches up with approvals made outside the bot (e.g. a revoke from a wallet UI) from the `Approval`
+  logs emitted since the cache was saved, once at start (fetched in chunks, and only for a recent cache),
+- updates the cache from its own approval receipts and from the amounts each mint actually spent,
+- reserves allowance for transactions in flight, so concurrent spends (portfolio workers) don't
+  count the same allowance twice.
+
+How a missing allowance is provided depends on APPROVAL_MODE:
+- "exact": an approval for what the in-flight transactions need (one approval per spend). Tokens that refuse
+  to change one non-zero allowance to another (USDT) get an approval of 0 first.
+- "max": a single approval of the uint256 maximum; later spends need no approval at all.
+- "permit": an EIP-2612 permit signed off-chain and redeemed by the NFT Position Manager's
+  `selfPermit` inside the same multicall as the mint, so no approval transaction is sent either.
+  The V3 NonfungiblePositionManager pulls tokens with a plain transferFrom and can't use Permit2,
+  so this is the signature flow it does support. Permits expire after PERMIT_DEADLINE_SECONDS. Tokens without
+  EIP-2612 fall back to "max".
+The SwapRouter's allowances (for the swap of a rebalance) are kept by a second manager in the same cache file,
+which approves in "exact" or "max" mode: its swaps are not multicalls that could redeem a permit.
+"""
+import json
+import os
+import threading
+import time
+
+from eth_keys import keys
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3 import Web3
+
+import log_ingester
+
+MAX_UINT256 = 2**256 - 1
+APPROVAL_MODES = ("exact", "max", "permit")
+# keccak256("Permit(address owner,address spender,uint256 value,uint256 nonce,uint256 deadline)")
+PERMIT_TYPEHASH = keccak(text="Permit(address owner,address spender,uint256 value,uint256 nonce,uint256 deadline)")
+# keccak256("Approval(address,address,uint256)")
+APPROVAL_TOPIC = Web3.to_hex(keccak(text="Approval(address,address,uint256)"))
+# EIP-2612 functions, which the generic ERC20 ABI doesn't have
+PERMIT_ABI = [
+    {"inputs": [], "name": "DOMAIN_SEPARATOR", "outputs": [{"type": "bytes32"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"name": "owner", "type": "address"}], "name": "nonces", "outputs": [{"type": "uint256"}], "stateMutability": "view", "type": "function"},
+]
+# The managers of several spenders share a cache file, and each rewrites it whole
+_cache_file_lock = threading.Lock()
+
+
+class AllowanceReservation:
+    """What one spending transaction needs: reserved amounts, approvals in flight and selfPermit calls."""
+    def __init__(self):
+        self.amounts = {} # token address -> amount reserved
+        self.approvals = [] # (token address, PendingTransaction) of each approval sent for this spend
+        self.permit_calls = [] # Encoded selfPermit calls, to prepend to the NFT Position Manager multicall
+        self.permit_tokens = []
+
+    def wait_for_approvals(self):
+        """Blocks until every approval sent for this spend is mined. Raises if one failed."""
+        return [pending_approval.result() for _, pending_approval in self.approvals]
+
+
+class AllowanceManager:
+    def __init__(self, client, spender: str, mode: str = "max", cache_file: str = "allowances.json",
+                 spender_name: str = "the NFT Position Manager"):
+        if mode not in APPROVAL_MODES:
+            raise Exception(f"Unknown approval mode {mode}. Use one of {', '.join(APPROVAL_MODES)}.")
+        self.client = client
+        self.owner = Web3.to_checksum_address(client.config.WALLET_ADDRESS)
+        self.spender = Web3.to_checksum_address(spender)
+        self.spender_name = spender_name
+        self.mode = mode
+        self.cache_file = cache_file
+        # One cache file can hold several wallets, spenders and chains
+        self._cache_key = f"{client.tx_pipeline.chain_id}:{self.owner}:{self.spender}"
+        self._allowances = {} # token address -> allowance on-chain once the transactions in flight are mined
+        self._reserved = {} # token address -> amount reserved by spends in flight
+        self._synced_block = 0 # Last block the cached allowances are known to be up to date with
+        self._domain_separators = {} # token address -> EIP-712 domain separator, or None without EIP-2612
+        self._permit_nonces = {} # token address -> next EIP-2612 nonce of the owner
+        self._zero_reset_tokens = {Web3.to_checksum_address(token) for token in client.config.APPROVAL_ZERO_RESET_TOKENS}
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    # --- Cache ---
+
+    def load(self):
+        """Loads the saved allowances and applies the Approval logs emitted since they were saved."""
+        with self._lock:
+            self._loaded = True
+            if not os.path.exists(self.cache_file):
+                return
+            try:
+                with _cache_file_lock, open(self.cache_file, "r") as f:
+                    cached = json.load(f).get(self._cache_key, {})
+            except Exception as e:
+                print(f"Error loading allowance cache, allowances will be read from the chain: {e}")
+                return
+            self._allowances = {token: int(allowance) for token, allowance in cached.get("allowances", {}).items()}
+            self._synced_block = cached.get("block", 0)
+            if self._allowances:
+                self.sync_approval_logs()
+
+    def save(self):
+        """Writes the allowances to the cache file, keeping the entries of other wallets/spenders/chains."""
+        with self._lock, _cache_file_lock:
+            try:
+                cache = {}
+                if os.path.exists(self.cache_file):
+                    with open(self.cache_file, "r") as f:
+                        cache = json.load(f)
+                cache[self._cache_key] = {
+                    "block": self._synced_block,
+                    # Stored as strings: JSON readers elsewhere may not handle uint256 integers
+                    "allowances": {token: str(allowance) for token, allowance in self._allowances.items()},
+                }
+                with open(self.cache_file, "w") as f:
+                    json.dump(cache, f, indent=2)
+            except Exception as e:
+                print(f"Error saving allowance cache: {e}")
+
+    def sync_approval_logs(self):
+        """
+        Applies the Approval(owner, spender) logs of the cached tokens emitted after the cache was last
+        up to date, e.g. an approval changed from a wallet UI while the bot was stopped. A cache older than
+        ALLOWANCE_SYNC_MAX_BLOCKS is dropped instead: reading the allowances again is cheaper than its logs.
+        """
+        config = self.client.config
+        latest_block = self.client.w3.eth.block_number
+        if self._synced_block >= latest_block:
+            return
+        if latest_block - self._synced_block > config.ALLOWANCE_SYNC_MAX_BLOCKS:
+            print(f"Allowance cache is {latest_block - self._synced_block} blocks old. Allowances will be read from the chain.")
+            self._allowances = {}
+            self._synced_block = 0
+            return
+        logs = log_ingester.fetch_logs(self.client.w3, {
+            'address': list(self._allowances),
+            'topics': [APPROVAL_TOPIC, self._address_topic(self.owner), self._address_topic(self.spender)],
+        }, self._synced_block + 1, latest_block, config.INGEST_CHUNK_BLOCKS)
+        for log in logs:
+            token = Web3.to_checksum_address(log['address'])
+            self._allowances[token] = int.from_bytes(HexBytes(log['data']), "big")
+            print(f"Allowance of {token} changed outside the bot to {self._allowances[token]}.")
+        self._synced_block = latest_block
+        self.save()
+
+    @staticmethod
+    def _address_topic(address: str) -> str:
+        return "0x" + "0" * 24 + address[2:].lower()
+
+    def _read_missing(self, tokens: list[str]):
+        """Reads, in one batched call, the allowances (and permit data) of tokens that aren't cached yet."""
+        missing = [token for token in tokens if token not in self._allowances]
+        if self.mode == "permit":
+            missing_permits = [token for token in tokens if token not in self._permit_nonces]
+        else:
+            missing_permits = []
+        if not missing and not missing_permits:
+            return
+        calls = []
+        for token in missing:
+            token_contract = self.client.get_contract(token, self.client.config.ERC20_ABI)
+            calls.append(token_contract.functions.allowance(self.owner, self.spender))
+        for token in missing_permits:
+            permit_contract = self.client.get_contract(token, PERMIT_ABI)
+            # Tokens without EIP-2612 revert (or return nothing), which the batch reports as None
+            calls.append((permit_contract.functions.DOMAIN_SEPARATOR(), True))
+            calls.append((permit_contract.functions.nonces(self.owner), True))
+        block_number, results = self.client.batch_call(calls)
+        for token, allowance in zip(missing, results):
+            self._allowances[token] = allowance
+        permit_results = results[len(missing):]
+        for index, token in enumerate(missing_permits):
+            domain_separator, nonce = permit_results[2 * index], permit_results[2 * index + 1]
+            self._domain_separators[token] = domain_separator if domain_separator is not None and nonce is not None else None
+            self._permit_nonces[token] = nonce
+        if not self._synced_block:
+            self._synced_block = block_number
+        self.save()
+
+    def get_allowance(self, token_address: str) -> int:
+        """Allowance of the spender for a token, from the cache (read from the chain the first time)."""
+        token = Web3.to_checksum_address(token_address)
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            self._read_missing([token])
+            return self._allowances[token]
+
+    # --- Spending ---
+
+    def reserve(self, amounts: dict[str, int], symbols: dict[str, str] | None = None) -> AllowanceReservation:
+        """
+        Reserves allowance for a transaction that will spend `amounts` (token address -> raw amount).
+        Tokens whose available allowance is too low get an approval submitted (not awaited) or, in
+        permit mode, a selfPermit call in the returned reservation. After the spend, call `settle`
+        (or `release` if it failed).
+        """
+        symbols = symbols or {}
+        reservation = AllowanceReservation()
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            tokens = [Web3.to_checksum_address(token) for token in amounts]
+            self._read_missing(tokens)
+            for token_address, token in zip(amounts, tokens):
+                amount = amounts[token_address]
+                symbol = symbols.get(token_address, token)
+                reserved = self._reserved.get(token, 0)
+                allowance = self._allowances[token]
+                reservation.amounts[token] = amount
+                self._reserved[token] = reserved + amount
+                if allowance == MAX_UINT256 or allowance - reserved >= amount:
+                    print(f"Allowance for {symbol} is sufficient.")
+                    continue
+                # Enough for this spend and every other spend in flight
+                value = reserved + amount if self.mode == "exact" else MAX_UINT256
+                if self.mode == "permit" and self._domain_separators.get(token) is not None:
+                    print(f"Signing a permit of {symbol} for {self.spender_name}...")
+                    reservation.permit_calls.append(self._sign_permit(token, value))
+                    reservation.permit_tokens.append(token)
+                else:
+                    if self.mode == "permit":
+                        print(f"{symbol} doesn't support EIP-2612 permits. Approving the maximum instead.")
+                    print(f"Approving {'the maximum' if value == MAX_UINT256 else value} {symbol} for {self.spender_name}...")
+                    token_contract = self.client.get_contract(token, self.client.config.ERC20_ABI)
+                    approve = token_contract.functions.approve(self.spender, value)
+                    gas_limit = None
+                    if token in self._zero_reset_tokens and allowance != 0:
+                        print(f"{symbol} only approves from a zero allowance. Resetting it to 0 first...")
+                        pending_reset = self.client.submit_transaction(token_contract.functions.approve(self.spender, 0))
+                        reservation.approvals.append((token, pending_reset))
+                        # Estimating the approval would revert until the reset is mined
+                        gas_limit = self.client.fee_engine.cached_gas_limit(approve, self.client.config.APPROVE_GAS_LIMIT)
+                    pending_approval = self.client.submit_transaction(approve, gas_limit)
+                    reservation.approvals.append((token, pending_approval))
+                # Approvals are submitted before the spend and permits execute inside it, so the spend sees this value
+                self._allowances[token] = value
+        return reservation
+
+    def _sign_permit(self, token: str, value: int) -> str:
+        """Signs an EIP-2612 permit and returns the NFT Position Manager `selfPermit` call redeeming it."""
+        nonce = self._permit_nonces[token]
+        self._permit_nonces[token] = nonce + 1
+        # Redeemable once (nonce), inside our own transaction; the deadline bounds how long a leaked signature stays valid
+        deadline = int(time.time()) + self.client.config.PERMIT_DEADLINE_SECONDS
+        struct_hash = keccak(self.client.w3.codec.encode(
+            ["bytes32", "address", "address", "uint256", "uint256", "uint256"],
+            [PERMIT_TYPEHASH, self.owner, self.spender, value, nonce, deadline]
+        ))
+        digest = keccak(b"\x19\x01" + self._domain_separators[token] + struct_hash)
+        signature = keys.PrivateKey(HexBytes(self.client.config.PRIVATE_KEY)).sign_msg_hash(digest)
+        nft_manager = self.client.get_contract(self.spender, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ABI)
+        return nft_manager.encodeABI(fn_name="selfPermit", args=[
+            token, value, deadline, signature.v + 27, signature.r.to_bytes(32, "big"), signature.s.to_bytes(32, "big")
+        ])
+
+    def _record_approval(self, token: str, receipt):
+        """Updates the cache from the Approval log of one of our mined approvals."""
+        token_contract = self.client.get_contract(token, self.client.config.ERC20_ABI)
+        for log in token_contract.events.Approval().process_receipt(receipt):
+            if log['args']['owner'] == self.owner and log['args']['spender'] == self.spender:
+                self._allowances[token] = log['args']['value']
+        self._synced_block = max(self._synced_block, receipt.blockNumber)
+
+    def settle(self, reservation: AllowanceReservation, spent: dict[str, int], block_number: int | None = None):
+        """
+        Releases a reservation after the spending transaction was mined: applies the Approval logs of the
+        approvals sent for it, then deducts what the transaction actually spent. A maximum allowance is
+        left as is (tokens don't decrease an infinite allowance).
+        """
+        with self._lock:
+            for token, pending_approval in reservation.approvals:
+                self._record_approval(token, pending_approval.result())
+            for token, amount in reservation.amounts.items():
+                self._reserved[token] = self._reserved.get(token, 0) - amount
+            for token_address, amount in spent.items():
+                token = Web3.to_checksum_address(token_address)
+                if token in self._allowances and self._allowances[token] != MAX_UINT256:
+                    self._allowances[token] = max(self._allowances[token] - amount, 0)
+            if block_number is not None:
+                self._synced_block = max(self._synced_block, block_number)
+            self.save()
+
+    def release(self, reservation: AllowanceReservation):
+        """
+        Releases a reservation whose spending transaction failed. Its tokens' allowances (and permit
+        nonces) are unknown now, so they are read from the chain again next time.
+        """
+        with self._lock:
+            for token, amount in reservation.amounts.items():
+                self._reserved[token] = self._reserved.get(token, 0) - amount
+                self._allowances.pop(token, None)
+            for token in reservation.permit_tokens:
+                self._permit_nonces.pop(token, None)
+            self.save()
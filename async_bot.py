@@ -0,0 +1,188 @@
+"""
+Asyncio execution path for the LP bot.
+
+The synchronous bot reads the chain and then asks the exchange for the hedge position, one request
+after the other. Here the chain reads go through AsyncWeb3, the exchange position (only read when the
+hedge executor's view is due for reconciliation) comes from a worker thread, and a cycle issues them
+together with `asyncio.gather`, so it takes as long as the slowest request instead of their sum.
+
+`AsyncLiquidityManagerBot` keeps the decision logic of `LiquidityManagerBot` and only swaps the I/O.
+Its synchronous methods (`read_cycle_state`, `run`) are a facade over an event loop running in a
+background thread, so existing callers, including the event-driven mode, keep working unchanged.
+
+Enable it with ASYNC_IO=true when running uniswap_lp_bot.py.
+"""
+import asyncio
+import threading
+import time
+from decimal import Decimal
+
+from web3 import AsyncHTTPProvider, AsyncWeb3, HTTPProvider
+from web3.middleware import async_geth_poa_middleware
+from web3.providers.async_base import AsyncBaseProvider
+
+import metrics
+import tracing
+from state_store import StateStore
+from uniswap_lp_bot import (
+    BlockchainClient,
+    Config,
+    CycleSnapshot,
+    DerivativesManager,
+    LiquidityManagerBot,
+    configure_tracing,
+    decode_batch_results,
+    encode_batch_calls,
+    is_poa_network,
+)
+
+
+class EventLoopThread:
+    """An asyncio event loop running forever in a daemon thread, for calling coroutines from sync code."""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-io-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine):
+        """Runs a coroutine on the loop and blocks until it finishes, returning its result."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("EventLoopThread.run cannot be called from inside its own event loop.")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+class ThreadedProvider(AsyncBaseProvider):
+    """
+    Async provider over a synchronous one (e.g. rpc_pool.ProviderPool or mock_chain.MockProvider): each request
+    runs in a worker thread, so concurrent requests still overlap.
+    """
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+
+    async def make_request(self, method, params):
+        return await asyncio.to_thread(self.provider.make_request, method, params)
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        return await asyncio.to_thread(self.provider.is_connected, show_traceback)
+
+
+class AsyncBlockchainClient:
+    """
+    Async counterpart of `BlockchainClient`'s reads, built on AsyncWeb3. It sends no transactions: every write goes
+    through `BlockchainClient.tx_pipeline`, which owns the wallet's nonces and fees.
+    `provider` is an async web3 provider, or a synchronous one run in worker threads; without one, the client
+    reads from the first of NODE_URLS.
+    """
+    def __init__(self, config: Config, provider=None):
+        if provider is not None and not isinstance(provider, AsyncBaseProvider):
+            provider = ThreadedProvider(provider)
+        self.w3 = AsyncWeb3(provider or AsyncHTTPProvider(config.NODE_URLS[0]))
+        # Inject middleware for Proof-of-Authority (PoA) networks, as in BlockchainClient.
+        if is_poa_network(config.NODE_URLS[0]):
+            self.w3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+        self.w3.middleware_onion.add(metrics.async_rpc_middleware, "metrics")
+        # As in BlockchainClient: no chain ID request before every eth_call
+        self.w3.middleware_onion.remove("validation")
+        self.config = config
+        self._contracts = {} # (address, id(abi)) -> (abi, contract)
+        self.multicall = self.get_contract(config.MULTICALL3_ADDRESS, config.MULTICALL3_ABI)
+
+    def get_contract(self, address, abi):
+        """Returns an AsyncWeb3 contract instance for a given address and ABI, built once as in `BlockchainClient`."""
+        key = (address, id(abi))
+        cached = self._contracts.get(key)
+        if cached is None:
+            cached = self._contracts[key] = (abi, self.w3.eth.contract(address=AsyncWeb3.to_checksum_address(address), abi=abi))
+        return cached[1]
+
+    async def batch_call(self, calls, block_identifier="latest"):
+        """Async `BlockchainClient.batch_call`: many reads in one Multicall3 eth_call, pinned to one block."""
+        calls = [(self.multicall.functions.getBlockNumber(), False)] + [
+            call if isinstance(call, tuple) else (call, False) for call in calls
+        ]
+        metrics.BATCH_CALL_SIZE.observe(len(calls) - 1)
+        raw_results = await self.multicall.functions.aggregate3(encode_batch_calls(calls)).call(block_identifier=block_identifier)
+        results = decode_batch_results(self.w3.codec, calls, raw_results)
+        return results[0], results[1:]
+
+
+class AsyncLiquidityManagerBot(LiquidityManagerBot):
+    """
+    `LiquidityManagerBot` whose cycle reads (chain batch + derivatives position) run concurrently.
+    Transactions and orders still go through the synchronous clients, in worker threads.
+    The arguments are those of `LiquidityManagerBot`, plus the provider of the async reads (see `AsyncBlockchainClient`).
+    """
+    def __init__(self, blockchain_client: BlockchainClient | None = None, derivatives_manager: DerivativesManager | None = None,
+                 state_store: StateStore | None = None, async_provider=None):
+        super().__init__(blockchain_client, derivatives_manager, state_store)
+        self.io_loop = EventLoopThread()
+        if async_provider is None:
+            # A single node is read over async HTTP. Several NODE_URLS (an rpc_pool.ProviderPool) or an injected
+            # provider (e.g. mock_chain's) are shared with the synchronous client, so both read the same nodes.
+            provider = self.blockchain_client.w3.provider
+            async_provider = None if isinstance(provider, HTTPProvider) else provider
+        # The synchronous client already reached the node, so the async one isn't checked separately
+        self.async_client = AsyncBlockchainClient(self.config, async_provider)
+
+    async def read_cycle_state_async(self, token_id: int) -> CycleSnapshot:
+        """Reads the chain state batch and the exchange position at the same time."""
+        pool_address = self.lp_manager.get_pool_address(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+        pool_contract = self.async_client.get_contract(pool_address, self.config.UNISWAP_POOL_ABI)
+        nft_manager = self.async_client.get_contract(self.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, self.config.UNISWAP_NFT_POSITION_MANAGER_ABI)
+        feed_calls, feed_reads = self.cycle_feed_reads()
+        (block_number, results), hedge_position = await asyncio.gather(
+            self.async_client.batch_call(self.cycle_calls(token_id, pool_contract, nft_manager, feed_calls)),
+            # Served from the hedge executor's position view; only a due reconciliation reaches the exchange
+            asyncio.to_thread(self.derivatives_manager.get_short_size, self.config.SHORT_TOKEN_SYMBOL),
+        )
+        print(f"Read cycle state for position {token_id} at block {block_number}.")
+        return self.snapshot_from_batch(token_id, block_number, results, feed_reads, hedge_position)
+
+    def read_cycle_state(self, token_id: int) -> CycleSnapshot:
+        """Synchronous facade over `read_cycle_state_async`, used by the inherited sync code paths."""
+        return self.io_loop.run(self.read_cycle_state_async(token_id))
+
+    async def run_cycle_async(self) -> tuple[CycleSnapshot, Decimal | None]:
+        """Async `run_cycle`: concurrent reads, then the unchanged rebalance and hedge logic in worker threads."""
+        with tracing.cycle(), metrics.stage("cycle"):
+            with metrics.stage("read_cycle_state"):
+                snapshot = await self.read_cycle_state_async(self.position_token_id)
+            with metrics.stage("rebalance_lp"):
+                rebalanced = await asyncio.to_thread(self.rebalance_or_report, self.position_token_id, snapshot)
+            if rebalanced:
+                with metrics.stage("read_cycle_state"):
+                    snapshot = await self.read_cycle_state_async(self.position_token_id)
+            with metrics.stage("manage_delta_neutral"):
+                hedged_short = await asyncio.to_thread(self.manage_delta_neutral, self.position_token_id, snapshot)
+            await asyncio.to_thread(self.grow_observations, snapshot.twap)
+            with metrics.stage("record_cycle"):
+                await asyncio.to_thread(self.record_cycle, snapshot, hedged_short)
+        metrics.LAST_CYCLE.set(time.time())
+        return snapshot, hedged_short
+
+    async def run_async(self):
+        """Async main loop for TRIGGER_MODE="poll"."""
+        while True:
+            try:
+                if self.position_token_id:
+                    print(f"\n--- Managing LP Position {self.position_token_id} ---")
+                    await self.run_cycle_async()
+                else:
+                    print("\nNo active LP position loaded. Attempting initial setup (if enabled)...")
+            except Exception as e:
+                print(f"Error during bot execution: {e}")
+            print(f"Waiting {self.config.CYCLE_INTERVAL_SECONDS} seconds before next execution cycle...")
+            await asyncio.sleep(self.config.CYCLE_INTERVAL_SECONDS)
+
+    def run(self):
+        """Main execution loop. Poll mode runs on the async loop; event mode uses the sync loop with async reads."""
+        if self.config.TRIGGER_MODE == "events":
+            return super().run()
+        print("Starting liquidity management and delta neutral bot (async I/O)...")
+        metrics.start_server(self.config.METRICS_HOST, self.config.METRICS_PORT)
+        configure_tracing(self.config)
+        self.resume()
+        self.config.TOKEN0_ADDRESS_SYMBOL = "WETH"
+        self.config.TOKEN1_ADDRESS_SYMBOL = "USDC"
+        self.io_loop.run(self.run_async())
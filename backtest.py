@@ -0,0 +1,246 @@
+"""
+Offline backtester for the rebalance + delta hedge strategy.
+
+Replays a price series (e.g. one price per block) through the same rules the live bot applies in
+`rebalance_lp` and `manage_delta_neutral`, as defined by a shared `StrategyParams` instance:
+- the position is re-centred (range_lower/range_upper of the price, tick-aligned) whenever the price
+  leaves the range by more than the out-of-range margin,
+- the short hedge is moved to (within the rehedge band of) the position's TOKEN0 amount whenever it drifts
+  by more than the hedge band.
+
+Position amounts, fees and hedge PnL are computed with NumPy over whole segments of the series.
+Rebalances are found with a vectorized search that jumps straight to the next trigger, and the hedge
+band is one scalar pass over plain floats, so years of per-block data replay in seconds.
+
+Prices are TOKEN1 per TOKEN0 (e.g. USDC per WETH) and all values are expressed in TOKEN1.
+
+Example:
+    prices = np.load("eth_usdc_per_block.npy")
+    result = run_backtest(prices, StrategyParams(range_lower=Decimal("0.95"), range_upper=Decimal("1.05")))
+    print(result.summary())
+"""
+from decimal import Decimal
+
+import numpy as np
+
+import tick_math
+from strategy import StrategyParams
+
+# First search window when looking for the next trigger; it doubles on every miss.
+_INITIAL_SEARCH_WINDOW = 256
+
+
+class BacktestResult:
+    """Per-step arrays and event indices produced by `run_backtest`. Values are in TOKEN1."""
+    def __init__(self, prices, lp_value, fees, hedge_position, hedge_pnl, costs, in_range,
+                 rebalance_indices, hedge_trade_indices, initial_capital):
+        self.prices = prices
+        self.lp_value = lp_value # Mark-to-market value of the LP position
+        self.fees = fees # Cumulative fees earned
+        self.hedge_position = hedge_position # Short size (TOKEN0 units) held during each step
+        self.hedge_pnl = hedge_pnl # Cumulative PnL of the short hedge
+        self.costs = costs # Cumulative gas and hedge trading costs
+        self.in_range = in_range # Whether the position earned fees at each step
+        self.rebalance_indices = rebalance_indices
+        self.hedge_trade_indices = hedge_trade_indices
+        self.initial_capital = initial_capital
+
+    @property
+    def equity(self):
+        """Total strategy value at each step: LP position + fees + hedge PnL - costs."""
+        return self.lp_value + self.fees + self.hedge_pnl - self.costs
+
+    def summary(self) -> dict:
+        """Headline numbers of the run."""
+        return {
+            "steps": len(self.prices),
+            "final_equity": float(self.equity[-1]),
+            "net_pnl": float(self.equity[-1] - self.initial_capital),
+            "lp_pnl": float(self.lp_value[-1] - self.initial_capital),
+            "fees": float(self.fees[-1]),
+            "hedge_pnl": float(self.hedge_pnl[-1]),
+            "costs": float(self.costs[-1]),
+            "rebalances": len(self.rebalance_indices),
+            "hedge_trades": len(self.hedge_trade_indices),
+            "time_in_range": float(self.in_range.mean()),
+        }
+
+
+def position_amounts(sqrt_prices, sqrt_lower: float, sqrt_upper: float, liquidity: float):
+    """
+    Vectorized token0/token1 amounts of a range position at each price (the float version of
+    LiquidityAmounts.getAmountsForLiquidity, in human-readable units).
+    """
+    clipped = np.clip(sqrt_prices, sqrt_lower, sqrt_upper)
+    amount0 = liquidity * (1.0 / clipped - 1.0 / sqrt_upper)
+    amount1 = liquidity * (clipped - sqrt_lower)
+    return amount0, amount1
+
+
+def tick_aligned_range(price: float, params: StrategyParams, fee: int, decimals0: int, decimals1: int) -> tuple[float, float]:
+    """
+    Returns the (lower, upper) prices of the range the live bot would mint around `price`: the
+    strategy's range bounds, converted to ticks and aligned to the fee tier's tick spacing.
+    """
+    lower_price, upper_price = params.new_range(Decimal(float(price)))
+    tick_spacing = tick_math.get_tick_spacing(fee)
+    lower_tick = tick_math.align_tick(tick_math.price_to_tick(lower_price, decimals0, decimals1), tick_spacing)
+    upper_tick = tick_math.align_tick(tick_math.price_to_tick(upper_price, decimals0, decimals1), tick_spacing)
+    if upper_tick <= lower_tick:
+        upper_tick = lower_tick + tick_spacing
+    return (float(tick_math.tick_to_price(lower_tick, decimals0, decimals1)),
+            float(tick_math.tick_to_price(upper_tick, decimals0, decimals1)))
+
+
+def run_backtest(prices, params: StrategyParams | None = None, fee: int = 3000,
+                 decimals0: int = 18, decimals1: int = 6, initial_capital: float = 10_000.0,
+                 decision_interval: int = 1, gas_cost_per_rebalance: float = 0.0,
+                 hedge_cost_rate: float = 0.0, volume_multiplier: float = 1.0) -> BacktestResult:
+    """
+    Replays `prices` (TOKEN1 per TOKEN0) through the strategy.
+
+    decision_interval: the bot only evaluates its rules every `decision_interval` steps (e.g. 25 for
+        a 5 minute loop over 12 second blocks); positions, fees and PnL are still tracked every step.
+    gas_cost_per_rebalance: TOKEN1 cost charged for each decrease/collect/mint cycle.
+    hedge_cost_rate: fraction of traded hedge notional paid as exchange fees and slippage.
+    volume_multiplier: fees are earned on the volume implied by the price path crossing the position's
+        liquidity; values above 1 account for volume that round-trips without moving the price.
+    """
+    params = params or StrategyParams()
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    n = len(prices)
+    if n < 2:
+        raise ValueError("At least two prices are needed for a backtest.")
+    sqrt_prices = np.sqrt(prices)
+    fee_rate = fee / 1_000_000
+    trigger_lower = float(params.out_of_range_lower)
+    trigger_upper = float(params.out_of_range_upper)
+
+    lp_value = np.empty(n)
+    amount0 = np.empty(n)
+    amount1 = np.empty(n)
+    liquidity = np.empty(n) # Liquidity active at each step (changes only at rebalances)
+    lower_bound = np.empty(n)
+    upper_bound = np.empty(n)
+    rebalance_indices = []
+
+    # --- Pass 1: LP segments between rebalances ---
+    # Each segment holds one position; at a rebalance the new position is minted at the same step with
+    # the old position's value, so index `end` already belongs to the next segment.
+    start = 0
+    capital = initial_capital
+    while True:
+        lower_price, upper_price = tick_aligned_range(prices[start], params, fee, decimals0, decimals1)
+        sqrt_lower, sqrt_upper = np.sqrt(lower_price), np.sqrt(upper_price)
+        # Mint with all capital, assuming the tokens were swapped into the range's ratio at `start`
+        unit0, unit1 = position_amounts(sqrt_prices[start], sqrt_lower, sqrt_upper, 1.0)
+        segment_liquidity = capital / (unit0 * prices[start] + unit1)
+
+        low_trigger, high_trigger = lower_price * trigger_lower, upper_price * trigger_upper
+        end = _first_index(
+            lambda lo, hi: _decision_mask(lo, hi, decision_interval) & ((prices[lo:hi] < low_trigger) | (prices[lo:hi] > high_trigger)),
+            start + 1, n
+        )
+        stop = n if end is None else end + 1
+        segment0, segment1 = position_amounts(sqrt_prices[start:stop], sqrt_lower, sqrt_upper, segment_liquidity)
+        amount0[start:stop] = segment0
+        amount1[start:stop] = segment1
+        lp_value[start:stop] = segment0 * prices[start:stop] + segment1
+        liquidity[start:stop] = segment_liquidity
+        lower_bound[start:stop] = lower_price
+        upper_bound[start:stop] = upper_price
+        if end is None:
+            break
+        rebalance_indices.append(end)
+        capital = lp_value[end]
+        start = end
+
+    # --- Fees: volume implied by the price path crossing the position's own liquidity ---
+    # When the price rises the position sells token0 for token1 (amount1 grows); when it falls it
+    # buys token0. The trader pays the fee on the input token, on top of the amount that reaches the pool.
+    # Step i (from i-1 to i) is earned by the position held at i-1.
+    prev_sqrt = sqrt_prices[:-1]
+    curr_sqrt = sqrt_prices[1:]
+    step_liquidity = liquidity[:-1]
+    sqrt_lo = np.sqrt(lower_bound[:-1])
+    sqrt_hi = np.sqrt(upper_bound[:-1])
+    prev_clipped = np.clip(prev_sqrt, sqrt_lo, sqrt_hi)
+    curr_clipped = np.clip(curr_sqrt, sqrt_lo, sqrt_hi)
+    input1 = step_liquidity * np.maximum(curr_clipped - prev_clipped, 0.0)
+    input0 = step_liquidity * np.maximum(1.0 / curr_clipped - 1.0 / prev_clipped, 0.0)
+    step_fees = fee_rate / (1.0 - fee_rate) * (input1 + input0 * prices[1:]) * volume_multiplier
+    fees = np.concatenate(([0.0], np.cumsum(step_fees)))
+    in_range = (prices >= lower_bound) & (prices <= upper_bound)
+
+    # --- Pass 2: hedge band over the TOKEN0 exposure ---
+    hedge_position, hedge_trade_indices = _hedge_path(amount0, float(params.hedge_threshold), decision_interval,
+                                                   float(params.hedge_rehedge_band))
+    hedge_pnl = np.concatenate(([0.0], np.cumsum(-hedge_position[:-1] * np.diff(prices))))
+
+    # --- Costs ---
+    step_costs = np.zeros(n)
+    if rebalance_indices:
+        step_costs[rebalance_indices] += gas_cost_per_rebalance
+    if hedge_trade_indices:
+        trade_idx = np.asarray(hedge_trade_indices)
+        previous = np.where(trade_idx > 0, hedge_position[np.maximum(trade_idx - 1, 0)], 0.0)
+        step_costs[trade_idx] += hedge_cost_rate * np.abs(hedge_position[trade_idx] - previous) * prices[trade_idx]
+    costs = np.cumsum(step_costs)
+
+    return BacktestResult(prices, lp_value, fees, hedge_position, hedge_pnl, costs, in_range,
+                          rebalance_indices, hedge_trade_indices, initial_capital)
+
+
+def _decision_mask(lo: int, hi: int, decision_interval: int):
+    """Marks the steps in [lo, hi) at which the bot evaluates its rules."""
+    if decision_interval == 1:
+        return np.ones(hi - lo, dtype=bool)
+    return np.arange(lo, hi) % decision_interval == 0
+
+
+def _first_index(mask_fn, start: int, stop: int) -> int | None:
+    """
+    Returns the first index in [start, stop) where `mask_fn(lo, hi)` (a boolean array for the slice
+    [lo, hi)) is True, or None. The search window doubles on every miss, so finding a trigger costs
+    time proportional to its distance rather than to the rest of the series.
+    """
+    window = _INITIAL_SEARCH_WINDOW
+    lo = start
+    while lo < stop:
+        hi = min(lo + window, stop)
+        hits = np.flatnonzero(mask_fn(lo, hi))
+        if hits.size:
+            return lo + int(hits[0])
+        lo = hi
+        window *= 2
+    return None
+
+
+def _hedge_path(target, threshold: float, decision_interval: int, rehedge_band: float = 0.0):
+    """
+    Replays the hedge band: starting flat, the short is moved to within `rehedge_band` of `target[i]` at
+    every decision step where it differs from the current short by more than `threshold`. Returns the
+    short held after each step and the indices of the hedge trades.
+
+    The band is path dependent (each trade moves the band), so this is one tight scalar pass over
+    the decision steps; the per-step short is then filled in with a vectorized forward fill.
+    """
+    n = len(target)
+    decision_steps = np.arange(0, n, decision_interval)
+    trade_indices = []
+    trade_values = []
+    current = 0.0
+    for step, value in zip(decision_steps.tolist(), target[decision_steps].tolist()):
+        if abs(value - current) > threshold:
+            current = value - rehedge_band if value > current else value + rehedge_band
+            trade_indices.append(step)
+            trade_values.append(current)
+
+    # Forward-fill: each step holds the short set by the latest trade at or before it.
+    hedge_position = np.zeros(n)
+    if trade_indices:
+        trades = np.asarray(trade_indices)
+        last_trade = np.searchsorted(trades, np.arange(n), side="right") - 1
+        filled = last_trade >= 0
+        hedge_position[filled] = np.asarray(trade_values)[last_trade[filled]]
+    return hedge_position, trade_indices
@@ -0,0 +1,330 @@
+"""
+Benchmarks of the strategy's hot paths, runnable offline.
+
+- Micro: the tick/price/amount math (tick_math.py, e.g. `calculate_tick_from_price` is `price_to_tick`), the
+  greeks behind `get_current_lp_exposure`, the hedge band, off-chain fee accrual and, with NumPy, the range
+  optimizer. `bot.get_current_lp_exposure` times the bot's own exposure step on a cycle snapshot.
+- Macro: whole `run_cycle`s of an unmodified `LiquidityManagerBot` against the in-memory chain of mock_chain.py,
+  whose provider sleeps the given latency per JSON-RPC request, and a `MockExchangeClient` with the same latency
+  per API call. "cycle.hold" keeps the price in range (one batched read, the exposure, a hedge check and the
+  cycle's records). "cycle.rebalance" starts every cycle from a fresh position with the price past the default
+  rebalance trigger: the remove, swap and mint transactions and their receipts, a second read and a hedge trade. RPC requests and
+  exchange calls per cycle are reported with the times, since against a real node they dominate.
+  "startup" restarts the bot of a position that already ran, as after a crash, and times it until the end of
+  its first cycle.
+
+Every benchmark runs in several rounds after a warm-up call; the median and minimum time per call are kept.
+`--save FILE` writes the results as a JSON baseline, and `--compare FILE` prints the change against a baseline
+and exits with status 1 if a benchmark got slower by more than --threshold.
+
+    python benchmarks.py --save baseline.json
+    python benchmarks.py --compare baseline.json
+    python benchmarks.py --only cycle --latency-ms 0,20,100
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import warnings
+from decimal import Decimal
+
+import fee_accrual
+import greeks
+import mock_chain
+import range_optimizer
+import tick_math
+from hedge_executor import MockExchangeClient
+from state_store import StateStore
+from strategy import StrategyParams
+from uniswap_lp_bot import BlockchainClient, Config, DerivativesManager, LiquidityManagerBot
+
+DECIMALS0 = 18
+DECIMALS1 = 6
+PRICE = Decimal("3000")
+# The benchmark position: 10 TOKEN0 and the TOKEN1 the range needs with it
+POSITION_TOKEN0 = 10 * 10**DECIMALS0
+
+
+def measure(operation, rounds: int = 5, min_time: float = 0.2, number: int | None = None, setup=None) -> dict:
+    """
+    Times `operation` in `rounds` rounds of `number` calls, after one warm-up call. Without `number`, it is
+    calibrated so that a round takes at least `min_time` seconds. A `setup` runs untimed before every call.
+    Returns the median and minimum seconds per call over the rounds.
+    """
+    def run_round(count: int) -> float:
+        if setup is None:
+            started = time.perf_counter()
+            for _ in range(count):
+                operation()
+            return time.perf_counter() - started
+        elapsed = 0.0
+        for _ in range(count):
+            setup()
+            started = time.perf_counter()
+            operation()
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    run_round(1)
+    if number is None:
+        number = 1
+        while True:
+            elapsed = run_round(number)
+            if elapsed >= min_time:
+                break
+            number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+    per_call = [run_round(number) / number for _ in range(rounds)]
+    return {"median_s": statistics.median(per_call), "min_s": min(per_call), "rounds": rounds, "number": number}
+
+
+def micro_benchmarks() -> dict:
+    """name -> callable of the pure math benchmarks."""
+    sqrt_price = tick_math.price_to_sqrt_price_x96(PRICE, DECIMALS0, DECIMALS1)
+    tick = tick_math.get_tick_at_sqrt_ratio(sqrt_price)
+    tick_spacing = tick_math.get_tick_spacing(3000)
+    tick_lower = tick_math.align_tick(tick_math.price_to_tick(PRICE * Decimal("0.9"), DECIMALS0, DECIMALS1), tick_spacing)
+    tick_upper = tick_math.align_tick(tick_math.price_to_tick(PRICE * Decimal("1.1"), DECIMALS0, DECIMALS1), tick_spacing)
+    sqrt_lower = tick_math.get_sqrt_ratio_at_tick(tick_lower)
+    sqrt_upper = tick_math.get_sqrt_ratio_at_tick(tick_upper)
+    liquidity = tick_math.get_liquidity_for_amount0(sqrt_price, sqrt_upper, POSITION_TOKEN0)
+    amount0, amount1 = tick_math.get_amounts_for_liquidity(sqrt_price, sqrt_lower, sqrt_upper, liquidity)
+    position_info = (0, mock_chain.ZERO_ADDRESS, mock_chain.ZERO_ADDRESS, mock_chain.ZERO_ADDRESS, 3000, tick_lower, tick_upper,
+                     liquidity, 3 << 120, 5 << 120, 1000, 2000)
+    lower_tick_info = (0, 0, 1 << 125, 1 << 124, 0, 0, 0, True)
+    upper_tick_info = (0, 0, 1 << 123, 1 << 122, 0, 0, 0, True)
+    benchmarks = {
+        "tick_math.price_to_tick": lambda: tick_math.price_to_tick(PRICE, DECIMALS0, DECIMALS1),
+        "tick_math.tick_to_price": lambda: tick_math.tick_to_price(tick, DECIMALS0, DECIMALS1),
+        "tick_math.get_sqrt_ratio_at_tick": lambda: tick_math.get_sqrt_ratio_at_tick(tick),
+        "tick_math.get_tick_at_sqrt_ratio": lambda: tick_math.get_tick_at_sqrt_ratio(sqrt_price),
+        "tick_math.sqrt_price_x96_to_price": lambda: tick_math.sqrt_price_x96_to_price(sqrt_price, DECIMALS0, DECIMALS1),
+        "tick_math.get_amounts_for_liquidity": lambda: tick_math.get_amounts_for_liquidity(sqrt_price, sqrt_lower, sqrt_upper, liquidity),
+        "tick_math.get_liquidity_for_amounts": lambda: tick_math.get_liquidity_for_amounts(sqrt_price, sqrt_lower, sqrt_upper, amount0, amount1),
+        "greeks.position_greeks": lambda: greeks.position_greeks(sqrt_price, tick_lower, tick_upper, liquidity, DECIMALS0, DECIMALS1),
+        "greeks.hedge_band_sqrt_prices": lambda: greeks.hedge_band_sqrt_prices(tick_lower, tick_upper, liquidity, Decimal("9.5"), Decimal("0.001"), DECIMALS0),
+        "fee_accrual.uncollected_fees": lambda: fee_accrual.uncollected_fees(position_info, tick, 1 << 126, 1 << 125, lower_tick_info, upper_tick_info),
+    }
+    if range_optimizer.OPTIMIZER_AVAILABLE:
+        optimizer = range_optimizer.RangeOptimizer(StrategyParams(), 3000, DECIMALS0, DECIMALS1)
+        volatility = 0.8 / (365 * 24 * 3600) ** 0.5 # 80% a year
+        benchmarks["range_optimizer.optimize"] = lambda: optimizer.optimize(sqrt_price, volatility, 60000.0, 15.0)
+    return benchmarks
+
+
+class MockEnvironment:
+    """
+    A LiquidityManagerBot on a fresh mock chain and mock exchange, both answering after `latency` seconds.
+    Must be created inside `mock_chain.workspace()`, where Config finds the mock ABIs.
+    """
+    def __init__(self, latency: float, strategy: StrategyParams | None = None):
+        config = Config()
+        config.PRIVATE_KEY = mock_chain.TEST_PRIVATE_KEY
+        config.WALLET_ADDRESS = mock_chain.TEST_ADDRESS
+        config.TOKEN0_ADDRESS_SYMBOL = "WETH"
+        config.TOKEN1_ADDRESS_SYMBOL = "USDC"
+        config.STRATEGY = strategy or StrategyParams()
+        # The fixed range keeps every rebalance identical; the optimizer has its own micro benchmark.
+        config.OPTIMIZE_RANGE = False
+        config.HEDGE_CHILD_INTERVAL_SECONDS = 0
+        config.STATE_DB_FILE = f"state-{id(self)}.db"
+        config.ALLOWANCE_CACHE_FILE = f"allowances-{id(self)}.json"
+        config.RECORDER_DIR = f"history-{id(self)}"
+        config.METADATA_CACHE_FILE = f"metadata-{id(self)}.json"
+        self.config = config
+        self.chain = mock_chain.MockChain()
+        self.deployment = mock_chain.deploy_uniswap(self.chain, config, tick_math.price_to_sqrt_price_x96(PRICE, DECIMALS0, DECIMALS1), DECIMALS0, DECIMALS1)
+        for token in (self.deployment.token0, self.deployment.token1):
+            token.mint_to(config.WALLET_ADDRESS, 10**40)
+            token.mint_to(self.deployment.nft_manager.address, 10**40)
+        self.provider = mock_chain.MockProvider(self.chain, latency=latency)
+        self.exchange = MockExchangeClient({config.SHORT_TOKEN_SYMBOL: PRICE}, latency=latency)
+        client = BlockchainClient(config, provider=self.provider)
+        state_store = StateStore(config.STATE_DB_FILE)
+        self.bot = LiquidityManagerBot(client, DerivativesManager(config, state_store, client=self.exchange), state_store)
+
+    def restart(self):
+        """Replaces the bot with a new one on the same chain, exchange and files, as after a crash, and resumes it."""
+        self.bot.state_store.close()
+        client = BlockchainClient(self.config, provider=self.provider)
+        state_store = StateStore(self.config.STATE_DB_FILE)
+        self.bot = LiquidityManagerBot(client, DerivativesManager(self.config, state_store, client=self.exchange), state_store)
+        self.bot.resume()
+
+    def set_price(self, price: Decimal):
+        self.deployment.pool.set_price(tick_math.price_to_sqrt_price_x96(price, DECIMALS0, DECIMALS1))
+
+    def mint_position(self, price: Decimal):
+        """Moves the pool to `price` and makes a new position over the strategy's range around it the bot's position."""
+        self.set_price(price)
+        lower_price, upper_price = self.config.STRATEGY.new_range(price)
+        tick_lower, tick_upper = self.bot.lp_manager.calculate_tick_range(lower_price, upper_price)
+        sqrt_price = self.deployment.pool.sqrt_price_x96
+        sqrt_lower = tick_math.get_sqrt_ratio_at_tick(tick_lower)
+        sqrt_upper = tick_math.get_sqrt_ratio_at_tick(tick_upper)
+        # Amounts in the range's exact ratio, so the mint's 1% slippage minimums hold for both tokens
+        liquidity = tick_math.get_liquidity_for_amount0(sqrt_price, sqrt_upper, POSITION_TOKEN0)
+        amount0, amount1 = tick_math.get_amounts_for_liquidity(sqrt_price, sqrt_lower, sqrt_upper, liquidity)
+        self.bot.position_token_id = self.bot.lp_manager.provide_liquidity(
+            Decimal(amount0) / Decimal(10**DECIMALS0), Decimal(amount1) / Decimal(10**DECIMALS1), lower_price, upper_price, (tick_lower, tick_upper)
+        )
+        self.bot.state_store.save_position(self.bot.position_token_id, self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+
+    def requests(self) -> tuple[int, int]:
+        """(JSON-RPC requests, exchange API calls) made so far."""
+        return sum(self.provider.calls.values()), sum(self.exchange.api_calls.values())
+
+
+def measure_cycles(environment: MockEnvironment, cycles: int, rounds: int, setup=None, expect_rebalance: bool = False,
+                   restart: bool = False) -> dict:
+    """
+    Times `run_cycle` of the environment's bot and adds the RPC requests and exchange calls per cycle,
+    averaged over every cycle run (the warm-up included). With `restart`, the bot is restarted before each
+    cycle and the restart is timed with it.
+    """
+    counted = {"cycles": 0, "rpc": 0, "exchange": 0}
+
+    def cycle():
+        rpc_before, exchange_before = environment.requests()
+        if restart:
+            environment.restart()
+        token_id = environment.bot.position_token_id
+        environment.bot.run_cycle()
+        if expect_rebalance and environment.bot.position_token_id == token_id:
+            raise Exception(f"The benchmark cycle didn't rebalance position {token_id}.")
+        rpc_after, exchange_after = environment.requests()
+        counted["cycles"] += 1
+        counted["rpc"] += rpc_after - rpc_before
+        counted["exchange"] += exchange_after - exchange_before
+
+    result = measure(cycle, rounds=rounds, number=cycles, setup=setup)
+    result["rpc_requests"] = counted["rpc"] / counted["cycles"]
+    result["exchange_calls"] = counted["exchange"] / counted["cycles"]
+    return result
+
+
+def macro_benchmarks(latencies_ms: list[float], cycles: int, rounds: int, min_time: float, selected) -> dict:
+    """Runs the cycle benchmarks (and the bot-level exposure) in a mock workspace."""
+    results = {}
+    with mock_chain.workspace():
+        if selected("bot.get_current_lp_exposure"):
+            environment = MockEnvironment(0)
+            environment.mint_position(PRICE)
+            snapshot = environment.bot.read_cycle_state(environment.bot.position_token_id)
+            token_id = environment.bot.position_token_id
+            results["bot.get_current_lp_exposure"] = measure(lambda: environment.bot.get_current_lp_exposure(token_id, snapshot),
+                                                             rounds=rounds, min_time=min_time)
+        for latency_ms in latencies_ms:
+            suffix = f"@{latency_ms:g}ms"
+            if selected("cycle.hold" + suffix):
+                environment = MockEnvironment(latency_ms / 1000)
+                environment.mint_position(PRICE)
+                environment.bot.run_cycle() # Opens the hedge, so the timed cycles are the steady state
+                results["cycle.hold" + suffix] = measure_cycles(environment, cycles, rounds)
+            if selected("startup" + suffix):
+                environment = MockEnvironment(latency_ms / 1000)
+                environment.mint_position(PRICE)
+                environment.bot.run_cycle() # Stores a cycle and fills the metadata cache, as a bot that ran before
+                results["startup" + suffix] = measure_cycles(environment, 1, rounds, restart=True)
+            if selected("cycle.rebalance" + suffix):
+                # The default trigger: a 15% move leaves the +/-10% range, whose tokens are then all TOKEN1,
+                # so each rebalance removes the position, swaps to the new range's ratio and mints
+                environment = MockEnvironment(latency_ms / 1000)
+
+                def setup(environment=environment):
+                    environment.mint_position(PRICE)
+                    environment.set_price(PRICE * Decimal("1.15"))
+                results["cycle.rebalance" + suffix] = measure_cycles(environment, cycles, rounds, setup, expect_rebalance=True)
+    return results
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.3f} us"
+
+
+def print_results(results: dict):
+    for name, result in results.items():
+        line = f"{name:<40} {format_seconds(result['median_s']):>12} median  {format_seconds(result['min_s']):>12} min  ({result['rounds']} x {result['number']})"
+        if "rpc_requests" in result:
+            line += f"  {result['rpc_requests']:.1f} RPC requests, {result['exchange_calls']:.1f} exchange calls per cycle"
+        print(line)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Prints the change of each benchmark's median against the baseline. Returns the names of the regressions."""
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<40} {'-':>12} {format_seconds(result['median_s']):>12}      new")
+            continue
+        change = result["median_s"] / previous["median_s"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  SLOWER"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<40} {format_seconds(previous['median_s']):>12} {format_seconds(result['median_s']):>12} {change:>+8.1%}{flag}")
+        if "rpc_requests" in result and "rpc_requests" in previous and result["rpc_requests"] != previous["rpc_requests"]:
+            print(f"{'':<40} RPC requests per cycle: {previous['rpc_requests']:.1f} -> {result['rpc_requests']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the strategy's hot paths against a mock chain and exchange.")
+    parser.add_argument("--only", default="", help="Only run benchmarks whose name contains one of these comma-separated words")
+    parser.add_argument("--latency-ms", default="0,50", help="Comma-separated per-request latencies of the mock node and exchange for the cycle benchmarks")
+    parser.add_argument("--cycles", type=int, default=10, help="Cycles per round of the cycle benchmarks")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round of the micro benchmarks")
+    parser.add_argument("--save", help="Write the results as a JSON baseline to this file")
+    parser.add_argument("--compare", help="Compare the results with the JSON baseline in this file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown of the median (0.10 = 10%%) that counts as a regression")
+    args = parser.parse_args()
+
+    words = [word for word in args.only.split(",") if word]
+    selected = lambda name: not words or any(word in name for word in words)
+    # The bot logs every step and web3 warns about each unrelated log in a receipt; neither is what is measured.
+    warnings.filterwarnings("ignore", message=".*MismatchedABI")
+    results = {}
+    with open(os.devnull, "w") as devnull:
+        for name, operation in micro_benchmarks().items():
+            if selected(name):
+                with contextlib.redirect_stdout(devnull):
+                    results[name] = measure(operation, rounds=args.rounds, min_time=args.min_time)
+                print_results({name: results[name]})
+        latencies_ms = [float(value) for value in args.latency_ms.split(",") if value]
+        with contextlib.redirect_stdout(devnull):
+            macro_results = macro_benchmarks(latencies_ms, args.cycles, args.rounds, args.min_time, selected)
+        print_results(macro_results)
+        results.update(macro_results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=2)
+        print(f"\nBaseline written to {args.save}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Append-only columnar history of what the bot observes, one row per block.
+
+Each row holds the pool state (tick and price), the Chainlink answer for TOKEN0, the managed position
+(token ID, liquidity, TOKEN0/TOKEN1 amounts; the TOKEN0 amount is also the position's delta, see greeks.py)
+and the hedge size. Rows are written by `BlockRecorder` into segments of memory-mapped NumPy arrays:
+
+    <directory>/<first block of the segment>/<column>.npy    one .npy file per column, SEGMENT_ROWS long
+    <directory>/<first block of the segment>/rows.json       number of valid rows
+
+A segment rolls over to a new directory once it is full. `rows.json` is rewritten after the arrays are
+flushed, so a reader never sees a row that wasn't completely written; rows beyond the count (e.g. after a
+crash) are overwritten by the next append. Appends flush every `flush_rows` rows or `flush_seconds` seconds,
+whichever comes first, rather than each row (every Swap in event-driven mode); `flush` publishes the rest,
+e.g. on shutdown.
+
+`HistoryReader` opens the segments read-only with `np.load(mmap_mode="r")`, so loading months of history
+costs no parsing and no copy: columns of a single segment are views on the mapped files, and only queries
+spanning several segments concatenate. Values are floats (liquidity included, which loses precision beyond
+2**53) because they are meant for analysis, e.g. `run_backtest(reader.column("price"))`; exact state lives on chain.
+"""
+import json
+import os
+import threading
+import time
+
+# NumPy is only needed for recording, so the live bot doesn't depend on it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+RECORDER_AVAILABLE = np is not None
+
+# Rows per segment file (1.4 MB per float column; about 9 days of Ethereum blocks).
+SEGMENT_ROWS = 1 << 16
+
+COLUMNS = {
+    "block_number": "int64",
+    "timestamp": "float64",
+    "tick": "int32",
+    "price": "float64", # Pool price, TOKEN1 per TOKEN0
+    "oracle_price": "float64", # Chainlink TOKEN0/USD answer, NaN when not read in that block
+    "token_id": "int64",
+    "liquidity": "float64",
+    "amount0": "float64", # Also the position's delta
+    "amount1": "float64",
+    "hedge_size": "float64", # Short size on the hedge contract, NaN when unknown
+}
+
+
+class BlockRecorder:
+    """Appends rows to the current segment, rolling over to a new one when it is full."""
+    def __init__(self, directory: str, segment_rows: int = SEGMENT_ROWS, flush_rows: int = 256, flush_seconds: float = 60):
+        if np is None:
+            raise Exception("BlockRecorder needs NumPy (pip install numpy).")
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._arrays = None
+        self._rows = 0
+        self._segment_dir = None
+        self.last_block = None
+        self._unflushed = 0 # Rows appended (or replaced) since the last flush
+        self._flushed_at = time.monotonic()
+        segments = _segment_dirs(directory)
+        if segments:
+            self._open_segment(segments[-1])
+            if self._rows:
+                self.last_block = int(self._arrays["block_number"][self._rows - 1])
+
+    def _open_segment(self, segment_dir: str, create: bool = False):
+        if create:
+            os.makedirs(segment_dir)
+        self._segment_dir = segment_dir
+        self._arrays = {}
+        for name, dtype in COLUMNS.items():
+            path = os.path.join(segment_dir, f"{name}.npy")
+            if create:
+                self._arrays[name] = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(self.segment_rows,))
+            else:
+                self._arrays[name] = np.load(path, mmap_mode="r+")
+        self._rows = 0 if create else _read_rows(segment_dir)
+
+    def append(self, block_number: int, **values):
+        """
+        Records the state at `block_number`; missing columns are stored as NaN (or 0 for integer columns).
+        A second row for the block of the last row replaces it, and older blocks are ignored, so the
+        history stays one row per block in block order.
+        """
+        with self._lock:
+            if self.last_block is not None and block_number < self.last_block:
+                return
+            if self.last_block is not None and block_number == self.last_block:
+                row = self._rows - 1
+            else:
+                if self._arrays is None or self._rows >= len(self._arrays["block_number"]):
+                    if self._arrays is not None:
+                        self._flush()
+                    self._open_segment(os.path.join(self.directory, f"{block_number:012d}"), create=True)
+                row = self._rows
+            for name, array in self._arrays.items():
+                if name == "block_number":
+                    array[row] = block_number
+                elif name in values and values[name] is not None:
+                    array[row] = values[name]
+                else:
+                    array[row] = np.nan if array.dtype.kind == "f" else 0
+            self._rows = row + 1
+            self.last_block = block_number
+            self._unflushed += 1
+            if self._unflushed >= self.flush_rows or time.monotonic() - self._flushed_at >= self.flush_seconds:
+                self._flush()
+
+    def flush(self):
+        """Flushes the mapped arrays to disk, then publishes the new row count to readers."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+        if self._arrays is None:
+            return
+        for array in self._arrays.values():
+            array.flush()
+        temporary = os.path.join(self._segment_dir, "rows.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump({"rows": self._rows}, f)
+        os.replace(temporary, os.path.join(self._segment_dir, "rows.json"))
+
+
+class HistoryReader:
+    """Read-only, zero-copy access to a recorder directory."""
+    def __init__(self, directory: str):
+        if np is None:
+            raise Exception("HistoryReader needs NumPy (pip install numpy).")
+        self.directory = directory
+        self.refresh()
+
+    def refresh(self):
+        """Maps the segments again, picking up rows and segments written since the reader was opened."""
+        self.segments = []
+        for segment_dir in _segment_dirs(self.directory):
+            rows = _read_rows(segment_dir)
+            if rows:
+                self.segments.append({
+                    name: np.load(os.path.join(segment_dir, f"{name}.npy"), mmap_mode="r")[:rows] for name in COLUMNS
+                })
+
+    def __len__(self):
+        return sum(len(segment["block_number"]) for segment in self.segments)
+
+    def column(self, name: str):
+        """The whole history of a column: a view on the mapped file if there is one segment, else one concatenated array."""
+        if not self.segments:
+            return np.empty(0, dtype=COLUMNS[name])
+        if len(self.segments) == 1:
+            return self.segments[0][name]
+        return np.concatenate([segment[name] for segment in self.segments])
+
+    def range(self, from_block: int, to_block: int, columns=None) -> dict:
+        """
+        Columns for the blocks in [from_block, to_block]. Segments are picked by block and rows by a binary search
+        on block_number, so only the mapped pages of the requested range are touched.
+        """
+        columns = list(columns or COLUMNS)
+        parts = {name: [] for name in columns}
+        for segment in self.segments:
+            blocks = segment["block_number"]
+            if blocks[0] > to_block or blocks[-1] < from_block:
+                continue
+            start = int(np.searchsorted(blocks, from_block, side="left"))
+            stop = int(np.searchsorted(blocks, to_block, side="right"))
+            for name in columns:
+                parts[name].append(segment[name][start:stop])
+        return {
+            name: (arrays[0] if len(arrays) == 1 else np.concatenate(arrays) if arrays else np.empty(0, dtype=COLUMNS[name]))
+            for name, arrays in parts.items()
+        }
+
+
+def _segment_dirs(directory: str) -> list[str]:
+    """Segment directories in block order (their names are zero-padded first blocks)."""
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.isdigit()]
+
+
+def _read_rows(segment_dir: str) -> int:
+    try:
+        with open(os.path.join(segment_dir, "rows.json"), "r") as f:
+            return json.load(f)["rows"]
+    except FileNotFoundError:
+        return 0
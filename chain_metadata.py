@@ -0,0 +1,72 @@
+"""
+On-disk cache of chain data that never changes once it exists: token decimals, pool addresses and pool tick
+spacings, and the decimals and description of Chainlink feeds (price_feeds.py).
+
+Without it, every start reads the decimals of both tokens and resolves the pool through the factory before the
+first cycle can run. With it, only the very first start on a chain reads them; later ones (e.g. a restart after
+a crash) find them in METADATA_CACHE_FILE and start without a single metadata request.
+
+Entries are kept per chain ID, so one file can serve bots on several networks. Nothing is ever invalidated:
+a token's decimals and a deployed pool's address and tick spacing are immutable. An empty path keeps the cache
+in memory only.
+"""
+import json
+import os
+import threading
+
+SECTIONS = ("decimals", "pools", "tick_spacing", "feeds")
+
+
+def pool_key(factory: str, token0: str, token1: str, fee: int) -> str:
+    """Key of a pool in the "pools" section."""
+    return f"{factory}:{token0}:{token1}:{fee}"
+
+
+class ChainMetadata:
+    def __init__(self, path: str, chain_id: int):
+        self.path = path
+        self._key = str(chain_id)
+        self._lock = threading.Lock()
+        self._entries = {section: {} for section in SECTIONS}
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                cached = json.load(f).get(self._key, {})
+        except Exception as e:
+            print(f"Error loading chain metadata cache, metadata will be read from the chain: {e}")
+            return
+        with self._lock:
+            for section in SECTIONS:
+                self._entries[section].update(cached.get(section, {}))
+
+    def save(self):
+        """Writes the entries to the cache file, keeping those of other chains. The file is replaced atomically."""
+        if not self.path:
+            return
+        with self._lock:
+            try:
+                cache = {}
+                if os.path.exists(self.path):
+                    with open(self.path, "r") as f:
+                        cache = json.load(f)
+                cache[self._key] = self._entries
+                temporary = f"{self.path}.tmp"
+                with open(temporary, "w") as f:
+                    json.dump(cache, f, indent=2)
+                os.replace(temporary, self.path)
+            except Exception as e:
+                print(f"Error saving chain metadata cache: {e}")
+
+    def get(self, section: str, key: str):
+        """The cached value, or None if it was never read."""
+        return self._entries[section].get(key)
+
+    def update(self, section: str, values: dict):
+        """Adds newly read values and saves the file."""
+        with self._lock:
+            self._entries[section].update(values)
+        self.save()
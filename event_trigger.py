@@ -0,0 +1,234 @@
+"""
+Event-driven cycle triggering for the LP bot.
+
+Instead of waking up every few minutes, the bot listens to new blocks and to the managed pool's
+`Swap` logs, tracks `sqrtPriceX96`/`tick` locally from those logs, and only runs `rebalance_lp`/
+`manage_delta_neutral` when the price crosses the strategy's out-of-range trigger or the position's
+TOKEN0 exposure drifts outside the hedge band.
+
+Two event sources are available:
+- `WebsocketEventSource` uses `eth_subscribe` (newHeads + logs), so an idle pool costs no RPC calls.
+- `PollingEventSource` is the fallback for HTTP-only providers: it installs a log filter and polls it
+  with `eth_getFilterChanges` (reinstalling it if the node dropped it), or polls `eth_getLogs` block by block
+  if filters are not supported. Either way it reads the block number and queues an event per new block.
+"""
+import asyncio
+import queue
+import threading
+import time
+from decimal import Decimal
+
+from web3 import AsyncWeb3, Web3
+from web3.providers import WebsocketProviderV2
+
+import greeks
+import tick_math
+
+# keccak256("Swap(address,address,int256,int256,uint160,uint128,int24)")
+SWAP_TOPIC = "0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67"
+
+
+class PoolEvent:
+    """A new block, or a Swap in the pool carrying the pool's post-swap price."""
+    def __init__(self, block_number: int, sqrt_price_x96: int | None = None, tick: int | None = None):
+        self.block_number = block_number
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick
+
+    @property
+    def is_swap(self) -> bool:
+        return self.sqrt_price_x96 is not None
+
+
+def _to_int(value) -> int:
+    """JSON-RPC quantities arrive as hex strings from raw subscriptions and as ints from formatted calls."""
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def decode_swap_log(log) -> PoolEvent:
+    """
+    Decodes a pool `Swap` log without going through the contract ABI. The data section is five words:
+    amount0 (int256), amount1 (int256), sqrtPriceX96 (uint160), liquidity (uint128), tick (int24).
+    """
+    data = log["data"]
+    data = bytes.fromhex(data[2:]) if isinstance(data, str) else bytes(data)
+    sqrt_price_x96 = int.from_bytes(data[64:96], "big")
+    tick = int.from_bytes(data[128:160], "big", signed=True)
+    return PoolEvent(_to_int(log["blockNumber"]), sqrt_price_x96, tick)
+
+
+class PollingEventSource:
+    """Polls the node for new Swap logs of one pool. Works with plain HTTP providers."""
+    def __init__(self, w3: Web3, pool_address: str, poll_interval: float):
+        self.w3 = w3
+        self.pool_address = Web3.to_checksum_address(pool_address)
+        self.poll_interval = poll_interval
+        self.events = queue.Queue()
+        self._filter = None
+        self._last_block = None
+
+    def start(self):
+        self._last_block = self.w3.eth.block_number
+        self._filter = self._install_filter()
+        threading.Thread(target=self._poll_forever, name="pool-event-poller", daemon=True).start()
+
+    def _install_filter(self):
+        """One eth_getFilterChanges per poll, which returns nothing while the pool is idle. None if filters aren't supported."""
+        try:
+            return self.w3.eth.filter({"address": self.pool_address, "topics": [SWAP_TOPIC]})
+        except Exception as e:
+            print(f"Could not install a log filter ({e}). Falling back to eth_getLogs polling.")
+            return None
+
+    def _poll_forever(self):
+        while True:
+            try:
+                for log in self._poll():
+                    self.events.put(decode_swap_log(log))
+            except Exception as e:
+                print(f"Error polling pool events: {e}")
+            time.sleep(self.poll_interval)
+
+    def _poll(self):
+        """Queues an event for a new block and returns the Swap logs mined since the last poll."""
+        logs = None
+        if self._filter is not None:
+            try:
+                logs = self._filter.get_new_entries()
+            except Exception as e:
+                # Nodes drop filters that aren't polled for a while, and all of them on restart ("filter not found").
+                # The new filter only sees logs from now on, so this poll catches up with eth_getLogs.
+                print(f"Log filter failed ({e}). Reinstalling it.")
+                self._filter = self._install_filter()
+        latest = self.w3.eth.block_number
+        if latest <= self._last_block:
+            return logs or []
+        if logs is None:
+            logs = self.w3.eth.get_logs({
+                "address": self.pool_address,
+                "topics": [SWAP_TOPIC],
+                "fromBlock": self._last_block + 1,
+                "toBlock": latest,
+            })
+        self._last_block = latest
+        self.events.put(PoolEvent(latest))
+        return logs
+
+
+class WebsocketEventSource:
+    """Subscribes to newHeads and the pool's Swap logs over a websocket connection."""
+    def __init__(self, ws_url: str, pool_address: str):
+        self.ws_url = ws_url
+        self.pool_address = Web3.to_checksum_address(pool_address)
+        self.events = queue.Queue()
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._subscribe_forever()), name="pool-event-subscriber", daemon=True).start()
+
+    async def _subscribe_forever(self):
+        while True:
+            try:
+                await self._subscribe()
+            except Exception as e:
+                print(f"Websocket subscription dropped ({e}). Reconnecting in 5 seconds...")
+                await asyncio.sleep(5)
+
+    async def _subscribe(self):
+        async with AsyncWeb3.persistent_websocket(WebsocketProviderV2(self.ws_url)) as w3:
+            await w3.eth.subscribe("newHeads")
+            await w3.eth.subscribe("logs", {"address": self.pool_address, "topics": [SWAP_TOPIC]})
+            print(f"Subscribed to new blocks and Swap logs of {self.pool_address}.")
+            async for message in w3.ws.process_subscriptions():
+                result = message["params"]["result"] if "params" in message else message["result"]
+                if "topics" in result:
+                    self.events.put(decode_swap_log(result))
+                else:
+                    self.events.put(PoolEvent(_to_int(result["number"])))
+
+
+class CycleTrigger:
+    """
+    Tracks the pool price from Swap events and decides when a cycle is worth running.
+    It is armed from a `CycleSnapshot` after each cycle; the rebalance trigger and the prices at which the
+    position's delta leaves the hedge band are precomputed as sqrtPriceX96 integers, so each event costs
+    a few integer comparisons. A cycle that couldn't evaluate the hedge is retried after `hedge_retry_seconds`, and
+    one that left the price outside the rebalance trigger after `rebalance_retry_seconds`, not on every event.
+    """
+    def __init__(self, strategy, decimals0: int, decimals1: int, hedge_retry_seconds: float = 60, rebalance_retry_seconds: float = 60):
+        self.strategy = strategy
+        self.decimals0 = decimals0
+        self.decimals1 = decimals1
+        self.hedge_retry_seconds = hedge_retry_seconds
+        self.rebalance_retry_seconds = rebalance_retry_seconds
+        self.sqrt_price_x96 = None
+        self.tick = None
+        self.block_number = None
+        self.armed_block = None # Block of the snapshot the trigger was armed from
+        self.hedged_short = None
+        self._hedge_retry_at = 0.0
+        self._rebalance_retry_at = 0.0
+
+    def arm(self, snapshot, hedged_short: Decimal | None, after_cycle: bool = False):
+        """
+        Records the position and hedge just acted on, and the price levels that should trigger again.
+        `after_cycle` says the snapshot was read after a cycle that had the chance to rebalance the position.
+        """
+        position_info = snapshot.position_info
+        self.sqrt_price_x96 = snapshot.sqrt_price_x96
+        self.tick = snapshot.tick
+        self.block_number = self.armed_block = snapshot.block_number
+        self.position_info = position_info
+        self.liquidity = position_info[7]
+        lower_price = tick_math.tick_to_price(position_info[5], self.decimals0, self.decimals1)
+        upper_price = tick_math.tick_to_price(position_info[6], self.decimals0, self.decimals1)
+        # The same margins `StrategyParams.is_out_of_range` applies to prices, expressed as sqrt prices.
+        self.trigger_low_x96 = tick_math.price_to_sqrt_price_x96(lower_price * self.strategy.out_of_range_lower, self.decimals0, self.decimals1)
+        self.trigger_high_x96 = tick_math.price_to_sqrt_price_x96(upper_price * self.strategy.out_of_range_upper, self.decimals0, self.decimals1)
+        self._rebalance_retry_at = 0.0
+        if after_cycle and self._outside_trigger():
+            # The cycle's rebalance failed or was deferred. Retrying it on the next Swap would resend its transactions
+            # every block while the price stays out, so the next attempt waits.
+            self._rebalance_retry_at = time.monotonic() + self.rebalance_retry_seconds
+        if hedged_short is None:
+            # The hedge couldn't be evaluated (e.g. the exchange or the price feed failed). The band around the
+            # last known short still applies, and the next attempt waits instead of following the next event.
+            hedged_short = self.hedged_short
+            self._hedge_retry_at = time.monotonic() + self.hedge_retry_seconds
+        else:
+            self._hedge_retry_at = 0.0
+        self.hedged_short = hedged_short
+        if hedged_short is not None:
+            # Closed-form inverse of the position's delta (greeks.py): outside these prices it has drifted
+            # out of the hedge band around the short.
+            self.hedge_low_x96, self.hedge_high_x96 = greeks.hedge_band_sqrt_prices(
+                position_info[5], position_info[6], self.liquidity, hedged_short, self.strategy.hedge_threshold, self.decimals0
+            )
+
+    def update(self, event: PoolEvent) -> bool:
+        """
+        Applies an event to the locally tracked pool state. Returns False for an event the armed snapshot already
+        includes, which is ignored: one from an older block, or a Swap of the block the snapshot was read at.
+        """
+        if self.armed_block is not None and (event.block_number < self.armed_block or
+                                             (event.is_swap and event.block_number == self.armed_block)):
+            return False
+        self.block_number = max(self.block_number or 0, event.block_number)
+        if event.is_swap:
+            self.sqrt_price_x96 = event.sqrt_price_x96
+            self.tick = event.tick
+        return True
+
+    def _outside_trigger(self) -> bool:
+        return self.sqrt_price_x96 < self.trigger_low_x96 or self.sqrt_price_x96 > self.trigger_high_x96
+
+    def needs_rebalance(self) -> bool:
+        if time.monotonic() < self._rebalance_retry_at:
+            return False
+        return self._outside_trigger()
+
+    def needs_hedge(self) -> bool:
+        if time.monotonic() < self._hedge_retry_at:
+            return False
+        if self.hedged_short is None:
+            return True
+        return self.sqrt_price_x96 < self.hedge_low_x96 or self.sqrt_price_x96 > self.hedge_high_x96
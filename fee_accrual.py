@@ -0,0 +1,60 @@
+"""
+Uncollected fees of a Uniswap V3 position, computed off-chain in exact integer math.
+
+`tokensOwed0/1` in `NonfungiblePositionManager.positions()` only include the fees credited at the position's
+last poke (mint, increase/decreaseLiquidity, collect). The fees earned since then follow from the pool's fee
+growth accounting, exactly as the contracts compute them when the position is next poked:
+
+    feeGrowthInside = feeGrowthGlobal - feeGrowthBelow(tickLower) - feeGrowthAbove(tickUpper)    (Tick.getFeeGrowthInside)
+    owed = tokensOwed + (feeGrowthInside - feeGrowthInsideLast) * liquidity / 2**128            (Position.update)
+
+Fee growth values are Q128 numbers that wrap at 2**256 and the credited amounts are truncated to uint128,
+so every subtraction and cast below wraps the same way the Solidity 0.7 contracts do.
+The inputs are `feeGrowthGlobal0X128`/`feeGrowthGlobal1X128`, the pool's `slot0` tick and the
+`feeGrowthOutside0X128`/`feeGrowthOutside1X128` fields (indices 2 and 3) of `ticks(tickLower)` and `ticks(tickUpper)`.
+"""
+from tick_math import MAX_UINT256, Q128
+
+MAX_UINT128 = (1 << 128) - 1
+
+
+def _sub256(a: int, b: int) -> int:
+    return (a - b) & MAX_UINT256
+
+
+def fee_growth_inside(tick_current: int, tick_lower: int, tick_upper: int, fee_growth_global: int,
+                      lower_fee_growth_outside: int, upper_fee_growth_outside: int) -> int:
+    """Tick.getFeeGrowthInside for one token: the fee growth per unit of liquidity inside [tick_lower, tick_upper)."""
+    if tick_current >= tick_lower:
+        fee_growth_below = lower_fee_growth_outside
+    else:
+        fee_growth_below = _sub256(fee_growth_global, lower_fee_growth_outside)
+    if tick_current < tick_upper:
+        fee_growth_above = upper_fee_growth_outside
+    else:
+        fee_growth_above = _sub256(fee_growth_global, upper_fee_growth_outside)
+    return _sub256(_sub256(fee_growth_global, fee_growth_below), fee_growth_above)
+
+
+def fees_accrued(liquidity: int, fee_growth_inside_now: int, fee_growth_inside_last: int) -> int:
+    """Position.update: fees earned by `liquidity` since the position's fee growth was last checkpointed."""
+    return (_sub256(fee_growth_inside_now, fee_growth_inside_last) * liquidity // Q128) & MAX_UINT128
+
+
+def uncollected_fees(position_info, tick_current: int, fee_growth_global0: int, fee_growth_global1: int,
+                     lower_tick_info, upper_tick_info) -> tuple[int, int]:
+    """
+    Raw TOKEN0/TOKEN1 amounts a `collect` of the position would return right now (excluding principal from
+    a decreaseLiquidity, which is also in tokensOwed until collected).
+    `position_info` is the `positions(tokenId)` tuple; the tick infos are `ticks()` results of its boundary ticks.
+    """
+    tick_lower, tick_upper, liquidity = position_info[5], position_info[6], position_info[7]
+    owed = []
+    for fee_growth_global, outside_index, inside_last, tokens_owed in (
+        (fee_growth_global0, 2, position_info[8], position_info[10]),
+        (fee_growth_global1, 3, position_info[9], position_info[11]),
+    ):
+        inside = fee_growth_inside(tick_current, tick_lower, tick_upper, fee_growth_global,
+                                   lower_tick_info[outside_index], upper_tick_info[outside_index])
+        owed.append((tokens_owed + fees_accrued(liquidity, inside, inside_last)) & MAX_UINT128)
+    return owed[0], owed[1]
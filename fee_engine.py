@@ -0,0 +1,145 @@
+"""
+EIP-1559 fee and gas-limit engine for the transaction pipeline.
+
+- Fees: a rolling window of `eth_feeHistory` (base fee and priority-fee percentiles per block) is
+  topped up at most once per block time, fetching only the blocks added since the last refresh.
+  `fee_params(urgency)` turns it into `maxFeePerGas`/`maxPriorityFeePerGas`: the tip is the median,
+  over the window, of the urgency's reward percentile, and the max fee leaves room for the base fee
+  to double. Networks without a base fee get a legacy `gasPrice`.
+- Gas limits: `estimate_gas` results are cached per call shape (contract address + function, e.g. the
+  NFT manager's `mint`) and raised by the gas actually used by successful transactions, so repeated
+  approve/mint/decreaseLiquidity/collect calls skip the estimate round trip. Transactions that depend
+  on others still pending (which can't be estimated yet) use the cached value too.
+"""
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+
+from hexbytes import HexBytes
+
+# Percentile of recent priority fees paid for each urgency level.
+URGENCY_PERCENTILES = {
+    "low": 10,
+    "medium": 50,
+    "high": 90,
+}
+# Blocks of fee history kept in the window.
+FEE_HISTORY_BLOCKS = 20
+# maxFeePerGas = BASE_FEE_HEADROOM * next base fee + tip. The base fee can rise 12.5% per block,
+# so 2x keeps the transaction valid through about six full blocks.
+BASE_FEE_HEADROOM = 2
+
+
+class FeeEngine:
+    def __init__(self, w3, block_time_seconds: float = 12, gas_limit_margin: Decimal = Decimal("1.2"),
+                 gas_estimate_ttl_seconds: float = 60 * 60):
+        self.w3 = w3
+        self.block_time_seconds = block_time_seconds
+        self.gas_limit_margin = Decimal(gas_limit_margin)
+        self.gas_estimate_ttl_seconds = gas_estimate_ttl_seconds
+        self.eip1559 = True # Switched off if the node reports no base fee
+        # Rolling window: one (block_number, base_fee, {percentile: reward}) entry per block
+        self._history = deque(maxlen=FEE_HISTORY_BLOCKS)
+        self._next_base_fee = None
+        self._refreshed_at = 0
+        self._gas_price = None
+        # (contract address, function name) -> (highest estimate or gas used seen, time of the last estimate)
+        self._gas_estimates = {}
+        self._lock = threading.Lock()
+
+    # --- Fees ---
+
+    def refresh(self, force: bool = False):
+        """Tops up the fee history window with the blocks mined since the last refresh (at most once per block)."""
+        with self._lock:
+            elapsed = time.time() - self._refreshed_at
+            if not force and elapsed < self.block_time_seconds:
+                return
+            if not self.eip1559:
+                self._gas_price = self.w3.eth.gas_price
+                self._refreshed_at = time.time()
+                return
+            # Only the blocks added since the last refresh are fetched (plus one to be safe).
+            block_count = FEE_HISTORY_BLOCKS if not self._history else min(FEE_HISTORY_BLOCKS, int(elapsed / self.block_time_seconds) + 1)
+            percentiles = sorted(URGENCY_PERCENTILES.values())
+            fee_history = self.w3.eth.fee_history(block_count, "latest", percentiles)
+            base_fees = fee_history["baseFeePerGas"]
+            if not any(base_fees):
+                print("Network reports no base fee. Using legacy gasPrice.")
+                self.eip1559 = False
+                self._gas_price = self.w3.eth.gas_price
+                self._refreshed_at = time.time()
+                return
+            last_block = self._history[-1][0] if self._history else -1
+            oldest_block = fee_history["oldestBlock"]
+            for offset, rewards in enumerate(fee_history["reward"]):
+                block_number = oldest_block + offset
+                if block_number > last_block:
+                    self._history.append((block_number, base_fees[offset], dict(zip(percentiles, rewards))))
+            # baseFeePerGas has one extra entry: the base fee of the next block
+            self._next_base_fee = base_fees[-1]
+            self._refreshed_at = time.time()
+
+    def fee_params(self, urgency: str = "medium") -> dict:
+        """Fee fields for a new transaction at the given urgency ("low", "medium" or "high")."""
+        self.refresh()
+        if not self.eip1559:
+            return {'gasPrice': self._gas_price}
+        percentile = URGENCY_PERCENTILES[urgency]
+        with self._lock:
+            rewards = sorted(entry[2][percentile] for entry in self._history)
+            next_base_fee = self._next_base_fee
+        max_priority_fee = rewards[len(rewards) // 2] if rewards else 0
+        return {
+            'maxFeePerGas': BASE_FEE_HEADROOM * next_base_fee + max_priority_fee,
+            'maxPriorityFeePerGas': max_priority_fee,
+        }
+
+    def expected_gas_price(self, urgency: str = "medium") -> int:
+        """Gas price a transaction is expected to actually pay (next base fee + tip), e.g. to budget transaction costs."""
+        fees = self.fee_params(urgency)
+        if not self.eip1559:
+            return fees['gasPrice']
+        with self._lock:
+            next_base_fee = self._next_base_fee
+        return next_base_fee + fees['maxPriorityFeePerGas']
+
+    # --- Gas limits ---
+
+    @staticmethod
+    def call_shape(tx) -> tuple:
+        """Cache key for a contract function call: what it calls, not with which arguments."""
+        if tx.fn_name == "multicall":
+            # A multicall's gas depends on what it bundles (e.g. a rebalance vs. a permit + mint), so the
+            # selectors of its inner calls are part of the key.
+            return (tx.address, tx.fn_name) + tuple(HexBytes(call)[:4].hex() for call in tx.args[0])
+        return (tx.address, tx.fn_name)
+
+    def cached_gas_limit(self, tx, default: int | None = None) -> int | None:
+        """Gas limit from the cache for this call shape, without any RPC call; `default` if never seen."""
+        with self._lock:
+            cached = self._gas_estimates.get(self.call_shape(tx))
+        if cached is None:
+            return default
+        return int(cached[0] * self.gas_limit_margin)
+
+    def gas_limit(self, tx, sender: str) -> int:
+        """Gas limit for a transaction: the cached estimate for its call shape, or a fresh `estimate_gas`."""
+        shape = self.call_shape(tx)
+        with self._lock:
+            cached = self._gas_estimates.get(shape)
+        if cached is not None and time.time() - cached[1] < self.gas_estimate_ttl_seconds:
+            return int(cached[0] * self.gas_limit_margin)
+        estimate = tx.estimate_gas({'from': sender})
+        with self._lock:
+            previous = self._gas_estimates.get(shape, (0, 0))[0]
+            self._gas_estimates[shape] = (max(estimate, previous), time.time())
+        return int(max(estimate, previous) * self.gas_limit_margin)
+
+    def record_gas_used(self, shape: tuple, gas_used: int):
+        """Raises the cached value for a call shape if a successful transaction used more gas than estimated."""
+        with self._lock:
+            estimate, estimated_at = self._gas_estimates.get(shape, (0, 0))
+            if gas_used > estimate:
+                self._gas_estimates[shape] = (gas_used, estimated_at)
@@ -0,0 +1,134 @@
+"""
+Closed-form delta and gamma of Uniswap V3 range positions.
+
+With P the price (TOKEN1 per TOKEN0), L the liquidity and [Pa, Pb] the range, the position's value in TOKEN1 is
+- below the range: V = L * (1/sqrt(Pa) - 1/sqrt(Pb)) * P            (all TOKEN0)
+- inside the range: V = L * (2*sqrt(P) - sqrt(Pa) - P/sqrt(Pb))
+- above the range: V = L * (sqrt(Pb) - sqrt(Pa))                     (all TOKEN1)
+so the greeks with respect to P are
+- delta = dV/dP = L * (1/sqrt(clip(P, Pa, Pb)) - 1/sqrt(Pb)), which is exactly the TOKEN0 amount the position holds,
+- gamma = d2V/dP2 = -L / (2 * P^1.5) inside the range and 0 outside (a short gamma position).
+
+`position_greeks` evaluates one position exactly (integer LiquidityAmounts math for delta, Decimal for gamma).
+`hedge_band_sqrt_prices` inverts delta in closed form: the prices at which the position's delta leaves the
+hedge band around the current short, so a scheduler knows in advance at which price the next hedge is due.
+`greeks_grid` evaluates many positions over a whole price grid at once with NumPy broadcasting, and
+`next_hedge_prices` reads the band crossings of any (e.g. summed) delta curve off such a grid.
+"""
+from decimal import Decimal
+
+import tick_math
+
+# NumPy is only needed for the grid functions, so the live bot doesn't depend on it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+GRID_AVAILABLE = np is not None
+
+
+def human_liquidity(liquidity: int, decimals0: int, decimals1: int) -> Decimal:
+    """Liquidity in human-readable units, so amounts come out in whole tokens when prices are human-readable."""
+    return Decimal(liquidity) / Decimal(10**(decimals0 + decimals1)).sqrt()
+
+
+def position_greeks(sqrt_price_x96: int, tick_lower: int, tick_upper: int, liquidity: int,
+                    decimals0: int, decimals1: int) -> tuple[Decimal, Decimal]:
+    """
+    Returns (delta, gamma) of a range position at the current price.
+    Delta is in TOKEN0 units (what to short to be neutral); gamma is the change of delta per unit of
+    price (TOKEN0 per TOKEN1-per-TOKEN0), negative inside the range.
+    """
+    sqrt_lower_x96 = tick_math.get_sqrt_ratio_at_tick(tick_lower)
+    sqrt_upper_x96 = tick_math.get_sqrt_ratio_at_tick(tick_upper)
+    # The TOKEN0 amount is the delta, and the integer port gives it to the wei
+    amount0, _ = tick_math.get_amounts_for_liquidity(sqrt_price_x96, sqrt_lower_x96, sqrt_upper_x96, liquidity)
+    delta = Decimal(amount0) / Decimal(10**decimals0)
+    if not sqrt_lower_x96 < sqrt_price_x96 < sqrt_upper_x96:
+        return delta, Decimal("0")
+    price = tick_math.sqrt_price_x96_to_price(sqrt_price_x96, decimals0, decimals1)
+    gamma = -human_liquidity(liquidity, decimals0, decimals1) / (2 * price * price.sqrt())
+    return delta, gamma
+
+
+def _sqrt_price_at_delta(delta_raw: int, sqrt_upper_x96: int, liquidity: int) -> int:
+    """Inverse of the in-range delta: the sqrtPriceX96 at which the position holds `delta_raw` of TOKEN0."""
+    # delta = L * Q96 * (sqrt_upper - s) / (s * sqrt_upper)  =>  s = L * Q96 * sqrt_upper / (delta * sqrt_upper + L * Q96)
+    return liquidity * tick_math.Q96 * sqrt_upper_x96 // (delta_raw * sqrt_upper_x96 + liquidity * tick_math.Q96)
+
+
+def hedge_band_sqrt_prices(tick_lower: int, tick_upper: int, liquidity: int, hedged_short: Decimal,
+                           hedge_threshold: Decimal, decimals0: int) -> tuple[int, int]:
+    """
+    Returns (low_x96, high_x96): the position's delta stays within `hedge_threshold` of `hedged_short`
+    while low_x96 <= sqrtPriceX96 <= high_x96. Below low_x96 it is too long (the short must grow),
+    above high_x96 too short. A side that can never be crossed is 0 (low) or MAX_SQRT_RATIO (high).
+    """
+    sqrt_lower_x96 = tick_math.get_sqrt_ratio_at_tick(tick_lower)
+    sqrt_upper_x96 = tick_math.get_sqrt_ratio_at_tick(tick_upper)
+    # Delta is largest (all TOKEN0) at or below the range and zero at or above it
+    max_delta_raw = tick_math.get_amount0_delta(sqrt_lower_x96, sqrt_upper_x96, liquidity)
+    upper_band_raw = int((hedged_short + hedge_threshold) * Decimal(10**decimals0))
+    lower_band_raw = int((hedged_short - hedge_threshold) * Decimal(10**decimals0))
+
+    if upper_band_raw >= max_delta_raw:
+        low_x96 = 0
+    elif upper_band_raw < 0:
+        low_x96 = tick_math.MAX_SQRT_RATIO # Already outside the band at any price
+    else:
+        low_x96 = _sqrt_price_at_delta(upper_band_raw, sqrt_upper_x96, liquidity)
+
+    if lower_band_raw <= 0:
+        high_x96 = tick_math.MAX_SQRT_RATIO
+    elif lower_band_raw > max_delta_raw:
+        high_x96 = 0 # Already outside the band at any price
+    else:
+        high_x96 = _sqrt_price_at_delta(lower_band_raw, sqrt_upper_x96, liquidity)
+    return low_x96, high_x96
+
+
+def price_grid(price: float, width: float = 0.2, points: int = 2001):
+    """Evenly spaced prices from price * (1 - width) to price * (1 + width)."""
+    if np is None:
+        raise Exception("price_grid needs NumPy (pip install numpy).")
+    return np.linspace(price * (1 - width), price * (1 + width), points)
+
+
+def greeks_grid(prices, liquidities, tick_lowers, tick_uppers, decimals0, decimals1):
+    """
+    Vectorized delta and gamma of many positions over a price grid (float version of `position_greeks`).
+    `prices` is a 1-D array of human-readable prices; the position arguments are scalars or 1-D arrays
+    with one entry per position. Returns (delta, gamma) arrays of shape (positions, prices); sum them
+    over axis 0 for the greeks of a portfolio.
+    """
+    if np is None:
+        raise Exception("greeks_grid needs NumPy (pip install numpy).")
+    prices = np.asarray(prices, dtype=float)[np.newaxis, :]
+    decimals0 = np.atleast_1d(np.asarray(decimals0, dtype=float))[:, np.newaxis]
+    decimals1 = np.atleast_1d(np.asarray(decimals1, dtype=float))[:, np.newaxis]
+    liquidity = np.atleast_1d(np.asarray(liquidities, dtype=float))[:, np.newaxis] / 10 ** ((decimals0 + decimals1) / 2)
+    # Human-readable price at a tick: 1.0001^tick * 10^(decimals0 - decimals1)
+    decimal_shift = 10 ** (decimals0 - decimals1)
+    lower_prices = 1.0001 ** np.atleast_1d(np.asarray(tick_lowers, dtype=float))[:, np.newaxis] * decimal_shift
+    upper_prices = 1.0001 ** np.atleast_1d(np.asarray(tick_uppers, dtype=float))[:, np.newaxis] * decimal_shift
+
+    delta = liquidity * (1.0 / np.sqrt(np.clip(prices, lower_prices, upper_prices)) - 1.0 / np.sqrt(upper_prices))
+    in_range = (prices > lower_prices) & (prices < upper_prices)
+    gamma = np.where(in_range, -liquidity / (2.0 * prices ** 1.5), 0.0)
+    return delta, gamma
+
+
+def next_hedge_prices(prices, delta, price: float, hedged_short: float, hedge_threshold: float) -> tuple[float | None, float | None]:
+    """
+    Reads a delta curve (e.g. a portfolio's summed `greeks_grid` delta) over the sorted price grid
+    `prices`: returns the nearest grid prices below and above `price` at which the delta leaves the
+    hedge band around `hedged_short`, or None on a side where it doesn't within the grid.
+    """
+    if np is None:
+        raise Exception("next_hedge_prices needs NumPy (pip install numpy).")
+    prices = np.asarray(prices, dtype=float)
+    outside = np.abs(np.asarray(delta, dtype=float) - hedged_short) > hedge_threshold
+    below = np.nonzero(outside & (prices < price))[0]
+    above = np.nonzero(outside & (prices > price))[0]
+    return (float(prices[below[-1]]) if len(below) else None,
+            float(prices[above[0]]) if len(above) else None)
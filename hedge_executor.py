@@ -0,0 +1,202 @@
+"""
+Hedge execution layer between `DerivativesManager` and the exchange client.
+
+- Position view: the signed position per contract (positive long, negative short) is read from the exchange
+  once and then kept up to date from the bot's own fills. It is re-read every `reconcile_seconds`, and
+  right away after a failed order, so a cycle normally costs no position request at all.
+- Netting: adjustments are queued per contract. While a contract is being worked, new adjustments (e.g.
+  from other portfolio workers, or the next cycle) are added to what is left to trade, so opposite
+  adjustments cancel out before they reach the exchange.
+- Slicing: a queued amount larger than `max_child_size` is sent as child orders of at most that size,
+  spaced `child_interval_seconds` apart (TWAP). With an interval of 0 each child is sent as soon as the
+  previous one filled, like an iceberg order's refills.
+
+`MockExchangeClient` implements the exchange client interface locally (positions, fills with a linear
+price impact, a count of API calls and an optional latency per call), so the executor and the bot's hedging
+can be run and benchmarked without an exchange.
+"""
+import threading
+import time
+from decimal import Decimal
+
+
+class MockExchangeClient:
+    """
+    Local stand-in for `DerivativesClient`. Market orders fill at once at the mark price moved against the
+    order by `impact_per_unit` (a fraction of the price per contract unit traded in one order).
+    Each API call first sleeps `latency` seconds, the round trip to a real exchange.
+    """
+    def __init__(self, mark_prices: dict[str, Decimal] | None = None, impact_per_unit: Decimal = Decimal("0.0005"),
+                 latency: float = 0):
+        self.mark_prices = dict(mark_prices or {})
+        self.impact_per_unit = Decimal(impact_per_unit)
+        self.latency = latency
+        self.positions = {} # symbol -> signed position
+        self.fills = [] # (symbol, side, amount, price) of every order
+        self.api_calls = {"get_market_price": 0, "get_current_position": 0, "place_order": 0}
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_market_price(self, symbol: str) -> Decimal:
+        self._wait()
+        with self._lock:
+            self.api_calls["get_market_price"] += 1
+            return self.mark_prices.get(symbol, Decimal("3000"))
+
+    def get_current_position(self, symbol: str) -> Decimal:
+        self._wait()
+        with self._lock:
+            self.api_calls["get_current_position"] += 1
+            return self.positions.get(symbol, Decimal("0"))
+
+    def place_order(self, symbol: str, side: str, amount: Decimal, order_type: str = "MARKET") -> Decimal:
+        """Fills the whole order and returns the filled amount."""
+        self._wait()
+        with self._lock:
+            self.api_calls["place_order"] += 1
+            direction = 1 if side == "BUY" else -1
+            mark_price = self.mark_prices.get(symbol, Decimal("3000"))
+            fill_price = mark_price * (1 + direction * self.impact_per_unit * amount)
+            self.positions[symbol] = self.positions.get(symbol, Decimal("0")) + direction * amount
+            self.fills.append((symbol, side, amount, fill_price))
+        print(f"Mock exchange filled {side} {amount} {symbol} at {fill_price:.2f}")
+        return amount
+
+    def slippage_cost(self, symbol: str) -> Decimal:
+        """Total paid over the mark price on all fills of `symbol`, in quote currency."""
+        mark_price = self.mark_prices.get(symbol, Decimal("3000"))
+        return sum((abs(price - mark_price) * amount for fill_symbol, _, amount, price in self.fills if fill_symbol == symbol), Decimal("0"))
+
+
+class HedgeExecutor:
+    """
+    Works queued position changes on an exchange client (`DerivativesClient` or `MockExchangeClient`).
+    Amounts are signed changes of the exchange position: negative sells (grows a short), positive buys.
+    """
+    def __init__(self, client, max_child_size: Decimal | None = None, child_interval_seconds: float = 0,
+                 reconcile_seconds: float = 15 * 60, order_type: str = "MARKET", on_fill=None, on_position=None):
+        self.client = client
+        self.max_child_size = None if max_child_size is None else Decimal(max_child_size)
+        self.child_interval_seconds = child_interval_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.order_type = order_type
+        # Optional callbacks, e.g. to persist the history and the view (state_store.py):
+        # on_fill(symbol, side, filled_amount, position_after) after each child order,
+        # on_position(symbol, position, read_at) whenever the view of a symbol changes.
+        self.on_fill = on_fill
+        self.on_position = on_position
+        self._positions = {} # symbol -> (signed position, time it was last read from the exchange)
+        self._pending = {} # symbol -> signed amount still to trade
+        self._working = set() # symbols with an execution loop running
+        self._lock = threading.Lock()
+
+    def position(self, symbol: str) -> Decimal:
+        """The signed position on `symbol`, from the local view unless it is due for reconciliation."""
+        with self._lock:
+            cached = self._positions.get(symbol)
+        if cached is not None and time.time() - cached[1] < self.reconcile_seconds:
+            return cached[0]
+        return self.reconcile(symbol)
+
+    def reconcile(self, symbol: str) -> Decimal:
+        """Re-reads the position from the exchange and replaces the local view with it."""
+        position = self.client.get_current_position(symbol)
+        read_at = time.time()
+        with self._lock:
+            self._positions[symbol] = (position, read_at)
+        if self.on_position is not None:
+            self.on_position(symbol, position, read_at)
+        return position
+
+    def seed(self, symbol: str, position: Decimal, read_at: float):
+        """
+        Restores a view saved by an earlier run. It is trusted until `reconcile_seconds` after it was last read
+        from the exchange, like a view kept in memory.
+        """
+        with self._lock:
+            self._positions.setdefault(symbol, (Decimal(position), read_at))
+
+    def invalidate(self, symbol: str):
+        """Forces the next `position` call to read the exchange (e.g. after a trade made outside the executor)."""
+        with self._lock:
+            self._positions.pop(symbol, None)
+
+    def submit(self, symbol: str, amount: Decimal):
+        """
+        Queues a signed position change and works the queue of `symbol` until it is empty. If the symbol is
+        already being worked (by another thread), the amount is netted into that queue and this returns at once.
+        """
+        with self._lock:
+            self._pending[symbol] = self._pending.get(symbol, Decimal("0")) + amount
+            if symbol in self._working:
+                print(f"Netted {amount} {symbol} into the adjustment already being executed.")
+                return
+            self._working.add(symbol)
+        try:
+            self._work(symbol)
+        except Exception:
+            with self._lock:
+                self._working.discard(symbol)
+            raise
+
+    def _next_child(self, symbol: str) -> Decimal:
+        """
+        Takes the next child order off the queue of `symbol`: at most `max_child_size`, keeping the sign.
+        An empty queue ends the symbol's execution loop, under the same lock `submit` nets into it with.
+        """
+        with self._lock:
+            remaining = self._pending.get(symbol, Decimal("0"))
+            if remaining == 0:
+                self._working.discard(symbol)
+                return remaining
+            child = remaining
+            if self.max_child_size is not None and abs(remaining) > self.max_child_size:
+                child = self.max_child_size if remaining > 0 else -self.max_child_size
+            self._pending[symbol] = remaining - child
+            return child
+
+    def _work(self, symbol: str):
+        """Sends the queued amount of `symbol` as child orders, updating the position view from each fill."""
+        child = self._next_child(symbol)
+        children = 0
+        while child != 0:
+            if children and self.child_interval_seconds:
+                time.sleep(self.child_interval_seconds)
+            side = "BUY" if child > 0 else "SELL"
+            try:
+                filled = self.client.place_order(symbol, side, abs(child), self.order_type)
+            except Exception:
+                # The fill is unknown: drop the queue and read the real position before the next decision
+                with self._lock:
+                    self._pending[symbol] = Decimal("0")
+                self.invalidate(symbol)
+                raise
+            # The conceptual client returns nothing for a market order; treat it as fully filled
+            filled = abs(child) if filled is None else Decimal(filled)
+            with self._lock:
+                position, read_at = self._positions.get(symbol, (None, 0))
+                if position is not None:
+                    position += filled if child > 0 else -filled
+                    self._positions[symbol] = (position, read_at)
+            if filled > 0:
+                if self.on_fill is not None:
+                    self.on_fill(symbol, side, filled, position)
+                if position is not None and self.on_position is not None:
+                    self.on_position(symbol, position, read_at)
+            with self._lock:
+                if filled == 0:
+                    # Nothing filled (e.g. no liquidity): stop here, the next decision starts from a fresh queue
+                    self._pending[symbol] = Decimal("0")
+                    self._working.discard(symbol)
+                    print(f"{side} {abs(child)} {symbol} did not fill. Dropping the rest of the adjustment.")
+                    return
+                if filled < abs(child):
+                    # Put the unfilled part back in the queue
+                    self._pending[symbol] += (abs(child) - filled) * (1 if child > 0 else -1)
+            children += 1
+            child = self._next_child(symbol)
+        if children > 1:
+            print(f"Executed the {symbol} adjustment in {children} child orders.")
@@ -0,0 +1,276 @@
+"""
+Backfills a pool's `Swap`, `Mint`, `Burn` and `Collect` logs into the state store (state_store.py).
+
+- The block range is cut into chunks fetched with raw `eth_getLogs` requests by a pool of worker threads.
+  Logs are decoded by slicing the topics and data words against precomputed event signatures, without
+  web3's response formatters or ABI decoding, which dominate the cost of large log ranges.
+- The chunk size adapts to the provider: a chunk rejected for being too large (block range or result
+  limits) is split in half and the shared chunk size shrinks; chunks that come back small let it grow again.
+  Providers refuse a range either with a JSON-RPC error or with an HTTP error status (e.g. 400 with the reason
+  in the body), which web3 raises; `is_range_error` recognizes both.
+- Each chunk's events and its block range are committed together, so an interrupted backfill resumes by
+  fetching only the ranges that are not in `ingested_ranges` yet.
+
+`fetch_logs` is the same chunked, splitting fetch on one thread for short ranges, e.g. the event-driven warm start.
+
+Run it with `python log_ingester.py FROM_BLOCK [TO_BLOCK]` for the pool configured in Config.
+"""
+import sys
+import threading
+import time
+
+from web3 import Web3
+
+from event_trigger import SWAP_TOPIC
+
+# keccak256 of the pool event signatures
+MINT_TOPIC = "0x7a53080ba414158be7ec69b987b5fb7d07dee101fe85488f0853ae16239d0bde" # Mint(address,address,int24,int24,uint128,uint256,uint256)
+BURN_TOPIC = "0x0c396cd989a39f4459b5fa1aed6a9a8dcdbc45908acfd67e028cd568da98982c" # Burn(address,int24,int24,uint128,uint256,uint256)
+COLLECT_TOPIC = "0x70935338e69775456a85ddef226c395fb668b63fa0115f5f20610b388e6ca9c0" # Collect(address,address,int24,int24,uint128,uint128)
+EVENT_KINDS = {SWAP_TOPIC: "swap", MINT_TOPIC: "mint", BURN_TOPIC: "burn", COLLECT_TOPIC: "collect"}
+
+# Most providers cap eth_getLogs at 10,000 results; a chunk returning less than this many logs grows the chunk size.
+GROW_BELOW_LOGS = 2500
+# Words of provider errors that mean the request was too large rather than failed
+RANGE_ERROR_WORDS = ("range", "limit", "exceed", "too many", "more than", "too large", "size")
+# ...unless they are about throttling, which is retried like any transient error
+RATE_LIMIT_WORDS = ("rate limit", "too many requests", "rate exceeded")
+
+
+def is_range_error(error) -> bool:
+    """
+    True if a failed eth_getLogs request was refused as too large. `error` is the JSON-RPC error of the response,
+    or the exception raised for an HTTP error status (whose response body carries the provider's reason).
+    Connection errors and timeouts, which have no response, are not.
+    """
+    if isinstance(error, BaseException):
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+        if status is None or status == 429:
+            return False
+        if status == 413:
+            return True
+        message = f"{error} {getattr(response, 'text', '')}"
+    elif isinstance(error, dict):
+        if error.get("code") == -32005:
+            return True
+        message = str(error.get("message", error))
+    else:
+        message = str(error)
+    message = message.lower()
+    return not any(word in message for word in RATE_LIMIT_WORDS) and any(word in message for word in RANGE_ERROR_WORDS)
+
+
+def _word(data: bytes, index: int, signed: bool = False) -> int:
+    return int.from_bytes(data[32 * index:32 * index + 32], "big", signed=signed)
+
+
+def _topic_int(topic: str) -> int:
+    """An indexed int24 (tick) topic, sign-extended to 32 bytes."""
+    return int.from_bytes(bytes.fromhex(topic[2:]), "big", signed=True)
+
+
+def _topic_address(topic: str) -> str:
+    return "0x" + topic[-40:]
+
+
+def decode_pool_log(log: dict) -> tuple:
+    """
+    Decodes a raw (hex) pool log into a `StateStore.record_pool_events` row:
+    (block_number, log_index, timestamp, kind, owner, tick_lower, tick_upper, liquidity, amount0, amount1, sqrt_price_x96, tick).
+    For swaps `owner` is the sender and `liquidity` the pool's in-range liquidity after the swap;
+    for mints and burns it is the liquidity added or removed.
+    """
+    topics = log["topics"]
+    kind = EVENT_KINDS[topics[0]]
+    data = bytes.fromhex(log["data"][2:])
+    timestamp = int(log["blockTimestamp"], 16) if log.get("blockTimestamp") else None
+    head = (int(log["blockNumber"], 16), int(log["logIndex"], 16), timestamp, kind, _topic_address(topics[1]))
+    if kind == "swap":
+        # data: amount0 (int256), amount1 (int256), sqrtPriceX96 (uint160), liquidity (uint128), tick (int24)
+        return head + (None, None, str(_word(data, 3)), str(_word(data, 0, True)), str(_word(data, 1, True)), str(_word(data, 2)), _word(data, 4, True))
+    ticks = (_topic_int(topics[2]), _topic_int(topics[3]))
+    if kind == "mint":
+        # data: sender (address), amount (uint128), amount0 (uint256), amount1 (uint256)
+        return head + ticks + (str(_word(data, 1)), str(_word(data, 2)), str(_word(data, 3)), None, None)
+    if kind == "burn":
+        # data: amount (uint128), amount0 (uint256), amount1 (uint256)
+        return head + ticks + (str(_word(data, 0)), str(_word(data, 1)), str(_word(data, 2)), None, None)
+    # collect data: recipient (address), amount0 (uint128), amount1 (uint128)
+    return head + ticks + (None, str(_word(data, 1)), str(_word(data, 2)), None, None)
+
+
+class RangeTooLarge(Exception):
+    """The provider refused a block range as too large."""
+
+
+def request_logs(w3: Web3, params: dict, retries: int = 5) -> list[dict]:
+    """
+    One raw eth_getLogs request for the filter `params` (hex block numbers), retried with backoff on transient
+    errors. Raises RangeTooLarge if the provider refuses the range.
+    """
+    for attempt in range(retries):
+        try:
+            response = w3.provider.make_request("eth_getLogs", [params])
+        except Exception as e:
+            error = e
+        else:
+            if "error" not in response:
+                return response["result"]
+            error = response["error"]
+        if is_range_error(error):
+            raise RangeTooLarge(str(error))
+        time.sleep(2 ** attempt)
+    raise Exception(f"eth_getLogs {int(params['fromBlock'], 16)}-{int(params['toBlock'], 16)} failed after {retries} attempts: {error}")
+
+
+def fetch_logs(w3: Web3, params: dict, from_block: int, to_block: int, chunk_blocks: int = 2000, retries: int = 5) -> list[dict]:
+    """
+    The raw logs matching `params` (address and topics) in [from_block, to_block], in block order. They are
+    fetched in chunks of at most `chunk_blocks` blocks; a chunk the provider refuses is halved, and so is every
+    later one. Removed (reorged) logs are left out.
+    """
+    logs = []
+    start = from_block
+    while start <= to_block:
+        end = min(to_block, start + chunk_blocks - 1)
+        try:
+            chunk = request_logs(w3, {**params, "fromBlock": hex(start), "toBlock": hex(end)}, retries)
+        except RangeTooLarge:
+            if end == start:
+                raise Exception(f"Block {start} alone exceeds the provider's log limit.")
+            chunk_blocks = (end - start + 1) // 2
+            continue
+        logs.extend(log for log in chunk if not log.get("removed"))
+        start = end + 1
+    return logs
+
+
+class LogIngester:
+    def __init__(self, w3: Web3, state_store, pool_address: str, workers: int = 8, chunk_blocks: int = 2000,
+                 max_chunk_blocks: int = 100_000, confirmations: int = 12, retries: int = 5):
+        self.w3 = w3
+        self.state_store = state_store
+        self.pool_address = Web3.to_checksum_address(pool_address)
+        self.workers = workers
+        self.chunk_blocks = chunk_blocks
+        # Lowered to just below any chunk size the provider rejected, so the chunk size doesn't grow back into it
+        self.max_chunk_blocks = max_chunk_blocks
+        # Blocks this close to the head may still be reorged, so they are left for a later run
+        self.confirmations = confirmations
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._ranges = [] # Block ranges still to fetch, [from_block, to_block], lowest first
+        self._error = None
+        self._events = 0
+        self._chunks = 0
+
+    def missing_ranges(self, from_block: int, to_block: int) -> list[list[int]]:
+        """The parts of [from_block, to_block] not ingested yet."""
+        missing = []
+        cursor = from_block
+        for start, end in self.state_store.ingested_ranges(self.pool_address):
+            if end < cursor:
+                continue
+            if start > to_block:
+                break
+            if start > cursor:
+                missing.append([cursor, start - 1])
+            cursor = end + 1
+        if cursor <= to_block:
+            missing.append([cursor, to_block])
+        return missing
+
+    def run(self, from_block: int, to_block: int | None = None) -> int:
+        """Ingests the missing parts of [from_block, to_block] (default: the confirmed head). Returns the number of events stored."""
+        if to_block is None:
+            to_block = self.w3.eth.block_number - self.confirmations
+        self._ranges = self.missing_ranges(from_block, to_block)
+        total_blocks = sum(end - start + 1 for start, end in self._ranges)
+        if not total_blocks:
+            print(f"Blocks {from_block}-{to_block} of {self.pool_address} are already ingested.")
+            return 0
+        print(f"Ingesting {total_blocks} blocks of {self.pool_address} logs in {len(self._ranges)} ranges with {self.workers} workers...")
+        self._error = None
+        self._events = 0
+        self._chunks = 0
+        started = time.time()
+        threads = [threading.Thread(target=self._worker, name=f"log-ingester-{i}", daemon=True) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise Exception(f"Log ingestion stopped ({self._error}). Run it again to resume.")
+        print(f"Ingested {self._events} events in {self._chunks} chunks in {time.time() - started:.1f} seconds.")
+        return self._events
+
+    def _take(self) -> tuple[int, int] | None:
+        """Cuts the next chunk off the lowest remaining range."""
+        with self._lock:
+            if not self._ranges or self._error is not None:
+                return None
+            start, end = self._ranges[0]
+            chunk_end = min(end, start + self.chunk_blocks - 1)
+            if chunk_end == end:
+                self._ranges.pop(0)
+            else:
+                self._ranges[0][0] = chunk_end + 1
+            return start, chunk_end
+
+    def _worker(self):
+        while True:
+            chunk = self._take()
+            if chunk is None:
+                return
+            start, end = chunk
+            try:
+                logs = self._fetch(start, end)
+            except RangeTooLarge:
+                with self._lock:
+                    if end == start:
+                        self._error = f"block {start} alone exceeds the provider's log limit"
+                        return
+                    # Split the chunk and make every later chunk at most the size of a half
+                    middle = (start + end) // 2
+                    self.max_chunk_blocks = max(1, min(self.max_chunk_blocks, end - start))
+                    self.chunk_blocks = max(1, min(self.chunk_blocks, middle - start + 1))
+                    self._ranges[:0] = [[start, middle], [middle + 1, end]]
+                continue
+            except Exception as e:
+                with self._lock:
+                    self._error = e
+                return
+            rows = [decode_pool_log(log) for log in logs if not log.get("removed")]
+            self.state_store.record_pool_events(self.pool_address, start, end, rows)
+            with self._lock:
+                self._events += len(rows)
+                self._chunks += 1
+                if len(logs) < GROW_BELOW_LOGS and end - start + 1 >= self.chunk_blocks:
+                    self.chunk_blocks = min(self.max_chunk_blocks, self.chunk_blocks * 2)
+                if self._chunks % 100 == 0:
+                    print(f"{self._chunks} chunks, {self._events} events ingested (chunk size {self.chunk_blocks} blocks).")
+
+    def _fetch(self, start: int, end: int) -> list[dict]:
+        """One raw eth_getLogs request for the chunk (see `request_logs`)."""
+        return request_logs(self.w3, {
+            "address": self.pool_address,
+            "topics": [list(EVENT_KINDS)],
+            "fromBlock": hex(start),
+            "toBlock": hex(end),
+        }, self.retries)
+
+
+if __name__ == "__main__":
+    from state_store import StateStore
+    from uniswap_lp_bot import BlockchainClient, Config
+
+    config = Config()
+    client = BlockchainClient(config)
+    factory = client.get_contract(config.UNISWAP_FACTORY_ADDRESS, config.UNISWAP_FACTORY_ABI)
+    pool_address = factory.functions.getPool(
+        Web3.to_checksum_address(config.TOKEN0_ADDRESS), Web3.to_checksum_address(config.TOKEN1_ADDRESS), config.POOL_FEE
+    ).call()
+    ingester = LogIngester(client.w3, StateStore(config.STATE_DB_FILE), pool_address, config.INGEST_WORKERS,
+                           config.INGEST_CHUNK_BLOCKS, confirmations=config.INGEST_CONFIRMATIONS)
+    ingester.run(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,247 @@
+"""
+Latency histograms, counters and gauges for the bot, served in the Prometheus text format.
+
+Everything is recorded into the module-level `REGISTRY`:
+- every JSON-RPC request, through a web3 middleware (`rpc_middleware`, `async_rpc_middleware`), by method,
+- the health, failovers and hedged reads of each endpoint of a provider pool (rpc_pool.py),
+- every derivatives exchange call, through `InstrumentedClient`, by client method,
+- transactions from submission to receipt, their outcome, gas used and fees paid (tx_pipeline.py),
+- the reads of each Chainlink feed, and the age and staleness of its last round (price_feeds.py),
+- the size of Multicall3 batches, and the duration of each cycle stage (`timed`).
+
+Recording an observation is a bisect and a few additions under a lock (about a microsecond), so it stays on
+in the hot path. `start_server` serves the registry at http://METRICS_HOST:METRICS_PORT/metrics from a
+daemon thread; nothing is formatted until it is scraped.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tracing
+
+# Latency buckets in seconds, from a fast local eth_call up to a slow receipt wait
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: tuple, values: tuple, extra: tuple = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"] + [
+            f"{self.name}{_label_text(self.labelnames, labels)} {value}" for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {} # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+RPC_SECONDS = REGISTRY.register(Histogram("lpbot_rpc_request_seconds", "JSON-RPC request latency by method.", ("method",)))
+RPC_ERRORS = REGISTRY.register(Counter("lpbot_rpc_errors_total", "JSON-RPC requests that raised or returned an error, by method.", ("method",)))
+RPC_ENDPOINT_LATENCY = REGISTRY.register(Gauge("lpbot_rpc_endpoint_latency_seconds", "EWMA latency of each RPC endpoint (rpc_pool.py).", ("endpoint",)))
+RPC_ENDPOINT_ERROR_RATE = REGISTRY.register(Gauge("lpbot_rpc_endpoint_error_rate", "EWMA error rate of each RPC endpoint.", ("endpoint",)))
+RPC_ENDPOINT_ERRORS = REGISTRY.register(Counter("lpbot_rpc_endpoint_errors_total", "Failed requests (exceptions and transient errors) by RPC endpoint.", ("endpoint",)))
+RPC_FAILOVERS = REGISTRY.register(Counter("lpbot_rpc_failovers_total", "JSON-RPC requests retried on another endpoint, by method.", ("method",)))
+RPC_HEDGED = REGISTRY.register(Counter("lpbot_rpc_hedged_total", "Reads also sent to a second endpoint after the hedge deadline, by method.", ("method",)))
+BATCH_CALL_SIZE = REGISTRY.register(Histogram("lpbot_batch_call_size", "Contract calls per Multicall3 batch.", (), SIZE_BUCKETS))
+EXCHANGE_SECONDS = REGISTRY.register(Histogram("lpbot_exchange_request_seconds", "Derivatives exchange API latency by call.", ("method",)))
+EXCHANGE_ERRORS = REGISTRY.register(Counter("lpbot_exchange_errors_total", "Derivatives exchange API calls that raised, by call.", ("method",)))
+TX_SECONDS = REGISTRY.register(Histogram("lpbot_transaction_seconds", "Time from sending a transaction to its receipt, by outcome.", ("status",)))
+TX_TOTAL = REGISTRY.register(Counter("lpbot_transactions_total", "Transactions by outcome (success, reverted, cancelled, send_error).", ("status",)))
+GAS_USED = REGISTRY.register(Counter("lpbot_gas_used_total", "Gas used by mined transactions."))
+GAS_FEES_WEI = REGISTRY.register(Counter("lpbot_gas_fees_wei_total", "Fees paid by mined transactions, in wei."))
+STAGE_SECONDS = REGISTRY.register(Histogram("lpbot_stage_seconds", "Duration of cycle stages (the whole cycle is stage=\"cycle\").", ("stage",)))
+STAGE_ERRORS = REGISTRY.register(Counter("lpbot_stage_errors_total", "Cycle stages that raised, by stage.", ("stage",)))
+CHAINLINK_READS = REGISTRY.register(Counter("lpbot_chainlink_reads_total", "latestRoundData reads by Chainlink feed (price_feeds.py).", ("feed",)))
+CHAINLINK_ROUND_AGE = REGISTRY.register(Gauge("lpbot_chainlink_round_age_seconds", "Age of the last round read from each Chainlink feed, when last priced.", ("feed",)))
+CHAINLINK_STALE = REGISTRY.register(Gauge("lpbot_chainlink_stale", "1 if the last round of a Chainlink feed is stale (past its heartbeat), else 0.", ("feed",)))
+LAST_CYCLE = REGISTRY.register(Gauge("lpbot_last_cycle_timestamp_seconds", "Unix time at which the last cycle finished."))
+
+
+class timed:
+    """
+    Context manager recording the duration of a block into a histogram (and errors into a counter), e.g. a cycle stage.
+    With a `trace_category`, the block is also a span of the cycle's trace when tracing is on (tracing.py).
+    """
+    __slots__ = ("histogram", "errors", "labels", "trace_category", "trace", "started")
+
+    def __init__(self, histogram: Histogram, *labels, errors: Counter | None = None, trace_category: str | None = None):
+        self.histogram = histogram
+        self.errors = errors
+        self.labels = labels
+        self.trace_category = trace_category
+
+    def __enter__(self):
+        self.trace = tracing.span(self.labels[0], self.trace_category) if self.trace_category else tracing.NOOP_SPAN
+        self.trace.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        self.trace.__exit__(exc_type, exc, tb)
+        if exc_type is not None and self.errors is not None:
+            self.errors.inc(1, *self.labels)
+        return False
+
+
+def stage(name: str) -> timed:
+    """Times a cycle stage."""
+    return timed(STAGE_SECONDS, name, errors=STAGE_ERRORS, trace_category="stage")
+
+
+def rpc_middleware(make_request, w3):
+    """web3 middleware timing every JSON-RPC request by method."""
+    def middleware(method, params):
+        started = time.perf_counter()
+        try:
+            with tracing.span(method, "rpc"):
+                response = make_request(method, params)
+        except Exception:
+            RPC_ERRORS.inc(1, method)
+            raise
+        finally:
+            RPC_SECONDS.observe(time.perf_counter() - started, method)
+        if "error" in response:
+            RPC_ERRORS.inc(1, method)
+        return response
+    return middleware
+
+
+async def async_rpc_middleware(make_request, w3):
+    """AsyncWeb3 counterpart of `rpc_middleware`."""
+    async def middleware(method, params):
+        started = time.perf_counter()
+        try:
+            with tracing.span(method, "rpc"):
+                response = await make_request(method, params)
+        except Exception:
+            RPC_ERRORS.inc(1, method)
+            raise
+        finally:
+            RPC_SECONDS.observe(time.perf_counter() - started, method)
+        if "error" in response:
+            RPC_ERRORS.inc(1, method)
+        return response
+    return middleware
+
+
+class InstrumentedClient:
+    """Wraps an exchange client so that each of its method calls is timed by name."""
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with timed(EXCHANGE_SECONDS, name, errors=EXCHANGE_ERRORS, trace_category="exchange"):
+                return attribute(*args, **kwargs)
+        return call
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes would otherwise print a line each
+
+
+_server = None
+
+
+def start_server(host: str, port: int):
+    """Serves /metrics on a daemon thread. Does nothing if the port is 0 or the server is already running."""
+    global _server
+    if not port or _server is not None:
+        return
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics served at http://{host}:{port}/metrics")
@@ -0,0 +1,1108 @@
+"""
+In-memory stand-in for the chain the bot talks to, served through a web3 provider.
+
+`MockProvider` answers the JSON-RPC methods the bot uses (eth_call, eth_sendRawTransaction, receipts, fee
+history, logs, ...) from a `MockChain`, after sleeping a configurable latency per request, so the unmodified
+bot runs offline with round trips of a chosen cost (see benchmarks.py). The chain holds Python contracts by
+address, called through the minimal ABIs in `ABIS`. Config loads its ABIs from abi/, so `workspace` writes
+them to a temporary directory and runs there.
+
+- `MockERC20`, `MockChainlinkFeed`, `MockMulticall3` and `MockFactory` behave like the real contracts.
+- `MockPool` has a price that is set directly (`set_price`), fee growth and tick data that are set directly
+  too, and a TWAP oracle of the prices it was set to.
+- `MockPositionManager` mints, increases, decreases, collects and burns positions with the exact
+  LiquidityAmounts math, and credits fees from the pool's fee growth (fee_accrual.py). It holds the tokens
+  itself, like the pool would hold those of every LP, so seed it with tokens (`MockERC20.mint_to`).
+- `MockSwapRouter` swaps through v3_simulator's pools, and fills a `MockPool` swap at its set price.
+- v3_simulator.py has a pool with real swaps, ticks and oracle in their place.
+
+Every transaction is mined into its own block as soon as it is sent. A reverted one is mined with status 0
+and leaves the state untouched. Block timestamps follow the wall clock (or a fixed `start_time`), plus whatever
+`advance` added.
+"""
+import copy
+import functools
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+import rlp
+from eth_abi import decode as abi_decode, encode as abi_encode
+from eth_account import Account
+from eth_utils import keccak
+from eth_utils.abi import collapse_if_tuple
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+import fee_accrual
+import tick_math
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+MAX_UINT128 = (1 << 128) - 1
+# A well-known development key (the first Hardhat/Anvil account). Never fund it on a real network.
+TEST_PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+TEST_ADDRESS = Account.from_key(TEST_PRIVATE_KEY).address
+
+# Gas reported by estimates and receipts, by function name (roughly mainnet figures)
+GAS_USED = {
+    "approve": 46_000, "transfer": 52_000, "transferFrom": 60_000,
+    "mint": 380_000, "increaseLiquidity": 200_000, "decreaseLiquidity": 170_000,
+    "collect": 130_000, "burn": 60_000, "multicall": 650_000, "exactInputSingle": 130_000,
+}
+DEFAULT_GAS_USED = 100_000
+# Checksumming hashes the address, and the same few addresses are checksummed on every call
+_checksum = functools.lru_cache(maxsize=None)(Web3.to_checksum_address)
+
+
+# --- ABIs ---
+
+def _param(spec):
+    """An ABI parameter from "type name" or "type indexed name" (dicts, e.g. from `_struct`, pass through)."""
+    if isinstance(spec, dict):
+        return spec
+    words = spec.split()
+    param = {"type": words[0], "name": words[-1] if len(words) > 1 else ""}
+    if "indexed" in words:
+        param["indexed"] = True
+    return param
+
+
+def _struct(name: str, fields: list, array: bool = False) -> dict:
+    return {"type": "tuple[]" if array else "tuple", "name": name, "components": [_param(field) for field in fields]}
+
+
+def _function(name: str, inputs=(), outputs=(), mutability: str = "view") -> dict:
+    return {"type": "function", "name": name, "inputs": [_param(spec) for spec in inputs],
+            "outputs": [_param(spec) for spec in outputs], "stateMutability": mutability}
+
+
+def _event(name: str, inputs) -> dict:
+    return {"type": "event", "name": name, "inputs": [dict(_param(spec), indexed=" indexed " in spec) for spec in inputs], "anonymous": False}
+
+
+_ERC20_EVENTS = [
+    _event("Transfer", ["address indexed from", "address indexed to", "uint256 value"]),
+    _event("Approval", ["address indexed owner", "address indexed spender", "uint256 value"]),
+]
+
+# The functions and events of each contract the bot uses, under the file names Config loads them from.
+ABIS = {
+    "UniswapV3Factory.json": [
+        _function("getPool", ["address tokenA", "address tokenB", "uint24 fee"], ["address pool"]),
+        _function("feeAmountTickSpacing", ["uint24 fee"], ["int24"]),
+    ],
+    "UniswapV3Pool.json": [
+        _function("slot0", [], ["uint160 sqrtPriceX96", "int24 tick", "uint16 observationIndex", "uint16 observationCardinality",
+                                "uint16 observationCardinalityNext", "uint8 feeProtocol", "bool unlocked"]),
+        _function("liquidity", [], ["uint128"]),
+        _function("feeGrowthGlobal0X128", [], ["uint256"]),
+        _function("feeGrowthGlobal1X128", [], ["uint256"]),
+        _function("ticks", ["int24 tick"], ["uint128 liquidityGross", "int128 liquidityNet", "uint256 feeGrowthOutside0X128",
+                                            "uint256 feeGrowthOutside1X128", "int56 tickCumulativeOutside",
+                                            "uint160 secondsPerLiquidityOutsideX128", "uint32 secondsOutside", "bool initialized"]),
+        _function("observe", ["uint32[] secondsAgos"], ["int56[] tickCumulatives", "uint160[] secondsPerLiquidityCumulativeX128s"]),
+        _function("token0", [], ["address"]),
+        _function("token1", [], ["address"]),
+        _function("fee", [], ["uint24"]),
+        _function("tickSpacing", [], ["int24"]),
+        _function("increaseObservationCardinalityNext", ["uint16 observationCardinalityNext"], [], "nonpayable"),
+        _event("Mint", ["address sender", "address indexed owner", "int24 indexed tickLower", "int24 indexed tickUpper",
+                        "uint128 amount", "uint256 amount0", "uint256 amount1"]),
+        _event("Burn", ["address indexed owner", "int24 indexed tickLower", "int24 indexed tickUpper", "uint128 amount",
+                        "uint256 amount0", "uint256 amount1"]),
+        _event("Collect", ["address indexed owner", "address recipient", "int24 indexed tickLower", "int24 indexed tickUpper",
+                           "uint128 amount0", "uint128 amount1"]),
+        _event("Swap", ["address indexed sender", "address indexed recipient", "int256 amount0", "int256 amount1",
+                        "uint160 sqrtPriceX96", "uint128 liquidity", "int24 tick"]),
+    ],
+    "UniswapV3PositionManager.json": [
+        _function("positions", ["uint256 tokenId"], ["uint96 nonce", "address operator", "address token0", "address token1", "uint24 fee",
+                                                     "int24 tickLower", "int24 tickUpper", "uint128 liquidity",
+                                                     "uint256 feeGrowthInside0LastX128", "uint256 feeGrowthInside1LastX128",
+                                                     "uint128 tokensOwed0", "uint128 tokensOwed1"]),
+        _function("mint", [_struct("params", ["address token0", "address token1", "uint24 fee", "int24 tickLower", "int24 tickUpper",
+                                              "uint256 amount0Desired", "uint256 amount1Desired", "uint256 amount0Min",
+                                              "uint256 amount1Min", "address recipient", "uint256 deadline"])],
+                  ["uint256 tokenId", "uint128 liquidity", "uint256 amount0", "uint256 amount1"], "payable"),
+        _function("increaseLiquidity", [_struct("params", ["uint256 tokenId", "uint256 amount0Desired", "uint256 amount1Desired",
+                                                           "uint256 amount0Min", "uint256 amount1Min", "uint256 deadline"])],
+                  ["uint128 liquidity", "uint256 amount0", "uint256 amount1"], "payable"),
+        _function("decreaseLiquidity", [_struct("params", ["uint256 tokenId", "uint128 liquidity", "uint256 amount0Min",
+                                                           "uint256 amount1Min", "uint256 deadline"])],
+                  ["uint256 amount0", "uint256 amount1"], "payable"),
+        _function("collect", [_struct("params", ["uint256 tokenId", "address recipient", "uint128 amount0Max", "uint128 amount1Max"])],
+                  ["uint256 amount0", "uint256 amount1"], "payable"),
+        _function("burn", ["uint256 tokenId"], [], "payable"),
+        _function("multicall", ["bytes[] data"], ["bytes[] results"], "payable"),
+        _function("selfPermit", ["address token", "uint256 value", "uint256 deadline", "uint8 v", "bytes32 r", "bytes32 s"], [], "payable"),
+        _function("ownerOf", ["uint256 tokenId"], ["address"]),
+        _event("IncreaseLiquidity", ["uint256 indexed tokenId", "uint128 liquidity", "uint256 amount0", "uint256 amount1"]),
+        _event("DecreaseLiquidity", ["uint256 indexed tokenId", "uint128 liquidity", "uint256 amount0", "uint256 amount1"]),
+        _event("Collect", ["uint256 indexed tokenId", "address recipient", "uint256 amount0", "uint256 amount1"]),
+        _event("Transfer", ["address indexed from", "address indexed to", "uint256 indexed tokenId"]),
+    ],
+    "SwapRouter.json": [
+        _function("exactInputSingle", [_struct("params", ["address tokenIn", "address tokenOut", "uint24 fee", "address recipient",
+                                                          "uint256 deadline", "uint256 amountIn", "uint256 amountOutMinimum",
+                                                          "uint160 sqrtPriceLimitX96"])],
+                  ["uint256 amountOut"], "payable"),
+    ],
+    "ERC20.json": [
+        _function("name", [], ["string"]),
+        _function("symbol", [], ["string"]),
+        _function("decimals", [], ["uint8"]),
+        _function("totalSupply", [], ["uint256"]),
+        _function("balanceOf", ["address account"], ["uint256"]),
+        _function("allowance", ["address owner", "address spender"], ["uint256"]),
+        _function("approve", ["address spender", "uint256 value"], ["bool"], "nonpayable"),
+        _function("transfer", ["address to", "uint256 value"], ["bool"], "nonpayable"),
+        _function("transferFrom", ["address from", "address to", "uint256 value"], ["bool"], "nonpayable"),
+    ] + _ERC20_EVENTS,
+    "ChainlinkAggregatorV3.json": [
+        _function("decimals", [], ["uint8"]),
+        _function("description", [], ["string"]),
+        _function("version", [], ["uint256"]),
+        _function("latestRoundData", [], ["uint80 roundId", "int256 answer", "uint256 startedAt", "uint256 updatedAt", "uint80 answeredInRound"]),
+        _function("getRoundData", ["uint80 _roundId"], ["uint80 roundId", "int256 answer", "uint256 startedAt", "uint256 updatedAt", "uint80 answeredInRound"]),
+    ],
+    "Multicall3.json": [
+        _function("aggregate3", [_struct("calls", ["address target", "bool allowFailure", "bytes callData"], array=True)],
+                  [_struct("returnData", ["bool success", "bytes returnData"], array=True)], "payable"),
+        _function("getBlockNumber", [], ["uint256 blockNumber"]),
+        _function("getCurrentBlockTimestamp", [], ["uint256 timestamp"]),
+    ],
+}
+
+
+def write_abis(directory: str):
+    """Writes `ABIS` as the abi/*.json files Config loads."""
+    os.makedirs(directory, exist_ok=True)
+    for name, abi in ABIS.items():
+        with open(os.path.join(directory, name), "w") as f:
+            json.dump(abi, f, indent=1)
+
+
+@contextmanager
+def workspace():
+    """Runs the block in a temporary working directory with the mock ABIs in abi/, and removes it afterwards."""
+    previous = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="mock-chain-")
+    try:
+        write_abis(os.path.join(directory, "abi"))
+        os.chdir(directory)
+        yield directory
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+_function_tables = {}
+_event_signatures = {}
+
+
+def _functions(abi_name: str) -> dict:
+    """selector -> (name, input types, output types, state mutability) of an ABI in `ABIS`."""
+    table = _function_tables.get(abi_name)
+    if table is None:
+        table = {}
+        for fragment in ABIS[abi_name]:
+            if fragment["type"] != "function":
+                continue
+            inputs = [collapse_if_tuple(param) for param in fragment["inputs"]]
+            outputs = [collapse_if_tuple(param) for param in fragment["outputs"]]
+            selector = keccak(text=f"{fragment['name']}({','.join(inputs)})")[:4]
+            table[selector] = (fragment["name"], inputs, outputs, fragment["stateMutability"])
+        _function_tables[abi_name] = table
+    return table
+
+
+def _event_signature(abi_name: str, name: str) -> tuple:
+    """(topic0, [(type, indexed)]) of an event in `ABIS`."""
+    key = (abi_name, name)
+    if key not in _event_signatures:
+        fragment = next(item for item in ABIS[abi_name] if item["type"] == "event" and item["name"] == name)
+        types = [(collapse_if_tuple(param), param.get("indexed", False)) for param in fragment["inputs"]]
+        topic = keccak(text=f"{name}({','.join(type_ for type_, _ in types)})")
+        _event_signatures[key] = (topic, types)
+    return _event_signatures[key]
+
+
+# --- Chain ---
+
+class RpcError(Exception):
+    """A JSON-RPC error answer other than a revert, e.g. for an unknown filter."""
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class Revert(Exception):
+    """A contract call reverted; the message is the revert reason."""
+
+
+class MockChain:
+    """Accounts, contracts, blocks, receipts and logs. Not thread-safe on its own; `MockProvider` serializes access."""
+    def __init__(self, chain_id: int = 1, base_fee: int = 20 * 10**9, priority_fee: int = 10**9, start_time: int | None = None):
+        self.chain_id = chain_id
+        self.base_fee = base_fee
+        self.priority_fee = priority_fee
+        self.block_number = 1
+        # With a start time, the clock only moves by `advance` (deterministic replays); else it follows the wall clock.
+        self.start_time = start_time
+        self.time_offset = 0 # Seconds added to the clock by `advance`
+        self.block_timestamps = {1: self.now()}
+        self.contracts = {}
+        self.nonces = {}
+        self.receipts = {} # transaction hash (hex) -> receipt
+        self.logs = [] # Every log mined, in order: formatted dicts, or entries of `execute` formatted when first read
+        self._log_blocks = [] # Block number of each log, for bisecting a block range
+        self.static = False # True while an eth_call runs
+        self._senders = [] # msg.sender of each nested call
+        self._pending_logs = None
+        self.lock = threading.RLock()
+
+    def now(self) -> int:
+        return (int(time.time()) if self.start_time is None else self.start_time) + self.time_offset
+
+    @property
+    def timestamp(self) -> int:
+        return self.block_timestamps[self.block_number]
+
+    @property
+    def sender(self) -> str:
+        """msg.sender of the call being executed."""
+        return self._senders[-1]
+
+    def deploy(self, contract):
+        self.contracts[contract.address] = contract
+        return contract
+
+    def advance(self, seconds: int, blocks: int = 1):
+        """Moves the clock forward by `seconds`, mining `blocks` empty blocks (none: the next block gets the new time)."""
+        self.time_offset += seconds
+        for _ in range(blocks):
+            self._new_block()
+
+    def _new_block(self) -> int:
+        self.block_number += 1
+        self.block_timestamps[self.block_number] = max(self.now(), self.block_timestamps[self.block_number - 1])
+        return self.block_number
+
+    def block_hash(self, number: int) -> str:
+        return Web3.to_hex(keccak(number.to_bytes(32, "big")))
+
+    # --- Execution ---
+
+    def call(self, sender: str, to: str, data: bytes) -> bytes:
+        """Executes a call to a contract (also nested calls from contracts) and returns the ABI-encoded result."""
+        contract = self.contracts.get(_checksum(to))
+        if contract is None:
+            return b"" # A call to an account without code succeeds and returns nothing
+        entry = _functions(contract.ABI).get(bytes(data[:4]))
+        if entry is None or not hasattr(contract, entry[0]):
+            raise Revert(f"function {Web3.to_hex(data[:4])} not supported by {type(contract).__name__}")
+        name, input_types, output_types, mutability = entry
+        if self.static and mutability not in ("view", "pure") and name not in contract.STATIC_CALLS:
+            raise Revert(f"{name} changes state in a static call")
+        args = [_checksummed(type_, value) for type_, value in zip(input_types, abi_decode(input_types, bytes(data[4:])))]
+        result = self.invoke(sender, contract, name, *args)
+        if len(output_types) == 1:
+            result = (result,)
+        return abi_encode(output_types, list(result or ()))
+
+    def invoke(self, sender: str, contract, name: str, *args):
+        """Calls a contract's Python method with `sender` as msg.sender, e.g. a token transfer made by another contract."""
+        self._senders.append(_checksum(sender))
+        try:
+            return getattr(contract, name)(*args)
+        finally:
+            self._senders.pop()
+
+    def static_call(self, sender: str, to: str, data: bytes) -> bytes:
+        self.static = True
+        try:
+            return self.call(sender, to, data)
+        finally:
+            self.static = False
+
+    def emit(self, address: str, abi_name: str, event: str, values):
+        """Adds a log of `event` (a name in the contract's ABI) to the transaction being executed."""
+        if self._pending_logs is not None:
+            self._pending_logs.append((address, abi_name, event, values))
+
+    @staticmethod
+    def _format_log(entry: tuple, block_number: int, block_hash: str, tx_hash: str, index: int) -> dict:
+        address, abi_name, event, values = entry
+        topic, types = _event_signature(abi_name, event)
+        topics = [topic] + [abi_encode([type_], [value]) for (type_, indexed), value in zip(types, values) if indexed]
+        data = abi_encode([type_ for type_, indexed in types if not indexed], [value for (_, indexed), value in zip(types, values) if not indexed])
+        return {
+            "address": address, "topics": [Web3.to_hex(topic) for topic in topics], "data": Web3.to_hex(data),
+            "blockNumber": hex(block_number), "blockHash": block_hash, "transactionHash": tx_hash,
+            "transactionIndex": "0x0", "logIndex": hex(index), "removed": False,
+        }
+
+    def _snapshot(self) -> dict:
+        return {address: {key: copy.deepcopy(value) for key, value in vars(contract).items() if key != "chain"}
+                for address, contract in self.contracts.items()}
+
+    def _restore(self, snapshot: dict):
+        for address, state in snapshot.items():
+            vars(self.contracts[address]).update(state)
+
+    def send_raw_transaction(self, raw: bytes) -> str:
+        """Validates the nonce, then executes and mines the transaction into a new block. Returns its hash."""
+        tx = decode_raw_transaction(raw)
+        sender = Account.recover_transaction(raw)
+        expected_nonce = self.nonces.get(sender, 0)
+        if tx["nonce"] != expected_nonce:
+            raise Revert(f"nonce too {'low' if tx['nonce'] < expected_nonce else 'high'}: next nonce {expected_nonce}, tx nonce {tx['nonce']}")
+        self.nonces[sender] = expected_nonce + 1
+        tx_hash = Web3.to_hex(keccak(raw))
+        block_number = self._new_block()
+        snapshot = self._snapshot()
+        self._pending_logs = []
+        status = 1
+        try:
+            if tx["to"]:
+                self.call(sender, tx["to"], tx["data"])
+        except Revert as e:
+            print(f"Mock chain: transaction {tx_hash} reverted: {e}")
+            self._restore(snapshot)
+            self._pending_logs = []
+            status = 0
+        formatted_logs = self._record_logs(block_number, tx_hash)
+        entry = _functions_by_selector(self, tx["to"], tx["data"])
+        gas_used = min(tx["gas"], GAS_USED.get(entry, DEFAULT_GAS_USED))
+        effective_gas_price = tx["gasPrice"] if tx["gasPrice"] is not None else min(tx["maxFeePerGas"], self.base_fee + tx["maxPriorityFeePerGas"])
+        block_hash = self.block_hash(block_number)
+        self.receipts[tx_hash] = {
+            "transactionHash": tx_hash, "transactionIndex": "0x0", "blockHash": block_hash, "blockNumber": hex(block_number),
+            "from": sender, "to": tx["to"], "contractAddress": None, "cumulativeGasUsed": hex(gas_used), "gasUsed": hex(gas_used),
+            "effectiveGasPrice": hex(effective_gas_price), "status": hex(status), "type": hex(tx["type"]),
+            "logs": formatted_logs, "logsBloom": "0x" + "00" * 256,
+        }
+        return tx_hash
+
+    def execute(self, sender: str, operation, *args):
+        """
+        Runs `operation(*args)` (Python calls into contracts, e.g. a simulated swap) as a transaction of `sender`
+        mined into a new block, and records the logs it emits. Returns its result. Unlike a sent transaction,
+        an exception propagates and nothing is rolled back, so the state isn't copied for every block.
+        """
+        block_number = self._new_block()
+        self._pending_logs = []
+        self._senders.append(_checksum(sender))
+        try:
+            result = operation(*args)
+        finally:
+            self._senders.pop()
+            self._record_logs(block_number, Web3.to_hex(keccak(b"execute" + block_number.to_bytes(32, "big"))), lazy=True)
+        return result
+
+    def _record_logs(self, block_number: int, tx_hash: str, lazy: bool = False) -> list[dict] | None:
+        """
+        Mines the logs emitted by the transaction that just ran into `block_number`. `lazy` leaves their ABI encoding,
+        the bulk of a simulated block's cost, to the first eth_getLogs that reads them.
+        """
+        logs, self._pending_logs = self._pending_logs, None
+        block_hash = self.block_hash(block_number)
+        self._log_blocks.extend([block_number] * len(logs))
+        if lazy:
+            self.logs.extend((entry, block_number, block_hash, tx_hash, index) for index, entry in enumerate(logs))
+            return None
+        formatted_logs = [self._format_log(entry, block_number, block_hash, tx_hash, index) for index, entry in enumerate(logs)]
+        self.logs.extend(formatted_logs)
+        return formatted_logs
+
+    def get_logs(self, log_filter: dict) -> list[dict]:
+        """eth_getLogs over the mined logs: address (one or a list), topics (None, a topic or a list per position), block range."""
+        from_block = _block_param(log_filter.get("fromBlock", "latest"), self.block_number)
+        to_block = _block_param(log_filter.get("toBlock", "latest"), self.block_number)
+        addresses = log_filter.get("address")
+        if addresses is not None:
+            addresses = {Web3.to_checksum_address(address) for address in ([addresses] if isinstance(addresses, str) else addresses)}
+        topic_filters = log_filter.get("topics") or []
+        matches = []
+        for log_index in range(bisect_left(self._log_blocks, from_block), bisect_right(self._log_blocks, to_block)):
+            log = self.logs[log_index]
+            if isinstance(log, tuple):
+                if addresses is not None and log[0][0] not in addresses:
+                    continue
+                log = self.logs[log_index] = self._format_log(*log)
+            if addresses is not None and log["address"] not in addresses:
+                continue
+            if all(wanted is None or log["topics"][position] in ([wanted] if isinstance(wanted, str) else wanted)
+                   for position, wanted in enumerate(topic_filters) if position < len(log["topics"])) and len(topic_filters) <= len(log["topics"]):
+                matches.append(log)
+        return matches
+
+
+def _split_tuple_type(type_: str) -> list[str]:
+    """The component types of "(a,(b,c),d[])"."""
+    components, depth, start = [], 0, 1
+    for index, char in enumerate(type_[1:-1], 1):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            components.append(type_[start:index])
+            start = index + 1
+    components.append(type_[start:-1])
+    return components
+
+
+def _checksummed(type_: str, value):
+    """A decoded value with its addresses checksummed (eth_abi decodes them lowercase), as contracts key balances by them."""
+    if type_ == "address":
+        return _checksum(value)
+    if type_.endswith("]"):
+        inner = type_[:type_.rindex("[")]
+        return [_checksummed(inner, item) for item in value]
+    if type_.startswith("("):
+        return tuple(_checksummed(component, item) for component, item in zip(_split_tuple_type(type_), value))
+    return value
+
+
+def _functions_by_selector(chain: MockChain, to: str | None, data: bytes) -> str | None:
+    """Name of the function a transaction calls, for its gas."""
+    contract = chain.contracts.get(_checksum(to)) if to else None
+    if contract is None:
+        return None
+    entry = _functions(contract.ABI).get(bytes(data[:4]))
+    return entry[0] if entry else None
+
+
+def _block_param(value, latest: int) -> int:
+    if isinstance(value, int):
+        return value
+    if value in ("latest", "pending", "safe", "finalized"):
+        return latest
+    if value == "earliest":
+        return 0
+    return int(value, 16)
+
+
+def _int(value: bytes) -> int:
+    return int.from_bytes(value, "big")
+
+
+def decode_raw_transaction(raw: bytes) -> dict:
+    """The fields of a signed legacy, EIP-2930 (type 1) or EIP-1559 (type 2) transaction."""
+    raw = bytes(raw)
+    tx = {"gasPrice": None, "maxFeePerGas": None, "maxPriorityFeePerGas": None}
+    if raw[0] == 2:
+        fields = rlp.decode(raw[1:])
+        tx.update(type=2, nonce=_int(fields[1]), maxPriorityFeePerGas=_int(fields[2]), maxFeePerGas=_int(fields[3]),
+                  gas=_int(fields[4]), to=fields[5], value=_int(fields[6]), data=fields[7])
+    elif raw[0] == 1:
+        fields = rlp.decode(raw[1:])
+        tx.update(type=1, nonce=_int(fields[1]), gasPrice=_int(fields[2]), gas=_int(fields[3]), to=fields[4], value=_int(fields[5]), data=fields[6])
+    else:
+        fields = rlp.decode(raw)
+        tx.update(type=0, nonce=_int(fields[0]), gasPrice=_int(fields[1]), gas=_int(fields[2]), to=fields[3], value=_int(fields[4]), data=fields[5])
+    tx["to"] = Web3.to_checksum_address(tx["to"]) if tx["to"] else None
+    return tx
+
+
+# --- Provider ---
+
+class MockProvider(BaseProvider):
+    """
+    Web3 provider answering from a `MockChain`. Each request first sleeps `latency` seconds (or the
+    `method_latency` of its method) plus up to `jitter` seconds, outside the chain lock, so concurrent
+    requests overlap like they would on a real connection. Requests are counted by method in `calls`.
+    Log filters live in the provider, as they live in the node that installed them: clear `filters` to drop them.
+    """
+    def __init__(self, chain: MockChain, latency: float = 0.0, jitter: float = 0.0, method_latency: dict | None = None, seed: int = 0):
+        super().__init__()
+        self.chain = chain
+        self.latency = latency
+        self.jitter = jitter
+        self.method_latency = dict(method_latency or {})
+        self.calls = {}
+        self._random = random.Random(seed)
+        self._request_id = 0
+        self.filters = {} # filter ID -> [log filter, last block returned by eth_getFilterChanges]
+        self._handlers = {
+            "web3_clientVersion": lambda: "MockChain/v1",
+            "net_version": lambda: str(self.chain.chain_id),
+            "eth_chainId": lambda: hex(self.chain.chain_id),
+            "eth_blockNumber": lambda: hex(self.chain.block_number),
+            "eth_gasPrice": lambda: hex(self.chain.base_fee + self.chain.priority_fee),
+            "eth_maxPriorityFeePerGas": lambda: hex(self.chain.priority_fee),
+            "eth_getBalance": lambda address, block="latest": hex(10**24),
+            "eth_getTransactionCount": lambda address, block="latest": hex(self.chain.nonces.get(Web3.to_checksum_address(address), 0)),
+            "eth_getBlockByNumber": self._get_block,
+            "eth_feeHistory": self._fee_history,
+            "eth_call": self._call,
+            "eth_estimateGas": self._estimate_gas,
+            "eth_sendRawTransaction": lambda raw: self.chain.send_raw_transaction(Web3.to_bytes(hexstr=raw)),
+            "eth_getTransactionReceipt": lambda tx_hash: self.chain.receipts.get(tx_hash.lower() if isinstance(tx_hash, str) else Web3.to_hex(tx_hash)),
+            "eth_getLogs": lambda log_filter: self.chain.get_logs(log_filter),
+            "eth_newFilter": self._new_filter,
+            "eth_getFilterChanges": self._get_filter_changes,
+            "eth_getFilterLogs": lambda filter_id: self.chain.get_logs(self._filter(filter_id)[0]),
+            "eth_uninstallFilter": lambda filter_id: self.filters.pop(filter_id, None) is not None,
+        }
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+    def make_request(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        delay = self.method_latency.get(method, self.latency) + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        self._request_id += 1
+        response = {"jsonrpc": "2.0", "id": self._request_id}
+        handler = self._handlers.get(method)
+        if handler is None:
+            response["error"] = {"code": -32601, "message": f"the method {method} does not exist/is not available"}
+            return response
+        with self.chain.lock:
+            try:
+                response["result"] = handler(*params)
+            except Revert as e:
+                response["error"] = {"code": 3, "message": f"execution reverted: {e}", "data": "0x"}
+            except RpcError as e:
+                response["error"] = {"code": e.code, "message": str(e)}
+        return response
+
+    def _new_filter(self, log_filter: dict) -> str:
+        filter_id = hex(self._request_id)
+        self.filters[filter_id] = [log_filter, self.chain.block_number]
+        return filter_id
+
+    def _filter(self, filter_id: str) -> list:
+        if filter_id not in self.filters:
+            raise RpcError(-32000, "filter not found")
+        return self.filters[filter_id]
+
+    def _get_filter_changes(self, filter_id: str) -> list[dict]:
+        entry = self._filter(filter_id)
+        log_filter, last_block = entry
+        entry[1] = self.chain.block_number
+        return self.chain.get_logs({**log_filter, "fromBlock": last_block + 1, "toBlock": self.chain.block_number})
+
+    def _call(self, tx: dict, block="latest"):
+        return Web3.to_hex(self.chain.static_call(tx.get("from") or ZERO_ADDRESS, tx["to"], Web3.to_bytes(hexstr=tx.get("data", tx.get("input", "0x")))))
+
+    def _estimate_gas(self, tx: dict, block="latest"):
+        name = _functions_by_selector(self.chain, tx.get("to"), Web3.to_bytes(hexstr=tx.get("data", "0x")))
+        return hex(GAS_USED.get(name, DEFAULT_GAS_USED))
+
+    def _fee_history(self, block_count, newest_block, percentiles):
+        block_count = block_count if isinstance(block_count, int) else int(block_count, 16)
+        newest = _block_param(newest_block, self.chain.block_number)
+        block_count = max(1, min(block_count, newest))
+        return {
+            "oldestBlock": hex(newest - block_count + 1),
+            "baseFeePerGas": [hex(self.chain.base_fee)] * (block_count + 1),
+            "gasUsedRatio": [0.5] * block_count,
+            "reward": [[hex(self.chain.priority_fee)] * len(percentiles) for _ in range(block_count)],
+        }
+
+    def _get_block(self, block, full_transactions=False):
+        number = _block_param(block, self.chain.block_number)
+        if number not in self.chain.block_timestamps:
+            return None
+        return {
+            "number": hex(number), "hash": self.chain.block_hash(number), "parentHash": self.chain.block_hash(number - 1),
+            "timestamp": hex(self.chain.block_timestamps[number]), "baseFeePerGas": hex(self.chain.base_fee),
+            "gasLimit": hex(30_000_000), "gasUsed": hex(0), "miner": ZERO_ADDRESS, "difficulty": "0x0", "totalDifficulty": "0x0",
+            "extraData": "0x", "logsBloom": "0x" + "00" * 256, "nonce": "0x0000000000000000", "sha3Uncles": "0x" + "00" * 32,
+            "mixHash": "0x" + "00" * 32, "stateRoot": "0x" + "00" * 32, "transactionsRoot": "0x" + "00" * 32,
+            "receiptsRoot": "0x" + "00" * 32, "size": "0x0", "transactions": [], "uncles": [],
+        }
+
+
+# --- Contracts ---
+
+class MockContract:
+    ABI = "" # File name of the contract's ABI in ABIS
+    STATIC_CALLS = () # Non-view functions that may run in an eth_call (they only forward calls)
+
+    def __init__(self, chain: MockChain, address: str):
+        self.chain = chain
+        self.address = Web3.to_checksum_address(address)
+
+    def emit(self, event: str, *values):
+        self.chain.emit(self.address, self.ABI, event, values)
+
+
+class MockERC20(MockContract):
+    ABI = "ERC20.json"
+
+    def __init__(self, chain: MockChain, address: str, symbol: str, decimals: int):
+        super().__init__(chain, address)
+        self._symbol = symbol
+        self._decimals = decimals
+        self.balances = {}
+        self.allowances = {} # (owner, spender) -> allowance
+        self.supply = 0
+
+    def mint_to(self, account: str, amount: int):
+        """Creates tokens out of thin air, e.g. to fund the test wallet."""
+        account = Web3.to_checksum_address(account)
+        self.balances[account] = self.balances.get(account, 0) + amount
+        self.supply += amount
+
+    def name(self):
+        return self._symbol
+
+    def symbol(self):
+        return self._symbol
+
+    def decimals(self):
+        return self._decimals
+
+    def totalSupply(self):
+        return self.supply
+
+    def balanceOf(self, account):
+        return self.balances.get(account, 0)
+
+    def allowance(self, owner, spender):
+        return self.allowances.get((owner, spender), 0)
+
+    def approve(self, spender, value):
+        self.allowances[(self.chain.sender, spender)] = value
+        self.emit("Approval", self.chain.sender, spender, value)
+        return True
+
+    def transfer(self, to, value):
+        self._move(self.chain.sender, to, value)
+        return True
+
+    def transferFrom(self, owner, to, value):
+        allowance = self.allowances.get((owner, self.chain.sender), 0)
+        if allowance < value:
+            raise Revert(f"{self._symbol}: insufficient allowance")
+        if allowance != (1 << 256) - 1:
+            self.allowances[(owner, self.chain.sender)] = allowance - value
+        self._move(owner, to, value)
+        return True
+
+    def _move(self, owner, to, value):
+        if self.balances.get(owner, 0) < value:
+            raise Revert(f"{self._symbol}: transfer amount exceeds balance")
+        self.balances[owner] -= value
+        self.balances[to] = self.balances.get(to, 0) + value
+        self.emit("Transfer", owner, to, value)
+
+
+class MockChainlinkFeed(MockContract):
+    ABI = "ChainlinkAggregatorV3.json"
+
+    def __init__(self, chain: MockChain, address: str, answer: int, decimals: int = 8, description: str = ""):
+        super().__init__(chain, address)
+        self._decimals = decimals
+        self._description = description
+        self.rounds = {}
+        self.round_id = 0
+        self.set_answer(answer)
+
+    def set_answer(self, answer: int):
+        """Publishes a new round at the current block's timestamp."""
+        self.round_id += 1
+        self.rounds[self.round_id] = (answer, self.chain.timestamp)
+
+    def decimals(self):
+        return self._decimals
+
+    def description(self):
+        return self._description
+
+    def version(self):
+        return 4
+
+    def getRoundData(self, round_id):
+        if round_id not in self.rounds:
+            raise Revert("No data present")
+        answer, updated_at = self.rounds[round_id]
+        return round_id, answer, updated_at, updated_at, round_id
+
+    def latestRoundData(self):
+        return self.getRoundData(self.round_id)
+
+
+class MockMulticall3(MockContract):
+    ABI = "Multicall3.json"
+    STATIC_CALLS = ("aggregate3",)
+
+    def aggregate3(self, calls):
+        results = []
+        for target, allow_failure, call_data in calls:
+            try:
+                results.append((True, self.chain.call(self.address, target, call_data)))
+            except Revert as e:
+                if not allow_failure:
+                    raise Revert(f"Multicall3: call failed ({e})")
+                results.append((False, b""))
+        return results
+
+    def getBlockNumber(self):
+        return self.chain.block_number
+
+    def getCurrentBlockTimestamp(self):
+        return self.chain.timestamp
+
+
+class MockFactory(MockContract):
+    ABI = "UniswapV3Factory.json"
+
+    def __init__(self, chain: MockChain, address: str):
+        super().__init__(chain, address)
+        self.pools = {} # (token0, token1, fee) with token0 < token1 -> pool address
+
+    @staticmethod
+    def _key(token_a: str, token_b: str, fee: int) -> tuple:
+        token0, token1 = sorted((Web3.to_checksum_address(token_a), Web3.to_checksum_address(token_b)), key=str.lower)
+        return token0, token1, fee
+
+    def add_pool(self, pool):
+        self.pools[self._key(pool._token0, pool._token1, pool._fee)] = pool.address
+
+    def getPool(self, token_a, token_b, fee):
+        return self.pools.get(self._key(token_a, token_b, fee), ZERO_ADDRESS)
+
+    def feeAmountTickSpacing(self, fee):
+        return tick_math.FEE_TICK_SPACING.get(fee, 0)
+
+
+class MockPool(MockContract):
+    """A pool whose price, fee growth and tick data are set directly instead of by swaps."""
+    ABI = "UniswapV3Pool.json"
+
+    def __init__(self, chain: MockChain, address: str, token0: str, token1: str, fee: int, sqrt_price_x96: int):
+        super().__init__(chain, address)
+        self._token0 = Web3.to_checksum_address(token0)
+        self._token1 = Web3.to_checksum_address(token1)
+        self._fee = fee
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick_math.get_tick_at_sqrt_ratio(sqrt_price_x96)
+        self.in_range_liquidity = 0
+        self.fee_growth_global = [0, 0]
+        self.tick_infos = {} # tick -> [feeGrowthOutside0X128, feeGrowthOutside1X128]
+        self.observations = [(chain.timestamp, 0)] # (timestamp, tickCumulative)
+        # Every observation is kept; the cardinality only records what increaseObservationCardinalityNext asked for
+        self.cardinality_next = 1
+
+    def set_price(self, sqrt_price_x96: int):
+        """Moves the price, writing an oracle observation of the tick that held until now."""
+        timestamp, cumulative = self.observations[-1]
+        now = self.chain.timestamp
+        if now > timestamp:
+            self.observations.append((now, cumulative + self.tick * (now - timestamp)))
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick_math.get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+    def add_fees(self, fee_growth0_x128: int, fee_growth1_x128: int):
+        """Adds fee growth, as swaps with the price inside the given ticks' ranges would."""
+        self.fee_growth_global[0] = (self.fee_growth_global[0] + fee_growth0_x128) & tick_math.MAX_UINT256
+        self.fee_growth_global[1] = (self.fee_growth_global[1] + fee_growth1_x128) & tick_math.MAX_UINT256
+
+    def fee_growth_inside(self, tick_lower: int, tick_upper: int) -> tuple[int, int]:
+        lower = self.tick_infos.get(tick_lower, [0, 0])
+        upper = self.tick_infos.get(tick_upper, [0, 0])
+        return tuple(fee_accrual.fee_growth_inside(self.tick, tick_lower, tick_upper, self.fee_growth_global[i], lower[i], upper[i]) for i in (0, 1))
+
+    def touch_tick(self, tick: int):
+        """Initializes a tick like the first position using it would: growth below the price counts as outside."""
+        if tick not in self.tick_infos:
+            self.tick_infos[tick] = list(self.fee_growth_global) if self.tick >= tick else [0, 0]
+
+    def slot0(self):
+        cardinality = max(len(self.observations), self.cardinality_next)
+        return self.sqrt_price_x96, self.tick, len(self.observations) - 1, cardinality, cardinality, 0, True
+
+    def liquidity(self):
+        return self.in_range_liquidity
+
+    def feeGrowthGlobal0X128(self):
+        return self.fee_growth_global[0]
+
+    def feeGrowthGlobal1X128(self):
+        return self.fee_growth_global[1]
+
+    def ticks(self, tick):
+        outside0, outside1 = self.tick_infos.get(tick, [0, 0])
+        return 0, 0, outside0, outside1, 0, 0, 0, tick in self.tick_infos
+
+    def observe(self, seconds_agos):
+        now = self.chain.timestamp
+        cumulatives = []
+        for seconds_ago in seconds_agos:
+            target = now - seconds_ago
+            timestamp, cumulative = self.observations[-1]
+            if target >= timestamp:
+                cumulatives.append(cumulative + self.tick * (target - timestamp))
+                continue
+            if target < self.observations[0][0]:
+                raise Revert("OLD")
+            # The last observation at or before the target, interpolated towards the next one as the pool does
+            index = max(i for i, (observed_at, _) in enumerate(self.observations) if observed_at <= target)
+            before_time, before_cumulative = self.observations[index]
+            after_time, after_cumulative = self.observations[index + 1]
+            slope = int((after_cumulative - before_cumulative) / (after_time - before_time))
+            cumulatives.append(before_cumulative + slope * (target - before_time))
+        return cumulatives, [0] * len(seconds_agos)
+
+    def increaseObservationCardinalityNext(self, cardinality_next):
+        self.cardinality_next = max(self.cardinality_next, cardinality_next)
+
+    def token0(self):
+        return self._token0
+
+    def token1(self):
+        return self._token1
+
+    def fee(self):
+        return self._fee
+
+    def tickSpacing(self):
+        return tick_math.get_tick_spacing(self._fee)
+
+
+class MockPositionManager(MockContract):
+    """NonfungiblePositionManager over `MockPool`s: the position bookkeeping and token flows, without an NFT registry beyond owners."""
+    ABI = "UniswapV3PositionManager.json"
+
+    def __init__(self, chain: MockChain, address: str, factory: MockFactory):
+        super().__init__(chain, address)
+        self.factory_address = factory.address
+        self.next_token_id = 1
+        self.positions_by_id = {}
+
+    def _pool(self, token0: str, token1: str, fee: int) -> MockPool:
+        pool_address = self.chain.contracts[self.factory_address].getPool(token0, token1, fee)
+        if pool_address == ZERO_ADDRESS:
+            raise Revert("pool not found")
+        return self.chain.contracts[pool_address]
+
+    def _position(self, token_id: int, owner_only: bool = True) -> dict:
+        position = self.positions_by_id.get(token_id)
+        if position is None:
+            raise Revert("Invalid token ID")
+        if owner_only and position["owner"] != self.chain.sender:
+            raise Revert("Not approved")
+        return position
+
+    def _check_deadline(self, deadline: int):
+        if self.chain.timestamp > deadline:
+            raise Revert("Transaction too old")
+
+    def _poke(self, position: dict, pool: MockPool):
+        """Credits the fees earned since the position was last touched (Position.update)."""
+        inside = pool.fee_growth_inside(position["tick_lower"], position["tick_upper"])
+        for i in (0, 1):
+            earned = fee_accrual.fees_accrued(position["liquidity"], inside[i], position["fee_growth_inside_last"][i])
+            position["tokens_owed"][i] = (position["tokens_owed"][i] + earned) & MAX_UINT128
+        position["fee_growth_inside_last"] = list(inside)
+
+    def _add_liquidity(self, pool: MockPool, tick_lower: int, tick_upper: int, amount0_desired: int, amount1_desired: int,
+                       amount0_min: int, amount1_min: int) -> tuple[int, int, int]:
+        """LiquidityManagement.addLiquidity: pulls the tokens for the most liquidity the amounts allow."""
+        sqrt_lower = tick_math.get_sqrt_ratio_at_tick(tick_lower)
+        sqrt_upper = tick_math.get_sqrt_ratio_at_tick(tick_upper)
+        liquidity = tick_math.get_liquidity_for_amounts(pool.sqrt_price_x96, sqrt_lower, sqrt_upper, amount0_desired, amount1_desired)
+        if liquidity == 0:
+            raise Revert("liquidity is zero")
+        amount0, amount1 = _amounts_for_liquidity(pool.sqrt_price_x96, sqrt_lower, sqrt_upper, liquidity, round_up=True)
+        if amount0 < amount0_min or amount1 < amount1_min:
+            raise Revert("Price slippage check")
+        payer = self.chain.sender
+        for token, amount in ((pool._token0, amount0), (pool._token1, amount1)):
+            if amount:
+                self.chain.invoke(self.address, self.chain.contracts[token], "transferFrom", payer, self.address, amount)
+        pool.touch_tick(tick_lower)
+        pool.touch_tick(tick_upper)
+        if tick_lower <= pool.tick < tick_upper:
+            pool.in_range_liquidity += liquidity
+        return liquidity, amount0, amount1
+
+    def positions(self, token_id):
+        position = self._position(token_id, owner_only=False)
+        return (0, ZERO_ADDRESS, position["token0"], position["token1"], position["fee"], position["tick_lower"], position["tick_upper"],
+                position["liquidity"], position["fee_growth_inside_last"][0], position["fee_growth_inside_last"][1],
+                position["tokens_owed"][0], position["tokens_owed"][1])
+
+    def ownerOf(self, token_id):
+        return self._position(token_id, owner_only=False)["owner"]
+
+    def mint(self, params):
+        token0, token1, fee, tick_lower, tick_upper, amount0_desired, amount1_desired, amount0_min, amount1_min, recipient, deadline = params
+        self._check_deadline(deadline)
+        if tick_lower >= tick_upper:
+            raise Revert("TLU")
+        pool = self._pool(token0, token1, fee)
+        liquidity, amount0, amount1 = self._add_liquidity(pool, tick_lower, tick_upper, amount0_desired, amount1_desired, amount0_min, amount1_min)
+        token_id = self.next_token_id
+        self.next_token_id += 1
+        self.positions_by_id[token_id] = {
+            "owner": recipient, "token0": pool._token0, "token1": pool._token1, "fee": fee,
+            "tick_lower": tick_lower, "tick_upper": tick_upper, "liquidity": liquidity,
+            "fee_growth_inside_last": list(pool.fee_growth_inside(tick_lower, tick_upper)), "tokens_owed": [0, 0],
+        }
+        self.emit("Transfer", ZERO_ADDRESS, recipient, token_id)
+        self.emit("IncreaseLiquidity", token_id, liquidity, amount0, amount1)
+        return token_id, liquidity, amount0, amount1
+
+    def increaseLiquidity(self, params):
+        token_id, amount0_desired, amount1_desired, amount0_min, amount1_min, deadline = params
+        self._check_deadline(deadline)
+        position = self._position(token_id, owner_only=False)
+        pool = self._pool(position["token0"], position["token1"], position["fee"])
+        liquidity, amount0, amount1 = self._add_liquidity(pool, position["tick_lower"], position["tick_upper"],
+                                                          amount0_desired, amount1_desired, amount0_min, amount1_min)
+        self._poke(position, pool)
+        position["liquidity"] += liquidity
+        self.emit("IncreaseLiquidity", token_id, liquidity, amount0, amount1)
+        return liquidity, amount0, amount1
+
+    def decreaseLiquidity(self, params):
+        token_id, liquidity, amount0_min, amount1_min, deadline = params
+        self._check_deadline(deadline)
+        position = self._position(token_id)
+        if liquidity == 0 or liquidity > position["liquidity"]:
+            raise Revert("invalid liquidity")
+        pool = self._pool(position["token0"], position["token1"], position["fee"])
+        amount0, amount1 = _amounts_for_liquidity(pool.sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(position["tick_lower"]),
+                                                  tick_math.get_sqrt_ratio_at_tick(position["tick_upper"]), liquidity, round_up=False)
+        if amount0 < amount0_min or amount1 < amount1_min:
+            raise Revert("Price slippage check")
+        self._poke(position, pool)
+        position["liquidity"] -= liquidity
+        position["tokens_owed"][0] = (position["tokens_owed"][0] + amount0) & MAX_UINT128
+        position["tokens_owed"][1] = (position["tokens_owed"][1] + amount1) & MAX_UINT128
+        if position["tick_lower"] <= pool.tick < position["tick_upper"]:
+            pool.in_range_liquidity -= liquidity
+        self.emit("DecreaseLiquidity", token_id, liquidity, amount0, amount1)
+        return amount0, amount1
+
+    def collect(self, params):
+        token_id, recipient, amount0_max, amount1_max = params
+        position = self._position(token_id)
+        pool = self._pool(position["token0"], position["token1"], position["fee"])
+        if position["liquidity"] > 0:
+            self._poke(position, pool)
+        amount0 = min(amount0_max, position["tokens_owed"][0])
+        amount1 = min(amount1_max, position["tokens_owed"][1])
+        position["tokens_owed"][0] -= amount0
+        position["tokens_owed"][1] -= amount1
+        recipient = self.address if recipient == ZERO_ADDRESS else recipient
+        for token, amount in ((pool._token0, amount0), (pool._token1, amount1)):
+            if amount:
+                self.chain.invoke(self.address, self.chain.contracts[token], "transfer", recipient, amount)
+        self.emit("Collect", token_id, recipient, amount0, amount1)
+        return amount0, amount1
+
+    def burn(self, token_id):
+        position = self._position(token_id)
+        if position["liquidity"] or any(position["tokens_owed"]):
+            raise Revert("Not cleared")
+        del self.positions_by_id[token_id]
+        self.emit("Transfer", position["owner"], ZERO_ADDRESS, token_id)
+
+    def multicall(self, data):
+        # A delegatecall to itself, so msg.sender stays the caller's
+        return [self.chain.call(self.chain.sender, self.address, call_data) for call_data in data]
+
+
+class MockSwapRouter(MockContract):
+    """
+    SwapRouter's exactInputSingle. Pools with a `swap` (v3_simulator's) are swapped through; a `MockPool` has no
+    liquidity curve, so the swap fills at its set price (less the fee) and the output is minted to the recipient.
+    """
+    ABI = "SwapRouter.json"
+
+    def __init__(self, chain: MockChain, address: str, factory: MockFactory):
+        super().__init__(chain, address)
+        self.factory_address = factory.address
+
+    def exactInputSingle(self, params):
+        token_in, token_out, fee, recipient, deadline, amount_in, amount_out_minimum, sqrt_price_limit_x96 = params
+        if self.chain.timestamp > deadline:
+            raise Revert("Transaction too old")
+        pool_address = self.chain.contracts[self.factory_address].getPool(token_in, token_out, fee)
+        if pool_address == ZERO_ADDRESS:
+            raise Revert("pool not found")
+        pool = self.chain.contracts[pool_address]
+        zero_for_one = token_in == pool._token0
+        payer = self.chain.sender
+        # The swap callback pulls the input from the caller, so the router needs its allowance
+        self.chain.invoke(self.address, self.chain.contracts[token_in], "transferFrom", payer, self.address, amount_in)
+        if hasattr(pool, "swap"):
+            if sqrt_price_limit_x96 == 0:
+                sqrt_price_limit_x96 = tick_math.MIN_SQRT_RATIO + 1 if zero_for_one else tick_math.MAX_SQRT_RATIO - 1
+            amount0, amount1 = self.chain.invoke(self.address, pool, "swap", recipient, zero_for_one, amount_in, sqrt_price_limit_x96, self.address)
+            paid, amount_out = (amount0, -amount1) if zero_for_one else (amount1, -amount0)
+            if paid < amount_in: # Stopped at the price limit
+                self.chain.invoke(self.address, self.chain.contracts[token_in], "transfer", payer, amount_in - paid)
+        else:
+            amount_in_less_fee = amount_in * (10**6 - fee) // 10**6
+            price_x192 = pool.sqrt_price_x96 ** 2
+            amount_out = amount_in_less_fee * price_x192 >> 192 if zero_for_one else (amount_in_less_fee << 192) // price_x192
+            self.chain.invoke(self.address, self.chain.contracts[token_in], "transfer", pool.address, amount_in)
+            self.chain.contracts[token_out].mint_to(recipient, amount_out)
+            amount0, amount1 = (amount_in, -amount_out) if zero_for_one else (-amount_out, amount_in)
+            pool.emit("Swap", self.address, recipient, amount0, amount1, pool.sqrt_price_x96, pool.in_range_liquidity, pool.tick)
+        if amount_out < amount_out_minimum:
+            raise Revert("Too little received")
+        return amount_out
+
+
+def _amounts_for_liquidity(sqrt_price_x96: int, sqrt_lower_x96: int, sqrt_upper_x96: int, liquidity: int, round_up: bool) -> tuple[int, int]:
+    """Token amounts of `liquidity` at the price, rounded up when paid into the pool (mint) and down when paid out."""
+    if sqrt_price_x96 <= sqrt_lower_x96:
+        return tick_math.get_amount0_delta(sqrt_lower_x96, sqrt_upper_x96, liquidity, round_up), 0
+    if sqrt_price_x96 < sqrt_upper_x96:
+        return (tick_math.get_amount0_delta(sqrt_price_x96, sqrt_upper_x96, liquidity, round_up),
+                tick_math.get_amount1_delta(sqrt_lower_x96, sqrt_price_x96, liquidity, round_up))
+    return 0, tick_math.get_amount1_delta(sqrt_lower_x96, sqrt_upper_x96, liquidity, round_up)
+
+
+class UniswapDeployment:
+    """The contracts `deploy_uniswap` put on a chain."""
+    def __init__(self, chain, token0, token1, factory, pool, nft_manager, token0_feed, token1_feed, multicall, swap_router=None):
+        self.chain = chain
+        self.token0 = token0
+        self.token1 = token1
+        self.factory = factory
+        self.pool = pool
+        self.nft_manager = nft_manager
+        self.token0_feed = token0_feed
+        self.token1_feed = token1_feed
+        self.multicall = multicall
+        self.swap_router = swap_router
+
+
+def deploy_uniswap(chain: MockChain, config, sqrt_price_x96: int, decimals0: int = 18, decimals1: int = 6,
+                   token0_usd: int | None = None, token1_usd: int = 10**8, symbols: tuple = ("WETH", "USDC")) -> UniswapDeployment:
+    """
+    Deploys the tokens, pool, factory, position manager, swap router, Chainlink feeds and Multicall3 at the addresses in
+    `config` (a uniswap_lp_bot.Config), so the bot finds them where it expects them. The TOKEN0 feed answers
+    `token0_usd` (8 decimals), by default the pool price.
+    """
+    token0 = chain.deploy(MockERC20(chain, config.TOKEN0_ADDRESS, symbols[0], decimals0))
+    token1 = chain.deploy(MockERC20(chain, config.TOKEN1_ADDRESS, symbols[1], decimals1))
+    factory = chain.deploy(MockFactory(chain, config.UNISWAP_FACTORY_ADDRESS))
+    pool_address = Web3.to_checksum_address(keccak(text=f"pool:{config.TOKEN0_ADDRESS}:{config.TOKEN1_ADDRESS}:{config.POOL_FEE}")[-20:])
+    pool = chain.deploy(MockPool(chain, pool_address, config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE, sqrt_price_x96))
+    factory.add_pool(pool)
+    nft_manager = chain.deploy(MockPositionManager(chain, config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, factory))
+    if token0_usd is None:
+        token0_usd = int(tick_math.sqrt_price_x96_to_price(sqrt_price_x96, decimals0, decimals1) * 10**8)
+    token0_feed = chain.deploy(MockChainlinkFeed(chain, config.CHAINLINK_ETH_USD_FEED, token0_usd, 8, f"{symbols[0]} / USD"))
+    token1_feed = chain.deploy(MockChainlinkFeed(chain, config.CHAINLINK_USDC_USD_FEED, token1_usd, 8, f"{symbols[1]} / USD"))
+    multicall = chain.deploy(MockMulticall3(chain, config.MULTICALL3_ADDRESS))
+    swap_router = chain.deploy(MockSwapRouter(chain, config.UNISWAP_SWAP_ROUTER_ADDRESS, factory))
+    return UniswapDeployment(chain, token0, token1, factory, pool, nft_manager, token0_feed, token1_feed, multicall, swap_router)
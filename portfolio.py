@@ -0,0 +1,287 @@
+"""
+Portfolio mode: one process managing many LP positions across pools and fee tiers.
+
+`LiquidityManagerBot` manages a single position in the pool fixed by Config. The `PortfolioManager`
+loads every position listed in PORTFOLIO_FILE and, over a single shared connection:
+- reads the state of all positions and pools in one Multicall3 batch per cycle, with each pool's
+  slot0 read once no matter how many positions it holds,
+- runs per-position rebalances on a bounded worker pool (PORTFOLIO_MAX_WORKERS threads),
+- nets the TOKEN0 exposure of all positions per hedge contract (Config.HEDGE_SYMBOLS) and sends
+  at most one order per contract to the `DerivativesManager`,
+- evaluates the summed delta of each contract's positions over a price grid (greeks.py) to report
+  at which prices the next hedge will be due.
+
+Run it with `python portfolio.py`. The portfolio file lists the position token IDs:
+    {"positions": [123456, 123789]}
+It is rewritten whenever a rebalance replaces a position with a new one.
+"""
+import copy
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import block_recorder
+import greeks
+import metrics
+import tick_math
+import tracing
+from state_store import StateStore
+from uniswap_lp_bot import BlockchainClient, Config, CycleSnapshot, DerivativesManager, LiquidityManagerBot, configure_tracing
+
+
+class PortfolioBot(LiquidityManagerBot):
+    """
+    Bot for the positions of one pool. Each position is a copy of its pool's bot (see `for_position`), so positions
+    in the same pool share the connection, token decimals, pool address, TWAP service and the pool's price samples
+    (the volatility estimate), and keep their own per-position state.
+    """
+    def __init__(self, portfolio: "PortfolioManager", pool_client: BlockchainClient):
+        super().__init__(pool_client, portfolio.derivatives_manager, portfolio.state_store)
+        self.portfolio = portfolio
+
+    def for_position(self, token_id: int) -> "PortfolioBot":
+        """A shallow copy of this pool's bot managing `token_id`, with its own deferral count and position ticks."""
+        position = copy.copy(self)
+        position.position_token_id = token_id
+        position._deferred_rebalances = {}
+        position._position_ticks = {}
+        return position
+
+    def _save_position_id(self, token_id: int):
+        """A rebalance replaced the position: record it in the state store and rewrite the portfolio file."""
+        super()._save_position_id(token_id)
+        self.portfolio.save()
+
+
+class PortfolioManager:
+    def __init__(self, config: Config | None = None, blockchain_client: BlockchainClient | None = None,
+                 derivatives_manager: DerivativesManager | None = None, state_store: StateStore | None = None):
+        # As in LiquidityManagerBot, a client (e.g. over mock_chain's provider), derivatives manager and store can be passed in
+        self.config = blockchain_client.config if blockchain_client else config or Config()
+        self.client = blockchain_client or BlockchainClient(self.config)
+        # One store for every pool's bot: rebalances, hedge fills and per-position cycle snapshots
+        self.state_store = state_store or StateStore(self.config.STATE_DB_FILE)
+        self.derivatives_manager = derivatives_manager or DerivativesManager(self.config, self.state_store)
+        self.nft_manager = self.client.get_contract(self.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, self.config.UNISWAP_NFT_POSITION_MANAGER_ABI)
+        self.executor = ThreadPoolExecutor(max_workers=self.config.PORTFOLIO_MAX_WORKERS, thread_name_prefix="portfolio-worker")
+        self.pools = {} # (token0, token1, fee) -> PortfolioBot for that pool
+        self.positions = [] # One PortfolioBot copy per managed position
+        self._save_lock = threading.Lock()
+
+    def _load_token_ids(self) -> list[int]:
+        """Reads the position token IDs from the portfolio file."""
+        if not os.path.exists(self.config.PORTFOLIO_FILE):
+            print(f"Portfolio file {self.config.PORTFOLIO_FILE} not found.")
+            return []
+        with open(self.config.PORTFOLIO_FILE, "r") as f:
+            return [int(token_id) for token_id in json.load(f).get("positions", [])]
+
+    def save(self):
+        """Writes the current position token IDs to the portfolio file. Called from worker threads."""
+        with self._save_lock:
+            token_ids = [position.position_token_id for position in self.positions if position.position_token_id]
+            try:
+                with open(self.config.PORTFOLIO_FILE, "w") as f:
+                    json.dump({"positions": token_ids}, f, indent=2)
+                print(f"Portfolio of {len(token_ids)} positions saved to {self.config.PORTFOLIO_FILE}")
+            except Exception as e:
+                print(f"Error saving portfolio: {e}")
+
+    def load(self):
+        """Loads every position of the portfolio file, reading all of them in one batched call."""
+        token_ids = self._load_token_ids()
+        if not token_ids:
+            return
+        _, position_infos = self.client.batch_call([self.nft_manager.functions.positions(token_id) for token_id in token_ids])
+        for token_id, position_info in zip(token_ids, position_infos):
+            if position_info[7] == 0:
+                print(f"Position {token_id} has no liquidity. Skipping it.")
+                continue
+            position = self.get_pool_bot(position_info[2], position_info[3], position_info[4]).for_position(token_id)
+            if self.config.RECORDER_DIR and block_recorder.RECORDER_AVAILABLE:
+                # One history per position (named after the position it started from), since rows are per block
+                position.recorder = block_recorder.BlockRecorder(os.path.join(self.config.RECORDER_DIR, str(token_id)),
+                                                                 flush_rows=self.config.RECORDER_FLUSH_ROWS,
+                                                                 flush_seconds=self.config.RECORDER_FLUSH_SECONDS)
+            self.positions.append(position)
+        print(f"Loaded {len(self.positions)} positions in {len(self.pools)} pools.")
+
+    def get_pool_bot(self, token0_address: str, token1_address: str, fee: int) -> PortfolioBot:
+        """Returns the bot of a pool, creating it the first time the pool is seen."""
+        key = (token0_address, token1_address, fee)
+        if key in self.pools:
+            return self.pools[key]
+        # A view of the shared client whose config describes this pool. It shares the connection,
+        # the account and the transaction lock with every other pool.
+        pool_config = copy.copy(self.config)
+        pool_config.TOKEN0_ADDRESS = token0_address
+        pool_config.TOKEN1_ADDRESS = token1_address
+        pool_config.POOL_FEE = fee
+        pool_config.RECORDER_DIR = "" # Positions get their own recorder in `load`
+        _, (symbol0, symbol1) = self.client.batch_call([
+            (self.client.get_contract(token0_address, self.config.ERC20_ABI).functions.symbol(), True),
+            (self.client.get_contract(token1_address, self.config.ERC20_ABI).functions.symbol(), True),
+        ])
+        pool_config.TOKEN0_ADDRESS_SYMBOL = symbol0 or token0_address
+        pool_config.TOKEN1_ADDRESS_SYMBOL = symbol1 or token1_address
+        pool_client = copy.copy(self.client)
+        pool_client.config = pool_config
+
+        pool_bot = PortfolioBot(self, pool_client)
+        pool_bot.pool_key = key
+        # Resolve the pool address now, so worker threads only ever read the memoized value.
+        pool_bot.pool_contract = pool_bot.lp_manager.get_pool_contract()
+        self.pools[key] = pool_bot
+        return pool_bot
+
+    def read_state(self) -> dict[int, CycleSnapshot]:
+        """
+        Reads every pool's slot0 and TWAPs and every position in one batched call, pinned to one block.
+        Returns a snapshot per position token ID; positions in the same pool share their pool's slot0 and TWAPs.
+        """
+        pool_bots = list(self.pools.values())
+        block_number, results = self.client.batch_call(
+            [pool_bot.pool_contract.functions.slot0() for pool_bot in pool_bots] +
+            [call for pool_bot in pool_bots for call in pool_bot.twap.calls()] +
+            [self.nft_manager.functions.positions(position.position_token_id) for position in self.positions]
+        )
+        slot0_by_pool = {pool_bot.pool_key: slot0 for pool_bot, slot0 in zip(pool_bots, results)}
+        twap_results = results[len(pool_bots):3 * len(pool_bots)]
+        twap_by_pool = {pool_bot.pool_key: pool_bot.twap.apply(block_number, slot0_by_pool[pool_bot.pool_key], twap_results[2 * index:2 * index + 2])
+                        for index, pool_bot in enumerate(pool_bots)}
+        snapshots = {}
+        for position, position_info in zip(self.positions, results[3 * len(pool_bots):]):
+            slot0 = slot0_by_pool[position.pool_key]
+            snapshots[position.position_token_id] = CycleSnapshot(block_number, position_info, slot0[0], slot0[1], None,
+                                                                  twap=twap_by_pool[position.pool_key])
+        print(f"Read portfolio state ({len(pool_bots)} pools, {len(self.positions)} positions) at block {block_number}.")
+        return snapshots
+
+    def _rebalance(self, position: PortfolioBot, snapshot: CycleSnapshot) -> bool:
+        """
+        Worker task: rebalances one position. A failure is reported and does not affect other positions; it still
+        returns True, since it may have changed the position (e.g. liquidity removed and not restored).
+        """
+        return position.rebalance_or_report(position.position_token_id, snapshot)
+
+    def net_exposures(self, snapshots: dict[int, CycleSnapshot]) -> dict[str, Decimal]:
+        """Sums the TOKEN0 exposure of all positions per hedge contract."""
+        exposures = {}
+        for position in self.positions:
+            symbol = self.config.HEDGE_SYMBOLS.get(position.config.TOKEN0_ADDRESS)
+            if symbol is None:
+                print(f"No hedge contract configured for {position.config.TOKEN0_ADDRESS_SYMBOL}. Position {position.position_token_id} is not hedged.")
+                continue
+            exposure = position.get_current_lp_exposure(position.position_token_id, snapshots[position.position_token_id])
+            exposures[symbol] = exposures.get(symbol, Decimal("0")) + exposure
+        return exposures
+
+    def hedge_outlook(self, snapshots: dict[int, CycleSnapshot], hedged_shorts: dict[str, Decimal],
+                      grid_width: float = 0.2, grid_points: int = 2001) -> dict[str, tuple[float | None, float | None]]:
+        """
+        Evaluates the delta of every position over a price grid of +/- `grid_width` around the current price,
+        in one vectorized call per hedge contract, and returns the nearest prices below and above at which
+        the contract's net delta leaves the hedge band around its short (None if not within the grid).
+        """
+        outlook = {}
+        for symbol, hedged_short in hedged_shorts.items():
+            positions = [position for position in self.positions if self.config.HEDGE_SYMBOLS.get(position.config.TOKEN0_ADDRESS) == symbol]
+            if not positions:
+                continue
+            decimals0 = [position.price_oracle.token_decimals[position.config.TOKEN0_ADDRESS] for position in positions]
+            decimals1 = [position.price_oracle.token_decimals[position.config.TOKEN1_ADDRESS] for position in positions]
+            # Positions hedged by the same contract share TOKEN0, so their pools' prices are (nearly) the same
+            price = float(tick_math.sqrt_price_x96_to_price(snapshots[positions[0].position_token_id].sqrt_price_x96, decimals0[0], decimals1[0]))
+            prices = greeks.price_grid(price, grid_width, grid_points)
+            position_infos = [snapshots[position.position_token_id].position_info for position in positions]
+            delta, _ = greeks.greeks_grid(
+                prices,
+                [position_info[7] for position_info in position_infos],
+                [position_info[5] for position_info in position_infos],
+                [position_info[6] for position_info in position_infos],
+                decimals0, decimals1
+            )
+            outlook[symbol] = greeks.next_hedge_prices(prices, delta.sum(axis=0), price, float(hedged_short), float(self.config.STRATEGY.hedge_threshold))
+            low, high = (None if bound is None else round(bound, 2) for bound in outlook[symbol])
+            print(f"Next {symbol} hedge due when the price leaves {low} - {high} (None: not within +/-{grid_width:.0%}).")
+        return outlook
+
+    def _hedge(self, symbol: str, target_short: Decimal) -> Decimal:
+        """
+        Worker task: moves the short on `symbol` to the portfolio's net exposure, as a single adjustment
+        (which the hedge executor may send as several child orders).
+        """
+        current_short = self.derivatives_manager.get_short_size(symbol)
+        amount_to_adjust = self.config.STRATEGY.hedge_adjustment(target_short, current_short)
+        print(f"Net portfolio exposure on {symbol}: {target_short}. Current short: {current_short}.")
+        self.derivatives_manager.adjust_short_position(symbol, amount_to_adjust)
+        return current_short + amount_to_adjust
+
+    def run_cycle(self) -> dict[str, Decimal]:
+        """
+        Runs one cycle over the whole portfolio: batched read, parallel rebalances, netted hedge.
+        Returns the short size per hedge contract after the cycle.
+        """
+        with tracing.cycle(), metrics.stage("cycle"):
+            with metrics.stage("read_state"):
+                snapshots = self.read_state()
+            # Rebalances send transactions, so they run on the worker pool; positions that are in range return at once.
+            with metrics.stage("rebalance_lp"):
+                futures = [self.executor.submit(self._rebalance, position, snapshots[position.position_token_id]) for position in self.positions]
+                rebalanced = any([future.result() for future in futures])
+            if rebalanced:
+                # Drop positions whose replacement could not be minted, then re-read the replaced or failed positions
+                self.positions = [position for position in self.positions if position.position_token_id]
+                with metrics.stage("read_state"):
+                    snapshots = self.read_state()
+
+            with metrics.stage("hedge"):
+                exposures = self.net_exposures(snapshots)
+                symbols = list(exposures)
+                hedged_shorts = dict(zip(symbols, self.executor.map(lambda symbol: self._hedge(symbol, exposures[symbol]), symbols)))
+                if greeks.GRID_AVAILABLE:
+                    self.hedge_outlook(snapshots, hedged_shorts)
+            # Shorts are per contract, not per position, so the snapshots are stored without one
+            with metrics.stage("record_cycle"):
+                for position in self.positions:
+                    snapshot = snapshots[position.position_token_id]
+                    self.state_store.record_snapshot(position.position_token_id, snapshot, None)
+                    position.record_block(snapshot.block_number, snapshot.sqrt_price_x96, snapshot.tick, snapshot.position_info, None)
+                self.state_store.flush()
+        metrics.LAST_CYCLE.set(time.time())
+        return hedged_shorts
+
+    def close(self):
+        """Publishes the recorded rows of every position not flushed yet. Call it on shutdown."""
+        for position in self.positions:
+            position.close()
+
+    def run(self):
+        """Main execution loop for portfolio mode."""
+        print("Starting portfolio liquidity management and delta neutral bot...")
+        metrics.start_server(self.config.METRICS_HOST, self.config.METRICS_PORT)
+        configure_tracing(self.config)
+        self.load()
+        while True:
+            try:
+                if self.positions:
+                    print(f"\n--- Managing {len(self.positions)} LP positions ---")
+                    self.run_cycle()
+                else:
+                    print(f"\nNo positions to manage. Add token IDs to {self.config.PORTFOLIO_FILE}.")
+            except Exception as e:
+                print(f"Error during portfolio execution: {e}")
+            print(f"Waiting {self.config.CYCLE_INTERVAL_SECONDS} seconds before next execution cycle...")
+            time.sleep(self.config.CYCLE_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    # Same setup as uniswap_lp_bot.py (ABIs in 'abi/', environment variables), plus a portfolio file.
+    manager = PortfolioManager()
+    try:
+        manager.run()
+    finally:
+        manager.close()
@@ -0,0 +1,240 @@
+"""
+Registry of the Chainlink feeds tokens are priced with, caching each feed's last round.
+
+A Chainlink aggregator publishes a round when its answer moves by the feed's deviation threshold, or when its
+heartbeat elapses without one; in between, latestRoundData() keeps returning the same round. The registry keeps,
+per feed, its decimals and description (read once, then kept in the chain metadata cache), its heartbeat and
+deviation threshold (off-chain parameters, from CHAINLINK_FEEDS) and the last round read. A feed is only read
+again when a new round could exist:
+- its heartbeat elapsed since the last round was updated,
+- a reference price (e.g. the pool's, for the volatile token) moved by DEVIATION_MARGIN of the deviation
+  threshold since the last read,
+- or it wasn't read for `max_check_seconds`, which bounds how late a deviation round of a feed without a
+  reference price (e.g. a stablecoin depeg) is noticed.
+
+Staleness is explicit: a round older than its heartbeat plus `stale_grace_seconds`, answered in an earlier
+round, or with a non-positive answer is stale (`Feed.staleness`), and the age and staleness of every feed are
+exported as metrics. Times are chain time: the block timestamp read with every batch, advanced by the wall
+clock since.
+
+Any token can be mapped to a feed (and "native" to the gas token's); tokens sharing a feed share its round.
+Reads are batched: `refresh_calls`/`apply` embed them in a larger Multicall3 batch (e.g. the cycle's), and
+`refresh` runs them on their own.
+"""
+import threading
+import time
+from decimal import Decimal
+
+import metrics
+
+# Fraction of a feed's deviation threshold a reference price must move before the feed is read again
+DEVIATION_MARGIN = Decimal("0.5")
+
+
+class Feed:
+    """One Chainlink aggregator: its parameters, its metadata and the last round read from it."""
+    def __init__(self, address: str, contract, heartbeat: float, deviation: Decimal):
+        self.address = address
+        self.contract = contract
+        self.heartbeat = heartbeat
+        self.deviation = Decimal(deviation)
+        self.decimals = None
+        self.description = None
+        self.round = None # (roundId, answer, startedAt, updatedAt, answeredInRound) of the last read
+        self.checked_at = None # Chain time of the last read
+        self.reference = None # Reference price at the last read
+
+    @property
+    def name(self) -> str:
+        return self.description or self.address
+
+    def to_price(self, answer: int) -> Decimal | None:
+        """An answer of this feed as a price, or None while its decimals are unknown."""
+        return None if self.decimals is None else Decimal(answer) / Decimal(10**self.decimals)
+
+    def age(self, now: float) -> float | None:
+        """Seconds since the last round was updated, or None before the first read."""
+        return None if self.round is None else now - self.round[3]
+
+    def staleness(self, now: float, grace: float) -> str | None:
+        """Why the last round can't be trusted, or None if it is fresh."""
+        if self.round is None:
+            return "no round read"
+        round_id, answer, _, updated_at, answered_in_round = self.round
+        if answer <= 0:
+            return f"non-positive answer {answer}"
+        if answered_in_round < round_id:
+            return f"round {round_id} answered in earlier round {answered_in_round}"
+        if now - updated_at > self.heartbeat + grace:
+            return f"last updated {now - updated_at:.0f} s ago, heartbeat {self.heartbeat:.0f} s"
+        return None
+
+    def is_due(self, now: float, reference: Decimal | None, max_check_seconds: float) -> bool:
+        """True if a round newer than the last one read could have been published."""
+        if self.round is None or self.decimals is None:
+            return True
+        if now - self.round[3] >= self.heartbeat or now - self.checked_at >= max_check_seconds:
+            return True
+        return (reference is not None and self.reference is not None and self.reference > 0
+                and abs(Decimal(reference) / self.reference - 1) >= self.deviation * DEVIATION_MARGIN)
+
+
+class FeedRegistry:
+    def __init__(self, client, feeds: dict, max_check_seconds: float = 15 * 60, stale_grace_seconds: float = 5 * 60,
+                 default_heartbeat: float = 60 * 60, default_deviation: Decimal = Decimal("0.005")):
+        self.client = client
+        self.max_check_seconds = max_check_seconds
+        self.stale_grace_seconds = stale_grace_seconds
+        self.default_heartbeat = default_heartbeat
+        self.default_deviation = default_deviation
+        self._feeds = {} # feed address -> Feed
+        self._tokens = {} # token address (or "native") -> Feed
+        self._chain_time = None # (block timestamp, time.monotonic() when it was read)
+        self._lock = threading.Lock()
+        for token, spec in feeds.items():
+            self.add(token, spec["feed"], spec.get("heartbeat"), spec.get("deviation"))
+
+    def add(self, token: str, feed_address: str, heartbeat: float | None = None, deviation: Decimal | None = None) -> Feed:
+        """Prices `token` with the feed at `feed_address`. Metadata cached for the feed is loaded; nothing is read."""
+        with self._lock:
+            feed = self._feeds.get(feed_address)
+            if feed is None:
+                contract = self.client.get_contract(feed_address, self.client.config.CHAINLINK_ABI)
+                feed = self._feeds[feed_address] = Feed(feed_address, contract, heartbeat or self.default_heartbeat,
+                                                        deviation if deviation is not None else self.default_deviation)
+                cached = self.client.metadata.get("feeds", feed_address)
+                if cached is not None:
+                    feed.decimals, feed.description = cached
+            self._tokens[token] = feed
+        return feed
+
+    def feed(self, token: str) -> Feed | None:
+        return self._tokens.get(token)
+
+    def now(self) -> float:
+        """Current chain time, estimated from the last block timestamp read (the wall clock before any)."""
+        if self._chain_time is None:
+            return time.time()
+        timestamp, read_at = self._chain_time
+        return timestamp + time.monotonic() - read_at
+
+    def due(self, tokens, references: dict | None = None) -> list[Feed]:
+        """The feeds of `tokens` that need a read, each once. `references` maps tokens to a reference price."""
+        now = self.now()
+        feeds = []
+        for token in tokens:
+            feed = self._tokens.get(token)
+            if feed is None or feed in feeds:
+                continue
+            if feed.is_due(now, (references or {}).get(token), self.max_check_seconds):
+                feeds.append(feed)
+        return feeds
+
+    def refresh_calls(self, feeds: list[Feed]) -> tuple[list, list]:
+        """
+        Returns (calls, reads): the batch calls reading `feeds`, and what `apply` needs to store their results.
+        The calls are the block timestamp, then each feed's latest round (and its decimals and description, the
+        first time). Feed calls may fail, since an unreachable oracle must not fail the rest of a batch.
+        No feeds, no calls.
+        """
+        if not feeds:
+            return [], []
+        calls = [self.client.multicall.functions.getCurrentBlockTimestamp()]
+        reads = []
+        for feed in feeds:
+            calls.append((feed.contract.functions.latestRoundData(), True))
+            with_metadata = feed.decimals is None
+            if with_metadata:
+                calls += [(feed.contract.functions.decimals(), True), (feed.contract.functions.description(), True)]
+            reads.append((feed, with_metadata))
+        return calls, reads
+
+    def apply(self, reads: list, results: list, references: dict | None = None) -> int:
+        """
+        Stores the results of the calls of `refresh_calls`, which start `results` (results of other calls of the
+        batch may follow). `references` maps tokens to their reference price at the time of the read, which later
+        moves are measured against. Returns the number of results used.
+        """
+        if not reads:
+            return 0
+        self._chain_time = (results[0], time.monotonic())
+        now = self.now()
+        index = 1
+        new_metadata = {}
+        with self._lock:
+            for feed, with_metadata in reads:
+                round_data = results[index]
+                index += 1
+                if with_metadata:
+                    decimals, description = results[index:index + 2]
+                    index += 2
+                    if decimals is not None:
+                        feed.decimals, feed.description = decimals, description or ""
+                        new_metadata[feed.address] = [feed.decimals, feed.description]
+                metrics.CHAINLINK_READS.inc(1, feed.address)
+                if round_data is None:
+                    print(f"Chainlink feed {feed.name} could not be read.")
+                    continue
+                if feed.round is None or round_data[0] >= feed.round[0]:
+                    feed.round = tuple(round_data)
+                feed.checked_at = now
+                # Without a new reference the old one stays: moves are then measured from before this read, which
+                # only makes the next read come sooner
+                for token, reference in (references or {}).items():
+                    if self._tokens.get(token) is feed and reference is not None:
+                        feed.reference = Decimal(reference)
+                self._export(feed, now)
+        if new_metadata:
+            self.client.metadata.update("feeds", new_metadata)
+        return index
+
+    def refresh(self, tokens, references: dict | None = None, force: bool = False) -> list[Feed]:
+        """Reads the feeds of `tokens` that are due (all of them with `force`) in one batched call. Returns those read."""
+        feeds = self.due(tokens, references)
+        if force:
+            feeds = []
+            for feed in (self._tokens.get(token) for token in tokens):
+                if feed is not None and feed not in feeds:
+                    feeds.append(feed)
+        calls, reads = self.refresh_calls(feeds)
+        if calls:
+            _, results = self.client.batch_call(calls)
+            self.apply(reads, results, references)
+        return feeds
+
+    def observe(self, token: str, round_data):
+        """Stores a round of the token's feed read elsewhere, if it is newer than the cached one."""
+        feed = self._tokens.get(token)
+        if feed is None or round_data is None:
+            return
+        with self._lock:
+            if feed.round is None or round_data[0] > feed.round[0]:
+                feed.round = tuple(round_data)
+                feed.checked_at = self.now()
+                self._export(feed, feed.checked_at)
+
+    def _export(self, feed: Feed, now: float):
+        metrics.CHAINLINK_ROUND_AGE.set(feed.age(now), feed.address)
+        metrics.CHAINLINK_STALE.set(0 if feed.staleness(now, self.stale_grace_seconds) is None else 1, feed.address)
+
+    def price(self, token: str) -> tuple[Decimal | None, str | None]:
+        """
+        (price, staleness) of a token from its feed's last round read. The price is None if the token has no feed
+        or none of its rounds could be read; staleness is None for a fresh round, else why it is stale.
+        """
+        feed = self._tokens.get(token)
+        if feed is None or feed.round is None or feed.decimals is None:
+            return None, "no round read"
+        now = self.now()
+        staleness = feed.staleness(now, self.stale_grace_seconds)
+        self._export(feed, now)
+        return feed.to_price(feed.round[1]), staleness
+
+    def stats(self) -> list[dict]:
+        """Per-feed state, for logs and the dashboard."""
+        now = self.now()
+        return [{"feed": feed.name, "address": feed.address, "decimals": feed.decimals, "heartbeat": feed.heartbeat,
+                 "deviation": feed.deviation, "round_id": None if feed.round is None else feed.round[0],
+                 "price": None if feed.round is None else feed.to_price(feed.round[1]), "age_s": feed.age(now),
+                 "stale": feed.staleness(now, self.stale_grace_seconds)}
+                for feed in self._feeds.values()]
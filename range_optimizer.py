@@ -0,0 +1,238 @@
+"""
+Range-width optimizer: picks the range a rebalance mints from realized volatility and a simulation
+of what each candidate range would earn and cost.
+
+Instead of always re-centring at the fixed `StrategyParams.range_lower`/`range_upper` of the price, the bot:
+1. estimates the pool's realized volatility, from `observe()` tick cumulatives (`twap_volatility`) or from
+   price samples it collected itself (`realized_volatility`),
+2. simulates one batch of price paths over a decision horizon, shared by every candidate (common random
+   numbers, so candidates are compared on the same paths),
+3. scores every candidate tick-spacing-aligned range on those paths, all at once with NumPy broadcasting
+   over a (candidates, paths, steps) grid:
+   - fees: while in range, the position's liquidity times the pool's fee growth per unit of liquidity,
+     measured from `feeGrowthGlobal0X128`/`feeGrowthGlobal1X128` (`fee_growth_rate`). Until the bot has
+     two readings of those, the backtester's model (backtest.py) is used instead: the fee on the volume
+     implied by the price path crossing the position's own liquidity, times a volume multiplier,
+   - impermanent loss: the PnL of the LP position hedged to its delta at every step (the short gamma
+     bleed a delta neutral LP actually pays, rather than the loss against holding),
+   - hedge costs: the traded hedge notional times the exchange fee/slippage rate,
+   - gas: charged once when the path triggers the next rebalance (`StrategyParams.is_out_of_range`).
+   The path stops earning at that trigger, where the next range takes over, so ranges are ranked by their
+   long-run rate (renewal reward): expected net PnL per range / expected time the range lives.
+
+The fixed StrategyParams range is always one of the candidates, so the optimizer only moves away from it
+when the simulation expects a better rate.
+"""
+import math
+from decimal import Decimal
+
+import tick_math
+from strategy import StrategyParams
+
+# NumPy is only needed for the optimizer, so the live bot doesn't depend on it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+OPTIMIZER_AVAILABLE = np is not None
+
+LOG_TICK_BASE = math.log(1.0001)
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+
+class RangeDecision:
+    """Winning range of a `RangeOptimizer.optimize` run, with the simulated numbers behind it."""
+    def __init__(self, lower_tick: int, upper_tick: int, rate_per_day: float, static_rate_per_day: float,
+                 exit_probability: float, expected_lifetime_seconds: float, volatility: float):
+        self.lower_tick = lower_tick
+        self.upper_tick = upper_tick
+        self.rate_per_day = rate_per_day # Expected net PnL in TOKEN1 per day (fees - IL - hedge costs - gas)
+        self.static_rate_per_day = static_rate_per_day # Same, for the fixed StrategyParams range
+        self.exit_probability = exit_probability # Probability the range triggers a rebalance within the horizon
+        self.expected_lifetime_seconds = expected_lifetime_seconds
+        self.volatility = volatility # Annualized
+
+    def __repr__(self):
+        return (f"RangeDecision(ticks=[{self.lower_tick}, {self.upper_tick}], rate/day={self.rate_per_day:.4f}, "
+                f"static rate/day={self.static_rate_per_day:.4f}, exit probability={self.exit_probability:.1%}, "
+                f"annualized volatility={self.volatility:.1%})")
+
+
+def twap_volatility(tick_cumulatives, interval_seconds: float) -> float:
+    """
+    Volatility (standard deviation of the log price per sqrt(second)) from a pool `observe()` result taken at
+    evenly spaced `secondsAgos` (oldest first). Each interval's average tick is a TWAP, and differences of
+    consecutive averages of a Brownian motion have 2/3 of its variance, so the estimate is scaled back by sqrt(3/2).
+    """
+    if np is None:
+        raise Exception("twap_volatility needs NumPy (pip install numpy).")
+    average_ticks = np.diff(np.asarray(tick_cumulatives, dtype=float)) / interval_seconds
+    log_returns = np.diff(average_ticks) * LOG_TICK_BASE
+    if len(log_returns) < 2:
+        raise ValueError("At least four observations are needed to estimate volatility.")
+    return float(np.sqrt(1.5 * np.mean(log_returns ** 2) / interval_seconds))
+
+
+def fee_growth_rate(fee_growth0_start: int, fee_growth1_start: int, fee_growth0_end: int, fee_growth1_end: int,
+                    seconds: float, price: float, decimals0: int, decimals1: int) -> float:
+    """
+    Fees the pool paid per unit of human-readable liquidity (see `greeks.human_liquidity`) per second, in
+    TOKEN1, from two readings of its Q128 `feeGrowthGlobal0X128`/`feeGrowthGlobal1X128` (which wrap at 2**256).
+    """
+    growth0 = (fee_growth0_end - fee_growth0_start) % (tick_math.MAX_UINT256 + 1) / tick_math.Q128
+    growth1 = (fee_growth1_end - fee_growth1_start) % (tick_math.MAX_UINT256 + 1) / tick_math.Q128
+    # Raw fee per raw liquidity unit -> whole tokens per human-readable liquidity unit: times 10^((d1 - d0) / 2)
+    # for token0 and 10^((d0 - d1) / 2) for token1
+    return (growth0 * 10 ** ((decimals1 - decimals0) / 2) * price + growth1 * 10 ** ((decimals0 - decimals1) / 2)) / seconds
+
+
+def realized_volatility(timestamps, prices) -> float:
+    """Volatility (standard deviation of the log price per sqrt(second)) from irregularly spaced price samples."""
+    if np is None:
+        raise Exception("realized_volatility needs NumPy (pip install numpy).")
+    timestamps = np.asarray(timestamps, dtype=float)
+    log_returns = np.diff(np.log(np.asarray(prices, dtype=float)))
+    elapsed = timestamps[-1] - timestamps[0] if len(timestamps) else 0.0
+    if len(log_returns) < 2 or elapsed <= 0:
+        raise ValueError("At least three samples over a positive time span are needed to estimate volatility.")
+    return float(np.sqrt(np.sum(log_returns ** 2) / elapsed))
+
+
+class RangeOptimizer:
+    """
+    Scores candidate ranges for one pool (fee tier and token decimals) under the strategy's rebalance trigger.
+
+    horizon_seconds/steps: length and resolution of the simulated paths. A range that survives the whole
+        horizon is scored on what it earned until then.
+    paths: number of simulated price paths.
+    candidates: number of symmetric range widths tried, spaced geometrically from one tick spacing on each
+        side of the price to `max_width` (e.g. 0.5 for -33%/+50%).
+    hedge_cost_rate: fraction of traded hedge notional paid as exchange fees and slippage.
+    volume_multiplier: as in `backtest.run_backtest`, scales the fees earned on the path-implied volume
+        (only used without a measured fee rate).
+    tick_spacing: the pool's tick spacing, if known; the fee tier's standard spacing otherwise.
+    """
+    def __init__(self, params: StrategyParams, fee: int, decimals0: int, decimals1: int,
+                 horizon_seconds: float = 24 * 60 * 60, steps: int = 96, paths: int = 512, candidates: int = 32,
+                 max_width: float = 0.5, hedge_cost_rate: float = 0.0005, volume_multiplier: float = 1.0, seed: int = 0,
+                 tick_spacing: int | None = None):
+        if np is None:
+            raise Exception("RangeOptimizer needs NumPy (pip install numpy).")
+        self.params = params
+        self.fee = fee
+        self.decimals0 = decimals0
+        self.decimals1 = decimals1
+        self.tick_spacing = tick_spacing or tick_math.get_tick_spacing(fee)
+        self.horizon_seconds = horizon_seconds
+        self.steps = steps
+        self.paths = paths
+        self.candidates = candidates
+        self.max_width = max_width
+        self.hedge_cost_rate = hedge_cost_rate
+        self.volume_multiplier = volume_multiplier
+        self.seed = seed
+
+    def static_ticks(self, price: Decimal) -> tuple[int, int]:
+        """The fixed StrategyParams range around `price`, aligned the same way `calculate_tick_range` does."""
+        lower_price, upper_price = self.params.new_range(price)
+        lower_tick = tick_math.align_tick(tick_math.price_to_tick(lower_price, self.decimals0, self.decimals1), self.tick_spacing)
+        upper_tick = tick_math.align_tick(tick_math.price_to_tick(upper_price, self.decimals0, self.decimals1), self.tick_spacing)
+        return lower_tick, max(upper_tick, lower_tick + self.tick_spacing)
+
+    def candidate_ticks(self, tick: int, static_ticks: tuple[int, int]):
+        """
+        (lower_ticks, upper_ticks) integer arrays of the candidate ranges around `tick`: the lower bound is
+        rounded down and the upper bound up to the tick spacing, so every candidate contains the price.
+        The static range comes first.
+        """
+        max_half_width = max(math.log(1 + self.max_width) / LOG_TICK_BASE, self.tick_spacing)
+        half_widths = np.unique(np.geomspace(self.tick_spacing, max_half_width, self.candidates).astype(np.int64))
+        lower_ticks = (tick - half_widths) // self.tick_spacing * self.tick_spacing
+        upper_ticks = -(-(tick + half_widths + 1) // self.tick_spacing) * self.tick_spacing
+        bounds = np.unique(np.stack((lower_ticks, upper_ticks), axis=1), axis=0)
+        bounds = np.clip(bounds, tick_math.align_tick(tick_math.MIN_TICK, self.tick_spacing), tick_math.align_tick(tick_math.MAX_TICK, self.tick_spacing))
+        bounds = bounds[(bounds[:, 0] != static_ticks[0]) | (bounds[:, 1] != static_ticks[1])]
+        return np.concatenate(([static_ticks[0]], bounds[:, 0])), np.concatenate(([static_ticks[1]], bounds[:, 1]))
+
+    def optimize(self, sqrt_price_x96: int, volatility: float, capital: float, gas_cost: float,
+                 fee_rate_per_liquidity: float | None = None) -> RangeDecision:
+        """
+        Returns the best range to mint at `sqrt_price_x96`.
+        volatility: standard deviation of the log price per sqrt(second) (see `twap_volatility`).
+        capital: value of the position in TOKEN1. gas_cost: TOKEN1 cost of one rebalance transaction.
+        fee_rate_per_liquidity: the pool's measured fee rate (see `fee_growth_rate`), or None to use the
+            path-crossing fee model.
+        """
+        price = tick_math.sqrt_price_x96_to_price(sqrt_price_x96, self.decimals0, self.decimals1)
+        tick = tick_math.get_tick_at_sqrt_ratio(sqrt_price_x96)
+        lower_ticks, upper_ticks = self.candidate_ticks(tick, self.static_ticks(price))
+        rates, exit_probability, lifetime = self.score(float(price), lower_ticks, upper_ticks, volatility, capital, gas_cost, fee_rate_per_liquidity)
+
+        best = int(np.argmax(rates))
+        seconds_per_day = 24 * 60 * 60
+        return RangeDecision(
+            int(lower_ticks[best]), int(upper_ticks[best]), float(rates[best]) * seconds_per_day, float(rates[0]) * seconds_per_day,
+            float(exit_probability[best]), float(lifetime[best]), volatility * math.sqrt(SECONDS_PER_YEAR)
+        )
+
+    def simulate_paths(self, price: float, volatility: float):
+        """
+        (paths, steps + 1) array of driftless geometric Brownian motion prices starting at `price`. The shocks are
+        drawn from a fixed seed, so a decision is reproducible and the optimizer can be shared between threads.
+        """
+        dt = self.horizon_seconds / self.steps
+        shocks = np.random.default_rng(self.seed).standard_normal((self.paths, self.steps))
+        log_steps = volatility * math.sqrt(dt) * shocks - 0.5 * volatility ** 2 * dt
+        log_paths = np.concatenate((np.zeros((self.paths, 1)), np.cumsum(log_steps, axis=1)), axis=1)
+        return price * np.exp(log_paths)
+
+    def score(self, price: float, lower_ticks, upper_ticks, volatility: float, capital: float, gas_cost: float,
+              fee_rate_per_liquidity: float | None = None):
+        """
+        Simulates every candidate range on the same price paths. Returns, per candidate, the expected net
+        rate (TOKEN1 per second), the probability of triggering a rebalance within the horizon and the
+        expected lifetime in seconds.
+        """
+        dt = self.horizon_seconds / self.steps
+        fee_rate = self.fee / 1_000_000
+        prices = self.simulate_paths(price, volatility)[np.newaxis] # (1, paths, steps + 1)
+        sqrt_prices = np.sqrt(prices)
+        # Human-readable price at a tick: 1.0001^tick * 10^(decimals0 - decimals1)
+        decimal_shift = 10.0 ** (self.decimals0 - self.decimals1)
+        lower_prices = (1.0001 ** lower_ticks.astype(float) * decimal_shift)[:, np.newaxis, np.newaxis]
+        upper_prices = (1.0001 ** upper_ticks.astype(float) * decimal_shift)[:, np.newaxis, np.newaxis]
+        sqrt_lower, sqrt_upper = np.sqrt(lower_prices), np.sqrt(upper_prices)
+
+        # Mint with all capital at the current price (same as the backtester)
+        sqrt_start = math.sqrt(price)
+        start_clipped = np.clip(sqrt_start, sqrt_lower, sqrt_upper)
+        liquidity = capital / ((1.0 / start_clipped - 1.0 / sqrt_upper) * price + (start_clipped - sqrt_lower))
+
+        clipped = np.clip(sqrt_prices, sqrt_lower, sqrt_upper) # (candidates, paths, steps + 1)
+        amount0 = liquidity * (1.0 / clipped - 1.0 / sqrt_upper)
+        amount1 = liquidity * (clipped - sqrt_lower)
+        value = amount0 * prices + amount1
+        next_prices = prices[..., 1:]
+
+        # Step i (from i to i+1) is earned with the position (and hedge) held at i
+        if fee_rate_per_liquidity is not None:
+            in_range = (prices[..., :-1] >= lower_prices) & (prices[..., :-1] <= upper_prices)
+            fees = np.where(in_range, liquidity * fee_rate_per_liquidity * dt, 0.0)
+        else:
+            input1 = liquidity * np.maximum(np.diff(clipped, axis=-1), 0.0)
+            input0 = liquidity * np.maximum(np.diff(1.0 / clipped, axis=-1), 0.0)
+            fees = fee_rate / (1.0 - fee_rate) * (input1 + input0 * next_prices) * self.volume_multiplier
+        hedged_pnl = np.diff(value, axis=-1) - amount0[..., :-1] * np.diff(prices, axis=-1)
+        hedge_costs = self.hedge_cost_rate * np.abs(np.diff(amount0, axis=-1)) * next_prices
+
+        # A step counts until (and including) the step at which the rebalance trigger fires
+        triggered = (next_prices < lower_prices * float(self.params.out_of_range_lower)) | (next_prices > upper_prices * float(self.params.out_of_range_upper))
+        exited = np.logical_or.accumulate(triggered, axis=-1)
+        alive = np.ones_like(exited)
+        alive[..., 1:] = ~exited[..., :-1]
+
+        net = np.where(alive, fees + hedged_pnl - hedge_costs, 0.0).sum(axis=-1) # (candidates, paths)
+        exit_probability = exited[..., -1].mean(axis=-1)
+        lifetime = alive.sum(axis=-1).mean(axis=-1) * dt
+        rates = (net.mean(axis=-1) - gas_cost * exit_probability) / lifetime
+        return rates, exit_probability, lifetime
@@ -0,0 +1,276 @@
+"""
+A web3 provider spreading the bot's JSON-RPC requests over several endpoints (NODE_URLS).
+
+- Each endpoint keeps an EWMA of its latency and of its error rate. Reads go to the healthy endpoint with the
+  lowest latency, weighted up by its error rate. Every PROBE_EVERY-th read goes to the runner-up instead, so a
+  node that was slow once gets a chance to show it recovered. An endpoint that fails (connection error,
+  timeout, HTTP error, or a rate-limit/overload JSON-RPC error) is avoided for a cooldown that doubles with each
+  consecutive failure, and the request fails over to the next endpoint.
+- Hedged reads (`hedge_after` > 0): a read still unanswered after `hedge_after` seconds is also sent to the
+  next-best endpoint, and the first good answer wins. Set it around the p95 latency: the duplicate requests are
+  then a few percent of the reads, and a hiccup of one node costs `hedge_after` instead of its timeout.
+- Writes (eth_sendRawTransaction), transaction lookups and pending nonces stick to one endpoint, the first
+  one until it fails, so a transaction is looked up on the node it was sent to. A raw transaction that fails
+  over to another endpoint which already has it ("already known") counts as sent.
+- Filters only exist on the node that installed them: new filters go to the sticky endpoint, and polling or
+  removing a filter goes to the endpoint that installed it, without failover. If that node fails or dropped the
+  filter, the error is returned and the caller installs a new one.
+- Reverts and other deterministic JSON-RPC errors are answers, not failures, and are returned as they are.
+  So are eth_getLogs errors, which log_ingester.py reads to size its block ranges.
+- HTTP endpoints are web3 HTTPProviders on keep-alive requests sessions, with a connection pool large enough
+  for the threads sharing the client. Any web3 provider can be an endpoint too (e.g. mock_chain.MockProvider).
+
+Reads routed to different nodes may see heads a block apart, as with any load-balanced RPC service.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+from eth_utils import keccak
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+import metrics
+
+# Requests that must reach the node the wallet's transactions went to
+STICKY_METHODS = ("eth_sendRawTransaction", "eth_sendTransaction", "eth_getTransactionReceipt", "eth_getTransactionByHash")
+# Requests installing a filter, and requests addressing one by its ID (first parameter)
+NEW_FILTER_METHODS = ("eth_newFilter", "eth_newBlockFilter", "eth_newPendingTransactionFilter")
+FILTER_METHODS = ("eth_getFilterChanges", "eth_getFilterLogs", "eth_uninstallFilter")
+# Reads never hedged: eth_getLogs can be heavy, and a duplicate doubles the provider's work for it.
+# A filter is on one node only, so a duplicate of a filter request would go to a node without it.
+UNHEDGED_METHODS = ("eth_getLogs", "eth_subscribe", "eth_unsubscribe") + NEW_FILTER_METHODS + FILTER_METHODS
+# JSON-RPC error codes and message words of an endpoint that is overloaded or behind, rather than of a bad request
+TRANSIENT_ERROR_CODES = (-32005, -32603, 429)
+TRANSIENT_ERROR_WORDS = ("rate limit", "too many requests", "capacity", "header not found", "unknown block",
+                         "timeout", "timed out", "internal error", "service unavailable", "bad gateway")
+PROBE_EVERY = 100 # Every Nth read goes to the second-best endpoint, to refresh its latency estimate
+
+
+def endpoint_name(url: str) -> str:
+    """The host of an endpoint URL, for logs and metrics. The path and query often hold an API key."""
+    return urlparse(url).netloc or url
+
+
+def http_provider(url: str, timeout: float, pool_size: int):
+    """An HTTPProvider whose keep-alive session pools up to `pool_size` connections."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return Web3.HTTPProvider(url, request_kwargs={"timeout": timeout}, session=session)
+
+
+def is_transient_error(response: dict) -> bool:
+    """True if a JSON-RPC error response says the endpoint is overloaded or unhealthy (worth another endpoint)."""
+    error = response.get("error")
+    if error is None:
+        return False
+    if not isinstance(error, dict):
+        return any(word in str(error).lower() for word in TRANSIENT_ERROR_WORDS)
+    message = str(error.get("message", "")).lower()
+    if "revert" in message:
+        return False
+    return error.get("code") in TRANSIENT_ERROR_CODES or any(word in message for word in TRANSIENT_ERROR_WORDS)
+
+
+class Endpoint:
+    """One RPC endpoint and its health: EWMA latency and error rate, consecutive failures and cooldown."""
+    def __init__(self, name: str, provider, alpha: float):
+        self.name = name
+        self.provider = provider
+        self.alpha = alpha
+        self.latency = None # EWMA of successful request latency in seconds; None until the first one
+        self.error_rate = 0.0 # EWMA of failures (1) and successes (0)
+        self.failures = 0 # Consecutive failures
+        self.down_until = 0.0 # Avoided until this time.monotonic() after a failure
+        self.requests = 0
+
+    def record(self, seconds: float, ok: bool, cooldown: float):
+        self.requests += 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency = seconds if self.latency is None else self.latency + self.alpha * (seconds - self.latency)
+            self.failures = 0
+            self.down_until = 0.0
+        else:
+            self.failures += 1
+            self.down_until = time.monotonic() + cooldown * 2 ** min(self.failures - 1, 5)
+        metrics.RPC_ENDPOINT_LATENCY.set(self.latency or 0.0, self.name)
+        metrics.RPC_ENDPOINT_ERROR_RATE.set(self.error_rate, self.name)
+
+    def score(self) -> float:
+        """Expected cost of a read here: latency, inflated by the error rate. Unmeasured endpoints are tried first."""
+        return (self.latency or 0.0) * (1 + 10 * self.error_rate)
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+
+class ProviderPool(BaseProvider):
+    """
+    Web3 provider over several endpoints (URLs or web3 providers) with latency-aware routing of reads,
+    optional hedging, sticky writes and failover. See the module docstring.
+    """
+    def __init__(self, endpoints: list, hedge_after: float = 0.0, timeout: float = 10.0, cooldown: float = 5.0,
+                 alpha: float = 0.2, pool_size: int = 16, names: list[str] | None = None):
+        super().__init__()
+        if not endpoints:
+            raise Exception("The provider pool needs at least one endpoint.")
+        self.endpoints = []
+        for index, endpoint in enumerate(endpoints):
+            if isinstance(endpoint, str):
+                name, provider = endpoint_name(endpoint), http_provider(endpoint, timeout, pool_size)
+            else:
+                name, provider = f"{type(endpoint).__name__}-{index}", endpoint
+            self.endpoints.append(Endpoint(names[index] if names else name, provider, alpha))
+        self.hedge_after = hedge_after
+        self.cooldown = cooldown
+        self._sticky = 0 # Index of the endpoint writes go to
+        self._filters = {} # Filter ID -> the endpoint that installed it
+        self._reads = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="rpc-hedge") if hedge_after > 0 and len(self.endpoints) > 1 else None
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return any(endpoint.provider.is_connected(show_traceback) for endpoint in self.endpoints)
+
+    # --- Routing ---
+
+    def _read_order(self) -> list[Endpoint]:
+        """Healthy endpoints from the best score, then the ones cooling down, soonest back first."""
+        now = time.monotonic()
+        with self._lock:
+            self._reads += 1
+            probe = self._reads % PROBE_EVERY == 0
+        healthy = sorted((endpoint for endpoint in self.endpoints if endpoint.healthy(now)), key=Endpoint.score)
+        down = sorted((endpoint for endpoint in self.endpoints if not endpoint.healthy(now)), key=lambda endpoint: endpoint.down_until)
+        if probe and len(healthy) > 1:
+            healthy[0], healthy[1] = healthy[1], healthy[0]
+        return healthy + down
+
+    def _sticky_order(self) -> list[Endpoint]:
+        """The sticky endpoint, then the others in configured order."""
+        with self._lock:
+            start = self._sticky
+        return self.endpoints[start:] + self.endpoints[:start]
+
+    def _move_sticky(self, failed: Endpoint):
+        """After a failure of the sticky endpoint, sticks to the next one."""
+        with self._lock:
+            if self.endpoints[self._sticky] is failed:
+                self._sticky = (self._sticky + 1) % len(self.endpoints)
+                print(f"RPC writes moved from {failed.name} to {self.endpoints[self._sticky].name}.")
+
+    def _filter_order(self, filter_id) -> list[Endpoint]:
+        """The endpoint that installed the filter, or the sticky order for a filter the pool didn't install."""
+        with self._lock:
+            endpoint = self._filters.get(filter_id)
+        return [endpoint] if endpoint is not None else self._sticky_order()
+
+    @staticmethod
+    def _is_sticky(method: str, params) -> bool:
+        if method in STICKY_METHODS or method in NEW_FILTER_METHODS or method in FILTER_METHODS:
+            return True
+        # The pending nonce depends on the mempool of the node the transactions were sent to
+        return method == "eth_getTransactionCount" and len(params) > 1 and params[1] == "pending"
+
+    # --- Requests ---
+
+    def _send(self, endpoint: Endpoint, method: str, params) -> dict:
+        """One request to one endpoint, recorded in its stats. Raises on connection errors and HTTP errors."""
+        started = time.perf_counter()
+        try:
+            response = endpoint.provider.make_request(method, params)
+        except Exception:
+            endpoint.record(time.perf_counter() - started, False, self.cooldown)
+            metrics.RPC_ENDPOINT_ERRORS.inc(1, endpoint.name)
+            raise
+        transient = is_transient_error(response) and method != "eth_getLogs"
+        endpoint.record(time.perf_counter() - started, not transient, self.cooldown)
+        if transient:
+            metrics.RPC_ENDPOINT_ERRORS.inc(1, endpoint.name)
+        return response
+
+    def _hedged(self, method: str, params, primary: Endpoint, secondary: Endpoint) -> dict:
+        """
+        Sends to `primary`, and also to `secondary` if `primary` hasn't answered well within `hedge_after`.
+        Returns the first good answer, else the last answer, else raises the last error.
+        """
+        first = self._executor.submit(self._send, primary, method, params)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done and first.exception() is None and not is_transient_error(first.result()):
+            return first.result()
+        if done:
+            metrics.RPC_FAILOVERS.inc(1, method)
+        else:
+            metrics.RPC_HEDGED.inc(1, method)
+        pending = {first, self._executor.submit(self._send, secondary, method, params)}
+        response = error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                response = future.result()
+                if not is_transient_error(response):
+                    return response
+        if response is not None:
+            return response
+        raise error
+
+    def make_request(self, method, params):
+        sticky = self._is_sticky(method, params)
+        if method in FILTER_METHODS:
+            order = self._filter_order(params[0])
+        else:
+            order = self._sticky_order() if sticky else self._read_order()
+        hedge = self._executor is not None and not sticky and method not in UNHEDGED_METHODS and len(order) > 1
+        last_response = last_error = None
+        index = 0
+        while index < len(order):
+            endpoint = order[index]
+            hedged = hedge and index == 0
+            index += 2 if hedged else 1
+            try:
+                response = self._hedged(method, params, endpoint, order[1]) if hedged else self._send(endpoint, method, params)
+            except Exception as e:
+                last_error = e
+                self._track_filter(method, params, endpoint, None)
+            else:
+                if method == "eth_getLogs" or not is_transient_error(response):
+                    if method == "eth_sendRawTransaction" and index > 1 and "already known" in str(response.get("error", "")).lower():
+                        # An endpoint tried before got the transaction before it failed
+                        return {"jsonrpc": "2.0", "id": response.get("id"), "result": Web3.to_hex(keccak(Web3.to_bytes(hexstr=params[0])))}
+                    self._track_filter(method, params, endpoint, response)
+                    return response
+                last_response = response
+            if sticky:
+                self._move_sticky(endpoint)
+            if index < len(order):
+                metrics.RPC_FAILOVERS.inc(1, method)
+        if last_response is not None:
+            return last_response
+        raise last_error
+
+    def _track_filter(self, method: str, params, endpoint: Endpoint, response: dict | None):
+        """
+        Remembers where a filter was installed, and forgets it once removed, unknown to its node or failed there
+        (`response` None): the caller installs a new filter then.
+        """
+        with self._lock:
+            if method in NEW_FILTER_METHODS and response is not None and "result" in response:
+                self._filters[response["result"]] = endpoint
+            elif method == "eth_uninstallFilter" or (method in FILTER_METHODS and (response is None or "error" in response)):
+                self._filters.pop(params[0], None)
+
+    def stats(self) -> list[dict]:
+        """Per-endpoint health, for logs and the dashboard."""
+        now = time.monotonic()
+        return [{"endpoint": endpoint.name, "latency_ms": (endpoint.latency or 0.0) * 1000, "error_rate": endpoint.error_rate,
+                 "requests": endpoint.requests, "healthy": endpoint.healthy(now), "sticky": endpoint is self.endpoints[self._sticky]}
+                for endpoint in self.endpoints]
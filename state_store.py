@@ -0,0 +1,356 @@
+"""
+Embedded SQLite store for the bot's state and history.
+
+It replaces position_id.txt: the managed positions (with their range and liquidity), every rebalance,
+every hedge fill, one snapshot per cycle and the last block the bot has seen are kept in a single
+database file, so a restart is warm and the history can be queried locally instead of over RPC.
+The pool's own history (Swap/Mint/Burn/Collect logs) is backfilled into it by log_ingester.py.
+
+- The database runs in WAL mode, so analytics can read it (e.g. with the sqlite3 shell) while the bot writes.
+- History rows (snapshots, fills, rebalances) are buffered and written in one transaction per flush,
+  either when `BATCH_SIZE` rows are waiting or when the bot calls `flush()` at the end of a cycle.
+  Position changes are written at once, since a lost position ID is the one thing a restart can't recover from.
+- The schema is versioned with `PRAGMA user_version`; `MIGRATIONS` holds one script per version and the
+  missing ones are applied in order when the store is opened.
+
+Integers that don't fit SQLite's 64-bit INTEGER (liquidity, sqrtPriceX96) and Decimals are stored as TEXT.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+
+# Buffered history rows are written once this many are waiting.
+BATCH_SIZE = 100
+
+# MIGRATIONS[i] upgrades the schema from version i to i + 1.
+MIGRATIONS = [
+    """
+    CREATE TABLE positions (
+        token_id INTEGER PRIMARY KEY,
+        token0 TEXT NOT NULL,
+        token1 TEXT NOT NULL,
+        fee INTEGER NOT NULL,
+        tick_lower INTEGER,
+        tick_upper INTEGER,
+        liquidity TEXT,
+        opened_at REAL NOT NULL,
+        closed_at REAL
+    );
+    CREATE INDEX positions_pool ON positions (token0, token1, fee, closed_at);
+
+    CREATE TABLE rebalances (
+        id INTEGER PRIMARY KEY,
+        time REAL NOT NULL,
+        block_number INTEGER,
+        old_token_id INTEGER NOT NULL,
+        new_token_id INTEGER NOT NULL,
+        price TEXT NOT NULL,
+        tick_lower INTEGER,
+        tick_upper INTEGER
+    );
+    CREATE INDEX rebalances_time ON rebalances (time);
+
+    CREATE TABLE hedge_fills (
+        id INTEGER PRIMARY KEY,
+        time REAL NOT NULL,
+        symbol TEXT NOT NULL,
+        side TEXT NOT NULL,
+        amount TEXT NOT NULL,
+        position_after TEXT
+    );
+    CREATE INDEX hedge_fills_symbol_time ON hedge_fills (symbol, time);
+
+    CREATE TABLE cycle_snapshots (
+        id INTEGER PRIMARY KEY,
+        time REAL NOT NULL,
+        block_number INTEGER NOT NULL,
+        token_id INTEGER NOT NULL,
+        position_info TEXT NOT NULL,
+        sqrt_price_x96 TEXT NOT NULL,
+        tick INTEGER NOT NULL,
+        hedged_short TEXT
+    );
+    CREATE INDEX cycle_snapshots_token_block ON cycle_snapshots (token_id, block_number);
+
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """,
+    # Pool history backfilled by log_ingester.py, and the block ranges already ingested per pool
+    """
+    CREATE TABLE pool_events (
+        pool TEXT NOT NULL,
+        block_number INTEGER NOT NULL,
+        log_index INTEGER NOT NULL,
+        timestamp INTEGER,
+        kind TEXT NOT NULL,
+        owner TEXT,
+        tick_lower INTEGER,
+        tick_upper INTEGER,
+        liquidity TEXT,
+        amount0 TEXT,
+        amount1 TEXT,
+        sqrt_price_x96 TEXT,
+        tick INTEGER,
+        PRIMARY KEY (pool, block_number, log_index)
+    ) WITHOUT ROWID;
+    CREATE INDEX pool_events_kind ON pool_events (pool, kind, block_number);
+
+    CREATE TABLE ingested_ranges (
+        pool TEXT NOT NULL,
+        from_block INTEGER NOT NULL,
+        to_block INTEGER NOT NULL,
+        PRIMARY KEY (pool, from_block)
+    );
+    """,
+]
+
+
+class StoredSnapshot:
+    """A cycle snapshot read back from the store (the fields of `CycleSnapshot` that were recorded)."""
+    def __init__(self, time_recorded: float, block_number: int, token_id: int, position_info, sqrt_price_x96: int,
+                 tick: int, hedged_short: Decimal | None):
+        self.time = time_recorded
+        self.block_number = block_number
+        self.token_id = token_id
+        self.position_info = position_info
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick
+        self.hedged_short = hedged_short
+
+
+class StateStore:
+    def __init__(self, path: str):
+        self.path = path
+        # One connection shared by the bot's threads (portfolio workers, the hedge executor), serialized by the lock.
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode NORMAL only risks the last transactions on power loss, never corruption
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.RLock()
+        self._pending = [] # (sql, params) of buffered history rows
+        self.migrate()
+
+    # --- Schema ---
+
+    def migrate(self):
+        """Applies the migrations the database hasn't seen yet."""
+        with self._lock:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            for target_version, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                # executescript commits first, so the script and the version bump are one transaction of their own
+                self.conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {target_version};\nCOMMIT;")
+                print(f"State store {self.path} migrated to schema version {target_version}.")
+
+    # --- Writes ---
+
+    def _buffer(self, sql: str, params: tuple):
+        with self._lock:
+            self._pending.append((sql, params))
+            if len(self._pending) >= BATCH_SIZE:
+                self.flush()
+
+    def flush(self):
+        """Writes all buffered rows in one transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            self.conn.execute("BEGIN")
+            try:
+                # Consecutive rows of the same statement go through one executemany
+                start = 0
+                while start < len(pending):
+                    end = start
+                    while end < len(pending) and pending[end][0] == pending[start][0]:
+                        end += 1
+                    self.conn.executemany(pending[start][0], [params for _, params in pending[start:end]])
+                    start = end
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def save_position(self, token_id: int, token0: str, token1: str, fee: int):
+        """Records `token_id` as an open position of the pool, written immediately."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO positions (token_id, token0, token1, fee, opened_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (token_id) DO UPDATE SET closed_at = NULL",
+                (token_id, token0, token1, fee, time.time())
+            )
+
+    def close_position(self, token_id: int):
+        """Marks a position as no longer managed (e.g. replaced by a rebalance), written immediately."""
+        with self._lock:
+            self.conn.execute("UPDATE positions SET closed_at = ? WHERE token_id = ? AND closed_at IS NULL", (time.time(), token_id))
+
+    def record_rebalance(self, old_token_id: int, new_token_id: int, price: Decimal, block_number: int | None = None,
+                         tick_lower: int | None = None, tick_upper: int | None = None):
+        self._buffer(
+            "INSERT INTO rebalances (time, block_number, old_token_id, new_token_id, price, tick_lower, tick_upper) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), block_number, old_token_id, new_token_id, str(price), tick_lower, tick_upper)
+        )
+
+    def record_hedge_fill(self, symbol: str, side: str, amount: Decimal, position_after: Decimal | None):
+        self._buffer(
+            "INSERT INTO hedge_fills (time, symbol, side, amount, position_after) VALUES (?, ?, ?, ?, ?)",
+            (time.time(), symbol, side, str(amount), None if position_after is None else str(position_after))
+        )
+
+    def record_snapshot(self, token_id: int, snapshot, hedged_short: Decimal | None):
+        """Records a `CycleSnapshot` of `token_id`, updates the position's range and liquidity, and the last seen block."""
+        position_info = snapshot.position_info
+        self._buffer(
+            "INSERT INTO cycle_snapshots (time, block_number, token_id, position_info, sqrt_price_x96, tick, hedged_short) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), snapshot.block_number, token_id, json.dumps([str(value) if isinstance(value, int) and abs(value) >= 2**63 else value for value in position_info]),
+             str(snapshot.sqrt_price_x96), snapshot.tick, None if hedged_short is None else str(hedged_short))
+        )
+        self._buffer(
+            "UPDATE positions SET tick_lower = ?, tick_upper = ?, liquidity = ? WHERE token_id = ?",
+            (position_info[5], position_info[6], str(position_info[7]), token_id)
+        )
+        self.set_last_block(snapshot.block_number)
+
+    def record_pool_events(self, pool: str, from_block: int, to_block: int, rows: list[tuple]):
+        """
+        Stores the decoded logs of a block range and marks the range as ingested, in one transaction written
+        immediately, so a backfill interrupted at any point resumes without gaps or duplicates.
+        `rows` are (block_number, log_index, timestamp, kind, owner, tick_lower, tick_upper, liquidity, amount0,
+        amount1, sqrt_price_x96, tick) with the big integers as strings.
+        """
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO pool_events (pool, block_number, log_index, timestamp, kind, owner, tick_lower, tick_upper, "
+                    "liquidity, amount0, amount1, sqrt_price_x96, tick) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(pool,) + row for row in rows]
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ingested_ranges (pool, from_block, to_block) VALUES (?, ?, ?)", (pool, from_block, to_block)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def set_meta(self, key: str, value):
+        self._buffer("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, json.dumps(value)))
+
+    def set_last_block(self, block_number: int):
+        self.set_meta("last_block", block_number)
+
+    # --- Reads ---
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            self.flush()
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def last_block(self) -> int | None:
+        return self.get_meta("last_block")
+
+    def active_position(self, token0: str, token1: str, fee: int) -> int | None:
+        """The most recently opened position of the pool that is still managed."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT token_id FROM positions WHERE token0 = ? AND token1 = ? AND fee = ? AND closed_at IS NULL ORDER BY opened_at DESC LIMIT 1",
+                (token0, token1, fee)
+            ).fetchone()
+        return row[0] if row else None
+
+    def last_snapshot(self, token_id: int) -> StoredSnapshot | None:
+        snapshots = self.recent_snapshots(token_id, 1)
+        return snapshots[0] if snapshots else None
+
+    def recent_snapshots(self, token_id: int, limit: int) -> list[StoredSnapshot]:
+        """The last `limit` cycle snapshots of a position, oldest first."""
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute(
+                "SELECT time, block_number, token_id, position_info, sqrt_price_x96, tick, hedged_short FROM cycle_snapshots "
+                "WHERE token_id = ? ORDER BY block_number DESC, id DESC LIMIT ?",
+                (token_id, limit)
+            ).fetchall()
+        snapshots = []
+        for row in reversed(rows):
+            position_info = [int(value) if isinstance(value, str) and value.isdigit() else value for value in json.loads(row[3])]
+            snapshots.append(StoredSnapshot(row[0], row[1], row[2], position_info, int(row[4]), row[5], None if row[6] is None else Decimal(row[6])))
+        return snapshots
+
+    def snapshots(self, token_id: int, from_block: int = 0, to_block: int | None = None) -> list[tuple]:
+        """(block_number, sqrt_price_x96, tick, hedged_short) rows of a position, oldest first."""
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute(
+                "SELECT block_number, sqrt_price_x96, tick, hedged_short FROM cycle_snapshots "
+                "WHERE token_id = ? AND block_number >= ? AND block_number <= ? ORDER BY block_number",
+                (token_id, from_block, to_block if to_block is not None else 2**63 - 1)
+            ).fetchall()
+        return [(block, int(sqrt_price), tick, None if short is None else Decimal(short)) for block, sqrt_price, tick, short in rows]
+
+    def rebalances(self, since: float = 0) -> list[tuple]:
+        """(time, block_number, old_token_id, new_token_id, price, tick_lower, tick_upper) rows, oldest first."""
+        with self._lock:
+            self.flush()
+            return self.conn.execute(
+                "SELECT time, block_number, old_token_id, new_token_id, price, tick_lower, tick_upper FROM rebalances WHERE time >= ? ORDER BY time",
+                (since,)
+            ).fetchall()
+
+    def hedge_fills(self, symbol: str, since: float = 0) -> list[tuple]:
+        """(time, side, amount, position_after) rows of a contract, oldest first."""
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute(
+                "SELECT time, side, amount, position_after FROM hedge_fills WHERE symbol = ? AND time >= ? ORDER BY time",
+                (symbol, since)
+            ).fetchall()
+        return [(fill_time, side, Decimal(amount), None if after is None else Decimal(after)) for fill_time, side, amount, after in rows]
+
+    def ingested_ranges(self, pool: str) -> list[tuple[int, int]]:
+        """(from_block, to_block) ranges of `pool` already ingested, in block order."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT from_block, to_block FROM ingested_ranges WHERE pool = ? ORDER BY from_block", (pool,)
+            ).fetchall()
+
+    def pool_events(self, pool: str, kind: str | None = None, from_block: int = 0, to_block: int | None = None) -> list[tuple]:
+        """
+        (block_number, log_index, timestamp, kind, owner, tick_lower, tick_upper, liquidity, amount0, amount1,
+        sqrt_price_x96, tick) rows of a pool's ingested logs, oldest first, with the big integers as ints.
+        """
+        sql = ("SELECT block_number, log_index, timestamp, kind, owner, tick_lower, tick_upper, liquidity, amount0, amount1, sqrt_price_x96, tick "
+               "FROM pool_events WHERE pool = ? AND block_number >= ? AND block_number <= ?")
+        params = [pool, from_block, to_block if to_block is not None else 2**63 - 1]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        with self._lock:
+            rows = self.conn.execute(sql + " ORDER BY block_number, log_index", params).fetchall()
+        return [row[:7] + tuple(None if value is None else int(value) for value in row[7:11]) + row[11:] for row in rows]
+
+    def import_position_file(self, path: str, token0: str, token1: str, fee: int) -> int | None:
+        """One-time migration of a legacy position_id.txt into the store. The file is renamed once imported."""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            token_id_str = f.read().strip()
+        if not token_id_str:
+            return None
+        token_id = int(token_id_str)
+        self.save_position(token_id, token0, token1, fee)
+        os.replace(path, path + ".imported")
+        print(f"Imported position ID {token_id} from {path} into the state store.")
+        return token_id
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
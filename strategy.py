@@ -0,0 +1,51 @@
+"""
+Rebalance and hedge rules of the delta neutral LP strategy.
+
+The live bot (`uniswap_lp_bot.py`) and the offline backtester (`backtest.py`) both read their
+thresholds from a `StrategyParams` instance, so a parameter set evaluated offline is exactly the one
+that runs live.
+"""
+from decimal import Decimal
+
+
+class StrategyParams:
+    """Thresholds for the rebalance trigger, the re-centred range and the hedge band."""
+    def __init__(self,
+                 out_of_range_lower: Decimal = Decimal("0.99"),
+                 out_of_range_upper: Decimal = Decimal("1.01"),
+                 range_lower: Decimal = Decimal("0.90"),
+                 range_upper: Decimal = Decimal("1.10"),
+                 hedge_threshold: Decimal = Decimal("0.001"),
+                 hedge_rehedge_band: Decimal = Decimal("0")):
+        # Rebalance when the price is 1% below the lower bound or 1% above the upper bound of the range.
+        self.out_of_range_lower = Decimal(out_of_range_lower)
+        self.out_of_range_upper = Decimal(out_of_range_upper)
+        # New ranges are placed at -10%/+10% of the current price.
+        self.range_lower = Decimal(range_lower)
+        self.range_upper = Decimal(range_upper)
+        # Minimum hedge adjustment (in units of the volatile token, e.g. 0.001 ETH) worth trading.
+        self.hedge_threshold = Decimal(hedge_threshold)
+        # Hysteresis: a hedge trade stops this far short of the target instead of reaching it exactly, so a price
+        # oscillating around the band edge doesn't trigger a trade each way. Must be below hedge_threshold.
+        self.hedge_rehedge_band = Decimal(hedge_rehedge_band)
+        if not 0 <= self.hedge_rehedge_band < self.hedge_threshold:
+            # A band as wide as the threshold would leave trades of zero or the wrong sign
+            raise ValueError(f"hedge_rehedge_band ({self.hedge_rehedge_band}) must be in [0, hedge_threshold ({self.hedge_threshold})).")
+
+    def is_out_of_range(self, price: Decimal, lower_price: Decimal, upper_price: Decimal) -> bool:
+        """True if `price` has left [lower_price, upper_price] by more than the trigger margin."""
+        return price < lower_price * self.out_of_range_lower or price > upper_price * self.out_of_range_upper
+
+    def new_range(self, price: Decimal) -> tuple[Decimal, Decimal]:
+        """Returns the (lower, upper) prices of a range re-centred on `price`."""
+        return price * self.range_lower, price * self.range_upper
+
+    def hedge_adjustment(self, target_short: Decimal, current_short: Decimal) -> Decimal:
+        """
+        Returns how much the short position must grow (positive) or shrink (negative) to get within
+        `hedge_rehedge_band` of `target_short`, or 0 if the difference is inside the hedge band.
+        """
+        amount_to_adjust = target_short - current_short
+        if abs(amount_to_adjust) > self.hedge_threshold:
+            return amount_to_adjust - self.hedge_rehedge_band if amount_to_adjust > 0 else amount_to_adjust + self.hedge_rehedge_band
+        return Decimal("0")
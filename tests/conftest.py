@@ -0,0 +1,96 @@
+"""
+Shared fixtures. The bot's modules live at the repository root, and Config loads its ABIs from abi/, so every
+test that builds a Config runs in a `mock_chain.workspace()`.
+"""
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_chain  # noqa: E402
+import tick_math  # noqa: E402
+from hedge_executor import MockExchangeClient  # noqa: E402
+from state_store import StateStore  # noqa: E402
+from uniswap_lp_bot import BlockchainClient, Config, DerivativesManager, LiquidityManagerBot  # noqa: E402
+from v3_simulator import TRADER_ADDRESS, MarketSimulation, deploy_simulator  # noqa: E402
+
+
+def pytest_configure(config):
+    # web3's process_receipt warns about every log of a receipt emitted by another contract than the one decoding it
+    config.addinivalue_line("filterwarnings", "ignore:The log with transaction hash:UserWarning")
+
+
+@pytest.fixture
+def workspace():
+    with mock_chain.workspace() as directory:
+        yield directory
+
+
+class SimulatedMarket:
+    """A bot trading against v3_simulator's pool, with a mock exchange for its hedge (see `simulated_market`)."""
+    def __init__(self, config, chain, deployment, simulation, bot, exchange):
+        self.config = config
+        self.chain = chain
+        self.deployment = deployment
+        self.pool = deployment.pool
+        self.simulation = simulation
+        self.bot = bot
+        self.exchange = exchange
+
+    def price(self) -> Decimal:
+        return tick_math.sqrt_price_x96_to_price(self.pool.sqrt_price_x96, 18, 6)
+
+    def open_position(self, token0_amount: int = 10 * 10**18) -> int:
+        """Mints the bot's position over the strategy's range around the pool price, holding `token0_amount` raw TOKEN0."""
+        lower_price, upper_price = self.config.STRATEGY.new_range(self.price())
+        lower_tick, upper_tick = self.bot.lp_manager.calculate_tick_range(lower_price, upper_price)
+        sqrt_lower = tick_math.get_sqrt_ratio_at_tick(lower_tick)
+        sqrt_upper = tick_math.get_sqrt_ratio_at_tick(upper_tick)
+        liquidity = tick_math.get_liquidity_for_amount0(self.pool.sqrt_price_x96, sqrt_upper, token0_amount)
+        amount0, amount1 = tick_math.get_amounts_for_liquidity(self.pool.sqrt_price_x96, sqrt_lower, sqrt_upper, liquidity)
+        self.bot.position_token_id = self.bot.lp_manager.provide_liquidity(
+            Decimal(amount0) / 10**18, Decimal(amount1) / 10**6, lower_price, upper_price, (lower_tick, upper_tick))
+        self.bot._save_position_id(self.bot.position_token_id)
+        return self.bot.position_token_id
+
+    def move_price(self, price: Decimal):
+        """Swaps the pool to `price` in one block, then mines blocks at it until the decision TWAP has caught up."""
+        sqrt_price_x96 = tick_math.price_to_sqrt_price_x96(price, 18, 6)
+        for _ in range(self.config.TWAP_DECISION_WINDOW_SECONDS // self.simulation.seconds_per_block + 1):
+            self.chain.advance(self.simulation.seconds_per_block, blocks=0)
+            self.chain.execute(TRADER_ADDRESS, self.simulation.swap_to, sqrt_price_x96)
+
+
+@pytest.fixture
+def simulated_market(workspace):
+    """
+    Builds a `SimulatedMarket`: a WETH/USDC pool at 3000 with depth, the bot's wallet funded with both tokens, and a
+    bot with a MockExchangeClient hedge, the fixed strategy range and no per-child hedge delay.
+    Call it with Config attribute overrides, e.g. `simulated_market(ATOMIC_REBALANCE=False)`.
+    """
+    def build(seed: int = 0, volatility: float = 0.8, **overrides) -> SimulatedMarket:
+        config = Config()
+        config.PRIVATE_KEY = mock_chain.TEST_PRIVATE_KEY
+        config.WALLET_ADDRESS = mock_chain.TEST_ADDRESS
+        config.TOKEN0_ADDRESS_SYMBOL = "WETH"
+        config.TOKEN1_ADDRESS_SYMBOL = "USDC"
+        config.METRICS_PORT = 0
+        config.OPTIMIZE_RANGE = False
+        config.HEDGE_CHILD_INTERVAL_SECONDS = 0
+        for name, value in overrides.items():
+            setattr(config, name, value)
+        chain = mock_chain.MockChain(start_time=1_700_000_000)
+        deployment = deploy_simulator(chain, config, tick_math.price_to_sqrt_price_x96(Decimal(3000), 18, 6))
+        for token in (deployment.token0, deployment.token1):
+            token.mint_to(config.WALLET_ADDRESS, 10**30)
+        simulation = MarketSimulation(chain, deployment, volatility=volatility, volume_per_block=20_000 * 10**6, seed=seed)
+        client = BlockchainClient(config, provider=mock_chain.MockProvider(chain))
+        store = StateStore(config.STATE_DB_FILE)
+        exchange = MockExchangeClient({config.SHORT_TOKEN_SYMBOL: Decimal(3000)})
+        bot = LiquidityManagerBot(client, DerivativesManager(config, store, client=exchange), store)
+        return SimulatedMarket(config, chain, deployment, simulation, bot, exchange)
+
+    return build
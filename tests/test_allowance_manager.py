@@ -0,0 +1,52 @@
+from allowance_manager import AllowanceManager
+
+
+def test_zero_reset_token_is_approved_from_zero(simulated_market):
+    market = simulated_market(APPROVAL_MODE="exact")
+    token = market.config.TOKEN1_ADDRESS
+    market.config.APPROVAL_ZERO_RESET_TOKENS = {token}
+    client = market.bot.blockchain_client
+    allowances = AllowanceManager(client, market.config.UNISWAP_SWAP_ROUTER_ADDRESS, "exact", market.config.ALLOWANCE_CACHE_FILE)
+
+    first = allowances.reserve({token: 100})
+    allowances.settle(first, {})
+    assert len(first.approvals) == 1
+
+    second = allowances.reserve({token: 500})
+    allowances.settle(second, {})
+
+    # A reset to 0, then the approval
+    assert len(second.approvals) == 2
+    assert allowances.get_allowance(token) == 500
+    assert market.deployment.token1.allowance(market.config.WALLET_ADDRESS, market.config.UNISWAP_SWAP_ROUTER_ADDRESS) == 500
+
+
+def test_cache_catches_up_with_outside_approvals(simulated_market):
+    # Chunks of 2 blocks, so the Approval logs take several eth_getLogs requests
+    market = simulated_market(APPROVAL_MODE="exact", INGEST_CHUNK_BLOCKS=2)
+    token = market.config.TOKEN0_ADDRESS
+    client = market.bot.blockchain_client
+    spender = market.config.UNISWAP_SWAP_ROUTER_ADDRESS
+    allowances = AllowanceManager(client, spender, "exact", market.config.ALLOWANCE_CACHE_FILE)
+    allowances.settle(allowances.reserve({token: 100}), {})
+
+    # Approved from a wallet UI while the bot was stopped
+    market.simulation.run(blocks=5)
+    client.send_transaction(client.get_contract(token, market.config.ERC20_ABI).functions.approve(spender, 7))
+    market.simulation.run(blocks=5)
+
+    restarted = AllowanceManager(client, spender, "exact", market.config.ALLOWANCE_CACHE_FILE)
+    assert restarted.get_allowance(token) == 7
+
+
+def test_old_cache_is_read_again(simulated_market):
+    market = simulated_market(APPROVAL_MODE="exact", ALLOWANCE_SYNC_MAX_BLOCKS=3)
+    token = market.config.TOKEN0_ADDRESS
+    client = market.bot.blockchain_client
+    spender = market.config.UNISWAP_SWAP_ROUTER_ADDRESS
+    allowances = AllowanceManager(client, spender, "exact", market.config.ALLOWANCE_CACHE_FILE)
+    allowances.settle(allowances.reserve({token: 100}), {})
+    market.simulation.run(blocks=5)
+
+    restarted = AllowanceManager(client, spender, "exact", market.config.ALLOWANCE_CACHE_FILE)
+    assert restarted.get_allowance(token) == 100
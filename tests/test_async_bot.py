@@ -0,0 +1,25 @@
+from async_bot import AsyncLiquidityManagerBot
+from uniswap_lp_bot import LiquidityManagerBot
+
+
+def test_async_read_matches_the_sync_snapshot(simulated_market):
+    market = simulated_market()
+    market.open_position()
+    market.simulation.run(blocks=10)
+    market.bot.run_cycle()
+    bot = market.bot
+    async_bot = AsyncLiquidityManagerBot(bot.blockchain_client, bot.derivatives_manager, bot.state_store)
+    # The first read learns the position's ticks, so both reads below include its fee growth
+    async_bot.read_cycle_state(bot.position_token_id)
+
+    expected = LiquidityManagerBot.read_cycle_state(async_bot, bot.position_token_id)
+    snapshot = async_bot.io_loop.run(async_bot.read_cycle_state_async(bot.position_token_id))
+
+    assert snapshot.block_number == expected.block_number == market.chain.block_number
+    assert tuple(snapshot.position_info) == tuple(expected.position_info)
+    assert (snapshot.sqrt_price_x96, snapshot.tick) == (expected.sqrt_price_x96, expected.tick)
+    assert snapshot.token0_round_data == expected.token0_round_data
+    assert snapshot.uncollected_fees == expected.uncollected_fees is not None
+    assert vars(snapshot.twap) == vars(expected.twap)
+    # Read alongside the chain batch, from the hedge executor's position view
+    assert snapshot.hedge_position == bot.derivatives_manager.get_short_size(market.config.SHORT_TOKEN_SYMBOL)
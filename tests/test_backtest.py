@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+import numpy as np
+
+import tick_math
+from backtest import run_backtest, tick_aligned_range
+from block_recorder import HistoryReader
+from strategy import StrategyParams
+from v3_simulator import MarketSimulation
+
+
+def test_fees_of_a_recorded_path_match_the_simulated_pool(simulated_market):
+    market = simulated_market(RECORDER_DIR="history")
+    bot = market.bot
+    token_id = market.open_position()
+    position_info = bot.read_cycle_state(token_id).position_info
+    # No noise volume: the position only earns the fees of the price path crossing it
+    simulation = MarketSimulation(market.chain, market.deployment)
+
+    def record(block_number):
+        bot.record_block(block_number, market.pool.sqrt_price_x96, market.pool.tick, position_info, None)
+
+    record(market.chain.block_number)
+    # 3000 up to 3250 in 25 blocks, inside the position's range
+    simulation.replay([tick_math.price_to_sqrt_price_x96(Decimal(3000 + 10 * step), 18, 6) for step in range(1, 26)], on_block=record)
+    bot.close()
+    prices = HistoryReader("history").column("price")
+    sqrt_lower, sqrt_upper = (tick_math.get_sqrt_ratio_at_tick(tick) for tick in position_info[5:7])
+    amount0, amount1 = tick_math.get_amounts_for_liquidity(tick_math.price_to_sqrt_price_x96(Decimal(prices[0]), 18, 6),
+                                                           sqrt_lower, sqrt_upper, position_info[7])
+
+    result = run_backtest(prices, market.config.STRATEGY, market.config.POOL_FEE, initial_capital=amount0 / 1e18 * prices[0] + amount1 / 1e6)
+
+    fees0, fees1 = bot.read_cycle_state(token_id).uncollected_fees
+    assert len(prices) == 26
+    assert result.rebalance_indices == []
+    # A rising price only brings TOKEN1 in
+    assert fees0 == 0 and fees1 > 0
+    assert abs(result.fees[-1] - fees1 / 1e6) <= 1e-6 * result.fees[-1]
+
+
+def test_rebalances_follow_the_trigger_over_a_known_path():
+    params = StrategyParams()
+    # 3000 up to 3490, then down to 2700, 10 USDC per step
+    prices = np.concatenate([np.arange(3000.0, 3500.0, 10.0), np.arange(3490.0, 2690.0, -10.0)])
+
+    result = run_backtest(prices, params)
+
+    # Up through the first range's upper trigger, then down through the lower trigger of the range minted there
+    _, upper = tick_aligned_range(prices[0], params, 3000, 18, 6)
+    first = int(np.argmax(prices > upper * float(params.out_of_range_upper)))
+    lower, _ = tick_aligned_range(prices[first], params, 3000, 18, 6)
+    second = first + int(np.argmax(prices[first:] < lower * float(params.out_of_range_lower)))
+    assert result.rebalance_indices == [first, second]
+    assert result.summary()["rebalances"] == 2
+    # Above the range but short of the trigger, the position earns nothing
+    assert not result.in_range[first - 1]
+    assert result.fees[first - 1] == result.fees[first - 2]
+    assert np.all(np.diff(result.fees) >= 0)
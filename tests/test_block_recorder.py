@@ -0,0 +1,33 @@
+from block_recorder import BlockRecorder, HistoryReader
+
+
+def test_rows_are_published_every_flush_rows(tmp_path):
+    recorder = BlockRecorder(str(tmp_path), segment_rows=16, flush_rows=3, flush_seconds=3600)
+    for block_number in (1, 2):
+        recorder.append(block_number, price=3000.0)
+    assert len(HistoryReader(str(tmp_path))) == 0
+
+    recorder.append(3, price=3001.0)
+    assert list(HistoryReader(str(tmp_path)).column("block_number")) == [1, 2, 3]
+
+    recorder.append(4, price=3002.0)
+    recorder.flush()
+    assert list(HistoryReader(str(tmp_path)).column("price")) == [3000.0, 3000.0, 3001.0, 3002.0]
+
+
+def test_rows_are_published_after_flush_seconds(tmp_path):
+    recorder = BlockRecorder(str(tmp_path), segment_rows=16, flush_rows=100, flush_seconds=0)
+    recorder.append(1, price=3000.0)
+    assert len(HistoryReader(str(tmp_path))) == 1
+
+
+def test_reopened_recorder_continues_the_history(tmp_path):
+    recorder = BlockRecorder(str(tmp_path), segment_rows=2, flush_rows=1)
+    for block_number in (1, 2, 3):
+        recorder.append(block_number)
+
+    reopened = BlockRecorder(str(tmp_path), segment_rows=2, flush_rows=1)
+    assert reopened.last_block == 3
+    reopened.append(3) # Same block: replaces the last row
+    reopened.append(4)
+    assert list(HistoryReader(str(tmp_path)).column("block_number")) == [1, 2, 3, 4]
@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+import tick_math
+
+
+def exchange_short(market) -> Decimal:
+    return -market.exchange.positions.get(market.config.SHORT_TOKEN_SYMBOL, Decimal("0"))
+
+
+def position_token0(market, snapshot) -> Decimal:
+    info = snapshot.position_info
+    amount0, _ = tick_math.get_amounts_for_liquidity(snapshot.sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(info[5]),
+                                                      tick_math.get_sqrt_ratio_at_tick(info[6]), info[7])
+    return Decimal(amount0) / 10**18
+
+
+def test_cycle_inside_the_range_holds_and_hedges(simulated_market):
+    market = simulated_market(volatility=0.1)
+    token_id = market.open_position()
+    market.simulation.run(blocks=20)
+
+    snapshot, hedged_short = market.bot.run_cycle()
+
+    assert market.bot.position_token_id == token_id
+    # The first cycle opens the short against the TOKEN0 the position holds
+    assert abs(hedged_short - position_token0(market, snapshot)) <= market.config.STRATEGY.hedge_threshold
+    assert exchange_short(market) == hedged_short
+
+
+def test_cycle_follows_the_price_out_of_the_range(simulated_market):
+    market = simulated_market()
+    token_id = market.open_position()
+    market.bot.run_cycle()
+    market.move_price(Decimal(3000) * Decimal("0.8"))
+
+    snapshot, hedged_short = market.bot.run_cycle()
+
+    assert market.bot.position_token_id != token_id
+    assert snapshot.position_info[5] <= snapshot.tick < snapshot.position_info[6]
+    assert exchange_short(market) == hedged_short
+
+
+def test_cycle_rehedges_as_the_price_moves_inside_the_range(simulated_market):
+    market = simulated_market()
+    token_id = market.open_position()
+    _, first_short = market.bot.run_cycle()
+    market.move_price(Decimal(3000) * Decimal("1.05"))
+
+    snapshot, hedged_short = market.bot.run_cycle()
+
+    # Higher up the range the position holds less TOKEN0, so the short is bought back to match
+    assert market.bot.position_token_id == token_id
+    assert hedged_short < first_short
+    assert abs(hedged_short - position_token0(market, snapshot)) <= market.config.STRATEGY.hedge_threshold
+    assert exchange_short(market) == hedged_short
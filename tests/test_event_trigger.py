@@ -0,0 +1,147 @@
+from decimal import Decimal
+
+import tick_math
+from event_trigger import CycleTrigger, PollingEventSource, PoolEvent
+from strategy import StrategyParams
+from uniswap_lp_bot import CycleSnapshot
+from v3_simulator import TRADER_ADDRESS
+
+PRICE = Decimal(3000)
+
+
+def armed_trigger(hedged_short, hedge_retry_seconds=60, rebalance_retry_seconds=60):
+    # A WETH/USDC position of liquidity 10**15 on [2700, 3300], snapshot at block 100
+    lower = tick_math.price_to_tick(PRICE * Decimal("0.9"), 18, 6)
+    upper = tick_math.price_to_tick(PRICE * Decimal("1.1"), 18, 6)
+    position_info = (0, None, None, None, 500, lower, upper, 10**15, 0, 0, 0, 0)
+    sqrt_price_x96 = tick_math.price_to_sqrt_price_x96(PRICE, 18, 6)
+    snapshot = CycleSnapshot(100, position_info, sqrt_price_x96, tick_math.price_to_tick(PRICE, 18, 6), None)
+    trigger = CycleTrigger(StrategyParams(), 18, 6, hedge_retry_seconds, rebalance_retry_seconds)
+    trigger.arm(snapshot, hedged_short)
+    return trigger
+
+
+def swap_at(block_number, price):
+    return PoolEvent(block_number, tick_math.price_to_sqrt_price_x96(price, 18, 6), tick_math.price_to_tick(price, 18, 6))
+
+
+def test_events_the_snapshot_includes_are_ignored():
+    trigger = armed_trigger(Decimal("1"))
+
+    assert not trigger.update(swap_at(99, PRICE * 2))
+    assert not trigger.update(swap_at(100, PRICE * 2))
+    assert not trigger.needs_rebalance()
+    assert trigger.update(PoolEvent(100))
+    assert trigger.update(swap_at(101, PRICE * 2))
+    assert trigger.needs_rebalance()
+    assert trigger.block_number == 101
+
+
+def test_unevaluated_hedge_backs_off():
+    trigger = armed_trigger(None)
+    trigger.update(swap_at(101, PRICE))
+    assert not trigger.needs_hedge()
+
+    trigger = armed_trigger(None, hedge_retry_seconds=0)
+    assert trigger.needs_hedge()
+
+
+def test_unevaluated_hedge_keeps_the_last_known_short():
+    trigger = armed_trigger(Decimal("1"))
+    band = trigger.hedge_low_x96, trigger.hedge_high_x96
+    trigger.arm(CycleSnapshot(101, trigger.position_info, trigger.sqrt_price_x96, trigger.tick, None), None)
+
+    assert trigger.hedged_short == Decimal("1")
+    assert (trigger.hedge_low_x96, trigger.hedge_high_x96) == band
+
+
+def test_rebalance_a_cycle_left_pending_backs_off():
+    # A cycle re-armed from a snapshot outside the trigger couldn't rebalance
+    for retry_seconds, retried in ((60, False), (0, True)):
+        trigger = armed_trigger(Decimal("1"), rebalance_retry_seconds=retry_seconds)
+        out = swap_at(101, PRICE * 2)
+        trigger.arm(CycleSnapshot(101, trigger.position_info, out.sqrt_price_x96, out.tick, None), Decimal("1"), after_cycle=True)
+
+        assert trigger.update(swap_at(102, PRICE * 2))
+        assert trigger.needs_rebalance() == retried
+
+
+def test_deferred_rebalance_is_not_retried_on_the_next_swap(simulated_market):
+    market = simulated_market(volatility=0.1, TWAP_WINDOWS=(60,))
+    token_id = market.open_position()
+    # Enough observations for the decision TWAP
+    market.pool.increaseObservationCardinalityNext(100)
+    market.simulation.run(blocks=market.config.TWAP_DECISION_WINDOW_SECONDS // market.simulation.seconds_per_block + 1)
+    market.bot.run_cycle()
+    # A push out of the range in one block: the price is far from the TWAP, so the rebalance is deferred
+    pushed = tick_math.price_to_sqrt_price_x96(PRICE * Decimal("0.8"), 18, 6)
+    market.chain.advance(market.simulation.seconds_per_block, blocks=0)
+    market.chain.execute(TRADER_ADDRESS, market.simulation.swap_to, pushed)
+    trigger = CycleTrigger(market.config.STRATEGY, 18, 6)
+
+    snapshot, hedged_short = market.bot.run_cycle()
+    trigger.arm(snapshot, hedged_short, after_cycle=True)
+
+    assert market.bot.position_token_id == token_id
+    assert trigger.update(PoolEvent(snapshot.block_number + 1, pushed - 1, snapshot.tick))
+    assert not trigger.needs_rebalance()
+
+
+def polling_source(market):
+    source = PollingEventSource(market.bot.blockchain_client.w3, market.pool.address, 1)
+    source._last_block = market.chain.block_number
+    source._filter = source._install_filter()
+    return source
+
+
+def queued(source):
+    events = []
+    while not source.events.empty():
+        events.append(source.events.get())
+    return events
+
+
+def test_polling_queues_a_block_event_per_poll_with_a_filter(simulated_market):
+    market = simulated_market()
+    source = polling_source(market)
+    market.simulation.run(blocks=3)
+
+    logs = source._poll()
+
+    assert source._filter is not None
+    assert logs and all(log["blockNumber"] > market.chain.block_number - 3 for log in logs)
+    assert [event.block_number for event in queued(source)] == [market.chain.block_number]
+    assert source._poll() == []
+    assert queued(source) == []
+
+
+def test_polling_reinstalls_a_dropped_filter_and_catches_up(simulated_market):
+    market = simulated_market()
+    source = polling_source(market)
+    provider = market.bot.blockchain_client.w3.provider
+    provider.filters.clear()
+    market.simulation.run(blocks=3)
+
+    logs = source._poll()
+
+    # The swaps mined while the filter was gone come from eth_getLogs, and the next poll uses the new filter
+    assert len(logs) == len(market.chain.get_logs({"address": market.pool.address, "fromBlock": market.chain.block_number - 2}))
+    assert [event.block_number for event in queued(source)] == [market.chain.block_number]
+    assert len(provider.filters) == 1
+    market.simulation.run(blocks=1)
+    assert source._poll()
+    assert provider.calls["eth_getLogs"] == 1
+
+
+def test_warm_start_replays_the_swaps_since_the_stored_cycle(simulated_market):
+    # Chunks of 3 blocks, so the replay takes several eth_getLogs requests
+    market = simulated_market(INGEST_CHUNK_BLOCKS=3)
+    market.open_position()
+    market.bot.run_cycle()
+    market.simulation.run(blocks=10)
+    trigger = CycleTrigger(market.config.STRATEGY, 18, 6)
+
+    assert market.bot.warm_start(trigger)
+
+    assert trigger.sqrt_price_x96 == market.pool.sqrt_price_x96
+    assert trigger.block_number == market.chain.block_number
@@ -0,0 +1,15 @@
+import pytest
+
+
+def test_only_successful_transactions_size_gas_limits(simulated_market):
+    market = simulated_market()
+    client = market.bot.blockchain_client
+    router = client.get_contract(market.config.UNISWAP_SWAP_ROUTER_ADDRESS, market.config.UNISWAP_SWAP_ROUTER_ABI)
+    config = market.config
+    expired = router.functions.exactInputSingle(
+        (config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE, config.WALLET_ADDRESS, 0, 10**18, 0, 0))
+
+    with pytest.raises(Exception, match="Transaction failed"):
+        client.send_transaction(expired, gas_limit=5_000_000)
+
+    assert client.fee_engine.cached_gas_limit(expired) is None
@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+import pytest
+
+from hedge_executor import HedgeExecutor, MockExchangeClient
+from strategy import StrategyParams
+
+
+def test_large_adjustment_is_sliced_into_child_orders():
+    client = MockExchangeClient()
+    executor = HedgeExecutor(client, max_child_size=Decimal("1"))
+
+    executor.submit("ETH", Decimal("-2.5"))
+
+    assert [(side, amount) for _, side, amount, _ in client.fills] == [("SELL", Decimal("1")), ("SELL", Decimal("1")), ("SELL", Decimal("0.5"))]
+    assert client.positions["ETH"] == Decimal("-2.5")
+
+
+def test_adjustment_submitted_while_working_is_netted():
+    client = MockExchangeClient()
+    submitted = []
+
+    def on_fill(symbol, side, amount, position):
+        # Another worker's opposite adjustment arrives after the first child filled
+        if not submitted:
+            submitted.append(True)
+            executor.submit(symbol, Decimal("2"))
+
+    executor = HedgeExecutor(client, max_child_size=Decimal("1"), on_fill=on_fill)
+    executor.submit("ETH", Decimal("-3"))
+
+    # -3 + 2 leaves -1: one child was sent before the netting, and nothing after it
+    assert len(client.fills) == 1
+    assert client.positions["ETH"] == Decimal("-1")
+
+
+def test_position_view_follows_fills_without_reading_the_exchange():
+    client = MockExchangeClient()
+    executor = HedgeExecutor(client)
+    assert executor.position("ETH") == 0
+
+    executor.submit("ETH", Decimal("-2"))
+
+    assert executor.position("ETH") == Decimal("-2")
+    assert client.api_calls["get_current_position"] == 1
+
+
+def test_rehedge_band_stops_short_of_the_target():
+    strategy = StrategyParams(hedge_threshold=Decimal("0.1"), hedge_rehedge_band=Decimal("0.04"))
+
+    assert strategy.hedge_adjustment(Decimal("1.05"), Decimal("1")) == 0
+    assert strategy.hedge_adjustment(Decimal("1.5"), Decimal("1")) == Decimal("0.46")
+    assert strategy.hedge_adjustment(Decimal("0.5"), Decimal("1")) == Decimal("-0.46")
+
+
+def test_rehedge_band_must_be_inside_the_threshold():
+    with pytest.raises(ValueError):
+        StrategyParams(hedge_threshold=Decimal("0.1"), hedge_rehedge_band=Decimal("0.1"))
+    with pytest.raises(ValueError):
+        StrategyParams(hedge_rehedge_band=Decimal("-0.01"))
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import requests
+
+from log_ingester import LogIngester, is_range_error
+from state_store import StateStore
+
+POOL_ADDRESS = "0x" + "11" * 20
+
+
+def http_error(status: int, body: str) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    response._content = body.encode()
+    return requests.exceptions.HTTPError(f"{status} Client Error for url: https://node.example", response=response)
+
+
+def test_range_errors_are_told_from_transient_ones():
+    assert is_range_error({"code": -32005, "message": "query returned more than 10000 results"})
+    assert is_range_error(http_error(400, '{"error": {"message": "Log response size exceeded. Use up to a 2K block range"}}'))
+    assert is_range_error(http_error(413, ""))
+    assert not is_range_error({"code": -32016, "message": "rate limit exceeded"})
+    assert not is_range_error(http_error(429, "Too many requests"))
+    assert not is_range_error(requests.exceptions.ConnectionError("Max retries exceeded with url"))
+
+
+class RangeLimitedProvider:
+    """Answers eth_getLogs with no logs, raising an HTTP 400 for ranges over `max_blocks` like some hosted nodes."""
+    def __init__(self, max_blocks: int):
+        self.max_blocks = max_blocks
+        self.requests = 0
+
+    def make_request(self, method, params):
+        self.requests += 1
+        blocks = int(params[0]["toBlock"], 16) - int(params[0]["fromBlock"], 16) + 1
+        if blocks > self.max_blocks:
+            raise http_error(400, f'{{"error": {{"message": "eth_getLogs is limited to a {self.max_blocks} block range"}}}}')
+        return {"result": []}
+
+
+def test_http_range_error_splits_the_chunk(tmp_path):
+    provider = RangeLimitedProvider(100)
+    ingester = LogIngester(SimpleNamespace(provider=provider), StateStore(str(tmp_path / "state.db")), POOL_ADDRESS,
+                           workers=2, chunk_blocks=1000)
+
+    ingester.run(0, 999)
+
+    # Split instead of retried: the chunk size never grows back to a rejected one, and every block got ingested
+    assert ingester.max_chunk_blocks < 1000
+    assert ingester.missing_ranges(0, 999) == []
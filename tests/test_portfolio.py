@@ -0,0 +1,98 @@
+import json
+from decimal import Decimal
+
+import tick_math
+from portfolio import PortfolioManager
+from v3_simulator import SimulatedPool
+from web3 import Web3
+
+SECOND_FEE = 500
+
+
+def portfolio(market) -> PortfolioManager:
+    """
+    A portfolio of two positions on the bot's wallet: one in the simulated pool, one in a second WETH/USDC pool
+    (0.05% fee, no other liquidity) at the same price. Both are hedged on the same contract.
+    """
+    first_id = market.open_position()
+    pool = market.chain.deploy(SimulatedPool(market.chain, Web3.to_checksum_address("0x" + "05" * 20), market.config.TOKEN0_ADDRESS,
+                                             market.config.TOKEN1_ADDRESS, SECOND_FEE, market.pool.sqrt_price_x96))
+    market.deployment.factory.add_pool(pool)
+    bot = market.bot
+    manager = PortfolioManager(blockchain_client=bot.blockchain_client, derivatives_manager=bot.derivatives_manager, state_store=bot.state_store)
+    # 5 WETH and the matching USDC over the strategy's range
+    lp_manager = manager.get_pool_bot(market.config.TOKEN0_ADDRESS, market.config.TOKEN1_ADDRESS, SECOND_FEE).lp_manager
+    lower_price, upper_price = market.config.STRATEGY.new_range(market.price())
+    tick_range = lp_manager.calculate_tick_range(lower_price, upper_price)
+    sqrt_lower, sqrt_upper = (tick_math.get_sqrt_ratio_at_tick(tick) for tick in tick_range)
+    liquidity = tick_math.get_liquidity_for_amount0(pool.sqrt_price_x96, sqrt_upper, 5 * 10**18)
+    amount0, amount1 = tick_math.get_amounts_for_liquidity(pool.sqrt_price_x96, sqrt_lower, sqrt_upper, liquidity)
+    second_id = lp_manager.provide_liquidity(Decimal(amount0) / 10**18, Decimal(amount1) / 10**6, lower_price, upper_price, tick_range)
+    with open(market.config.PORTFOLIO_FILE, "w") as f:
+        json.dump({"positions": [first_id, second_id]}, f)
+    manager.load()
+    return manager
+
+
+def token0_held(snapshot) -> Decimal:
+    info = snapshot.position_info
+    amount0, _ = tick_math.get_amounts_for_liquidity(snapshot.sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(info[5]),
+                                                      tick_math.get_sqrt_ratio_at_tick(info[6]), info[7])
+    return Decimal(amount0) / 10**18
+
+
+def test_two_pools_are_hedged_as_one_netted_short(simulated_market):
+    market = simulated_market(volatility=0.1)
+    manager = portfolio(market)
+    symbol = market.config.SHORT_TOKEN_SYMBOL
+
+    hedged_shorts = manager.run_cycle()
+
+    snapshots = manager.read_state()
+    held = sum(token0_held(snapshot) for snapshot in snapshots.values())
+    assert list(hedged_shorts) == [symbol]
+    assert abs(hedged_shorts[symbol] - held) <= market.config.STRATEGY.hedge_threshold
+    assert -market.exchange.positions[symbol] == hedged_shorts[symbol]
+    # One adjustment for the net exposure of both positions, sent as child orders of at most HEDGE_MAX_CHILD_SIZE
+    assert {side for _, side, _, _ in market.exchange.fills} == {"SELL"}
+    assert sum(amount for _, _, amount, _ in market.exchange.fills) == hedged_shorts[symbol]
+
+
+def test_one_pool_rebalances_while_the_other_holds(simulated_market):
+    market = simulated_market()
+    manager = portfolio(market)
+    first_id, second_id = (position.position_token_id for position in manager.positions)
+    manager.run_cycle()
+    market.move_price(Decimal(3000) * Decimal("0.8"))
+
+    manager.run_cycle()
+
+    assert manager.positions[0].position_token_id not in (first_id, second_id)
+    assert manager.positions[1].position_token_id == second_id
+    with open(market.config.PORTFOLIO_FILE) as f:
+        assert json.load(f)["positions"] == [manager.positions[0].position_token_id, second_id]
+    # Positions keep their own per-position state
+    assert manager.positions[0]._deferred_rebalances is not manager.positions[1]._deferred_rebalances
+
+
+def test_a_failed_rebalance_rereads_the_position_before_hedging(simulated_market):
+    market = simulated_market()
+    manager = portfolio(market)
+    first, second = manager.positions
+    symbol = market.config.SHORT_TOKEN_SYMBOL
+
+    def remove_then_fail(token_id, position_info, *args, **kwargs):
+        # The liquidity comes out, then the new position can't be minted
+        market.chain.execute(market.config.WALLET_ADDRESS, market.deployment.nft_manager.decreaseLiquidity,
+                             (token_id, position_info[7], 0, 0, market.chain.timestamp + 600))
+        raise Exception("mint failed")
+
+    first.lp_manager.rebalance_position = remove_then_fail
+    market.move_price(Decimal(3000) * Decimal("0.8"))
+
+    hedged_shorts = manager.run_cycle()
+
+    # The emptied position holds no TOKEN0, so only the second pool's position is hedged
+    snapshots = manager.read_state()
+    assert snapshots[first.position_token_id].position_info[7] == 0
+    assert abs(hedged_shorts[symbol] - token0_held(snapshots[second.position_token_id])) <= market.config.STRATEGY.hedge_threshold
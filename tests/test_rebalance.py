@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import tick_math
+
+
+def test_price_leaving_the_range_mints_a_new_position(simulated_market):
+    market = simulated_market()
+    old_token_id = market.open_position()
+    market.move_price(Decimal(3000) * Decimal("1.15"))
+
+    snapshot, hedged_short = market.bot.run_cycle()
+
+    new_token_id = market.bot.position_token_id
+    assert new_token_id != old_token_id
+    assert market.bot.state_store.active_position(market.config.TOKEN0_ADDRESS, market.config.TOKEN1_ADDRESS, market.config.POOL_FEE) == new_token_id
+    position_info = snapshot.position_info
+    assert position_info[7] > 0
+    assert position_info[5] <= snapshot.tick < position_info[6]
+    # The old range held only TOKEN1; the swap gave the new one both tokens, with little left idle
+    amount0, amount1 = tick_math.get_amounts_for_liquidity(snapshot.sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(position_info[5]),
+                                                           tick_math.get_sqrt_ratio_at_tick(position_info[6]), position_info[7])
+    value = Decimal(amount0) / 10**18 * market.price() + Decimal(amount1) / 10**6
+    assert amount0 > 0 and amount1 > 0
+    assert value > Decimal(3000) * 20 * Decimal("0.95")
+    # The cycle went on to hedge the new position
+    assert hedged_short is not None and hedged_short > 0
+
+
+def test_non_atomic_rebalance_swaps_too(simulated_market):
+    market = simulated_market(ATOMIC_REBALANCE=False)
+    old_token_id = market.open_position()
+    market.move_price(Decimal(3000) * Decimal("0.85"))
+
+    snapshot, _ = market.bot.run_cycle()
+
+    assert market.bot.position_token_id != old_token_id
+    assert snapshot.position_info[5] <= snapshot.tick < snapshot.position_info[6]
+
+
+def test_failed_swap_restores_the_old_range(simulated_market):
+    # No swap can meet a negative slippage bound, so the collected tokens go back into the old range
+    market = simulated_market(REBALANCE_SWAP_SLIPPAGE=Decimal("-0.5"))
+    old_token_id = market.open_position()
+    old_info = market.bot.lp_manager.get_position_info(old_token_id)
+    market.move_price(Decimal(3000) * Decimal("1.15"))
+
+    snapshot, hedged_short = market.bot.run_cycle()
+
+    assert market.bot.position_token_id != old_token_id
+    assert snapshot.position_info[5:7] == old_info[5:7]
+    assert snapshot.position_info[7] > 0
+    assert hedged_short is not None
+
+
+def test_range_swap_lands_on_the_range_ratio(simulated_market):
+    market = simulated_market()
+    lp_manager = market.bot.lp_manager
+    sqrt_price_x96 = tick_math.price_to_sqrt_price_x96(Decimal(3450), 18, 6)
+    lower_tick, upper_tick = lp_manager.calculate_tick_range(Decimal(3100), Decimal(3800))
+    sqrt_lower, sqrt_upper = tick_math.get_sqrt_ratio_at_tick(lower_tick), tick_math.get_sqrt_ratio_at_tick(upper_tick)
+    for amount0, amount1 in ((0, 67_570 * 10**6), (20 * 10**18, 0), (5 * 10**18, 60_000 * 10**6)):
+        zero_for_one, amount_in = lp_manager.calculate_range_swap(amount0, amount1, sqrt_price_x96, lower_tick, upper_tick)
+        amount_out = lp_manager.quote_swap_output(zero_for_one, amount_in, sqrt_price_x96)
+        if zero_for_one:
+            amount0, amount1 = amount0 - amount_in, amount1 + amount_out
+        else:
+            amount0, amount1 = amount0 + amount_out, amount1 - amount_in
+        liquidity = tick_math.get_liquidity_for_amounts(sqrt_price_x96, sqrt_lower, sqrt_upper, amount0, amount1)
+        used0, used1 = tick_math.get_amounts_for_liquidity(sqrt_price_x96, sqrt_lower, sqrt_upper, liquidity)
+        assert used0 >= amount0 * Decimal("0.9999") and used1 >= amount1 * Decimal("0.9999")
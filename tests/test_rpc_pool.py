@@ -0,0 +1,51 @@
+import pytest
+from web3 import Web3
+
+import mock_chain
+from rpc_pool import ProviderPool
+
+RECIPIENT = "0x00000000000000000000000000000000000000b0"
+
+
+def token_chain():
+    """A chain with one token the test wallet holds, and a pool over two nodes of it."""
+    chain = mock_chain.MockChain()
+    token = chain.deploy(mock_chain.MockERC20(chain, "0x00000000000000000000000000000000000000a0", "TKN", 18))
+    token.mint_to(mock_chain.TEST_ADDRESS, 10**24)
+    nodes = [mock_chain.MockProvider(chain), mock_chain.MockProvider(chain)]
+    return chain, token, nodes, ProviderPool(nodes, hedge_after=0.05)
+
+
+def transfer(chain, token):
+    chain.execute(mock_chain.TEST_ADDRESS, token.transfer, RECIPIENT, 1)
+
+
+def test_filters_are_polled_on_the_node_that_installed_them(workspace):
+    chain, token, nodes, pool = token_chain()
+    w3 = Web3(pool)
+    log_filter = w3.eth.filter({"address": token.address})
+    # Reads now prefer the second node, and writes move to it
+    pool.endpoints[0].latency, pool.endpoints[1].latency = 1.0, 0.001
+    pool._move_sticky(pool.endpoints[0])
+    transfer(chain, token)
+
+    assert len(log_filter.get_new_entries()) == 1
+    assert w3.eth.uninstall_filter(log_filter.filter_id)
+
+    assert nodes[0].filters == {}
+    for method in ("eth_newFilter", "eth_getFilterChanges", "eth_uninstallFilter"):
+        assert nodes[0].calls[method] == 1
+        assert method not in nodes[1].calls
+
+
+def test_a_dropped_filter_is_reported_not_failed_over(workspace):
+    chain, token, nodes, pool = token_chain()
+    w3 = Web3(pool)
+    log_filter = w3.eth.filter({"address": token.address})
+    nodes[0].filters.clear()
+    transfer(chain, token)
+
+    with pytest.raises(ValueError, match="filter not found"):
+        log_filter.get_new_entries()
+    assert "eth_getFilterChanges" not in nodes[1].calls
+    assert pool._filters == {}
@@ -0,0 +1,93 @@
+from decimal import Context, Decimal
+
+import pytest
+
+import tick_math
+
+
+def encode_price_sqrt(reserve1: int, reserve0: int) -> int:
+    """The v3-core test helper: sqrt(reserve1 / reserve0) as a Q64.96, rounded down."""
+    context = Context(prec=60)
+    return int(context.multiply(context.sqrt(context.divide(Decimal(reserve1), Decimal(reserve0))), 2**96))
+
+
+TICKS = [tick_math.MIN_TICK, tick_math.MIN_TICK + 1, -200_000, -887, -60, -1, 0, 1, 60, 887, 200_000,
+         tick_math.MAX_TICK - 1, tick_math.MAX_TICK]
+
+
+# TickMath.spec.ts
+@pytest.mark.parametrize("tick, sqrt_ratio", [
+    (tick_math.MIN_TICK, 4295128739),
+    (tick_math.MIN_TICK + 1, 4295343490),
+    (0, 2**96),
+    (tick_math.MAX_TICK - 1, 1461373636630004318706518188784493106690254656249),
+    (tick_math.MAX_TICK, 1461446703485210103287273052203988822378723970342),
+])
+def test_sqrt_ratio_at_tick_matches_tick_math(tick, sqrt_ratio):
+    assert tick_math.get_sqrt_ratio_at_tick(tick) == sqrt_ratio
+
+
+def test_sqrt_ratio_at_tick_rejects_ticks_out_of_bounds():
+    for tick in (tick_math.MIN_TICK - 1, tick_math.MAX_TICK + 1):
+        with pytest.raises(ValueError):
+            tick_math.get_sqrt_ratio_at_tick(tick)
+
+
+@pytest.mark.parametrize("sqrt_ratio, tick", [
+    (tick_math.MIN_SQRT_RATIO, tick_math.MIN_TICK),
+    (tick_math.MIN_SQRT_RATIO + 1, tick_math.MIN_TICK),
+    (4295343490, tick_math.MIN_TICK + 1),
+    (2**96, 0),
+    (tick_math.MAX_SQRT_RATIO - 1, tick_math.MAX_TICK - 1),
+])
+def test_tick_at_sqrt_ratio_matches_tick_math(sqrt_ratio, tick):
+    assert tick_math.get_tick_at_sqrt_ratio(sqrt_ratio) == tick
+
+
+@pytest.mark.parametrize("tick", TICKS[:-1])
+def test_tick_round_trip(tick):
+    sqrt_ratio = tick_math.get_sqrt_ratio_at_tick(tick)
+    assert tick_math.get_tick_at_sqrt_ratio(sqrt_ratio) == tick
+    assert tick_math.get_tick_at_sqrt_ratio(tick_math.get_sqrt_ratio_at_tick(tick + 1) - 1) == tick
+
+
+# SqrtPriceMath.spec.ts
+def test_amount_deltas_match_sqrt_price_math():
+    sqrt_a, sqrt_b = encode_price_sqrt(1, 1), encode_price_sqrt(121, 100)
+    assert tick_math.get_amount0_delta(sqrt_a, sqrt_b, 10**18, True) == 90909090909090910
+    assert tick_math.get_amount0_delta(sqrt_a, sqrt_b, 10**18, False) == 90909090909090909
+    assert tick_math.get_amount1_delta(sqrt_a, sqrt_b, 10**18, True) == 100000000000000000
+    assert tick_math.get_amount1_delta(sqrt_a, sqrt_b, 10**18, False) == 99999999999999999
+
+
+# LiquidityAmounts.spec.ts: range [100/110, 110/100] with 100 token0 and 200 token1
+@pytest.mark.parametrize("sqrt_price, liquidity, amounts", [
+    (encode_price_sqrt(1, 1), 2148, (99, 99)),
+    (encode_price_sqrt(99, 110), 1048, (99, 0)),
+    (encode_price_sqrt(111, 100), 2097, (0, 199)),
+])
+def test_liquidity_amounts_match_liquidity_amounts(sqrt_price, liquidity, amounts):
+    sqrt_a, sqrt_b = encode_price_sqrt(100, 110), encode_price_sqrt(110, 100)
+    assert tick_math.get_liquidity_for_amounts(sqrt_price, sqrt_a, sqrt_b, 100, 200) == liquidity
+    assert tick_math.get_amounts_for_liquidity(sqrt_price, sqrt_a, sqrt_b, liquidity) == amounts
+
+
+@pytest.mark.parametrize("tick", [-200_000, -60, 0, 887, 200_000])
+def test_liquidity_round_trip(tick):
+    # A WETH/USDC-sized position on [tick - 6000, tick + 6000], with the price at `tick`
+    sqrt_price = tick_math.get_sqrt_ratio_at_tick(tick)
+    sqrt_a, sqrt_b = tick_math.get_sqrt_ratio_at_tick(tick - 6000), tick_math.get_sqrt_ratio_at_tick(tick + 6000)
+    liquidity = 10**18
+    amount0, amount1 = tick_math.get_amounts_for_liquidity(sqrt_price, sqrt_a, sqrt_b, liquidity)
+    # The amounts are rounded down, so they mint at most the liquidity they came from, and very nearly all of it
+    minted = tick_math.get_liquidity_for_amounts(sqrt_price, sqrt_a, sqrt_b, amount0, amount1)
+    assert liquidity - liquidity // 10**9 <= minted <= liquidity
+    used0, used1 = tick_math.get_amounts_for_liquidity(sqrt_price, sqrt_a, sqrt_b, minted)
+    assert used0 <= amount0 and used1 <= amount1
+
+
+@pytest.mark.parametrize("tick", [-276_325, -201_000, 0, 75_000])
+def test_price_round_trip(tick):
+    price = tick_math.tick_to_price(tick, 18, 6)
+    assert tick_math.price_to_tick(price, 18, 6) == tick
+    assert tick_math.sqrt_price_x96_to_price(tick_math.price_to_sqrt_price_x96(price, 18, 6), 18, 6) <= price
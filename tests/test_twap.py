@@ -0,0 +1,21 @@
+from twap import PoolTwap, TwapService, mean_tick
+
+
+def pool_twap(cardinality_next: int) -> PoolTwap:
+    return PoolTwap(100, 0, {}, None, cardinality_next, cardinality_next)
+
+
+def test_mean_tick_rounds_towards_negative_infinity():
+    assert mean_tick(0, 600, 60) == 10
+    assert mean_tick(0, -601, 60) == -11
+
+
+def test_cardinality_grows_within_the_gas_budget():
+    # One hour at 2 second blocks needs 1801 observations
+    service = TwapService(None, (60, 3600), 3600, 12, 2)
+    assert service.cardinality_target == 1801
+
+    assert service.next_cardinality(pool_twap(1)) == 1801
+    assert service.next_cardinality(pool_twap(1), max_gas=2_000_000) == 101
+    assert service.next_cardinality(pool_twap(1750), max_gas=2_000_000) == 1801
+    assert service.next_cardinality(pool_twap(1801), max_gas=2_000_000) is None
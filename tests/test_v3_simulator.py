@@ -0,0 +1,119 @@
+from decimal import Context, Decimal
+
+import pytest
+
+import mock_chain
+import tick_math
+from uniswap_lp_bot import Config
+from v3_simulator import LIQUIDITY_PROVIDER_ADDRESS, TRADER_ADDRESS, Q128, compute_swap_step, deploy_simulator
+
+
+def encode_price_sqrt(reserve1: int, reserve0: int) -> int:
+    """The v3-core test helper: sqrt(reserve1 / reserve0) as a Q64.96, rounded down."""
+    context = Context(prec=60)
+    return int(context.multiply(context.sqrt(context.divide(Decimal(reserve1), Decimal(reserve0))), 2**96))
+
+
+# SwapMath.spec.ts: (sqrtP, sqrtPTarget, liquidity, amountRemaining, feePips) -> (sqrtQ, amountIn, amountOut, feeAmount)
+SWAP_STEP_VECTORS = [
+    # Exact input capped at the price target, one for zero
+    ((encode_price_sqrt(1, 1), encode_price_sqrt(101, 100), 2 * 10**18, 10**18, 600),
+     (encode_price_sqrt(101, 100), 9975124224178055, 9925619580021728, 5988667735148)),
+    # Exact output capped at the price target, one for zero
+    ((encode_price_sqrt(1, 1), encode_price_sqrt(101, 100), 2 * 10**18, -10**18, 600),
+     (encode_price_sqrt(101, 100), 9975124224178055, 9925619580021728, 5988667735148)),
+    # Exact input fully spent, one for zero
+    ((encode_price_sqrt(1, 1), encode_price_sqrt(1000, 100), 2 * 10**18, 10**18, 600),
+     (None, 999400000000000000, 666399946655997866, 600000000000000)),
+    # Amount out capped at the desired amount out
+    ((417332158212080721273783715441582, 1452870262520218020823638996, 159344665391607089467575320103, -1, 1),
+     (417332158212080721273783715441581, 1, 1, 1)),
+    # Entire input amount taken as fee
+    ((2413, 79887613182836312, 1985041575832132834610021537970, 10, 1872), (2413, 0, 0, 10)),
+    # Intermediate insufficient liquidity, zero for one exact output
+    ((20282409603651670423947251286016, 20282409603651670423947251286016 * 11 // 10, 1024, -4, 3000),
+     (20282409603651670423947251286016 * 11 // 10, 26215, 0, 79)),
+    # Intermediate insufficient liquidity, one for zero exact output
+    ((20282409603651670423947251286016, 20282409603651670423947251286016 * 9 // 10, 1024, -263000, 3000),
+     (20282409603651670423947251286016 * 9 // 10, 1, 26214, 1)),
+]
+
+
+@pytest.mark.parametrize("args, expected", SWAP_STEP_VECTORS)
+def test_compute_swap_step_matches_swap_math(args, expected):
+    sqrt_next_x96, amount_in, amount_out, fee_amount = compute_swap_step(*args)
+    assert (amount_in, amount_out, fee_amount) == expected[1:]
+    if expected[0] is not None:
+        assert sqrt_next_x96 == expected[0]
+
+
+@pytest.fixture
+def pool(workspace):
+    """A 0.3% pool at price 1 without liquidity; the liquidity provider and the trader hold plenty of both tokens."""
+    config = Config()
+    config.POOL_FEE = 3000
+    chain = mock_chain.MockChain(start_time=1_700_000_000)
+    deployment = deploy_simulator(chain, config, encode_price_sqrt(1, 1), decimals1=18, depth_token0=0)
+    for token in (deployment.token0, deployment.token1):
+        token.mint_to(LIQUIDITY_PROVIDER_ADDRESS, 10**30)
+    return deployment.pool
+
+
+def mint(pool, tick_lower: int, tick_upper: int, liquidity: int):
+    pool.chain.execute(LIQUIDITY_PROVIDER_ADDRESS, pool.mint, LIQUIDITY_PROVIDER_ADDRESS, tick_lower, tick_upper, liquidity, LIQUIDITY_PROVIDER_ADDRESS)
+
+
+def swap(pool, zero_for_one: bool, amount_specified: int, limit: int | None = None) -> tuple[int, int]:
+    if limit is None:
+        limit = tick_math.MIN_SQRT_RATIO + 1 if zero_for_one else tick_math.MAX_SQRT_RATIO - 1
+    return pool.chain.execute(TRADER_ADDRESS, pool.swap, TRADER_ADDRESS, zero_for_one, amount_specified, limit, TRADER_ADDRESS)
+
+
+def test_swap_within_a_range_takes_one_step(pool):
+    mint(pool, -600, 600, 2 * 10**18)
+    sqrt_start_x96 = pool.sqrt_price_x96
+    sqrt_next_x96, amount_in, amount_out, fee_amount = compute_swap_step(sqrt_start_x96, tick_math.get_sqrt_ratio_at_tick(-600), 2 * 10**18, 10**15, 3000)
+    token0, token1 = (pool.chain.contracts[token] for token in (pool.token0(), pool.token1()))
+    balances = token0.balanceOf(TRADER_ADDRESS), token1.balanceOf(TRADER_ADDRESS)
+
+    assert swap(pool, True, 10**15) == (10**15, -amount_out)
+
+    assert amount_in + fee_amount == 10**15
+    assert pool.sqrt_price_x96 == sqrt_next_x96
+    assert pool.tick == tick_math.get_tick_at_sqrt_ratio(sqrt_next_x96)
+    assert pool.fee_growth_global == [fee_amount * Q128 // (2 * 10**18), 0]
+    assert token0.balanceOf(TRADER_ADDRESS) == balances[0] - 10**15
+    assert token1.balanceOf(TRADER_ADDRESS) == balances[1] + amount_out
+
+
+def test_swap_crossing_a_tick_drops_its_liquidity(pool):
+    mint(pool, -6000, 6000, 10**18)
+    mint(pool, -600, 600, 2 * 10**18)
+    sqrt_cross_x96 = tick_math.get_sqrt_ratio_at_tick(-600)
+    sqrt_limit_x96 = tick_math.get_sqrt_ratio_at_tick(-1200)
+    _, in0, out0, fee0 = compute_swap_step(pool.sqrt_price_x96, sqrt_cross_x96, 3 * 10**18, 10**24, 3000)
+    _, in1, out1, fee1 = compute_swap_step(sqrt_cross_x96, sqrt_limit_x96, 10**18, 10**24 - in0 - fee0, 3000)
+
+    assert swap(pool, True, 10**24, sqrt_limit_x96) == (in0 + fee0 + in1 + fee1, -(out0 + out1))
+
+    assert pool.sqrt_price_x96 == sqrt_limit_x96
+    assert pool.tick == -1200
+    assert pool.in_range_liquidity == 10**18
+    assert pool.fee_growth_global[0] == fee0 * Q128 // (3 * 10**18) + fee1 * Q128 // 10**18
+    # Swapping back crosses the tick the other way and restores its liquidity
+    swap(pool, False, 10**24, tick_math.get_sqrt_ratio_at_tick(0))
+    assert pool.in_range_liquidity == 3 * 10**18
+
+
+def test_exact_output_swap_pays_out_the_amount(pool):
+    mint(pool, -600, 600, 2 * 10**18)
+    _, amount_in, amount_out, fee_amount = compute_swap_step(pool.sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(600), 2 * 10**18, -10**15, 3000)
+
+    assert swap(pool, False, -10**15) == (-10**15, amount_in + fee_amount)
+    assert amount_out == 10**15
+
+
+def test_swap_rejects_a_limit_on_the_wrong_side(pool):
+    mint(pool, -600, 600, 2 * 10**18)
+    with pytest.raises(mock_chain.Revert):
+        swap(pool, True, 10**15, tick_math.get_sqrt_ratio_at_tick(60))
@@ -0,0 +1,218 @@
+"""
+Exact integer ports of the Uniswap V3 math libraries used by the bot.
+
+Everything here works on Python integers in the same Q64.96 / Q128.128 fixed-point formats as the
+contracts (TickMath.sol, SqrtPriceMath.sol, FullMath.sol and LiquidityAmounts.sol), so results match
+the on-chain values bit for bit. Python integers never overflow, so `mulDiv` is a plain `a * b // d`.
+"""
+from decimal import Decimal
+from math import isqrt
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+# getSqrtRatioAtTick(MIN_TICK) and getSqrtRatioAtTick(MAX_TICK)
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+
+Q96 = 1 << 96
+Q128 = 1 << 128
+Q192 = 1 << 192
+MAX_UINT256 = (1 << 256) - 1
+
+# Tick spacing enabled by the V3 factory for each fee tier.
+FEE_TICK_SPACING = {
+    100: 1,
+    500: 10,
+    3000: 60,
+    10000: 200,
+}
+
+# Multipliers for each bit of |tick| from TickMath.getSqrtRatioAtTick: 1/sqrt(1.0001)^(2^i) in Q128.128.
+_TICK_BIT_RATIOS = (
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+)
+
+
+def get_sqrt_ratio_at_tick(tick: int) -> int:
+    """Returns sqrt(1.0001^tick) as a Q64.96 integer, exactly like TickMath.getSqrtRatioAtTick."""
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"Tick {tick} is outside [{MIN_TICK}, {MAX_TICK}].")
+
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else Q128
+    for bit, multiplier in _TICK_BIT_RATIOS:
+        if abs_tick & bit:
+            ratio = (ratio * multiplier) >> 128
+
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+
+    # Q128.128 -> Q64.96, rounding up so getTickAtSqrtRatio of the result is consistent
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96: int) -> int:
+    """
+    Returns the greatest tick whose sqrt ratio is <= `sqrt_price_x96`, exactly like
+    TickMath.getTickAtSqrtRatio (including its log2 approximation and error bounds).
+    """
+    if not MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO:
+        raise ValueError(f"sqrtPriceX96 {sqrt_price_x96} is outside [MIN_SQRT_RATIO, MAX_SQRT_RATIO).")
+
+    ratio = sqrt_price_x96 << 32
+    msb = ratio.bit_length() - 1
+    r = ratio >> (msb - 127) if msb >= 128 else ratio << (127 - msb)
+
+    # Integer part of log2 in Q64.64, then 14 bits of fractional part by repeated squaring
+    log_2 = (msb - 128) << 64
+    for shift in range(63, 49, -1):
+        r = (r * r) >> 127
+        f = r >> 128
+        log_2 |= f << shift
+        r >>= f
+
+    log_sqrt10001 = log_2 * 255738958999603826347141 # 128.128 number
+
+    tick_low = (log_sqrt10001 - 3402992956809132418596140100660247210) >> 128
+    tick_high = (log_sqrt10001 + 291339464771989622907027621153398088495) >> 128
+
+    if tick_low == tick_high:
+        return tick_low
+    return tick_high if get_sqrt_ratio_at_tick(tick_high) <= sqrt_price_x96 else tick_low
+
+
+def mul_div_rounding_up(a: int, b: int, denominator: int) -> int:
+    """FullMath.mulDivRoundingUp for unbounded integers."""
+    return -(-(a * b) // denominator)
+
+
+def get_amount0_delta(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int, round_up: bool = False) -> int:
+    """SqrtPriceMath.getAmount0Delta: token0 between two prices for a given liquidity."""
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_ratio_b_x96 - sqrt_ratio_a_x96
+    if round_up:
+        return -(-mul_div_rounding_up(numerator1, numerator2, sqrt_ratio_b_x96) // sqrt_ratio_a_x96)
+    return (numerator1 * numerator2 // sqrt_ratio_b_x96) // sqrt_ratio_a_x96
+
+
+def get_amount1_delta(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int, round_up: bool = False) -> int:
+    """SqrtPriceMath.getAmount1Delta: token1 between two prices for a given liquidity."""
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    if round_up:
+        return mul_div_rounding_up(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+    return liquidity * (sqrt_ratio_b_x96 - sqrt_ratio_a_x96) // Q96
+
+
+def get_liquidity_for_amount0(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, amount0: int) -> int:
+    """LiquidityAmounts.getLiquidityForAmount0."""
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    intermediate = sqrt_ratio_a_x96 * sqrt_ratio_b_x96 // Q96
+    return amount0 * intermediate // (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)
+
+
+def get_liquidity_for_amount1(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, amount1: int) -> int:
+    """LiquidityAmounts.getLiquidityForAmount1."""
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    return amount1 * Q96 // (sqrt_ratio_b_x96 - sqrt_ratio_a_x96)
+
+
+def get_liquidity_for_amounts(sqrt_ratio_x96: int, sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int,
+                              amount0: int, amount1: int) -> int:
+    """
+    LiquidityAmounts.getLiquidityForAmounts: the maximum liquidity that `amount0`/`amount1` can mint
+    in the range [sqrt_ratio_a_x96, sqrt_ratio_b_x96] at the current price `sqrt_ratio_x96`.
+    """
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    if sqrt_ratio_x96 <= sqrt_ratio_a_x96:
+        return get_liquidity_for_amount0(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0)
+    if sqrt_ratio_x96 < sqrt_ratio_b_x96:
+        liquidity0 = get_liquidity_for_amount0(sqrt_ratio_x96, sqrt_ratio_b_x96, amount0)
+        liquidity1 = get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_x96, amount1)
+        return min(liquidity0, liquidity1)
+    return get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount1)
+
+
+def get_amounts_for_liquidity(sqrt_ratio_x96: int, sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int,
+                              liquidity: int) -> tuple[int, int]:
+    """
+    LiquidityAmounts.getAmountsForLiquidity: the token0/token1 amounts (rounded down) held by
+    `liquidity` in the range [sqrt_ratio_a_x96, sqrt_ratio_b_x96] at the current price.
+    """
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    if sqrt_ratio_x96 <= sqrt_ratio_a_x96:
+        return get_amount0_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity), 0
+    if sqrt_ratio_x96 < sqrt_ratio_b_x96:
+        return (get_amount0_delta(sqrt_ratio_x96, sqrt_ratio_b_x96, liquidity),
+                get_amount1_delta(sqrt_ratio_a_x96, sqrt_ratio_x96, liquidity))
+    return 0, get_amount1_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity)
+
+
+def get_tick_spacing(fee: int) -> int:
+    """Returns the factory's tick spacing for a fee tier."""
+    if fee not in FEE_TICK_SPACING:
+        raise ValueError(f"Unknown fee tier {fee}.")
+    return FEE_TICK_SPACING[fee]
+
+
+def align_tick(tick: int, tick_spacing: int) -> int:
+    """
+    Rounds a tick down to a multiple of `tick_spacing`, matching TickBitmap's compression
+    (which rounds towards negative infinity for negative ticks), and clamps it to the usable range.
+    """
+    min_usable = -(-MIN_TICK // tick_spacing) * tick_spacing
+    max_usable = (MAX_TICK // tick_spacing) * tick_spacing
+    return min(max((tick // tick_spacing) * tick_spacing, min_usable), max_usable)
+
+
+def price_to_sqrt_price_x96(price: Decimal, decimals0: int, decimals1: int) -> int:
+    """
+    Converts a human-readable price (TOKEN1 per TOKEN0, e.g. USDC per WETH) into sqrtPriceX96,
+    rounded down. The decimal price is converted to an exact fraction, so no precision is lost.
+    """
+    if price <= 0:
+        raise ValueError(f"Price must be positive, got {price}.")
+    numerator, denominator = Decimal(price).as_integer_ratio()
+    # raw price = price * 10^decimals1 / 10^decimals0, and sqrtPriceX96 = sqrt(raw price * 2^192)
+    ratio_x192 = (numerator * 10**decimals1 << 192) // (denominator * 10**decimals0)
+    return isqrt(ratio_x192)
+
+
+def sqrt_price_x96_to_price(sqrt_price_x96: int, decimals0: int, decimals1: int) -> Decimal:
+    """Converts sqrtPriceX96 into a human-readable price (TOKEN1 per TOKEN0)."""
+    return Decimal(sqrt_price_x96 * sqrt_price_x96 * 10**decimals0) / Decimal(Q192 * 10**decimals1)
+
+
+def price_to_tick(price: Decimal, decimals0: int, decimals1: int) -> int:
+    """Returns the tick whose price range contains `price` (TOKEN1 per TOKEN0), i.e. the floor tick."""
+    sqrt_price_x96 = min(max(price_to_sqrt_price_x96(price, decimals0, decimals1), MIN_SQRT_RATIO), MAX_SQRT_RATIO - 1)
+    return get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+
+def tick_to_price(tick: int, decimals0: int, decimals1: int) -> Decimal:
+    """Returns the human-readable price (TOKEN1 per TOKEN0) at a tick."""
+    return sqrt_price_x96_to_price(get_sqrt_ratio_at_tick(tick), decimals0, decimals1)
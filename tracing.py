@@ -0,0 +1,212 @@
+"""
+Per-cycle tracing and on-demand sampling profiles.
+
+Tracing (TRACE_DIR): while a cycle runs, every `span` (cycle stages, each JSON-RPC request, exchange calls,
+receipt waits, the exposure math) is recorded as a Chrome trace "complete" event, with the thread it ran on,
+so nested spans show up nested. Each cycle is written to TRACE_DIR/cycle-<time>.json, which opens in
+chrome://tracing, https://ui.perfetto.dev or https://www.speedscope.app.
+
+Profiling: sending the process SIGUSR1 (or creating PROFILE_FLAG_FILE, which is deleted once seen) profiles
+the next PROFILE_CYCLES cycles with a sampling profiler: a thread reads the stacks of all threads every
+PROFILE_INTERVAL_SECONDS. The samples are written to PROFILE_DIR/cycles-<time>.folded in the folded-stack
+format ("thread;outer;...;inner count"), the input of flamegraph.pl and speedscope.
+
+With both off, `span` returns a shared no-op object and `cycle` checks a flag and the flag file, so the
+hooks can stay in the hot path.
+"""
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+_tracer = None # The active Tracer while a traced cycle runs, else None
+_settings = {"trace_dir": "", "profile_dir": "profiles", "profile_cycles": 3, "flag_file": "", "interval": 0.005}
+_profile_requested = False
+_profiler = None
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "category", "args", "started")
+
+    def __init__(self, tracer, name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add(self.name, self.category, self.started, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer:
+    """Collects the spans of one cycle from every thread, as Chrome trace events."""
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.wall_start = time.time()
+        self.events = []
+        self.thread_names = {}
+
+    def add(self, name: str, category: str, started: float, ended: float, args: dict):
+        thread_id = threading.get_ident()
+        if thread_id not in self.thread_names:
+            self.thread_names[thread_id] = threading.current_thread().name
+        # list.append is atomic, so spans from worker threads need no lock
+        self.events.append({
+            "name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread_id,
+            "ts": (started - self.origin) * 1e6, "dur": (ended - started) * 1e6, "args": args,
+        })
+
+    def export(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"cycle-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.wall_start))}-{int(self.wall_start * 1000) % 1000:03d}.json")
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id, "args": {"name": name}}
+                    for thread_id, name in self.thread_names.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval and counts them as folded stacks.
+    Sampling is paused outside cycles (`sampling` cleared), so the waits between cycles don't fill the profile.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self.cycles_left = 0
+        self.sampling = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample_forever, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample_forever(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if not self.sampling.is_set():
+                continue
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def export(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"cycles-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def configure(trace_dir: str = "", profile_dir: str = "profiles", profile_cycles: int = 3, flag_file: str = "",
+              interval: float = 0.005):
+    _settings.update(trace_dir=trace_dir, profile_dir=profile_dir, profile_cycles=profile_cycles, flag_file=flag_file, interval=interval)
+
+
+def request_profile(*_):
+    """Profiles the next cycles (also the SIGUSR1 handler). Only sets a flag, so it is safe in a signal handler."""
+    global _profile_requested
+    _profile_requested = True
+
+
+def install_signal_handler():
+    """Makes SIGUSR1 request a profile. Must be called from the main thread; a no-op where SIGUSR1 doesn't exist."""
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, request_profile)
+
+
+def span(name: str, category: str = "stage", **args):
+    """A span of the current cycle's trace, or a no-op if the cycle isn't traced."""
+    tracer = _tracer
+    if tracer is None:
+        return NOOP_SPAN
+    return _Span(tracer, name, category, args)
+
+
+class cycle:
+    """
+    Scope of one bot cycle: starts a trace if TRACE_DIR is set, and starts (or continues) a requested
+    profile, which is written out after `profile_cycles` cycles. The cycle's own span comes from the
+    "cycle" stage opened inside it (metrics.stage).
+    """
+    __slots__ = ("tracer",)
+
+    def __enter__(self):
+        global _tracer, _profile_requested, _profiler
+        flag_file = _settings["flag_file"]
+        if flag_file and os.path.exists(flag_file):
+            os.remove(flag_file)
+            _profile_requested = True
+        if _profile_requested and _profiler is None:
+            _profile_requested = False
+            _profiler = SamplingProfiler(_settings["interval"])
+            _profiler.cycles_left = _settings["profile_cycles"]
+            _profiler.start()
+            print(f"Profiling the next {_profiler.cycles_left} cycles...")
+        if _profiler is not None:
+            _profiler.sampling.set()
+        self.tracer = None
+        if _settings["trace_dir"]:
+            self.tracer = _tracer = Tracer()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _tracer, _profiler
+        if self.tracer is not None:
+            _tracer = None
+            try:
+                path = self.tracer.export(_settings["trace_dir"])
+                print(f"Cycle trace written to {path}")
+            except Exception as e:
+                print(f"Error writing cycle trace: {e}")
+        if _profiler is not None:
+            _profiler.sampling.clear()
+            _profiler.cycles_left -= 1
+            if _profiler.cycles_left <= 0:
+                profiler, _profiler = _profiler, None
+                profiler.stop()
+                try:
+                    path = profiler.export(_settings["profile_dir"])
+                    print(f"Profile of {profiler.samples} samples written to {path}")
+                except Exception as e:
+                    print(f"Error writing profile: {e}")
+        return False
@@ -0,0 +1,124 @@
+"""
+Time-weighted average prices and realized volatility of a pool, from its `observe()` oracle.
+
+The spot price of slot0 moves with every swap, including swaps that only hold for a block (a sandwich, a large
+trade arbitraged back right after). The pool's oracle accumulates the tick over time, so the tick cumulatives
+at two `secondsAgos` give the average tick between them (OracleLibrary.consult). `TwapService` reads two
+`observe` calls, which ride along in a larger Multicall3 batch (e.g. the cycle's):
+- one at 0 and at each of its windows (e.g. 1m/5m/30m/1h), for the TWAP tick over each window,
+- one on an even grid over the volatility window, whose consecutive TWAP ticks give the realized volatility
+  (`range_optimizer.twap_volatility`, with NumPy).
+Each may revert on its own: a pool whose observations don't reach back to the oldest secondsAgo fails the call,
+and its TWAPs (or volatility) are then None.
+
+The result (`PoolTwap`) is cached for the block it was read at, so everything deciding on that block shares one
+read. `cardinality_target` is the number of observations covering the longest window at one per block;
+`next_cardinality` steps the pool's ring buffer towards it within a gas budget, and `increase_cardinality_call`
+grows it.
+"""
+import math
+from decimal import Decimal
+
+import range_optimizer
+import tick_math
+
+# Gas increaseObservationCardinalityNext pays per observation slot it initializes (a new storage write)
+GAS_PER_OBSERVATION = 20_000
+
+
+def mean_tick(tick_cumulative_start: int, tick_cumulative_end: int, seconds: int) -> int:
+    """Arithmetic mean tick between two tick cumulatives, rounded towards negative infinity as in OracleLibrary.consult."""
+    return (tick_cumulative_end - tick_cumulative_start) // seconds
+
+
+class PoolTwap:
+    """TWAP ticks and realized volatility of a pool at one block."""
+    def __init__(self, block_number: int, tick: int, ticks: dict, volatility: float | None,
+                 cardinality: int, cardinality_next: int):
+        self.block_number = block_number
+        self.tick = tick # Spot tick (slot0) at the block
+        self.ticks = ticks # Window in seconds -> TWAP tick over it, or None if the observations don't reach back that far
+        self.volatility = volatility # Standard deviation of the log price per sqrt(second), or None
+        self.cardinality = cardinality
+        self.cardinality_next = cardinality_next
+
+    def average_tick(self, window: int) -> int | None:
+        return self.ticks.get(window)
+
+    def price(self, window: int, decimals0: int, decimals1: int) -> Decimal | None:
+        """TWAP price (TOKEN1 per TOKEN0) over `window` seconds, or None if it couldn't be read."""
+        tick = self.average_tick(window)
+        return None if tick is None else tick_math.tick_to_price(tick, decimals0, decimals1)
+
+    def deviation(self, window: int) -> float | None:
+        """Relative distance between the spot price and the TWAP over `window` seconds, or None without the TWAP."""
+        tick = self.average_tick(window)
+        return None if tick is None else 1.0001 ** abs(self.tick - tick) - 1
+
+    def __repr__(self):
+        ticks = ", ".join(f"{window}s={tick}" for window, tick in sorted(self.ticks.items()))
+        volatility = "None" if self.volatility is None else f"{self.volatility * math.sqrt(range_optimizer.SECONDS_PER_YEAR):.1%}"
+        return f"PoolTwap(block={self.block_number}, tick={self.tick}, twap ticks: {ticks}, annualized volatility={volatility})"
+
+
+class TwapService:
+    """
+    TWAPs over `windows` (seconds) and the realized volatility over `volatility_window`, in `volatility_intervals`
+    intervals, of one pool. `block_time_seconds` sizes the observation buffer the windows need.
+    """
+    def __init__(self, pool_contract, windows, volatility_window: int, volatility_intervals: int, block_time_seconds: float):
+        self.pool_contract = pool_contract
+        self.windows = sorted(set(windows))
+        self.window_agos = sorted(set(self.windows) | {0}, reverse=True)
+        self.volatility_interval = volatility_window // volatility_intervals
+        self.volatility_agos = [self.volatility_interval * i for i in range(volatility_intervals, -1, -1)]
+        # One observation per block at most, plus the one the oldest window starts from
+        self.cardinality_target = math.ceil(self.windows[-1] / block_time_seconds) + 1
+        self._latest = None # PoolTwap of the last block read
+
+    def calls(self) -> list:
+        """The two `observe` calls for a batch, both allowed to fail. `apply` reads their results."""
+        return [
+            (self.pool_contract.functions.observe(self.window_agos), True),
+            (self.pool_contract.functions.observe(self.volatility_agos), True),
+        ]
+
+    def apply(self, block_number: int, slot0, results: list) -> PoolTwap:
+        """Builds the PoolTwap of `block_number` from its slot0 and the results of `calls`, and caches it."""
+        window_observations, volatility_observations = results[:2]
+        ticks = {window: None for window in self.windows}
+        if window_observations is not None:
+            cumulatives = dict(zip(self.window_agos, window_observations[0]))
+            ticks = {window: mean_tick(cumulatives[window], cumulatives[0], window) for window in self.windows}
+        volatility = None
+        if volatility_observations is not None and range_optimizer.OPTIMIZER_AVAILABLE:
+            volatility = range_optimizer.twap_volatility(volatility_observations[0], self.volatility_interval)
+        twap = PoolTwap(block_number, slot0[1], ticks, volatility, slot0[3], slot0[4])
+        if self._latest is None or block_number >= self._latest.block_number:
+            self._latest = twap
+        return twap
+
+    def at(self, block_number: int) -> PoolTwap | None:
+        """The PoolTwap read at `block_number`, if it is the last one read."""
+        latest = self._latest
+        return latest if latest is not None and latest.block_number == block_number else None
+
+    def read(self, client) -> PoolTwap:
+        """Reads the pool's slot0 and TWAPs in one batched call of its own."""
+        block_number, results = client.batch_call([self.pool_contract.functions.slot0()] + self.calls())
+        return self.apply(block_number, results[0], results[1:])
+
+    def next_cardinality(self, twap: PoolTwap, max_gas: int | None = None) -> int | None:
+        """
+        The cardinality to grow the buffer to next: `cardinality_target`, or as far towards it as `max_gas` pays for.
+        None if the buffer is large enough.
+        """
+        if twap.cardinality_next >= self.cardinality_target:
+            return None
+        if max_gas is None:
+            return self.cardinality_target
+        return min(self.cardinality_target, twap.cardinality_next + max(max_gas // GAS_PER_OBSERVATION, 1))
+
+    def increase_cardinality_call(self, cardinality_next: int):
+        """The `increaseObservationCardinalityNext` call growing the buffer to `cardinality_next`."""
+        return self.pool_contract.functions.increaseObservationCardinalityNext(cardinality_next)
@@ -0,0 +1,238 @@
+"""
+Pipelined transaction submission with a locally tracked nonce.
+
+`BlockchainClient.send_transaction` used to ask the node for the nonce, chain id and gas price on every
+send and then block until the receipt arrived, so dependent steps (approve, approve, mint) took one block
+each. `TransactionPipeline` instead:
+- hands out nonces from a local counter (synced from the node's pending count at start and after errors),
+- caches the chain id, and takes fees and gas limits from a `FeeEngine` (fee_engine.py),
+- signs and sends without waiting, returning a `PendingTransaction` whose receipt is awaited on a worker thread,
+- re-sends a transaction that is still pending after `replace_after_seconds` with the same nonce and a
+  higher fee (at least the engine's current "high" urgency fees), and after `max_replacements` cancels the
+  stuck nonce with a zero-value self-transfer. If even the cancellation doesn't get mined, the pipeline
+  refuses new transactions until the nonce is used, since each of them would queue behind it.
+
+Several transactions submitted back to back get consecutive nonces and are normally mined in the same block.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from web3.exceptions import TransactionNotFound
+
+import metrics
+import tracing
+from fee_engine import FeeEngine
+
+# Nodes only accept a replacement for a pending nonce if it pays at least 10% more; use a bit more.
+REPLACEMENT_FEE_BUMP = Decimal("1.125")
+FEE_FIELDS = ("gasPrice", "maxFeePerGas", "maxPriorityFeePerGas")
+
+
+class NonceManager:
+    """Thread-safe local nonce counter for one account."""
+    def __init__(self, w3, address: str):
+        self.w3 = w3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next_nonce = None
+
+    def next_nonce(self) -> int:
+        with self._lock:
+            if self._next_nonce is None:
+                self._next_nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            return nonce
+
+    def resync(self):
+        """Re-reads the nonce from the node, e.g. after a send failed and left a gap."""
+        with self._lock:
+            self._next_nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+            print(f"Nonce resynced from node: next nonce is {self._next_nonce}.")
+
+
+class PendingTransaction:
+    """A submitted transaction. Every hash sent for its nonce (original, replacements, cancellation) is tracked."""
+    def __init__(self, nonce: int, tx_params: dict, tx_hash, call_shape: tuple | None = None):
+        self.nonce = nonce
+        self.tx_params = tx_params
+        self.call_shape = call_shape # FeeEngine.call_shape of the contract call, for gas tracking
+        self.tx_hashes = [tx_hash]
+        self.cancel_hashes = [] # Hashes of the cancellation and its replacements
+        self.future = None
+        self.sent_at = time.perf_counter()
+
+    @property
+    def tx_hash(self):
+        """Hash of the most recently sent version of the transaction."""
+        return self.tx_hashes[-1]
+
+    def result(self, timeout: float | None = None):
+        """Blocks until the transaction is mined and returns its receipt. Raises if it failed or was cancelled."""
+        with tracing.span("wait_receipt", "tx", nonce=self.nonce):
+            return self.future.result(timeout)
+
+
+class TransactionPipeline:
+    def __init__(self, w3, account, private_key: str, fee_engine: FeeEngine, urgency: str = "medium",
+                 replace_after_seconds: float = 90, max_replacements: int = 3, receipt_poll_seconds: float = 1,
+                 max_workers: int = 16):
+        self.w3 = w3
+        self.account = account
+        self.private_key = private_key
+        self.fee_engine = fee_engine
+        self.urgency = urgency
+        self.replace_after_seconds = replace_after_seconds
+        self.max_replacements = max_replacements
+        self.receipt_poll_seconds = receipt_poll_seconds
+        self.chain_id = w3.eth.chain_id # Never changes for a connection, so it is read once
+        self.nonces = NonceManager(w3, account.address)
+        self.stuck_nonce = None # Nonce whose cancellation didn't get mined either; blocks new submissions
+        # Receipt waiters; each pending transaction occupies one thread until it is mined. A cycle has a few
+        # transactions in flight (e.g. approve, approve, mint), so `max_workers` only bounds a burst: a transaction
+        # beyond it is still sent at once, and its receipt is polled when a thread frees up. Its replacement
+        # timer runs from when it was sent, so the wait doesn't delay the fee bump.
+        self._waiters = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tx-receipt")
+
+    def submit(self, tx, gas_limit: int | None = None, urgency: str | None = None) -> PendingTransaction:
+        """
+        Builds, signs and sends a contract function call without waiting for it to be mined.
+        Without `gas_limit`, the fee engine's cached estimate for the call shape is used (estimating it
+        the first time). An explicit limit is needed when the transaction depends on another one that is
+        still pending (e.g. a mint submitted together with its approvals).
+        """
+        self._check_not_stuck()
+        fee_params = self.fee_engine.fee_params(urgency or self.urgency)
+        if gas_limit is None:
+            gas_limit = self.fee_engine.gas_limit(tx, self.account.address)
+        nonce = self.nonces.next_nonce()
+        params = {
+            'chainId': self.chain_id,
+            'from': self.account.address,
+            'nonce': nonce,
+            'gas': gas_limit,
+            **fee_params,
+        }
+        try:
+            tx_params = tx.build_transaction(params)
+            tx_hash = self._sign_and_send(tx_params)
+        except Exception:
+            # The nonce was not used, so later transactions would be stuck behind the gap
+            self.nonces.resync()
+            metrics.TX_TOTAL.inc(1, "send_error")
+            raise
+        print(f"Transaction sent: {tx_hash.hex()} (nonce {nonce})")
+        pending = PendingTransaction(nonce, tx_params, tx_hash, FeeEngine.call_shape(tx))
+        pending.future = self._waiters.submit(self._wait_for_receipt, pending)
+        return pending
+
+    def _check_not_stuck(self):
+        """Raises while the stuck nonce is still unused; clears it (and resyncs the nonce) once it was mined."""
+        if self.stuck_nonce is None:
+            return
+        if self.w3.eth.get_transaction_count(self.account.address, "latest") <= self.stuck_nonce:
+            raise Exception(f"Transaction pipeline halted: nonce {self.stuck_nonce} is stuck and could not be cancelled.")
+        print(f"Stuck nonce {self.stuck_nonce} was mined. Resuming the transaction pipeline.")
+        self.stuck_nonce = None
+        self.nonces.resync()
+
+    def _sign_and_send(self, tx_params: dict):
+        signed_tx = self.w3.eth.account.sign_transaction(tx_params, private_key=self.private_key)
+        return self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+
+    def _bumped_fees(self, tx_params: dict) -> dict:
+        """
+        The fee fields of `tx_params` raised enough to replace it, and at least the current "high" urgency fees,
+        so a transaction that got stuck because fees rose catches up in one replacement.
+        """
+        current = self.fee_engine.fee_params("high")
+        bumped = {key: int(tx_params[key] * REPLACEMENT_FEE_BUMP) + 1 for key in current if key in tx_params}
+        if len(bumped) != len(current):
+            # The network switched fee type since the transaction was sent; only the current fees apply
+            return current
+        return {key: max(bumped[key], current[key]) for key in current}
+
+    def replace(self, pending: PendingTransaction):
+        """Re-sends the transaction with the same nonce and a higher fee."""
+        unpriced = {key: value for key, value in pending.tx_params.items() if key not in FEE_FIELDS}
+        pending.tx_params = {**unpriced, **self._bumped_fees(pending.tx_params)}
+        tx_hash = self._sign_and_send(pending.tx_params)
+        pending.tx_hashes.append(tx_hash)
+        print(f"Transaction with nonce {pending.nonce} replaced with a higher fee: {tx_hash.hex()}")
+
+    def cancel(self, pending: PendingTransaction):
+        """
+        Frees a stuck nonce by sending a zero-value transfer to ourselves with the same nonce and a higher fee.
+        The pending transaction's result raises once the cancellation is mined. Calling it again replaces
+        the cancellation with a higher fee.
+        """
+        pending.tx_params = {
+            'chainId': self.chain_id,
+            'from': self.account.address,
+            'to': self.account.address,
+            'value': 0,
+            'gas': 21000,
+            'nonce': pending.nonce,
+            **self._bumped_fees(pending.tx_params),
+        }
+        cancel_hash = self._sign_and_send(pending.tx_params)
+        pending.cancel_hashes.append(cancel_hash)
+        pending.tx_hashes.append(cancel_hash)
+        print(f"Cancellation sent for nonce {pending.nonce}: {cancel_hash.hex()}")
+
+    def _get_receipt(self, tx_hash):
+        try:
+            return self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+
+    def _wait_for_receipt(self, pending: PendingTransaction):
+        """
+        Polls every hash sent for the nonce until one is mined, replacing the transaction if it is stuck and
+        cancelling it after `max_replacements`. Halts the pipeline if the cancellation is stuck as long.
+        """
+        replacements = 0
+        replace_at = pending.sent_at + self.replace_after_seconds
+        while True:
+            # Only one version of the nonce can be mined; check the newest first
+            for tx_hash in reversed(list(pending.tx_hashes)):
+                receipt = self._get_receipt(tx_hash)
+                if receipt is not None:
+                    return self._check_receipt(pending, receipt)
+            if time.perf_counter() >= replace_at:
+                if replacements >= 2 * self.max_replacements:
+                    self.stuck_nonce = pending.nonce
+                    raise Exception(f"Transaction with nonce {pending.nonce} still pending after {replacements} replacements and cancellations: {pending.tx_hash.hex()}")
+                try:
+                    if replacements < self.max_replacements:
+                        self.replace(pending)
+                    else:
+                        # Later transactions can't be mined before this nonce; give it up rather than keep them waiting
+                        self.cancel(pending)
+                    replacements += 1
+                except Exception as e:
+                    # Typically "nonce too low": one of the versions was mined in the meantime
+                    print(f"Could not replace transaction with nonce {pending.nonce}: {e}")
+                replace_at = time.perf_counter() + self.replace_after_seconds
+            time.sleep(self.receipt_poll_seconds)
+
+    def _check_receipt(self, pending: PendingTransaction, receipt):
+        tx_hash = receipt.transactionHash
+        cancelled = tx_hash in pending.cancel_hashes
+        status = "cancelled" if cancelled else "success" if receipt.status == 1 else "reverted"
+        metrics.TX_SECONDS.observe(time.perf_counter() - pending.sent_at, status)
+        metrics.TX_TOTAL.inc(1, status)
+        metrics.GAS_USED.inc(receipt.gasUsed)
+        metrics.GAS_FEES_WEI.inc(receipt.gasUsed * receipt.get("effectiveGasPrice", 0))
+        if cancelled:
+            raise Exception(f"Transaction with nonce {pending.nonce} was cancelled.")
+        if receipt.status != 1:
+            print(f"Transaction failed: {tx_hash.hex()}")
+            raise Exception(f"Transaction failed: {tx_hash.hex()}")
+        # Only successful runs size the estimates: a revert (e.g. out of gas) can burn up to the whole limit
+        if pending.call_shape is not None:
+            self.fee_engine.record_gas_used(pending.call_shape, receipt.gasUsed)
+        print(f"Transaction successful: {tx_hash.hex()}")
+        return receipt
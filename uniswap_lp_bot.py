@@ -1,20 +1,100 @@
 import os
 import time
 import json
+import queue
+from collections import deque
+from ens import ENS
+from eth_abi import encode as abi_encode
+from eth_utils import keccak
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
-from math import sqrt, log
-from decimal import Decimal, getcontext
-
-# Set precision for financial calculations
+from decimal import Decimal, DefaultContext, getcontext
+import greeks
+import tick_math
+import block_recorder
+import fee_accrual
+import metrics
+import tracing
+import range_optimizer
+import log_ingester
+from allowance_manager import AllowanceManager, AllowanceReservation
+from chain_metadata import ChainMetadata, pool_key
+from price_feeds import FeedRegistry
+from strategy import StrategyParams
+from twap import PoolTwap, TwapService
+from event_trigger import SWAP_TOPIC, CycleTrigger, PollingEventSource, WebsocketEventSource, decode_swap_log
+from fee_engine import FeeEngine
+from hedge_executor import HedgeExecutor, MockExchangeClient
+from rpc_pool import ProviderPool
+from state_store import StateStore
+from tx_pipeline import PendingTransaction, TransactionPipeline
+
+# Largest uint128, used as amount0Max/amount1Max to collect everything owed to a position.
+MAX_UINT128 = 2**128 - 1
+
+# Set precision for financial calculations. Worker threads start from DefaultContext, so set it there too.
 getcontext().prec = 50
+DefaultContext.prec = 50
 
 # --- 1. Configuration and Blockchain Connection ---
+_abi_cache = {} # Absolute path -> parsed ABI, shared by every Config of the process
+
+
+def load_abi(path: str) -> list:
+    """Parses an ABI file once per process. Later loads of the same file return the same list, so don't modify it."""
+    path = os.path.abspath(path)
+    if path not in _abi_cache:
+        with open(path, "r") as f:
+            _abi_cache[path] = json.load(f)
+    return _abi_cache[path]
+
+
+class AbiFile:
+    """
+    A Config attribute holding the ABI in `path`, loaded on first access rather than when Config is created.
+    Assigning the attribute on an instance replaces the ABI for that instance.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        abi = load_abi(self.path)
+        instance.__dict__[self.name] = abi
+        return abi
+
+
 class Config:
+    # ABIs (Application Binary Interfaces) for interacting with smart contracts.
+    # These JSON files define the contract's functions and events.
+    # Ensure these ABI files are located in a 'abi' subdirectory (relative to the working directory).
+    UNISWAP_FACTORY_ABI = AbiFile("abi/UniswapV3Factory.json")
+    UNISWAP_POOL_ABI = AbiFile("abi/UniswapV3Pool.json")
+    UNISWAP_NFT_POSITION_MANAGER_ABI = AbiFile("abi/UniswapV3PositionManager.json")
+    UNISWAP_SWAP_ROUTER_ABI = AbiFile("abi/SwapRouter.json")
+    ERC20_ABI = AbiFile("abi/ERC20.json") # Generic ABI for ERC20 tokens
+    # ABI for Chainlink AggregatorV3Interface.
+    # You can find this ABI on Chainlink's GitHub or Etherscan (search for a price feed contract).
+    CHAINLINK_ABI = AbiFile("abi/ChainlinkAggregatorV3.json")
+    MULTICALL3_ABI = AbiFile("abi/Multicall3.json")
+
     def __init__(self):
         # Node URL for connecting to the blockchain (e.g., Infura, Alchemy, or a local node)
         # Use environment variables for sensitive info like API keys.
         self.NODE_URL = os.getenv("NODE_URL", "https://mainnet.infura.io/v3/YOUR_INFURA_ID") # Or your L2 RPC node
+        # Several comma-separated endpoints (e.g. your own node, then Infura and Alchemy) are used as a pool
+        # (rpc_pool.py): reads go to the fastest healthy one, writes stick to the first that works, and a failing
+        # endpoint is skipped. NODE_URL is the only endpoint if unset.
+        self.NODE_URLS = [url.strip() for url in os.getenv("NODE_URLS", "").split(",") if url.strip()] or [self.NODE_URL]
+        # With several endpoints, a read unanswered after this many seconds is also sent to the next-best endpoint
+        # and the first answer is used. Set it around your p95 read latency; 0 disables hedging.
+        self.RPC_HEDGE_AFTER_SECONDS = float(os.getenv("RPC_HEDGE_AFTER_SECONDS", "0"))
+        self.RPC_TIMEOUT_SECONDS = 10 # Per request to a pool endpoint
+        self.RPC_COOLDOWN_SECONDS = 5 # A failed endpoint is skipped this long, doubling with each consecutive failure
         # Your wallet's private key. EXTREMELY DANGEROUS TO STORE IN CODE.
         # For production, use a more secure method (e.g., KMS, hardware wallet, encrypted keystore).
         self.PRIVATE_KEY = os.getenv("PRIVATE_KEY", "YOUR_PRIVATE_KEY")
@@ -25,14 +105,9 @@ class Config:
         # Verify these addresses for the specific network you are operating on.
         self.UNISWAP_FACTORY_ADDRESS = "0x1F98431c8Ef1800Ec79B6425a1F7Ff43C5f5fFfF" # V3 Factory
         self.UNISWAP_NFT_POSITION_MANAGER_ADDRESS = "0xC36442b4a4522E871399CD717aBDD847Ab11FE88" # NFT Position Manager
+        self.UNISWAP_SWAP_ROUTER_ADDRESS = "0xE592427A0AEce92De3Edee1F18E0157C05861564" # SwapRouter (exactInputSingle with a deadline)
 
-        # ABIs (Application Binary Interfaces) for interacting with smart contracts.
-        # These JSON files define the contract's functions and events.
-        # Ensure these ABI files are located in a 'abi' subdirectory.
-        self.UNISWAP_FACTORY_ABI = json.load(open("abi/UniswapV3Factory.json"))
-        self.UNISWAP_POOL_ABI = json.load(open("abi/UniswapV3Pool.json"))
-        self.UNISWAP_NFT_POSITION_MANAGER_ABI = json.load(open("abi/UniswapV3PositionManager.json"))
-        self.ERC20_ABI = json.load(open("abi/ERC20.json")) # Generic ABI for ERC20 tokens
+        # The ABIs of these contracts (and of Chainlink feeds and Multicall3) are the AbiFile attributes above.
 
         # Configuration for the specific Uniswap V3 pool to manage.
         # Example: WETH/USDC pool on Ethereum.
@@ -47,127 +122,428 @@ class Config:
         self.DERIVATIVES_EXCHANGE_API_KEY = os.getenv("DERIVATIVES_EXCHANGE_API_KEY", "YOUR_CEX_API_KEY")
         self.DERIVATIVES_EXCHANGE_API_SECRET = os.getenv("DERIVATIVES_EXCHANGE_API_SECRET", "YOUR_CEX_API_SECRET")
         self.SHORT_TOKEN_SYMBOL = "ETH-PERP" # The trading pair symbol for the perpetual swap or futures contract
+        # "conceptual" for DerivativesClient, or "mock" for the local MockExchangeClient (hedge_executor.py).
+        self.DERIVATIVES_EXCHANGE = os.getenv("DERIVATIVES_EXCHANGE", "conceptual")
+        # Hedge execution (hedge_executor.py): adjustments larger than HEDGE_MAX_CHILD_SIZE (in contract units,
+        # e.g. ETH) are split into child orders sent HEDGE_CHILD_INTERVAL_SECONDS apart. The position is tracked
+        # locally from fills and re-read from the exchange every HEDGE_RECONCILE_SECONDS.
+        # The cycle waits for the children, so an adjustment of A blocks it for about
+        # (A / HEDGE_MAX_CHILD_SIZE - 1) * HEDGE_CHILD_INTERVAL_SECONDS: 1 second for 10 ETH with these values.
+        self.HEDGE_MAX_CHILD_SIZE = Decimal("5")
+        self.HEDGE_CHILD_INTERVAL_SECONDS = 1
+        self.HEDGE_RECONCILE_SECONDS = 15 * 60
+        # Contract used to hedge each volatile token, keyed by token address. Portfolio mode (portfolio.py)
+        # nets the exposure of every position with the same TOKEN0 into one order on that contract.
+        self.HEDGE_SYMBOLS = {self.TOKEN0_ADDRESS: self.SHORT_TOKEN_SYMBOL}
+
+        # Portfolio mode: the LP position token IDs to manage are stored in this file (see portfolio.py),
+        # and per-position rebalances run on a pool of at most PORTFOLIO_MAX_WORKERS threads.
+        self.PORTFOLIO_FILE = os.getenv("PORTFOLIO_FILE", "portfolio.json")
+        self.PORTFOLIO_MAX_WORKERS = 8
+
+        # Rebalance trigger, range width and hedge band. The backtester (backtest.py) uses the same object,
+        # so a parameter set can be evaluated offline before it is deployed here.
+        self.STRATEGY = StrategyParams()
+        # Range optimizer (range_optimizer.py): a rebalance mints the tick-aligned range with the best simulated
+        # rate of fees - impermanent loss - hedge costs - gas, instead of STRATEGY.range_lower/range_upper.
+        # It needs NumPy; without it, or without a volatility estimate, the fixed range is used.
+        self.OPTIMIZE_RANGE = True
+        # Realized volatility is measured from the pool's observe() TWAPs over this window, in this many intervals.
+        self.VOLATILITY_WINDOW_SECONDS = 24 * 60 * 60
+        self.VOLATILITY_INTERVALS = 48
+        # Every cycle reads the pool's TWAPs over these windows (twap.py), with the volatility above, in its batch.
+        self.TWAP_WINDOWS = (60, 5 * 60, 30 * 60, 60 * 60)
+        # The spot price is only trusted while it is within TWAP_MAX_SPOT_DEVIATION of the TWAP over
+        # TWAP_DECISION_WINDOW_SECONDS. Further away (a manipulated or briefly pushed pool), rebalances wait and
+        # the hedge is sized at the TWAP price.
+        self.TWAP_DECISION_WINDOW_SECONDS = 5 * 60
+        self.TWAP_MAX_SPOT_DEVIATION = 0.02
+        # Grow the pool's observation buffer (increaseObservationCardinalityNext) if it can't cover the longest
+        # TWAP window at one observation per block. It costs about 20k gas per added observation, for every user
+        # of the pool, so it is off by default; each transaction adds at most TWAP_CARDINALITY_MAX_GAS worth.
+        self.TWAP_GROW_CARDINALITY = False
+        self.TWAP_CARDINALITY_MAX_GAS = 2_000_000
+        # Log a warning once rebalances of an out-of-range position were deferred (spot away from the TWAP)
+        # for this many cycles in a row: a price held away from its TWAP that long is no longer a brief push.
+        self.TWAP_DEFER_WARN_CYCLES = 5
+        # Candidate ranges are simulated over this horizon, up to -33%/+50% of the price (RANGE_MAX_WIDTH = 0.5).
+        self.RANGE_HORIZON_SECONDS = 24 * 60 * 60
+        self.RANGE_MAX_WIDTH = 0.5
+        # Fraction of traded hedge notional paid as exchange fees and slippage.
+        self.HEDGE_COST_RATE = Decimal("0.0005")
+        # Typical gas used by an atomic rebalance, priced at the fee engine's current gas price.
+        self.REBALANCE_GAS_UNITS = 500_000
+
+        # How the main loop decides when to run a cycle:
+        # - "poll": run a full cycle every CYCLE_INTERVAL_SECONDS.
+        # - "events": follow new blocks and the pool's Swap logs, and only run a cycle when the price crosses
+        #   the rebalance trigger or the exposure leaves the hedge band (see event_trigger.py).
+        self.TRIGGER_MODE = os.getenv("TRIGGER_MODE", "poll")
+        self.CYCLE_INTERVAL_SECONDS = 5 * 60
+        # Websocket endpoint for eth_subscribe in "events" mode. Without it, the pool is polled over NODE_URL.
+        self.NODE_WS_URL = os.getenv("NODE_WS_URL", "")
+        self.EVENT_POLL_INTERVAL_SECONDS = 2 # Roughly one block on most L2s; use 12 for Ethereum mainnet
+        # In "events" mode, still run a full reconciliation cycle if nothing triggered for this long.
+        self.EVENT_MAX_IDLE_SECONDS = 60 * 60
+        # A cycle that couldn't evaluate the hedge (exchange or price feed down) is retried after this long.
+        self.EVENT_HEDGE_RETRY_SECONDS = 60
+        # A cycle that left the price outside the rebalance trigger (the rebalance failed, or was deferred by the TWAP
+        # check) is retried after this long, rather than on every Swap of the pool.
+        self.EVENT_REBALANCE_RETRY_SECONDS = 60
+        # On restart in "events" mode, the trigger is re-armed from the last stored cycle and the Swap logs mined
+        # since, if that cycle is at most this many blocks old; otherwise the bot starts with a full cycle.
+        # The logs are fetched in chunks of INGEST_CHUNK_BLOCKS, halved while the provider refuses them.
+        self.EVENT_WARM_START_MAX_BLOCKS = 5000
+
+        # RPC, exchange, transaction and cycle stage metrics are served in the Prometheus format at
+        # http://METRICS_HOST:METRICS_PORT/metrics (metrics.py). Port 0 disables the endpoint.
+        self.METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+        # Cycle traces (tracing.py): with TRACE_DIR set, every cycle's stages, RPC requests and exchange calls are
+        # written as a Chrome trace file. Empty disables tracing.
+        self.TRACE_DIR = os.getenv("TRACE_DIR", "")
+        # `kill -USR1 <pid>` or creating PROFILE_FLAG_FILE profiles the next PROFILE_CYCLES cycles with a sampling
+        # profiler and writes a flamegraph (folded stacks) to PROFILE_DIR.
+        self.PROFILE_CYCLES = 3
+        self.PROFILE_DIR = "profiles"
+        self.PROFILE_FLAG_FILE = "profile.flag"
+        self.PROFILE_INTERVAL_SECONDS = 0.005
+
+        # Positions, rebalances, hedge fills, cycle snapshots and the last seen block are kept in this
+        # SQLite database (state_store.py). A legacy position_id.txt is imported into it on first start.
+        self.STATE_DB_FILE = os.getenv("STATE_DB_FILE", "bot_state.db")
+        # Backfill of the pool's Swap/Mint/Burn/Collect logs into the state store (log_ingester.py): eth_getLogs
+        # chunks start at INGEST_CHUNK_BLOCKS blocks and adapt to the provider's limits.
+        self.INGEST_WORKERS = 8
+        self.INGEST_CHUNK_BLOCKS = 2000
+        self.INGEST_CONFIRMATIONS = 12 # Blocks behind the head left for a later run, in case of reorgs
+        # Per-block pool price, Chainlink answer, position amounts and hedge size are appended to memory-mapped
+        # columns in this directory (block_recorder.py), for backtests and dashboards. Empty disables the recorder.
+        self.RECORDER_DIR = os.getenv("RECORDER_DIR", "history")
+        # Recorded rows are published to readers every RECORDER_FLUSH_ROWS rows or RECORDER_FLUSH_SECONDS,
+        # whichever comes first, and on shutdown.
+        self.RECORDER_FLUSH_ROWS = 256
+        self.RECORDER_FLUSH_SECONDS = 60
 
         # Chainlink Price Feed Addresses (Example for Ethereum Mainnet)
         # IMPORTANT: These addresses are specific to each blockchain network.
         # You MUST find the correct addresses for your chosen network (e.g., Polygon, Arbitrum, Base).
         # You can find them on Chainlink's official documentation: https://docs.chain.link/data-feeds/price-feeds/addresses
-        self.CHAINLINK_ETH_USD_FEED = "0x5f4eC3Df9cbd43714FE2740D5E3616155c5b841" # ETH/USD on Ethereum Mainnet
+        self.CHAINLINK_ETH_USD_FEED = "0x5f4eC3Df9cbd43714FE2740f5E3616155c5b8419" # ETH/USD on Ethereum Mainnet
         self.CHAINLINK_USDC_USD_FEED = "0x8fFfFfd4AfB6115b954Bd326cbe7B4BA57E2F0Cc" # USDC/USD on Ethereum Mainnet (often very close to 1)
-        # ABI for Chainlink AggregatorV3Interface.
-        # You can find this ABI on Chainlink's GitHub or Etherscan (search for a price feed contract).
-        self.CHAINLINK_ABI = json.load(open("abi/ChainlinkAggregatorV3.json"))
+        # Feed of each token the bot prices (any token can be added), and "native" for the gas token (price_feeds.py).
+        # Heartbeat (seconds) and deviation threshold are the feed's own parameters, listed next to its address in
+        # Chainlink's documentation: a feed is only read again when one of them could have produced a new round.
+        self.CHAINLINK_FEEDS = {
+            self.TOKEN0_ADDRESS: {"feed": self.CHAINLINK_ETH_USD_FEED, "heartbeat": 3600, "deviation": Decimal("0.005")},
+            self.TOKEN1_ADDRESS: {"feed": self.CHAINLINK_USDC_USD_FEED, "heartbeat": 86400, "deviation": Decimal("0.0025")},
+            "native": {"feed": self.CHAINLINK_ETH_USD_FEED, "heartbeat": 3600, "deviation": Decimal("0.005")},
+        }
+        # A feed without a reference price to watch (e.g. a stablecoin's) is still read at least this often, which
+        # bounds how late one of its deviation rounds is seen.
+        self.CHAINLINK_MAX_CHECK_SECONDS = 15 * 60
+        # A round older than its feed's heartbeat plus this grace is stale. With CHAINLINK_REJECT_STALE, a stale
+        # price is not used (the hedge is skipped and gas isn't valued for the range optimizer).
+        self.CHAINLINK_STALE_GRACE_SECONDS = 5 * 60
+        self.CHAINLINK_REJECT_STALE = True
+
+        # Multicall3 is deployed at the same address on Ethereum and on most L2s/sidechains.
+        # The bot uses its `aggregate3` function to batch all of a cycle's reads into a single eth_call.
+        # See https://www.multicall3.com for the deployment list and ABI.
+        self.MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+        # Transaction pipeline (tx_pipeline.py): a transaction still pending after TX_REPLACE_AFTER_SECONDS
+        # is re-sent with the same nonce and a higher fee, at most TX_MAX_REPLACEMENTS times, and then cancelled
+        # (a zero-value self-transfer, bumped as often). A nonce not even the cancellation frees halts new sends.
+        self.TX_REPLACE_AFTER_SECONDS = 90
+        self.TX_MAX_REPLACEMENTS = 3
+        self.TX_RECEIPT_POLL_SECONDS = 1
+        # Fees (fee_engine.py): EIP-1559 fees are derived from recent blocks' fee history, refreshed at most
+        # once per BLOCK_TIME_SECONDS. TX_URGENCY ("low", "medium", "high") picks the priority fee percentile.
+        self.TX_URGENCY = os.getenv("TX_URGENCY", "medium")
+        self.BLOCK_TIME_SECONDS = 12 # Ethereum mainnet; about 2 on most L2s
+        # Gas estimates are cached per contract function and used with this safety margin.
+        self.GAS_LIMIT_MARGIN = Decimal("1.2")
+        # Gas limits for transactions submitted in the same block as the transactions they depend on
+        # (e.g. a mint sent together with its approvals), used until a gas estimate for that call is cached.
+        self.MINT_GAS_LIMIT = 600_000
+        self.INCREASE_LIQUIDITY_GAS_LIMIT = 450_000
+        self.COLLECT_GAS_LIMIT = 200_000
+        self.REBALANCE_GAS_LIMIT = 1_000_000
+        self.SWAP_GAS_LIMIT = 300_000
+        self.APPROVE_GAS_LIMIT = 100_000
+
+        # Rebalance with a single NonfungiblePositionManager.multicall transaction
+        # (decreaseLiquidity + collect + mint, and burn of the emptied NFT if BURN_OLD_POSITIONS).
+        # With False, the rebalance is sent as separate transactions.
+        self.ATOMIC_REBALANCE = True
+        self.BURN_OLD_POSITIONS = True
+        # The tokens freed by a rebalance rarely match the new range's token ratio: once the price has left the old
+        # range, that range holds a single token. Unless the swap to the ratio is worth less than
+        # REBALANCE_SWAP_MIN_FRACTION of the position, the rebalance is then sent as remove, swap (through the
+        # SwapRouter) and mint transactions. The swap accepts at most REBALANCE_SWAP_SLIPPAGE less than its input is
+        # worth at the pool price, after the pool fee.
+        self.REBALANCE_SWAP_MIN_FRACTION = Decimal("0.01")
+        self.REBALANCE_SWAP_SLIPPAGE = Decimal("0.005")
+
+        # How the NFT Position Manager gets allowance for the tokens it pulls (see allowance_manager.py):
+        # - "exact": approve what each mint needs (an approval transaction per token and mint),
+        # - "max": approve the uint256 maximum once (no approvals afterwards, but the manager can always spend the tokens),
+        # - "permit": sign EIP-2612 permits redeemed inside the mint's multicall (falls back to "max" for other tokens).
+        self.APPROVAL_MODE = os.getenv("APPROVAL_MODE", "max")
+        # Known allowances are kept here, so steady-state rebalances read none from the chain.
+        self.ALLOWANCE_CACHE_FILE = os.getenv("ALLOWANCE_CACHE_FILE", "allowances.json")
+        # At start, a cache at most this many blocks old catches up from the Approval logs since (fetched in chunks of
+        # INGEST_CHUNK_BLOCKS); an older one is dropped and the allowances are read from the chain instead.
+        self.ALLOWANCE_SYNC_MAX_BLOCKS = 100_000
+        # Tokens whose approve reverts when it changes a non-zero allowance to another non-zero value (USDT on
+        # Ethereum mainnet): their allowance is first reset to 0, in a transaction sent right before the approval.
+        self.APPROVAL_ZERO_RESET_TOKENS = {"0xdAC17F958D2ee523a2206206994597C13D831ec7"}
+        # Permits expire this long after they are signed: enough for the mint and its fee replacements to be mined.
+        self.PERMIT_DEADLINE_SECONDS = 30 * 60
+        # Token decimals, the pool address and its tick spacing, and the decimals and description of the Chainlink
+        # feeds are kept here (chain_metadata.py), so a restart reads none of them from the chain. Empty keeps them
+        # in memory only.
+        self.METADATA_CACHE_FILE = os.getenv("METADATA_CACHE_FILE", "chain_metadata.json")
+
+
+def _abi_type(param) -> str:
+    """Collapses an ABI parameter (including tuple components) into its canonical type string."""
+    if param["type"].startswith("tuple"):
+        components = ",".join(_abi_type(component) for component in param["components"])
+        return f"({components}){param['type'][len('tuple'):]}"
+    return param["type"]
+
+
+# id(function ABI) -> (function ABI, selector, input types, output types), compiled once per function
+_call_codecs = {}
+
+
+def _call_codec(call) -> tuple:
+    """
+    The selector and canonical input/output types of a contract function call. Contracts are memoized
+    (`BlockchainClient.get_contract`), so a function's ABI is the same object in every cycle and is compiled once.
+    The ABI is kept in the entry, so its id can't be reused by another object.
+    """
+    codec = _call_codecs.get(id(call.abi))
+    if codec is None:
+        input_types = [_abi_type(param) for param in call.abi["inputs"]]
+        selector = keccak(text=f"{call.abi['name']}({','.join(input_types)})")[:4]
+        codec = _call_codecs[id(call.abi)] = (call.abi, selector, input_types, [_abi_type(output) for output in call.abi["outputs"]])
+    return codec
+
+
+def encode_call(call) -> bytes:
+    """
+    Calldata of a contract function call, from its precompiled codec. Calls whose arguments need web3's
+    normalization (keyword arguments, structs given as dicts, ENS names, ...) go through web3.
+    """
+    if not call.kwargs:
+        _, selector, input_types, _ = _call_codec(call)
+        try:
+            return selector + abi_encode(input_types, call.args)
+        except Exception:
+            pass
+    return Web3.to_bytes(hexstr=call._encode_transaction_data())
+
+
+def encode_batch_calls(calls) -> list:
+    """Encodes `(contract_function, allow_failure)` pairs into Multicall3 `Call3` structs."""
+    return [(call.address, allow_failure, encode_call(call)) for call, allow_failure in calls]
+
+
+def decode_batch_results(codec, calls, raw_results) -> list:
+    """
+    Decodes Multicall3 `Result` structs back into Python values, using the output types of each call.
+    Single-output functions are unwrapped, mirroring what `ContractFunction.call()` returns.
+    """
+    decoded = []
+    for (call, allow_failure), (success, return_data) in zip(calls, raw_results):
+        if not success or not return_data:
+            if not allow_failure:
+                raise Exception(f"Batched call {call.fn_name} to {call.address} failed.")
+            decoded.append(None)
+            continue
+        output_types = _call_codec(call)[3]
+        values = [
+            Web3.to_checksum_address(value) if output_type == "address" else value
+            for output_type, value in zip(output_types, codec.decode(output_types, return_data))
+        ]
+        decoded.append(values[0] if len(values) == 1 else values)
+    return decoded
+
+
+def is_poa_network(node_url: str) -> bool:
+    """True for Proof-of-Authority style networks (like Polygon, BNB Chain) that need the PoA middleware."""
+    return any(name in node_url.lower() for name in ("polygon", "bsc", "arbitrum", "base"))
 
 
 class BlockchainClient:
-    def __init__(self, config: Config):
-        self.w3 = Web3(Web3.HTTPProvider(config.NODE_URL))
+    def __init__(self, config: Config, provider=None):
+        # Any web3 provider can stand in for NODE_URL, e.g. the in-memory chain of mock_chain.py.
+        if provider is None and len(config.NODE_URLS) > 1:
+            provider = ProviderPool(config.NODE_URLS, hedge_after=config.RPC_HEDGE_AFTER_SECONDS,
+                                    timeout=config.RPC_TIMEOUT_SECONDS, cooldown=config.RPC_COOLDOWN_SECONDS)
+        self.w3 = Web3(provider or Web3.HTTPProvider(config.NODE_URLS[0]))
         # Inject middleware for Proof-of-Authority (PoA) networks (like Polygon, BNB Chain)
         # This is necessary for proper transaction signing and nonce management on these networks.
-        if "polygon" in config.NODE_URL.lower() or "bsc" in config.NODE_URL.lower() or "arbitrum" in config.NODE_URL.lower() or "base" in config.NODE_URL.lower():
+        if is_poa_network(config.NODE_URLS[0]):
              self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        # Latency and errors of every JSON-RPC request, by method (metrics.py)
+        self.w3.middleware_onion.add(metrics.rpc_middleware, "metrics")
+        # web3's validation middleware reads the chain ID before every eth_call and gas estimate, doubling the
+        # requests of a cycle. Transactions are signed with the chain ID the pipeline read once, so it is dropped.
+        self.w3.middleware_onion.remove("validation")
 
-        # Verify blockchain connection.
-        if not self.w3.is_connected():
-            raise Exception("Could not connect to the blockchain.")
+        # web3 builds a new ENS resolver each time `w3.ens` is read (for every contract built and every call
+        # encoded by web3), unless one is set.
+        self.w3.ens = ENS.from_web3(self.w3)
 
         self.config = config
+        # (address, id(abi)) -> (abi, contract). Building a contract object parses its whole ABI, so each is built once.
+        self._contracts = {}
         # Load account from private key. Use with extreme caution.
         self.account = self.w3.eth.account.from_key(config.PRIVATE_KEY)
-        print(f"Connected to blockchain. Address: {self.account.address}")
+        self.multicall = self.get_contract(config.MULTICALL3_ADDRESS, config.MULTICALL3_ABI)
+        # Nonces are tracked locally, so transactions can be in flight together, also from several
+        # threads sharing this client (e.g. portfolio workers).
+        self.fee_engine = FeeEngine(self.w3, config.BLOCK_TIME_SECONDS, config.GAS_LIMIT_MARGIN)
+        # The pipeline reads the chain ID, the first request of the client: there is no separate connection check.
+        try:
+            self.tx_pipeline = TransactionPipeline(
+                self.w3, self.account, config.PRIVATE_KEY, self.fee_engine, config.TX_URGENCY,
+                replace_after_seconds=config.TX_REPLACE_AFTER_SECONDS,
+                max_replacements=config.TX_MAX_REPLACEMENTS,
+                receipt_poll_seconds=config.TX_RECEIPT_POLL_SECONDS
+            )
+        except Exception as e:
+            raise Exception(f"Could not connect to the blockchain: {e}")
+        print(f"Connected to blockchain (chain ID {self.tx_pipeline.chain_id}). Address: {self.account.address}")
+        # Allowances are per wallet, so clients sharing this wallet (e.g. portfolio pools) share the cache.
+        self.allowances = AllowanceManager(self, config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, config.APPROVAL_MODE, config.ALLOWANCE_CACHE_FILE)
+        # The SwapRouter pulls the input of a rebalance's swap. Its swaps can't redeem permits, so permit mode approves the maximum.
+        self.swap_allowances = AllowanceManager(self, config.UNISWAP_SWAP_ROUTER_ADDRESS, "exact" if config.APPROVAL_MODE == "exact" else "max",
+                                                config.ALLOWANCE_CACHE_FILE, "the SwapRouter")
+        self.metadata = ChainMetadata(config.METADATA_CACHE_FILE, self.tx_pipeline.chain_id)
+        # Chainlink feeds and their last rounds (price_feeds.py), shared by clients copied from this one
+        self.price_feeds = FeedRegistry(self, config.CHAINLINK_FEEDS, config.CHAINLINK_MAX_CHECK_SECONDS, config.CHAINLINK_STALE_GRACE_SECONDS)
 
     def get_contract(self, address, abi):
-        """Returns a Web3 contract instance for a given address and ABI."""
-        return self.w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
-
-    def send_transaction(self, tx):
-        """Builds, signs, and sends a transaction to the blockchain."""
-        nonce = self.w3.eth.get_transaction_count(self.account.address)
-        # It's recommended to estimate gas before sending to avoid failures or overpaying
-        # gas_limit = tx.estimate_gas({'from': self.account.address}) # Uncomment if you want to estimate gas
-        tx_build = tx.build_transaction({
-            'chainId': self.w3.eth.chain_id,
-            'from': self.account.address,
-            'nonce': nonce,
-            # For Ethereum Mainnet (EIP-1559), you might want to use w3.eth.get_block('latest').baseFeePerGas
-            # For simplicity, using legacy gasPrice here. Adjust based on network.
-            'gasPrice': self.w3.eth.gas_price
-            # 'gas': gas_limit # Uncomment if using estimated gas
-        })
-        signed_tx = self.w3.eth.account.sign_transaction(tx_build, private_key=self.config.PRIVATE_KEY)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        print(f"Transaction sent: {tx_hash.hex()}")
-        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        if receipt.status == 1:
-            print(f"Transaction successful: {tx_hash.hex()}")
-        else:
-            print(f"Transaction failed: {tx_hash.hex()}")
-            # It's crucial to add more robust error handling here, potentially reverting or retrying.
-            raise Exception(f"Transaction failed: {tx_hash.hex()}")
-        return receipt
+        """Returns a Web3 contract instance for a given address and ABI, built on the first request for them."""
+        key = (address, id(abi))
+        cached = self._contracts.get(key)
+        if cached is None:
+            # The ABI is kept with the contract, so its id can't be reused by another list while the entry exists
+            cached = self._contracts[key] = (abi, self.w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi))
+        return cached[1]
+
+    def token_decimals(self, tokens: list[str]) -> dict:
+        """Decimals of each token, from the metadata cache. Those not cached yet are read in one batched call and cached."""
+        decimals = {token: self.metadata.get("decimals", token) for token in tokens}
+        missing = [token for token, value in decimals.items() if value is None]
+        if missing:
+            _, results = self.batch_call([self.get_contract(token, self.config.ERC20_ABI).functions.decimals() for token in missing])
+            decimals.update(zip(missing, results))
+            self.metadata.update("decimals", dict(zip(missing, results)))
+        return decimals
+
+    def batch_call(self, calls, block_identifier="latest"):
+        """
+        Executes many read-only contract calls in a single Multicall3 `aggregate3` eth_call.
+        `calls` is a list of contract function calls (e.g. `pool.functions.slot0()`), or
+        `(call, allow_failure)` tuples for reads that may revert (e.g. an oracle).
+        Returns (block_number, results). Every result comes from the same block and is decoded
+        the same way `.call()` would return it; a failed call that was allowed to fail yields None.
+        """
+        # The block number is read inside the same aggregate3 call, so it is the block the results belong to.
+        calls = [(self.multicall.functions.getBlockNumber(), False)] + [
+            call if isinstance(call, tuple) else (call, False) for call in calls
+        ]
+        metrics.BATCH_CALL_SIZE.observe(len(calls) - 1)
+        aggregate = self.multicall.functions.aggregate3(encode_batch_calls(calls))
+        # Encoded and decoded with the precompiled codec: web3's own formatting of the nested structs costs more than the call
+        return_data = self.w3.eth.call({"to": self.multicall.address, "data": encode_call(aggregate)}, block_identifier)
+        (raw_results,) = self.w3.codec.decode(_call_codec(aggregate)[3], return_data)
+        results = decode_batch_results(self.w3.codec, calls, raw_results)
+        return results[0], results[1:]
+
+    def submit_transaction(self, tx, gas_limit: int | None = None) -> PendingTransaction:
+        """
+        Builds, signs, and sends a transaction without waiting for it to be mined.
+        Call `.result()` on the returned PendingTransaction to get the receipt.
+        """
+        return self.tx_pipeline.submit(tx, gas_limit)
+
+    def send_transaction(self, tx, gas_limit: int | None = None):
+        """Builds, signs, and sends a transaction to the blockchain, and waits for its receipt."""
+        return self.submit_transaction(tx, gas_limit).result()
 
 # --- 2. Price and Oracle Module ---
 class PriceOracle:
     def __init__(self, blockchain_client: BlockchainClient):
         self.client = blockchain_client
-        # Initialize Chainlink price feed contracts
-        self.eth_usd_feed = self.client.get_contract(self.client.config.CHAINLINK_ETH_USD_FEED, self.client.config.CHAINLINK_ABI)
-        self.usdc_usd_feed = self.client.get_contract(self.client.config.CHAINLINK_USDC_USD_FEED, self.client.config.CHAINLINK_ABI)
+        # Chainlink feeds of the configured tokens, with their cached rounds
+        self.feeds = self.client.price_feeds
         # Store token decimals for accurate price conversions.
-        # For a more generic solution, you would fetch these on demand or from a token list.
-        self.token_decimals = {
-            self.client.config.TOKEN0_ADDRESS: self.client.get_contract(self.client.config.TOKEN0_ADDRESS, self.client.config.ERC20_ABI).functions.decimals().call(),
-            self.client.config.TOKEN1_ADDRESS: self.client.get_contract(self.client.config.TOKEN1_ADDRESS, self.client.config.ERC20_ABI).functions.decimals().call(),
-        }
+        # They come from the chain metadata cache; only the first start on a chain reads them (in one batched call).
+        self.token_decimals = self.client.token_decimals([self.client.config.TOKEN0_ADDRESS, self.client.config.TOKEN1_ADDRESS])
 
+    def get_feed(self, token_address: str):
+        """Returns the Chainlink feed contract configured for a token, or None if there is none."""
+        feed = self.feeds.feed(token_address)
+        return None if feed is None else feed.contract
 
-    def get_token_price_usd(self, token_address: str) -> Decimal:
+    def get_token_price_usd(self, token_address: str, latest_data=None) -> Decimal:
         """
-        Gets the price of a token in USD using Chainlink Price Feeds.
+        Gets the price of a token in USD using Chainlink Price Feeds, from the feed's cached round.
+        The feed is only read if a new round could have been published since (see price_feeds.py); a
+        `latestRoundData()` result already read in a batch can be passed as `latest_data`.
+        Returns 0 if there is no price, or if it is stale and CHAINLINK_REJECT_STALE is set.
         """
         print(f"Getting USD price for {token_address} using Chainlink...")
+        if self.feeds.feed(token_address) is None:
+            print(f"No Chainlink feed configured for {token_address}. Returning 0.")
+            return Decimal("0")
         try:
-            if token_address == self.client.config.TOKEN0_ADDRESS: # WETH
-                # Chainlink's latestRoundData returns (roundId, answer, startedAt, updatedAt, answeredInRound)
-                latest_data = self.eth_usd_feed.functions.latestRoundData().call()
-                price_raw = latest_data[1] # The 'answer' field
-                # Chainlink price feeds usually have 8 decimals, but check the specific feed's documentation
-                return Decimal(price_raw) / Decimal(10**8) # Assuming 8 decimals for Chainlink feeds
-            elif token_address == self.client.config.TOKEN1_ADDRESS: # USDC
-                latest_data = self.usdc_usd_feed.functions.latestRoundData().call()
-                price_raw = latest_data[1]
-                return Decimal(price_raw) / Decimal(10**8) # Assuming 8 decimals for Chainlink feeds
-            else:
-                print(f"No Chainlink feed configured for {token_address}. Returning 0.")
-                return Decimal("0")
+            self.feeds.observe(token_address, latest_data)
+            self.feeds.refresh([token_address])
         except Exception as e:
             print(f"Error getting price from Chainlink for {token_address}: {e}")
-            return Decimal("0") # Return 0 or raise an error as appropriate
+        price, staleness = self.feeds.price(token_address)
+        if staleness is not None:
+            print(f"Chainlink price of {token_address} is stale: {staleness}.")
+            if price is None or self.client.config.CHAINLINK_REJECT_STALE:
+                return Decimal("0")
+        return price
 
+    def get_native_price_usd(self, latest_data=None) -> Decimal:
+        """USD price of the network's gas token (ETH), to value gas costs. `latest_data` as in `get_token_price_usd`."""
+        price = self.get_token_price_usd("native", latest_data)
+        if price == 0:
+            raise Exception("Could not get the USD price of the native token.")
+        return price
 
-    def get_pool_prices(self, pool_address: str) -> tuple[Decimal, Decimal]:
+    def get_pool_prices(self, pool_address: str, sqrt_price_x96: int | None = None) -> tuple[Decimal, Decimal]:
         """
         Gets the current prices of token0 and token1 in the pool from Uniswap V3's slot0.
         Returns (price0_per_1, price1_per_0) where price0_per_1 is how much of token1 you get for 1 token0.
+        If `sqrt_price_x96` was already read in a batch, slot0 is not queried again.
         """
-        pool_contract = self.client.get_contract(pool_address, self.client.config.UNISWAP_POOL_ABI)
-        slot0 = pool_contract.functions.slot0().call()
-        sqrt_price_x96 = Decimal(slot0[0])
+        if sqrt_price_x96 is None:
+            pool_contract = self.client.get_contract(pool_address, self.client.config.UNISWAP_POOL_ABI)
+            slot0 = pool_contract.functions.slot0().call()
+            sqrt_price_x96 = slot0[0]
 
         # Get decimals for accurate price conversion
         decimals0 = self.token_decimals[self.client.config.TOKEN0_ADDRESS]
         decimals1 = self.token_decimals[self.client.config.TOKEN1_ADDRESS]
 
-        # Calculate price0_per_1 (how much token1 for 1 token0) from sqrtPriceX96
-        # price_token0_per_token1 = (sqrt_price_x96 / 2**96)**2
-        # price_token1_per_token0 = 1 / price_token0_per_token1
-        price0_per_1_raw = (sqrt_price_x96 / Decimal(2**96))**2
-
-        # Adjust for token decimals to get human-readable price
-        adjusted_price0_per_1 = price0_per_1_raw * Decimal(10**decimals1) / Decimal(10**decimals0)
+        # Calculate price0_per_1 (how much token1 for 1 token0) from sqrtPriceX96:
+        # raw price = (sqrt_price_x96 / 2**96)**2, adjusted by 10**decimals0 / 10**decimals1 to be human-readable.
+        adjusted_price0_per_1 = tick_math.sqrt_price_x96_to_price(sqrt_price_x96, decimals0, decimals1)
         adjusted_price1_per_0 = 1 / adjusted_price0_per_1
 
-        print(f"Price in pool: {adjusted_price1_per_0} {self.client.config.TOKEN0_ADDRESS_SYMBOL}/{self.client.config.TOKEN1_ADDRESS_SYMBOL} (Token0 per Token1)")
+        print(f"Price in pool: {adjusted_price0_per_1} {self.client.config.TOKEN1_ADDRESS_SYMBOL} per {self.client.config.TOKEN0_ADDRESS_SYMBOL}")
         return adjusted_price0_per_1, adjusted_price1_per_0 # price0_per_1 (token1 per token0), price1_per_0 (token0 per token1)
 
 # --- 3. Uniswap V3 Liquidity Management Module ---
@@ -177,111 +553,116 @@ class UniswapLPManager:
         self.oracle = oracle
         self.factory = client.get_contract(client.config.UNISWAP_FACTORY_ADDRESS, client.config.UNISWAP_FACTORY_ABI)
         self.nft_manager = client.get_contract(client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, client.config.UNISWAP_NFT_POSITION_MANAGER_ABI)
+        # Pool addresses never change for a given (token0, token1, fee), so they are resolved once.
+        self._pool_addresses = {}
 
     def get_pool_address(self, token0_address, token1_address, fee):
-        """Retrieves the address of a Uniswap V3 pool for a given token pair and fee tier."""
-        pool_address = self.factory.functions.getPool(
-            Web3.to_checksum_address(token0_address),
-            Web3.to_checksum_address(token1_address),
-            fee
-        ).call()
-        if pool_address == "0x0000000000000000000000000000000000000000":
-            raise Exception("Pool not found for the given parameters.")
-        print(f"Pool address: {pool_address}")
+        """
+        Retrieves the address of a Uniswap V3 pool for a given token pair and fee tier.
+        Pools are resolved from the chain metadata cache; the first time, the factory's getPool and the fee tier's
+        tick spacing are read in one batched call and cached.
+        """
+        key = (token0_address, token1_address, fee)
+        if key in self._pool_addresses:
+            return self._pool_addresses[key]
+        metadata_key = pool_key(self.factory.address, Web3.to_checksum_address(token0_address), Web3.to_checksum_address(token1_address), fee)
+        pool_address = self.client.metadata.get("pools", metadata_key)
+        if pool_address is None:
+            _, (pool_address, tick_spacing) = self.client.batch_call([
+                self.factory.functions.getPool(Web3.to_checksum_address(token0_address), Web3.to_checksum_address(token1_address), fee),
+                self.factory.functions.feeAmountTickSpacing(fee),
+            ])
+            if pool_address == "0x0000000000000000000000000000000000000000":
+                raise Exception("Pool not found for the given parameters.")
+            print(f"Pool address: {pool_address}")
+            self.client.metadata.update("tick_spacing", {pool_address: tick_spacing})
+            self.client.metadata.update("pools", {metadata_key: pool_address})
+        self._pool_addresses[key] = pool_address
         return pool_address
 
+    def get_pool_contract(self):
+        """Returns the contract of the configured pool."""
+        pool_address = self.get_pool_address(self.client.config.TOKEN0_ADDRESS, self.client.config.TOKEN1_ADDRESS, self.client.config.POOL_FEE)
+        return self.client.get_contract(pool_address, self.client.config.UNISWAP_POOL_ABI)
+
+    def get_tick_spacing(self) -> int:
+        """Tick spacing of the configured pool, from the chain metadata cache (falling back to the fee tier's standard spacing)."""
+        pool_address = self.get_pool_address(self.client.config.TOKEN0_ADDRESS, self.client.config.TOKEN1_ADDRESS, self.client.config.POOL_FEE)
+        return self.client.metadata.get("tick_spacing", pool_address) or tick_math.get_tick_spacing(self.client.config.POOL_FEE)
+
+    def reserve_allowances(self, amount0_wei: int, amount1_wei: int) -> AllowanceReservation:
+        """
+        Makes sure the NFT Position Manager can pull both amounts, from the cached allowances. Approvals
+        that are needed are submitted without waiting for them (or, in permit mode, permits are signed).
+        """
+        config = self.client.config
+        return self.client.allowances.reserve(
+            {config.TOKEN0_ADDRESS: amount0_wei, config.TOKEN1_ADDRESS: amount1_wei},
+            {config.TOKEN0_ADDRESS: config.TOKEN0_ADDRESS_SYMBOL, config.TOKEN1_ADDRESS: config.TOKEN1_ADDRESS_SYMBOL}
+        )
+
+    def send_spending_transaction(self, tx, reservation: AllowanceReservation, default_gas_limit: int):
+        """
+        Sends an NFT Position Manager call that pulls tokens from the wallet (mint, increaseLiquidity or a
+        multicall containing one) and waits for it, together with the approvals of its reservation.
+        Permits of the reservation are redeemed in the same transaction, by wrapping the call in a multicall.
+        The allowance cache is then updated with the amounts actually spent.
+        """
+        if reservation.permit_calls:
+            inner_calls = tx.args[0] if tx.fn_name == "multicall" else [self.nft_manager.encodeABI(fn_name=tx.fn_name, args=tx.args)]
+            tx = self.nft_manager.functions.multicall(reservation.permit_calls + list(inner_calls))
+        # While approvals are pending the call can't be gas-estimated, so it uses the cached estimate of
+        # earlier calls of the same shape, or a fixed gas limit the first time.
+        gas_limit = self.client.fee_engine.cached_gas_limit(tx, default_gas_limit) if reservation.approvals else None
+        try:
+            pending_tx = self.client.submit_transaction(tx, gas_limit)
+            reservation.wait_for_approvals()
+            receipt = pending_tx.result()
+        except Exception:
+            self.client.allowances.release(reservation)
+            raise
+        # Only the IncreaseLiquidity amounts were pulled, which may be less than was reserved
+        spent0 = spent1 = 0
+        for log in self.nft_manager.events.IncreaseLiquidity().process_receipt(receipt):
+            spent0 += log['args']['amount0']
+            spent1 += log['args']['amount1']
+        self.client.allowances.settle(reservation, {self.client.config.TOKEN0_ADDRESS: spent0, self.client.config.TOKEN1_ADDRESS: spent1}, receipt.blockNumber)
+        return receipt
+
     def calculate_tick_from_price(self, price: Decimal, token0_decimals: int, token1_decimals: int) -> int:
         """
         Calculates the Uniswap V3 tick corresponding to a given price.
-        Price is defined as amount_token1 / amount_token0.
-        """
-        # Adjust price by token decimals to match the contract's internal representation
-        adjusted_price = price * Decimal(10**token0_decimals) / Decimal(10**token1_decimals) # Price is token1 per token0, so adjust accordingly
-        # The formula for tick is log_1.0001(sqrt(adjusted_price))
-        # price = (sqrtPriceX96 / 2**96)^2 * (10**decimals0 / 10**decimals1)
-        # sqrtPriceX96 = sqrt(price / (10**decimals0 / 10**decimals1)) * 2**96
-        # tick = log(sqrtPriceX96 / (2**96), sqrt(1.0001))
-        # log_sqrt(1.0001)(P) = log(P) / log(sqrt(1.0001))
-        
-        # Invert the adjustment for price to match contract representation for tick calculation
-        price_for_tick_calc = price / (Decimal(10**token1_decimals) / Decimal(10**token0_decimals))
-        
-        # It's actually: P = (1.0001)^tick, so tick = log(1.0001, P)
-        # The price provided to `calculate_tick_from_price` is price of token0 in terms of token1.
-        # i.e., how many TOKEN1 you get for 1 TOKEN0.
-        # Uniswap V3's internal price is token1 / token0.
-        # So we need to ensure `adjusted_price` matches `token1 / token0` with 18 decimals each.
-        
-        # Normalize price to a common 1e18 basis (similar to how Uniswap's sqrtPriceX96 works relative to 1e18)
-        # P_actual = price_in_human_readable * 10**(decimals0 - decimals1)
-        # The 'price' argument here is token0 per token1.
-        # Uniswap uses `sqrtPriceX96 = sqrt(P) * 2^96` where P is token1/token0.
-        # So if we have price = token0_value / token1_value (e.g., ETH/USDC), we need to invert for internal price.
-        # price_internal = 1 / price_token0_per_token1 (how much token0 for 1 token1)
-        # If your `price` is (ETH/USDC), then that's `token0_per_token1`.
-        # Uniswap internal price `P` is `token1 / token0`.
-        # So, $P = 1/price$.
-        
-        # Re-evaluating based on Uniswap V3 whitepaper for tick and price:
-        # P_tick = (1.0001)^tick
-        # The current price (P_human) is token1 per token0, adjusted by decimals.
-        # P_human = (sqrtPriceX96 / 2^96)^2 * (10^decimals1 / 10^decimals0)
-        # If `price` input is token0_per_token1 (e.g., WETH/USDC):
-        # We need to compute tick for P_internal = 1/price
-        # P_internal_adjusted = (1/price) * (10**decimals0 / 10**decimals1) # internal price is token0/token1, adjusted for common scale
-        # tick = log(P_internal_adjusted, 1.0001)
-
-        # Let's assume 'price' is indeed `price_of_token0_in_token1` (e.g., $3000 USDC/WETH)
-        # The contract's internal price P is how much TOKEN1 you get for 1 unit of TOKEN0, normalized to 1e18.
-        # P = price * (10**decimals1 / 10**decimals0)
-        
-        normalized_price = price * Decimal(10**(decimals0 - decimals1))
-        # The formula for tick is log_sqrt(1.0001)(P) where P is the raw price.
-        # P = sqrtPriceX96^2 / 2^192
-        # price_token0_per_token1 = (sqrtPriceX96 / 2**96)**2 * (10**decimals1 / 10**decimals0)
-        # Rearranging to get (sqrtPriceX96 / 2**96)
-        # sqrtPriceRatio = sqrt(price / (10**decimals1 / 10**decimals0))
-        # tick = log(sqrtPriceRatio, sqrt(1.0001))
-        # Use Decimal.log10() and Decimal.from_float() for precision
-        
-        # Corrected tick calculation based on Uniswap V3 docs:
-        # price in P = token1 / token0
-        # Given `price` as `token0_per_token1` (e.g., WETH/USDC price).
-        # We need `price_token1_per_token0 = 1 / price`.
-        # Normalized price for internal tick calculation (P_normalized):
-        # P_normalized = (1 / price) * (10**decimals0 / 10**decimals1)
-        # tick = log_1.0001(P_normalized)
-
-        price_token1_per_token0 = Decimal("1") / price
-        P_normalized = price_token1_per_token0 * Decimal(10**decimals0) / Decimal(10**decimals1)
-        
-        # log_b(x) = log_e(x) / log_e(b)
-        tick = int(P_normalized.ln() / Decimal("1.0001").ln())
-        return tick
+        Price is defined as amount_token1 / amount_token0 in human-readable units (e.g. USDC per WETH).
+        Uses exact integer TickMath, so the result is the same tick the pool would report at that price.
+        """
+        return tick_math.price_to_tick(price, token0_decimals, token1_decimals)
 
 
     def calculate_price_from_tick(self, tick: int, token0_decimals: int, token1_decimals: int) -> Decimal:
         """
-        Calculates the price (amount_token0 / amount_token1) from a Uniswap V3 tick.
-        This function returns price as `token0_per_token1`.
+        Calculates the price (amount_token1 / amount_token0, e.g. USDC per WETH) at a Uniswap V3 tick.
+        This is the inverse of `calculate_tick_from_price`.
         """
-        # P = 1.0001^tick. This P is `token1 / token0` (internal price)
-        internal_price = Decimal("1.0001")**tick
-        
-        # Convert internal price back to human-readable `token0_per_token1`
-        # human_readable_price = (1 / internal_price) * (10**decimals1 / 10**decimals0)
-        # The convention is usually price of token0 in terms of token1.
-        # So price = token1 / token0 (from tick) * (10**decimals0 / 10**decimals1)
-        # Adjusted price is price of token0 in terms of token1 (ETH/USDC).
-        # P_human = (sqrtPriceX96 / 2**96)^2 * (10**decimals1 / 10**decimals0)
-        # From Uniswap's current tick, it's (1.0001)^tick.
-        # This is `price_token1_per_token0_raw`.
-        
-        price_token1_per_token0_raw = Decimal("1.0001")**tick
-        price_token0_per_token1 = (Decimal("1") / price_token1_per_token0_raw) * Decimal(10**token1_decimals) / Decimal(10**token0_decimals)
-        return price_token0_per_token1
+        return tick_math.tick_to_price(tick, token0_decimals, token1_decimals)
 
 
+    def calculate_tick_range(self, lower_price: Decimal, upper_price: Decimal) -> tuple[int, int]:
+        """Converts a price range (TOKEN1 per TOKEN0) into the pool's tick range, aligned to its tick spacing."""
+        decimals0 = self.oracle.token_decimals[self.client.config.TOKEN0_ADDRESS]
+        decimals1 = self.oracle.token_decimals[self.client.config.TOKEN1_ADDRESS]
+        lower_tick = self.calculate_tick_from_price(lower_price, decimals0, decimals1)
+        upper_tick = self.calculate_tick_from_price(upper_price, decimals0, decimals1)
+
+        # Adjust ticks to the fee tier's granularity (tick spacing)
+        # Ticks must be multiples of tick_spacing for the chosen fee tier (e.g. 60 for the 0.3% tier).
+        tick_spacing = self.get_tick_spacing()
+        lower_tick = tick_math.align_tick(lower_tick, tick_spacing)
+        upper_tick = tick_math.align_tick(upper_tick, tick_spacing)
+        # Ensure upper tick is greater than lower tick to form a valid range
+        if upper_tick <= lower_tick:
+            upper_tick = lower_tick + tick_spacing
+        return lower_tick, upper_tick
+
     def parse_mint_receipt_for_token_id(self, receipt) -> int:
         """
         Parses a transaction receipt to find the tokenId of a newly minted LP position.
@@ -306,59 +687,26 @@ class UniswapLPManager:
             raise
 
 
-    def provide_liquidity(self, token0_amount: Decimal, token1_amount: Decimal, lower_price: Decimal, upper_price: Decimal) -> int:
-        """Provides new liquidity to a Uniswap V3 pool within a specified price range."""
+    def provide_liquidity(self, token0_amount: Decimal, token1_amount: Decimal, lower_price: Decimal, upper_price: Decimal,
+                          tick_range: tuple[int, int] | None = None) -> int:
+        """
+        Provides new liquidity to a Uniswap V3 pool within a specified price range.
+        If `tick_range` (already aligned ticks, e.g. from the range optimizer) is given, it is used as is.
+        """
         pool_address = self.get_pool_address(self.client.config.TOKEN0_ADDRESS, self.client.config.TOKEN1_ADDRESS, self.client.config.POOL_FEE)
 
-        token0_contract = self.client.get_contract(self.client.config.TOKEN0_ADDRESS, self.client.config.ERC20_ABI)
-        token1_contract = self.client.get_contract(self.client.config.TOKEN1_ADDRESS, self.client.config.ERC20_ABI)
-        decimals0 = token0_contract.functions.decimals().call()
-        decimals1 = token1_contract.functions.decimals().call()
-
-        lower_tick = self.calculate_tick_from_price(lower_price, decimals0, decimals1)
-        upper_tick = self.calculate_tick_from_price(upper_price, decimals0, decimals1)
-
-        # Adjust ticks to the fee tier's granularity (tick spacing)
-        # Ticks must be multiples of tick_spacing for the chosen fee tier.
-        tick_spacing = self.client.config.POOL_FEE // 50 # e.g. 3000 / 50 = 60
-        lower_tick = (lower_tick // tick_spacing) * tick_spacing
-        upper_tick = (upper_tick // tick_spacing) * tick_spacing
-        # Ensure upper tick is greater than lower tick to form a valid range
-        if upper_tick <= lower_tick:
-            upper_tick = lower_tick + tick_spacing
+        decimals0 = self.oracle.token_decimals[self.client.config.TOKEN0_ADDRESS]
+        decimals1 = self.oracle.token_decimals[self.client.config.TOKEN1_ADDRESS]
 
+        lower_tick, upper_tick = tick_range or self.calculate_tick_range(lower_price, upper_price)
 
         # Convert human-readable amounts to wei/raw amounts using token decimals
         amount0_wei = int(token0_amount * Decimal(10**decimals0))
         amount1_wei = int(token1_amount * Decimal(10**decimals1))
 
-        # Check current allowance for token0 and approve if insufficient
-        current_allowance0 = token0_contract.functions.allowance(
-            self.client.config.WALLET_ADDRESS, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
-        ).call()
-        if current_allowance0 < amount0_wei:
-            print(f"Approving {token0_amount} {self.client.config.TOKEN0_ADDRESS_SYMBOL} for NFT Position Manager...")
-            approval_tx0 = token0_contract.functions.approve(
-                self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, amount0_wei
-            )
-            self.client.send_transaction(approval_tx0)
-            print(f"Approval for {self.client.config.TOKEN0_ADDRESS_SYMBOL} successful.")
-        else:
-            print(f"Allowance for {self.client.config.TOKEN0_ADDRESS_SYMBOL} is sufficient.")
-
-        # Check current allowance for token1 and approve if insufficient
-        current_allowance1 = token1_contract.functions.allowance(
-            self.client.config.WALLET_ADDRESS, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
-        ).call()
-        if current_allowance1 < amount1_wei:
-            print(f"Approving {token1_amount} {self.client.config.TOKEN1_ADDRESS_SYMBOL} for NFT Position Manager...")
-            approval_tx1 = token1_contract.functions.approve(
-                self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, amount1_wei
-            )
-            self.client.send_transaction(approval_tx1)
-            print(f"Approval for {self.client.config.TOKEN1_ADDRESS_SYMBOL} successful.")
-        else:
-            print(f"Allowance for {self.client.config.TOKEN1_ADDRESS_SYMBOL} is sufficient.")
+        # Approve each token whose allowance is insufficient. The approvals are not awaited here:
+        # they are in flight together with the mint below and land in the same block.
+        reservation = self.reserve_allowances(amount0_wei, amount1_wei)
 
 
         # Parameters for the `mint` function of the NFT Position Manager contract.
@@ -381,7 +729,7 @@ class UniswapLPManager:
 
         # Build and send the mint transaction.
         mint_tx = self.nft_manager.functions.mint(params)
-        mint_receipt = self.client.send_transaction(mint_tx)
+        mint_receipt = self.send_spending_transaction(mint_tx, reservation, self.client.config.MINT_GAS_LIMIT)
         print(f"Mint transaction sent. Receipt: {mint_receipt.transactionHash.hex()}")
         
         # Parse the transaction receipt to get the tokenId.
@@ -393,37 +741,60 @@ class UniswapLPManager:
         """Gets detailed information about a Uniswap V3 NFT position."""
         position_data = self.nft_manager.functions.positions(token_id).call()
         # position_data tuple: (nonce, operator, token0, token1, fee, tickLower, tickUpper,
-        # liquidity, feeGrowthOutside0X128, feeGrowthOutside1X128, tokensOwed0, tokensOwed1)
+        # liquidity, feeGrowthInside0LastX128, feeGrowthInside1LastX128, tokensOwed0, tokensOwed1)
         print(f"Position {token_id} info: {position_data}")
         return position_data
 
-    def collect_fees(self, token_id: int):
-        """Collects accrued fees from an LP position."""
-        position_data = self.get_position_info(token_id)
-        tokens_owed0 = position_data[9] # tokensOwed0 (fee amounts)
-        tokens_owed1 = position_data[10] # tokensOwed1 (fee amounts)
+    def get_uncollected_fees(self, token_id: int, position_info=None) -> tuple[int, int]:
+        """
+        Raw TOKEN0/TOKEN1 amounts a `collect` would return right now, computed from the pool's fee growth
+        (fee_accrual.py) in one batched call, so it needs no transaction to poke the position.
+        """
+        if position_info is None:
+            position_info = self.get_position_info(token_id)
+        pool_contract = self.get_pool_contract()
+        _, (slot0, fee_growth0, fee_growth1, lower_tick_info, upper_tick_info) = self.client.batch_call([
+            pool_contract.functions.slot0(),
+            pool_contract.functions.feeGrowthGlobal0X128(),
+            pool_contract.functions.feeGrowthGlobal1X128(),
+            pool_contract.functions.ticks(position_info[5]),
+            pool_contract.functions.ticks(position_info[6]),
+        ])
+        return fee_accrual.uncollected_fees(position_info, slot0[1], fee_growth0, fee_growth1, lower_tick_info, upper_tick_info)
+
+    def collect_fees(self, token_id: int, uncollected_fees: tuple[int, int] | None = None):
+        """
+        Collects accrued fees from an LP position. `uncollected_fees` (e.g. from a cycle snapshot) avoids the read;
+        otherwise they are computed off-chain with `get_uncollected_fees`.
+        """
+        owed0, owed1 = uncollected_fees or self.get_uncollected_fees(token_id)
 
-        if tokens_owed0 == 0 and tokens_owed1 == 0:
+        if owed0 == 0 and owed1 == 0:
             print(f"No fees to collect for position {token_id}.")
             return
 
         # Parameters for the `collect` function.
-        # amount0Max/amount1Max: Max amounts to collect. Usually set to the owed amounts.
+        # amount0Max/amount1Max: Max amounts to collect. The position manager pokes the pool first,
+        # so the uint128 maximum collects everything owed, including fees earned since the read.
         params = {
             'tokenId': token_id,
             'recipient': self.client.config.WALLET_ADDRESS,
-            'amount0Max': tokens_owed0,
-            'amount1Max': tokens_owed1
+            'amount0Max': MAX_UINT128,
+            'amount1Max': MAX_UINT128
         }
 
         # Build and send the collect transaction.
         collect_tx = self.nft_manager.functions.collect(params)
         collect_receipt = self.client.send_transaction(collect_tx)
-        print(f"Fees collected for position {token_id}. Receipt: {collect_receipt.transactionHash.hex()}")
+        print(f"Fees collected for position {token_id} ({owed0} / {owed1} raw units). Receipt: {collect_receipt.transactionHash.hex()}")
 
 
-    def decrease_liquidity(self, token_id: int, liquidity_to_remove: int) -> tuple[Decimal, Decimal]:
-        """Decreases liquidity from an LP position."""
+    def decrease_liquidity(self, token_id: int, liquidity_to_remove: int, collect_all: bool = False) -> tuple[Decimal, Decimal]:
+        """
+        Decreases liquidity from an LP position and returns the amounts removed.
+        With `collect_all`, a `collect` of everything owed (the removed amounts plus fees) is submitted right
+        behind the decrease, so both are mined in the same block.
+        """
         # Parameters for the `decreaseLiquidity` function.
         # amount0Min/amount1Min: Slippage tolerance for tokens received after removing liquidity.
         params = {
@@ -434,9 +805,28 @@ class UniswapLPManager:
             'deadline': int(time.time()) + 60 * 20
         }
         decrease_tx = self.nft_manager.functions.decreaseLiquidity(params)
-        decrease_receipt = self.client.send_transaction(decrease_tx)
+        pending_decrease = self.client.submit_transaction(decrease_tx)
+        if collect_all:
+            # The uint128 maximum collects whatever is owed once the decrease has executed, so the collect
+            # does not need the decrease receipt. Its gas can't be estimated before that, so the cached
+            # estimate of earlier collects (or a fixed limit) is used.
+            collect_tx = self.nft_manager.functions.collect({
+                'tokenId': token_id,
+                'recipient': self.client.config.WALLET_ADDRESS,
+                'amount0Max': MAX_UINT128,
+                'amount1Max': MAX_UINT128
+            })
+            pending_collect = self.client.submit_transaction(collect_tx, self.client.fee_engine.cached_gas_limit(collect_tx, self.client.config.COLLECT_GAS_LIMIT))
+        decrease_receipt = pending_decrease.result()
+        if collect_all:
+            collect_receipt = pending_collect.result()
+            print(f"Tokens and fees collected for position {token_id}. Receipt: {collect_receipt.transactionHash.hex()}")
         print(f"Liquidity decreased for {token_id} by {liquidity_to_remove}. Receipt: {decrease_receipt.transactionHash.hex()}")
         
+        return self.parse_decrease_receipt_amounts(decrease_receipt)
+
+    def parse_decrease_receipt_amounts(self, decrease_receipt) -> tuple[Decimal, Decimal]:
+        """Returns the human-readable token amounts removed by a decreaseLiquidity, from its event."""
         # --- START OF TODO 4 IMPLEMENTATION (Parse recovered amounts) ---
         # Parse the transaction receipt to get the amounts of tokens received.
         # The 'DecreaseLiquidity' event is emitted:
@@ -465,39 +855,15 @@ class UniswapLPManager:
 
     def increase_liquidity(self, token_id: int, token0_amount: Decimal, token1_amount: Decimal):
         """Increases liquidity for an existing LP position."""
-        token0_contract = self.client.get_contract(self.client.config.TOKEN0_ADDRESS, self.client.config.ERC20_ABI)
-        token1_contract = self.client.get_contract(self.client.config.TOKEN1_ADDRESS, self.client.config.ERC20_ABI)
-        decimals0 = token0_contract.functions.decimals().call()
-        decimals1 = token1_contract.functions.decimals().call()
+        decimals0 = self.oracle.token_decimals[self.client.config.TOKEN0_ADDRESS]
+        decimals1 = self.oracle.token_decimals[self.client.config.TOKEN1_ADDRESS]
 
         amount0_wei = int(token0_amount * Decimal(10**decimals0))
         amount1_wei = int(token1_amount * Decimal(10**decimals1))
 
-        # Check and approve tokens again for increasing liquidity, as amounts might exceed previous approvals
-        # This logic is similar to `provide_liquidity`'s approval block.
-        current_allowance0 = token0_contract.functions.allowance(
-            self.client.config.WALLET_ADDRESS, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
-        ).call()
-        if current_allowance0 < amount0_wei:
-            print(f"Approving {token0_amount} {self.client.config.TOKEN0_ADDRESS_SYMBOL} for NFT Position Manager (increase)...")
-            approval_tx0 = token0_contract.functions.approve(
-                self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, amount0_wei
-            )
-            self.client.send_transaction(approval_tx0)
-        else:
-            print(f"Allowance for {self.client.config.TOKEN0_ADDRESS_SYMBOL} is sufficient for increase.")
-
-        current_allowance1 = token1_contract.functions.allowance(
-            self.client.config.WALLET_ADDRESS, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
-        ).call()
-        if current_allowance1 < amount1_wei:
-            print(f"Approving {token1_amount} {self.client.config.TOKEN1_ADDRESS_SYMBOL} for NFT Position Manager (increase)...")
-            approval_tx1 = token1_contract.functions.approve(
-                self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, amount1_wei
-            )
-            self.client.send_transaction(approval_tx1)
-        else:
-            print(f"Allowance for {self.client.config.TOKEN1_ADDRESS_SYMBOL} is sufficient for increase.")
+        # Check and approve tokens again for increasing liquidity, as amounts might exceed previous approvals.
+        # As in `provide_liquidity`, the approvals are in flight together with the increase.
+        reservation = self.reserve_allowances(amount0_wei, amount1_wei)
 
         # Parameters for the `increaseLiquidity` function.
         params = {
@@ -509,10 +875,292 @@ class UniswapLPManager:
             'deadline': int(time.time()) + 60 * 20
         }
         increase_tx = self.nft_manager.functions.increaseLiquidity(params)
-        increase_receipt = self.client.send_transaction(increase_tx)
+        increase_receipt = self.send_spending_transaction(increase_tx, reservation, self.client.config.INCREASE_LIQUIDITY_GAS_LIMIT)
         print(f"Liquidity increased for {token_id} with {token0_amount} {self.client.config.TOKEN0_ADDRESS_SYMBOL} and {token1_amount} {self.client.config.TOKEN1_ADDRESS_SYMBOL}. Receipt: {increase_receipt.transactionHash.hex()}")
 
 
+    def calculate_range_swap(self, amount0: int, amount1: int, sqrt_price_x96: int, lower_tick: int, upper_tick: int) -> tuple[bool, int]:
+        """
+        The swap bringing raw (amount0, amount1) to the token ratio the range [lower_tick, upper_tick] takes at
+        `sqrt_price_x96`: (zero_for_one, raw amount in). The pool fee comes out of the input, so the swap is sized
+        to land on the ratio after paying it; its price impact isn't modelled (the mint leaves that part unused).
+        """
+        fee = self.client.config.POOL_FEE
+        price_x192 = sqrt_price_x96 * sqrt_price_x96
+        # Values are in TOKEN1 scaled by 2**192. Any liquidity in the range splits its value as range0 : range1.
+        range0, range1 = tick_math.get_amounts_for_liquidity(
+            sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(lower_tick), tick_math.get_sqrt_ratio_at_tick(upper_tick), 1 << 128
+        )
+        target0 = range0 * price_x192
+        target = target0 + (range1 << 192)
+        held0 = amount0 * price_x192
+        total = held0 + (amount1 << 192)
+        # TOKEN0 value held above its share of the total (scaled by `target`): sell that much TOKEN0, or buy the shortfall
+        excess0 = held0 * target - target0 * total
+        if excess0 > 0:
+            return True, excess0 * 10**6 // (target * 10**6 - target0 * fee) // price_x192
+        return False, (-excess0 * 10**6 // (target * (10**6 - fee) + target0 * fee)) >> 192
+
+    def quote_swap_output(self, zero_for_one: bool, amount_in: int, sqrt_price_x96: int) -> int:
+        """Raw output of swapping `amount_in` at `sqrt_price_x96`, after the pool fee and without price impact."""
+        amount_in_less_fee = amount_in * (10**6 - self.client.config.POOL_FEE) // 10**6
+        price_x192 = sqrt_price_x96 * sqrt_price_x96
+        return amount_in_less_fee * price_x192 >> 192 if zero_for_one else (amount_in_less_fee << 192) // price_x192
+
+    def swap_exact_input(self, zero_for_one: bool, amount_in: int, sqrt_price_x96: int) -> tuple[int, int, int]:
+        """
+        Swaps `amount_in` raw TOKEN0 (`zero_for_one`) or TOKEN1 for the other token through the SwapRouter, for at
+        least REBALANCE_SWAP_SLIPPAGE less than `quote_swap_output` at `sqrt_price_x96`.
+        Returns the pool's (amount0, amount1) deltas (positive: paid in by the wallet) and its sqrt price after the swap.
+        """
+        config = self.client.config
+        router = self.client.get_contract(config.UNISWAP_SWAP_ROUTER_ADDRESS, config.UNISWAP_SWAP_ROUTER_ABI)
+        token_in, token_out = (config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS) if zero_for_one else (config.TOKEN1_ADDRESS, config.TOKEN0_ADDRESS)
+        symbol_in, symbol_out = ((config.TOKEN0_ADDRESS_SYMBOL, config.TOKEN1_ADDRESS_SYMBOL) if zero_for_one
+                                 else (config.TOKEN1_ADDRESS_SYMBOL, config.TOKEN0_ADDRESS_SYMBOL))
+        amount_out_minimum = int(self.quote_swap_output(zero_for_one, amount_in, sqrt_price_x96) * (1 - config.REBALANCE_SWAP_SLIPPAGE))
+        reservation = self.client.swap_allowances.reserve({token_in: amount_in}, {token_in: symbol_in})
+        swap_tx = router.functions.exactInputSingle({
+            'tokenIn': Web3.to_checksum_address(token_in),
+            'tokenOut': Web3.to_checksum_address(token_out),
+            'fee': config.POOL_FEE,
+            'recipient': config.WALLET_ADDRESS,
+            'deadline': int(time.time()) + 60 * 20, # 20 minutes from now
+            'amountIn': amount_in,
+            'amountOutMinimum': amount_out_minimum,
+            'sqrtPriceLimitX96': 0
+        })
+        # As in `send_spending_transaction`, a swap sent behind its approval can't be gas-estimated yet
+        gas_limit = self.client.fee_engine.cached_gas_limit(swap_tx, config.SWAP_GAS_LIMIT) if reservation.approvals else None
+        print(f"Swapping {amount_in} raw {symbol_in} for at least {amount_out_minimum} raw {symbol_out}...")
+        try:
+            pending_swap = self.client.submit_transaction(swap_tx, gas_limit)
+            reservation.wait_for_approvals()
+            receipt = pending_swap.result()
+        except Exception:
+            self.client.swap_allowances.release(reservation)
+            raise
+        swap_logs = [log for log in self.get_pool_contract().events.Swap().process_receipt(receipt)
+                     if log['args']['recipient'] == Web3.to_checksum_address(config.WALLET_ADDRESS)]
+        if not swap_logs:
+            self.client.swap_allowances.release(reservation)
+            raise Exception(f"No Swap event found in transaction {receipt.transactionHash.hex()}")
+        amount0, amount1 = swap_logs[0]['args']['amount0'], swap_logs[0]['args']['amount1']
+        self.client.swap_allowances.settle(reservation, {token_in: amount0 if zero_for_one else amount1}, receipt.blockNumber)
+        print(f"Swapped {abs(amount0)} raw {config.TOKEN0_ADDRESS_SYMBOL} / {abs(amount1)} raw {config.TOKEN1_ADDRESS_SYMBOL}. Receipt: {receipt.transactionHash.hex()}")
+        return amount0, amount1, swap_logs[0]['args']['sqrtPriceX96']
+
+    def report_unused(self, available0: int, available1: int, receipt):
+        """Prints what of the raw amounts available to a mint (e.g. collected by a rebalance) the mint in `receipt` left in the wallet."""
+        minted = self.nft_manager.events.IncreaseLiquidity().process_receipt(receipt)
+        unused0 = available0 - sum(log['args']['amount0'] for log in minted)
+        unused1 = available1 - sum(log['args']['amount1'] for log in minted)
+        if unused0 > 0 or unused1 > 0:
+            decimals0 = self.oracle.token_decimals[self.client.config.TOKEN0_ADDRESS]
+            decimals1 = self.oracle.token_decimals[self.client.config.TOKEN1_ADDRESS]
+            print(f"{Decimal(max(unused0, 0)) / Decimal(10**decimals0)} {self.client.config.TOKEN0_ADDRESS_SYMBOL} and "
+                  f"{Decimal(max(unused1, 0)) / Decimal(10**decimals1)} {self.client.config.TOKEN1_ADDRESS_SYMBOL} not taken by the new range stay in the wallet.")
+
+    def mint_position(self, amount0: int, amount1: int, lower_tick: int, upper_tick: int, sqrt_price_x96: int,
+                      burn_token_id: int | None = None) -> int:
+        """
+        Mints as much liquidity as raw (amount0, amount1) fund in [lower_tick, upper_tick] at `sqrt_price_x96`, with 1%
+        slippage on the amounts that liquidity takes. With `burn_token_id`, that emptied NFT is burned in the same
+        multicall. Returns the new tokenId.
+        """
+        config = self.client.config
+        sqrt_lower_x96 = tick_math.get_sqrt_ratio_at_tick(lower_tick)
+        sqrt_upper_x96 = tick_math.get_sqrt_ratio_at_tick(upper_tick)
+        liquidity = tick_math.get_liquidity_for_amounts(sqrt_price_x96, sqrt_lower_x96, sqrt_upper_x96, amount0, amount1)
+        if liquidity == 0:
+            raise Exception(f"{amount0} raw {config.TOKEN0_ADDRESS_SYMBOL} and {amount1} raw {config.TOKEN1_ADDRESS_SYMBOL} can't fund the range [{lower_tick}, {upper_tick}].")
+        mint0, mint1 = tick_math.get_amounts_for_liquidity(sqrt_price_x96, sqrt_lower_x96, sqrt_upper_x96, liquidity)
+        calls = [self.nft_manager.functions.mint({
+            'token0': Web3.to_checksum_address(config.TOKEN0_ADDRESS),
+            'token1': Web3.to_checksum_address(config.TOKEN1_ADDRESS),
+            'fee': config.POOL_FEE,
+            'tickLower': lower_tick,
+            'tickUpper': upper_tick,
+            'amount0Desired': amount0,
+            'amount1Desired': amount1,
+            'amount0Min': int(mint0 * Decimal("0.99")), # 1% slippage tolerance
+            'amount1Min': int(mint1 * Decimal("0.99")), # 1% slippage tolerance
+            'recipient': config.WALLET_ADDRESS,
+            'deadline': int(time.time()) + 60 * 20 # 20 minutes from now
+        })]
+        if burn_token_id is not None:
+            calls.append(self.nft_manager.functions.burn(burn_token_id))
+        mint_tx = calls[0] if len(calls) == 1 else self.nft_manager.functions.multicall(
+            [self.nft_manager.encodeABI(fn_name=call.fn_name, args=call.args) for call in calls])
+        reservation = self.reserve_allowances(amount0, amount1)
+        receipt = self.send_spending_transaction(mint_tx, reservation, config.MINT_GAS_LIMIT)
+        new_token_id = self.parse_mint_receipt_for_token_id(receipt)
+        self.report_unused(amount0, amount1, receipt)
+        return new_token_id
+
+    def rebalance_position(self, token_id: int, position_info, sqrt_price_x96: int,
+                           lower_price: Decimal, upper_price: Decimal, burn_old: bool = True,
+                           tick_range: tuple[int, int] | None = None, atomic: bool = True) -> tuple[int, tuple[int, int]]:
+        """
+        Moves all liquidity of `token_id` to a new price range. Returns the new position's tokenId and ticks.
+        As in `provide_liquidity`, aligned ticks can be given in `tick_range`.
+
+        If the freed tokens fit the new range's token ratio (a swap to it would be worth at most
+        REBALANCE_SWAP_MIN_FRACTION of the position), and with `atomic`, this is ONE NonfungiblePositionManager.multicall
+        transaction: decreaseLiquidity + collect + mint (+ burn of the emptied NFT). There is no intermediate state
+        where the tokens sit in the wallet, and the bot is out of the market for a single block.
+        Otherwise, typically because the price left the old range (which then holds a single token), see `rebalance_with_swap`.
+        """
+        config = self.client.config
+        liquidity = position_info[7]
+        lower_tick, upper_tick = tick_range or self.calculate_tick_range(lower_price, upper_price)
+        deadline = int(time.time()) + 60 * 20 # 20 minutes from now
+
+        # The mint amounts must be fixed when the transaction is encoded, so they are computed from the
+        # current price with the exact LiquidityAmounts math: what the decrease will return, and what
+        # the new range will take of it.
+        removed0, removed1 = tick_math.get_amounts_for_liquidity(
+            sqrt_price_x96,
+            tick_math.get_sqrt_ratio_at_tick(position_info[5]),
+            tick_math.get_sqrt_ratio_at_tick(position_info[6]),
+            liquidity
+        )
+        zero_for_one, swap_amount = self.calculate_range_swap(removed0, removed1, sqrt_price_x96, lower_tick, upper_tick)
+        price_x192 = sqrt_price_x96 * sqrt_price_x96
+        swap_value = swap_amount * price_x192 if zero_for_one else swap_amount << 192
+        if not atomic or liquidity == 0 or swap_value > (removed0 * price_x192 + (removed1 << 192)) * config.REBALANCE_SWAP_MIN_FRACTION:
+            return self.rebalance_with_swap(token_id, position_info, sqrt_price_x96, lower_tick, upper_tick, burn_old)
+
+        # The decrease is guaranteed to return at least 99% of the expected amounts (1% slippage tolerance),
+        # so the mint offers exactly that and never needs tokens the rebalance didn't free.
+        amount0_desired = int(removed0 * Decimal("0.99"))
+        amount1_desired = int(removed1 * Decimal("0.99"))
+        sqrt_lower_x96 = tick_math.get_sqrt_ratio_at_tick(lower_tick)
+        sqrt_upper_x96 = tick_math.get_sqrt_ratio_at_tick(upper_tick)
+        new_liquidity = tick_math.get_liquidity_for_amounts(sqrt_price_x96, sqrt_lower_x96, sqrt_upper_x96, amount0_desired, amount1_desired)
+        if new_liquidity == 0:
+            # Only a position too small to fund a single unit of liquidity gets here. The mint would revert,
+            # so nothing is sent and the old position stays untouched.
+            raise Exception(f"The tokens of position {token_id} can't fund the new range.")
+        mint0, mint1 = tick_math.get_amounts_for_liquidity(sqrt_price_x96, sqrt_lower_x96, sqrt_upper_x96, new_liquidity)
+
+        calls = [
+            self.nft_manager.functions.decreaseLiquidity({
+                'tokenId': token_id,
+                'liquidity': liquidity,
+                'amount0Min': amount0_desired,
+                'amount1Min': amount1_desired,
+                'deadline': deadline
+            }),
+            # Tokens are collected to the wallet, and the mint pulls them back from it (msg.sender is
+            # preserved inside multicall), so the usual NFT Position Manager allowances apply.
+            self.nft_manager.functions.collect({
+                'tokenId': token_id,
+                'recipient': config.WALLET_ADDRESS,
+                'amount0Max': MAX_UINT128,
+                'amount1Max': MAX_UINT128
+            }),
+            self.nft_manager.functions.mint({
+                'token0': Web3.to_checksum_address(config.TOKEN0_ADDRESS),
+                'token1': Web3.to_checksum_address(config.TOKEN1_ADDRESS),
+                'fee': config.POOL_FEE,
+                'tickLower': lower_tick,
+                'tickUpper': upper_tick,
+                'amount0Desired': amount0_desired,
+                'amount1Desired': amount1_desired,
+                # The mint only takes the amounts the new range needs at the current price (the other
+                # token's excess stays in the wallet), so slippage is applied to those, not to the desired amounts.
+                'amount0Min': int(mint0 * Decimal("0.99")), # 1% slippage tolerance
+                'amount1Min': int(mint1 * Decimal("0.99")), # 1% slippage tolerance
+                'recipient': config.WALLET_ADDRESS,
+                'deadline': deadline
+            }),
+        ]
+        if burn_old:
+            # Only possible because the position is left with no liquidity and nothing owed
+            calls.append(self.nft_manager.functions.burn(token_id))
+
+        reservation = self.reserve_allowances(amount0_desired, amount1_desired)
+
+        # encodeABI (unlike the raw call encoder) accepts the struct parameters as dicts, like build_transaction does
+        multicall_tx = self.nft_manager.functions.multicall([self.nft_manager.encodeABI(fn_name=call.fn_name, args=call.args) for call in calls])
+        print(f"Sending atomic rebalance of position {token_id} ({len(calls)} calls in one multicall)...")
+        receipt = self.send_spending_transaction(multicall_tx, reservation, config.REBALANCE_GAS_LIMIT)
+
+        # Everything is decoded from the single receipt: the amounts removed, what was collected with the
+        # fees, what the mint left of it and the new tokenId.
+        self.parse_decrease_receipt_amounts(receipt)
+        collected = self.nft_manager.events.Collect().process_receipt(receipt)
+        self.report_unused(sum(log['args']['amount0'] for log in collected), sum(log['args']['amount1'] for log in collected), receipt)
+        new_token_id = self.parse_mint_receipt_for_token_id(receipt)
+        print(f"Atomic rebalance completed: position {token_id} -> {new_token_id}. Receipt: {receipt.transactionHash.hex()}")
+        return new_token_id, (lower_tick, upper_tick)
+
+    def rebalance_with_swap(self, token_id: int, position_info, sqrt_price_x96: int, lower_tick: int, upper_tick: int,
+                            burn_old: bool = True) -> tuple[int, tuple[int, int]]:
+        """
+        Rebalances `token_id` into [lower_tick, upper_tick] in three transactions: a multicall removing all its liquidity
+        and collecting everything owed (fees included), the swap of the collected tokens to the new range's ratio
+        (`calculate_range_swap`, skipped if worth less than REBALANCE_SWAP_MIN_FRACTION, and repeated once if its
+        price impact left the tokens off the ratio), and the mint of the result
+        (+ burn of the emptied NFT). If the swap or the mint fails, the tokens are minted back into the old range,
+        so the bot always ends up with a position (and a later cycle tries again). Returns the new tokenId and ticks.
+        """
+        config = self.client.config
+        liquidity = position_info[7]
+        calls = []
+        if liquidity:
+            removed0, removed1 = tick_math.get_amounts_for_liquidity(
+                sqrt_price_x96,
+                tick_math.get_sqrt_ratio_at_tick(position_info[5]),
+                tick_math.get_sqrt_ratio_at_tick(position_info[6]),
+                liquidity
+            )
+            calls.append(self.nft_manager.functions.decreaseLiquidity({
+                'tokenId': token_id,
+                'liquidity': liquidity,
+                'amount0Min': int(removed0 * Decimal("0.99")), # 1% slippage tolerance
+                'amount1Min': int(removed1 * Decimal("0.99")),
+                'deadline': int(time.time()) + 60 * 20
+            }))
+        calls.append(self.nft_manager.functions.collect({
+            'tokenId': token_id,
+            'recipient': config.WALLET_ADDRESS,
+            'amount0Max': MAX_UINT128,
+            'amount1Max': MAX_UINT128
+        }))
+        print(f"Removing position {token_id} to swap its tokens to the new range's ratio...")
+        remove_receipt = self.client.send_transaction(self.nft_manager.functions.multicall(
+            [self.nft_manager.encodeABI(fn_name=call.fn_name, args=call.args) for call in calls]))
+        collected = self.nft_manager.events.Collect().process_receipt(remove_receipt)
+        amount0 = sum(log['args']['amount0'] for log in collected)
+        amount1 = sum(log['args']['amount1'] for log in collected)
+        print(f"Collected {amount0} raw {config.TOKEN0_ADDRESS_SYMBOL} and {amount1} raw {config.TOKEN1_ADDRESS_SYMBOL} from position {token_id}. Receipt: {remove_receipt.transactionHash.hex()}")
+        if amount0 == 0 and amount1 == 0:
+            raise Exception(f"Position {token_id} holds no tokens to rebalance.")
+
+        burn_token_id = token_id if burn_old else None
+        try:
+            # The swap's price impact shifts the ratio the range takes (by a lot for a narrow range), so the
+            # ratio is checked again at the price after it, and a second, much smaller swap makes up the difference.
+            for _ in range(2):
+                zero_for_one, amount_in = self.calculate_range_swap(amount0, amount1, sqrt_price_x96, lower_tick, upper_tick)
+                price_x192 = sqrt_price_x96 * sqrt_price_x96
+                swap_value = amount_in * price_x192 if zero_for_one else amount_in << 192
+                if swap_value <= (amount0 * price_x192 + (amount1 << 192)) * config.REBALANCE_SWAP_MIN_FRACTION:
+                    break
+                delta0, delta1, sqrt_price_x96 = self.swap_exact_input(zero_for_one, amount_in, sqrt_price_x96)
+                amount0 -= delta0
+                amount1 -= delta1
+            new_token_id = self.mint_position(amount0, amount1, lower_tick, upper_tick, sqrt_price_x96, burn_token_id)
+        except Exception as e:
+            print(f"Rebalance of position {token_id} failed after its liquidity was removed ({e}). Minting the tokens back into its old range...")
+            restored_token_id = self.mint_position(amount0, amount1, position_info[5], position_info[6], sqrt_price_x96, burn_token_id)
+            print(f"Position {token_id} restored as {restored_token_id}.")
+            return restored_token_id, (position_info[5], position_info[6])
+        print(f"Rebalance with swap completed: position {token_id} -> {new_token_id}.")
+        return new_token_id, (lower_tick, upper_tick)
+
 # --- 4. Derivatives Management Module (for Delta Neutral) ---
 # --- START OF TODO 5 IMPLEMENTATION (DerivativesManager with conceptual client) ---
 class DerivativesClient:
@@ -561,20 +1209,55 @@ class DerivativesClient:
 
 
 class DerivativesManager:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, state_store: StateStore | None = None, client=None):
         self.config = config
-        self.client = DerivativesClient(config.DERIVATIVES_EXCHANGE_API_KEY, config.DERIVATIVES_EXCHANGE_API_SECRET)
+        self.state_store = state_store
+        # An exchange client can be passed in, e.g. a MockExchangeClient with latency (benchmarks.py)
+        if client is None and config.DERIVATIVES_EXCHANGE == "mock":
+            client = MockExchangeClient()
+        elif client is None:
+            client = DerivativesClient(config.DERIVATIVES_EXCHANGE_API_KEY, config.DERIVATIVES_EXCHANGE_API_SECRET)
+        # Every exchange call is timed by name (metrics.py)
+        self.client = metrics.InstrumentedClient(client)
+        # Orders go through the executor, which keeps the position view and nets and slices adjustments.
+        self.executor = HedgeExecutor(
+            self.client,
+            max_child_size=config.HEDGE_MAX_CHILD_SIZE,
+            child_interval_seconds=config.HEDGE_CHILD_INTERVAL_SECONDS,
+            reconcile_seconds=config.HEDGE_RECONCILE_SECONDS,
+            on_fill=self._record_fill if state_store else None,
+            on_position=self._record_position if state_store else None
+        )
+        if state_store:
+            # Warm start: the position view saved by the last run is used until it is due for reconciliation
+            for symbol in set(config.HEDGE_SYMBOLS.values()) | {config.SHORT_TOKEN_SYMBOL}:
+                saved = state_store.get_meta(f"hedge_position:{symbol}")
+                if saved:
+                    self.executor.seed(symbol, Decimal(saved[0]), saved[1])
+
+    def _record_fill(self, symbol: str, side: str, amount: Decimal, position_after: Decimal | None):
+        self.state_store.record_hedge_fill(symbol, side, amount, position_after)
+
+    def _record_position(self, symbol: str, position: Decimal, read_at: float):
+        self.state_store.set_meta(f"hedge_position:{symbol}", [str(position), read_at])
 
     def get_position_size(self, symbol: str) -> Decimal:
-        """Gets the current position size in the derivatives market for a given symbol."""
-        return self.client.get_current_position(symbol)
+        """
+        Gets the current position size in the derivatives market for a given symbol (positive for long,
+        negative for short), from the executor's locally reconciled view.
+        """
+        return self.executor.position(symbol)
+
+    def get_short_size(self, symbol: str) -> Decimal:
+        """Size of the short on `symbol` (negative if the account is long), the quantity the hedge targets."""
+        return -self.get_position_size(symbol)
 
     def open_short_position(self, symbol: str, amount: Decimal):
         """Opens a short position on the asset."""
         # For a short position, you usually 'SELL' the asset.
         # Ensure amount is positive when calling place_order.
         if amount > 0:
-            self.client.place_order(symbol, "SELL", amount, "MARKET")
+            self.executor.submit(symbol, -amount)
         else:
             print(f"Attempted to open short position with non-positive amount: {amount}")
 
@@ -583,20 +1266,34 @@ class DerivativesManager:
         # If your current position is short (negative amount), to close it, you 'BUY'.
         # If your current position is long (positive amount), to close it, you 'SELL'.
         # This function assumes 'amount' is the absolute quantity to close.
+        # The position comes from the executor's view, so the caller's earlier read isn't repeated.
         current_pos = self.get_position_size(symbol)
         
         if current_pos < 0: # Currently short, need to buy to close
             amount_to_buy = min(amount, abs(current_pos)) # Don't buy more than needed to close short
             if amount_to_buy > 0:
-                self.client.place_order(symbol, "BUY", amount_to_buy, "MARKET")
+                self.executor.submit(symbol, amount_to_buy)
         elif current_pos > 0: # Currently long, need to sell to close
             amount_to_sell = min(amount, abs(current_pos)) # Don't sell more than needed to close long
             if amount_to_sell > 0:
-                self.client.place_order(symbol, "SELL", amount_to_sell, "MARKET")
+                self.executor.submit(symbol, -amount_to_sell)
         else:
             print(f"No open position for {symbol} to close.")
 
 
+    def adjust_short_position(self, symbol: str, amount_to_adjust: Decimal):
+        """Grows (positive amount) or shrinks (negative amount) the short position on `symbol`."""
+        if amount_to_adjust > 0: # Need to increase short position (or reduce existing long)
+            print(f"Need to increase net short position by {amount_to_adjust} {symbol}")
+            self.open_short_position(symbol, amount_to_adjust)
+        elif amount_to_adjust < 0: # Need to reduce short position (or increase existing long)
+            # Note: -amount_to_adjust is positive, representing the amount to reduce.
+            print(f"Need to reduce net short position by {-amount_to_adjust} {symbol}")
+            # close_position handles whether the account is currently short or long
+            self.close_position(symbol, -amount_to_adjust)
+        else:
+            print("Delta neutral hedge position stable. No significant adjustment needed.")
+
     def calculate_delta_hedge_amount(self, current_lp_delta: Decimal, price_of_token_to_hedge: Decimal) -> Decimal:
         """
         Calculates the amount of token to short to neutralize the delta.
@@ -610,15 +1307,83 @@ class DerivativesManager:
         return current_lp_delta # This represents the amount in units of the volatile token (e.g., ETH)
 # --- END OF TODO 5 IMPLEMENTATION (DerivativesManager with conceptual client) ---
 
+def configure_tracing(config: Config):
+    """Applies the tracing and profiling settings and makes SIGUSR1 request a profile."""
+    tracing.configure(config.TRACE_DIR, config.PROFILE_DIR, config.PROFILE_CYCLES, config.PROFILE_FLAG_FILE, config.PROFILE_INTERVAL_SECONDS)
+    tracing.install_signal_handler()
+
+
 # --- 5. Main Bot Logic ---
+class CycleSnapshot:
+    """
+    All the chain state one bot cycle needs, read in a single Multicall3 round trip.
+    Every field comes from the same block, so rebalance and hedge decisions see a consistent view.
+    """
+    def __init__(self, block_number: int, position_info, sqrt_price_x96: int, tick: int, token0_round_data,
+                 hedge_position: Decimal | None = None, uncollected_fees: tuple[int, int] | None = None,
+                 twap: PoolTwap | None = None):
+        self.block_number = block_number
+        # Raw `positions(tokenId)` tuple, indexed the same way as `get_position_info`'s result.
+        self.position_info = position_info
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick
+        # Last Chainlink `latestRoundData()` of TOKEN0's feed (read in this batch or cached), or None if none was read.
+        self.token0_round_data = token0_round_data
+        # Short size on SHORT_TOKEN_SYMBOL if it was fetched alongside the chain reads,
+        # otherwise None and `manage_delta_neutral` asks the exchange itself.
+        self.hedge_position = hedge_position
+        # Raw TOKEN0/TOKEN1 fees a `collect` would return (fee_accrual.py), or None if the fee growth wasn't read.
+        self.uncollected_fees = uncollected_fees
+        # The pool's TWAPs and realized volatility at this block (twap.py), or None if they weren't read.
+        self.twap = twap
+
+
 class LiquidityManagerBot:
-    def __init__(self):
-        self.config = Config()
-        self.blockchain_client = BlockchainClient(self.config)
+    def __init__(self, blockchain_client: BlockchainClient | None = None, derivatives_manager: DerivativesManager | None = None,
+                 state_store: StateStore | None = None):
+        # A client, derivatives manager and state store can be passed in to share them between bots (see portfolio.py);
+        # the bot then manages the pool configured in `blockchain_client.config`.
+        self.config = blockchain_client.config if blockchain_client else Config()
+        self.blockchain_client = blockchain_client or BlockchainClient(self.config)
+        self.state_store = state_store or StateStore(self.config.STATE_DB_FILE)
         self.price_oracle = PriceOracle(self.blockchain_client)
         self.lp_manager = UniswapLPManager(self.blockchain_client, self.price_oracle)
-        self.derivatives_manager = DerivativesManager(self.config)
+        self.derivatives_manager = derivatives_manager or DerivativesManager(self.config, self.state_store)
         self.position_token_id = None # Will store the tokenId of the LP position.
+        self.range_optimizer = None
+        if self.config.OPTIMIZE_RANGE and range_optimizer.OPTIMIZER_AVAILABLE:
+            self.range_optimizer = range_optimizer.RangeOptimizer(
+                self.config.STRATEGY, self.config.POOL_FEE,
+                self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS],
+                self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS],
+                horizon_seconds=self.config.RANGE_HORIZON_SECONDS,
+                max_width=self.config.RANGE_MAX_WIDTH,
+                hedge_cost_rate=float(self.config.HEDGE_COST_RATE),
+                tick_spacing=self.lp_manager.get_tick_spacing()
+            )
+        # TWAPs and volatility of the pool, read in every cycle batch and cached per block
+        self.twap = TwapService(self.lp_manager.get_pool_contract(), set(self.config.TWAP_WINDOWS) | {self.config.TWAP_DECISION_WINDOW_SECONDS},
+                                self.config.VOLATILITY_WINDOW_SECONDS, self.config.VOLATILITY_INTERVALS, self.config.BLOCK_TIME_SECONDS)
+        # Observation cardinality already requested from the pool, so a growth transaction is sent once per target
+        self._cardinality_requested = 0
+        # Consecutive cycles each position's rebalance was deferred while out of range, per position token ID
+        self._deferred_rebalances = {}
+        # Pool prices seen by past cycles, (time, price): the volatility estimate when observe() can't cover the window.
+        self._price_samples = deque(maxlen=1000)
+        # Last (time, feeGrowthGlobal0X128, feeGrowthGlobal1X128) reading, to measure the pool's fee rate.
+        self._fee_growth_reading = None
+        # (tickLower, tickUpper) per position token ID. They never change, so once known the cycle batch also reads
+        # the fee growth at the position's boundaries and the snapshot carries its uncollected fees.
+        self._position_ticks = {}
+        # Last (token ID, time, uncollected fees in TOKEN1) reading, for the fee APR
+        self._fee_reading = None
+        self.recorder = None
+        if self.config.RECORDER_DIR:
+            if block_recorder.RECORDER_AVAILABLE:
+                self.recorder = block_recorder.BlockRecorder(self.config.RECORDER_DIR, flush_rows=self.config.RECORDER_FLUSH_ROWS,
+                                                             flush_seconds=self.config.RECORDER_FLUSH_SECONDS)
+            else:
+                print("NumPy is not installed. Per-block history will not be recorded.")
 
     def initial_setup(self, initial_token0_amount: Decimal, initial_token1_amount: Decimal,
                       lower_price: Decimal, upper_price: Decimal):
@@ -629,153 +1394,257 @@ class LiquidityManagerBot:
         
         if self.position_token_id:
             print(f"LP position created with Token ID: {self.position_token_id}")
-            # TODO: Store the tokenId persistently (e.g., in a database or file)
             self._save_position_id(self.position_token_id)
         else:
             print("Failed to create LP position or retrieve Token ID.")
 
     def _save_position_id(self, token_id: int):
-        """Saves the position ID to a file for persistence."""
+        """Records the position as the pool's managed position in the state store."""
         try:
-            with open("position_id.txt", "w") as f:
-                f.write(str(token_id))
-            print(f"Position ID {token_id} saved to position_id.txt")
+            self.state_store.save_position(token_id, self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+            print(f"Position ID {token_id} saved to {self.state_store.path}")
         except Exception as e:
             print(f"Error saving position ID: {e}")
 
     def _load_position_id(self) -> int | None:
-        """Loads the position ID from a file."""
+        """Loads the pool's managed position ID from the state store (importing a legacy position_id.txt)."""
         try:
-            if os.path.exists("position_id.txt"):
-                with open("position_id.txt", "r") as f:
-                    token_id_str = f.read().strip()
-                    if token_id_str:
-                        token_id = int(token_id_str)
-                        print(f"Loaded existing position ID: {token_id}")
-                        return token_id
-            return None
+            token_id = self.state_store.active_position(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+            if token_id is None:
+                token_id = self.state_store.import_position_file("position_id.txt", self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+            if token_id is not None:
+                print(f"Loaded existing position ID: {token_id}")
+            return token_id
         except Exception as e:
             print(f"Error loading position ID: {e}")
             return None
 
-    def get_current_lp_exposure(self, token_id: int) -> Decimal:
+    def resume(self):
         """
-        Calculates the net exposure of your LP position to the volatile token (TOKEN0).
-        This is a more accurate, but still simplified, calculation based on Uniswap V3 math.
-        It assumes TOKEN0 is the volatile asset you want to hedge (e.g., ETH) and TOKEN1 is stable (USDC).
+        Picks up where the last run stopped, without a single RPC request: loads the managed position and seeds
+        what past cycles learned from the state store. The position's ticks make the first cycle batch read its
+        fee growth too, and the recent pool prices back the volatility estimate from the first rebalance on.
         """
-        position_info = self.lp_manager.get_position_info(token_id)
-        liquidity = Decimal(position_info[7]) # Liquidity of the position
-        tick_lower = position_info[5]
-        tick_upper = position_info[6]
-
-        pool_address = self.lp_manager.get_pool_address(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
-        pool_contract = self.blockchain_client.get_contract(pool_address, self.config.UNISWAP_POOL_ABI)
-        slot0 = pool_contract.functions.slot0().call()
-        current_sqrt_price_x96 = Decimal(slot0[0])
-
+        self.position_token_id = self._load_position_id()
+        if not self.position_token_id:
+            return
+        stored = self.state_store.recent_snapshots(self.position_token_id, self._price_samples.maxlen)
+        if not stored:
+            return
         decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
         decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
+        self._position_ticks[self.position_token_id] = (stored[-1].position_info[5], stored[-1].position_info[6])
+        self._price_samples.extend((snapshot.time, float(tick_math.sqrt_price_x96_to_price(snapshot.sqrt_price_x96, decimals0, decimals1)))
+                                   for snapshot in stored)
+        print(f"Resumed from the cycle stored at block {stored[-1].block_number} ({len(stored)} stored prices).")
 
-        sqrt_price_lower_x96 = Decimal.from_float(sqrt(Decimal("1.0001")**tick_lower)) * Decimal(2**96)
-        sqrt_price_upper_x96 = Decimal.from_float(sqrt(Decimal("1.0001")**tick_upper)) * Decimal(2**96)
-
-        # --- START OF TODO 6 IMPLEMENTATION (More accurate LP delta calculation) ---
-        # Calculate x and y amounts for a given liquidity and price range
-        # These are the "virtual" amounts of tokens held by the position at the current price.
-        # This is based on Uniswap V3 whitepaper formulas for x and y reserves in a range.
+    def _record_rebalance(self, old_token_id: int, snapshot: CycleSnapshot, price: Decimal, tick_range: tuple[int, int] | None):
+        """Closes the replaced position in the state store and records the rebalance."""
+        try:
+            self.state_store.close_position(old_token_id)
+            tick_lower, tick_upper = tick_range or (None, None)
+            self.state_store.record_rebalance(old_token_id, self.position_token_id, price, snapshot.block_number, tick_lower, tick_upper)
+        except Exception as e:
+            print(f"Error recording rebalance: {e}")
 
-        amount0_current = Decimal("0")
-        amount1_current = Decimal("0")
+    def read_cycle_state(self, token_id: int) -> CycleSnapshot:
+        """
+        Reads the position, the pool's slot0 and TWAPs, the TOKEN0 Chainlink round (when a new one could be out)
+        and the position's fee growth in one batched call.
+        """
+        feed_calls, feed_reads = self.cycle_feed_reads()
+        calls = self.cycle_calls(token_id, self.lp_manager.get_pool_contract(), self.lp_manager.nft_manager, feed_calls)
+        block_number, results = self.blockchain_client.batch_call(calls)
+        print(f"Read cycle state for position {token_id} at block {block_number}.")
+        return self.snapshot_from_batch(token_id, block_number, results, feed_reads)
 
-        # Normalize sqrt_price_x96 by 2**96 to get sqrt(P)
-        current_sqrt_price = current_sqrt_price_x96 / Decimal(2**96)
-        sqrt_price_lower = sqrt_price_lower_x96 / Decimal(2**96)
-        sqrt_price_upper = sqrt_price_upper_x96 / Decimal(2**96)
+    def cycle_feed_reads(self) -> tuple[list, list]:
+        """
+        (calls, reads) of the TOKEN0 feed for the cycle batch, empty while its cached round can't be outdated.
+        The pool price seen by the last cycle is the reference its deviation threshold is checked against.
+        """
+        references = {self.config.TOKEN0_ADDRESS: self._price_samples[-1][1]} if self._price_samples else None
+        feeds = self.price_oracle.feeds
+        return feeds.refresh_calls(feeds.due([self.config.TOKEN0_ADDRESS], references))
+
+    def cycle_calls(self, token_id: int, pool_contract, nft_manager, feed_calls: list) -> list:
+        """The calls of a cycle batch, on the given (sync or async) contracts. See `snapshot_from_batch` for the results."""
+        calls = [
+            nft_manager.functions.positions(token_id),
+            pool_contract.functions.slot0(),
+        ] + feed_calls + self.twap.calls()
+        ticks = self._position_ticks.get(token_id)
+        if ticks is not None:
+            calls += [
+                pool_contract.functions.feeGrowthGlobal0X128(),
+                pool_contract.functions.feeGrowthGlobal1X128(),
+                pool_contract.functions.ticks(ticks[0]),
+                pool_contract.functions.ticks(ticks[1]),
+            ]
+        return calls
+
+    def snapshot_from_batch(self, token_id: int, block_number: int, results, feed_reads: list,
+                            hedge_position: Decimal | None = None) -> CycleSnapshot:
+        """
+        Builds the snapshot from the results of `cycle_calls`: stores the feed rounds read (`feed_reads` from
+        `cycle_feed_reads`) and the pool's TWAPs, and computes the uncollected fees if their inputs were read.
+        """
+        position_info, slot0 = results[:2]
+        self._position_ticks[token_id] = (position_info[5], position_info[6])
+        price = tick_math.sqrt_price_x96_to_price(slot0[0], self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS],
+                                                  self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS])
+        feeds = self.price_oracle.feeds
+        twap_start = 2 + feeds.apply(feed_reads, results[2:], {self.config.TOKEN0_ADDRESS: price})
+        twap = self.twap.apply(block_number, slot0, results[twap_start:twap_start + 2])
+        fee_results = results[twap_start + 2:]
+        uncollected_fees = None
+        if fee_results:
+            fee_growth0, fee_growth1, lower_tick_info, upper_tick_info = fee_results
+            uncollected_fees = fee_accrual.uncollected_fees(position_info, slot0[1], fee_growth0, fee_growth1, lower_tick_info, upper_tick_info)
+        token0_feed = feeds.feed(self.config.TOKEN0_ADDRESS)
+        token0_round_data = None if token0_feed is None else token0_feed.round
+        return CycleSnapshot(block_number, position_info, slot0[0], slot0[1], token0_round_data, hedge_position, uncollected_fees, twap)
+
+    def spot_deviation(self, snapshot: CycleSnapshot) -> float | None:
+        """How far the snapshot's spot price is from the TWAP over TWAP_DECISION_WINDOW_SECONDS, or None without it."""
+        return None if snapshot.twap is None else snapshot.twap.deviation(self.config.TWAP_DECISION_WINDOW_SECONDS)
+
+    def decision_sqrt_price_x96(self, snapshot: CycleSnapshot) -> int:
+        """
+        The sqrt price decisions are made at: the spot price, unless it is further than TWAP_MAX_SPOT_DEVIATION
+        from the decision TWAP, then the TWAP price.
+        """
+        deviation = self.spot_deviation(snapshot)
+        if deviation is None or deviation <= self.config.TWAP_MAX_SPOT_DEVIATION:
+            return snapshot.sqrt_price_x96
+        return tick_math.get_sqrt_ratio_at_tick(snapshot.twap.average_tick(self.config.TWAP_DECISION_WINDOW_SECONDS))
 
-        # Case 1: Current price is below the lower tick
-        if current_sqrt_price <= sqrt_price_lower:
-            amount0_current = liquidity * ((sqrt_price_upper - sqrt_price_lower) / (sqrt_price_lower * sqrt_price_upper))
-            amount1_current = Decimal("0") # Only token0 is left in the position
+    def get_current_lp_exposure(self, token_id: int, snapshot: CycleSnapshot | None = None) -> Decimal:
+        """
+        Calculates the net exposure (delta) of your LP position to the volatile token (TOKEN0), in closed form.
+        It assumes TOKEN0 is the volatile asset you want to hedge (e.g., ETH) and TOKEN1 is stable (USDC).
+        The exposure is evaluated at `decision_sqrt_price_x96`: a spot price far from the TWAP doesn't move the hedge.
+        """
+        if snapshot is None:
+            snapshot = self.read_cycle_state(token_id)
+        position_info = snapshot.position_info
+        liquidity = position_info[7] # Liquidity of the position
+        tick_lower = position_info[5]
+        tick_upper = position_info[6]
 
-        # Case 2: Current price is above the upper tick
-        elif current_sqrt_price >= sqrt_price_upper:
-            amount0_current = Decimal("0") # Only token1 is left in the position
-            amount1_current = liquidity * (sqrt_price_upper - sqrt_price_lower)
+        decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
+        decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
 
-        # Case 3: Current price is within the range [lower_tick, upper_tick]
-        else:
-            amount0_current = liquidity * ((sqrt_price_upper - current_sqrt_price) / (current_sqrt_price * sqrt_price_upper))
-            amount1_current = liquidity * (current_sqrt_price - sqrt_price_lower)
-        
-        # Adjust for token decimals for human-readable amounts
-        amount0_human = amount0_current / Decimal(10**decimals0)
-        amount1_human = amount1_current / Decimal(10**decimals1)
-
-        print(f"Current theoretical LP holdings: {amount0_human} {self.config.TOKEN0_ADDRESS_SYMBOL}, {amount1_human} {self.config.TOKEN1_ADDRESS_SYMBOL}")
-
-        # The delta exposure is primarily to TOKEN0 (WETH) in a WETH/USDC pool.
-        # It's the amount of TOKEN0 held (long exposure).
-        # We need to account for the value of TOKEN1 if we think of it as "short" TOKEN0.
-        # For a standard delta hedge, we want to short the volatile asset.
-        # So, the effective long exposure to TOKEN0 is `amount0_human`.
-        # However, as price moves, the ratio of tokens changes.
-        # When price goes up, you have more TOKEN1 (USDC), less TOKEN0 (ETH).
-        # When price goes down, you have more TOKEN0 (ETH), less TOKEN1 (USDC).
-        # Your effective delta is how many units of TOKEN0 your position is "long".
-
-        # A more precise delta calculation would be the derivative of the value function
-        # with respect to the price of TOKEN0.
-        # For simplicity in this context, we will consider the `amount0_human` as the primary
-        # long exposure to TOKEN0 that needs to be hedged. This is a common approximation.
-        # If your strategy needs to hedge the `amount1_human` against a short ETH position,
-        # it gets more complex (e.g., if you consider your USDC as a short ETH position when price goes up).
-
-        # For a delta-neutral position, if your LP has a long TOKEN0 exposure, you short TOKEN0.
-        # So, the amount of TOKEN0 to hedge is `amount0_human`.
-        
-        # Let's refine the delta: The position has TOKEN0 and TOKEN1.
-        # Value = Amount0 * Price_Token0 + Amount1 * Price_Token1
-        # If Price_Token0 changes, how much does Value change?
-        # dValue/dPrice_Token0 = Amount0 + Amount1 * (dPrice_Token1/dPrice_Token0)
-        # If Token1 is stable (Price_Token1 = 1), dPrice_Token1/dPrice_Token0 = 0.
-        # So, Delta ~ Amount0.
-
-        # This simple delta considers only the current actual token amounts.
-        # The issue is that the actual amounts in your position change as price moves.
-        # A true "delta" for a range order is non-linear.
-        # A common proxy for delta is the amount of TOKEN0 you would have if price moved to the lower bound,
-        # minus the amount if it moved to the upper bound, relative to liquidity.
-        
-        # A more common interpretation of delta for LP:
-        # If current price `P` is between `P_L` and `P_U`:
-        # x_amount = L * (1/sqrt(P) - 1/sqrt(P_U))
-        # y_amount = L * (sqrt(P) - sqrt(P_L))
-        # Where L is liquidity, sqrt(P) is current sqrtPriceX96 normalized, etc.
-        # Delta_x = dx/dP = -0.5 * L * P^(-1.5) + 0 (if P_U is constant wrt P)
-        # Delta_y = dy/dP = 0.5 * L * P^(-0.5)
-        # Total delta in terms of token0 would be Delta_x + Delta_y / P_current
-
-        # For practical purposes and given the context, let's use the current `amount0_human` as the delta.
-        # This implicitly assumes you're hedging against the ETH exposure in your LP position.
-        # If `amount0_human` is high, you're long ETH, and need to short ETH.
-        # If `amount0_human` is low (meaning more USDC), you're less long ETH.
-
-        estimated_delta_exposure_token0 = amount0_human
-        
-        print(f"Estimated Delta Exposure to {self.config.TOKEN0_ADDRESS_SYMBOL} from LP: {estimated_delta_exposure_token0} {self.config.TOKEN0_ADDRESS_SYMBOL}")
+        # --- START OF TODO 6 IMPLEMENTATION (More accurate LP delta calculation) ---
+        # Valued in TOKEN1, a range position is worth V = L * (2*sqrt(P) - sqrt(P_L) - P/sqrt(P_U)) inside
+        # the range, so its delta dV/dP = L * (1/sqrt(P) - 1/sqrt(P_U)) is exactly the TOKEN0 amount it holds
+        # (and stays equal to it below and above the range). Gamma, -L / (2 * P^1.5) inside the range,
+        # tells how fast that delta, and so the hedge, drifts as the price moves (see greeks.py).
+        sqrt_price_x96 = self.decision_sqrt_price_x96(snapshot)
+        if sqrt_price_x96 != snapshot.sqrt_price_x96:
+            print(f"Spot price is {self.spot_deviation(snapshot):.2%} away from the {self.config.TWAP_DECISION_WINDOW_SECONDS}s TWAP. Exposure evaluated at the TWAP price.")
+        with tracing.span("lp_exposure"):
+            estimated_delta_exposure_token0, gamma = greeks.position_greeks(
+                sqrt_price_x96, tick_lower, tick_upper, liquidity, decimals0, decimals1
+            )
+        print(f"Current LP holdings: {estimated_delta_exposure_token0} {self.config.TOKEN0_ADDRESS_SYMBOL} (delta), gamma {gamma:.6E} {self.config.TOKEN0_ADDRESS_SYMBOL} per {self.config.TOKEN1_ADDRESS_SYMBOL}")
         return estimated_delta_exposure_token0
         # --- END OF TODO 6 IMPLEMENTATION (More accurate LP delta calculation) ---
 
 
-    def rebalance_lp(self, token_id: int):
+    def read_market_stats(self, block_number: int | None = None) -> tuple[float, float | None, Decimal]:
+        """
+        Reads what the range optimizer needs besides the cycle snapshot, in one batched call: the pool's fee
+        growth, its realized volatility over VOLATILITY_WINDOW_SECONDS (unless the TWAPs read at `block_number`
+        are still cached) and, if their cached rounds could be outdated, the prices that value gas in TOKEN1.
+        Returns (volatility per sqrt(second), fee rate per unit of liquidity or None, gas cost of a rebalance in TOKEN1).
+        """
+        pool_contract = self.lp_manager.get_pool_contract()
+        twap = None if block_number is None else self.twap.at(block_number)
+        twap_calls = [] if twap is not None else self.twap.calls()
+        # The feeds valuing gas are only read when a new round could be out (see price_feeds.py)
+        feeds = self.price_oracle.feeds
+        feed_calls, feed_reads = feeds.refresh_calls(feeds.due(["native", self.config.TOKEN1_ADDRESS]))
+        read_block, results = self.blockchain_client.batch_call([
+            pool_contract.functions.slot0(),
+            pool_contract.functions.feeGrowthGlobal0X128(),
+            pool_contract.functions.feeGrowthGlobal1X128(),
+        ] + twap_calls + feed_calls)
+        slot0, fee_growth0, fee_growth1 = results[:3]
+        if twap is None:
+            twap = self.twap.apply(read_block, slot0, results[3:5])
+        feeds.apply(feed_reads, results[3 + len(twap_calls):])
+        decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
+        decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
+        price = float(tick_math.sqrt_price_x96_to_price(slot0[0], decimals0, decimals1))
+
+        volatility = twap.volatility
+        if volatility is None:
+            print("Pool observations don't cover the volatility window. Using the bot's own price samples.")
+            times, prices = zip(*self._price_samples) if self._price_samples else ((), ())
+            volatility = range_optimizer.realized_volatility(times, prices)
+
+        now = time.time()
+        fee_rate = None
+        if self._fee_growth_reading is not None and now > self._fee_growth_reading[0]:
+            fee_rate = range_optimizer.fee_growth_rate(
+                self._fee_growth_reading[1], self._fee_growth_reading[2], fee_growth0, fee_growth1,
+                now - self._fee_growth_reading[0], price, decimals0, decimals1
+            )
+        # Only the first reading is kept, so the fee rate is measured over the bot's whole run
+        if self._fee_growth_reading is None:
+            self._fee_growth_reading = (now, fee_growth0, fee_growth1)
+
+        token1_usd_price = self.price_oracle.get_token_price_usd(self.config.TOKEN1_ADDRESS)
+        if token1_usd_price == 0:
+            raise Exception("Could not get the TOKEN1 USD price to value gas.")
+        gas_price = self.blockchain_client.fee_engine.expected_gas_price(self.config.TX_URGENCY)
+        gas_cost = (Decimal(self.config.REBALANCE_GAS_UNITS * gas_price) / Decimal(10**18)
+                    * self.price_oracle.get_native_price_usd() / token1_usd_price)
+        return volatility, fee_rate, gas_cost
+
+    def choose_new_range(self, snapshot: CycleSnapshot, current_price: Decimal) -> tuple[Decimal, Decimal, tuple[int, int] | None]:
+        """
+        Returns (lower_price, upper_price, tick_range) of the range a rebalance should mint: the range optimizer's
+        winner if it is enabled (with its aligned ticks), otherwise the fixed StrategyParams range (tick_range None).
+        """
+        lower_price, upper_price = self.config.STRATEGY.new_range(current_price)
+        if self.range_optimizer is None:
+            return lower_price, upper_price, None
+        decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
+        decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
+        try:
+            volatility, fee_rate, gas_cost = self.read_market_stats(snapshot.block_number)
+            position_info = snapshot.position_info
+            amount0, amount1 = tick_math.get_amounts_for_liquidity(
+                snapshot.sqrt_price_x96,
+                tick_math.get_sqrt_ratio_at_tick(position_info[5]),
+                tick_math.get_sqrt_ratio_at_tick(position_info[6]),
+                position_info[7]
+            )
+            capital = Decimal(amount0) / Decimal(10**decimals0) * current_price + Decimal(amount1) / Decimal(10**decimals1)
+            started = time.time()
+            decision = self.range_optimizer.optimize(snapshot.sqrt_price_x96, volatility, float(capital), float(gas_cost), fee_rate)
+        except Exception as e:
+            print(f"Range optimizer failed ({e}). Using the fixed range.")
+            return lower_price, upper_price, None
+        print(f"Range optimizer ({time.time() - started:.2f}s): {decision}")
+        return (self.lp_manager.calculate_price_from_tick(decision.lower_tick, decimals0, decimals1),
+                self.lp_manager.calculate_price_from_tick(decision.upper_tick, decimals0, decimals1),
+                (decision.lower_tick, decision.upper_tick))
+
+    def rebalance_lp(self, token_id: int, snapshot: CycleSnapshot | None = None) -> bool:
         """
         Rebalances the LP position if the price moves out of range or if optimization is needed.
+        Returns True if the position was rebalanced (and `self.position_token_id` changed).
         """
-        position_info = self.lp_manager.get_position_info(token_id)
+        if snapshot is None:
+            snapshot = self.read_cycle_state(token_id)
+        position_info = snapshot.position_info
         # Get current prices from the pool itself for rebalance decision
         current_price0_per_1, current_price1_per_0 = self.price_oracle.get_pool_prices(
-            self.lp_manager.get_pool_address(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+            self.lp_manager.get_pool_address(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE),
+            snapshot.sqrt_price_x96
         )
 
         lower_tick = position_info[5]
@@ -787,62 +1656,76 @@ class LiquidityManagerBot:
         current_lower_price = self.lp_manager.calculate_price_from_tick(lower_tick, decimals0, decimals1)
         current_upper_price = self.lp_manager.calculate_price_from_tick(upper_tick, decimals0, decimals1)
 
-        print(f"Current Pool Price (Token0/Token1): {current_price1_per_0}, LP Range: {current_lower_price} (lower price for Token0) - {current_upper_price} (upper price for Token0)")
+        # All prices here are TOKEN1 per TOKEN0 (e.g. USDC per WETH), the convention the tick functions use.
+        self._price_samples.append((time.time(), float(current_price0_per_1)))
+        print(f"Current Pool Price (Token1/Token0): {current_price0_per_1}, LP Range: {current_lower_price} (lower price for Token0) - {current_upper_price} (upper price for Token0)")
 
         # Rebalancing logic:
         # 1. If the price is outside the defined range (or near boundary):
         #    - Decrease current liquidity (withdraw tokens).
         #    - Collect any accrued fees.
         #    - Calculate a new range centered on the current price.
+        #    - Swap the recovered tokens to the new range's token ratio if they don't fit it.
         #    - Re-provide liquidity in the new range with the recovered tokens.
         # Note: This strategy incurs gas fees for each rebalance.
         # Define a threshold for "out of range" to avoid rebalancing too frequently on small price movements.
-        # E.g., if price is 1% below lower bound or 1% above upper bound.
-        if current_price1_per_0 < current_lower_price * Decimal("0.99") or current_price1_per_0 > current_upper_price * Decimal("1.01"):
+        # E.g., if price is 1% below lower bound or 1% above upper bound (see `StrategyParams`).
+        if self.config.STRATEGY.is_out_of_range(current_price0_per_1, current_lower_price, current_upper_price):
+            deviation = self.spot_deviation(snapshot)
+            if deviation is not None and deviation > self.config.TWAP_MAX_SPOT_DEVIATION:
+                # A price pushed for a few blocks (e.g. to make the bot mint around it) must not move the range
+                deferred = self._deferred_rebalances[token_id] = self._deferred_rebalances.get(token_id, 0) + 1
+                print(f"Price is out of range, but {deviation:.2%} away from the {self.config.TWAP_DECISION_WINDOW_SECONDS}s TWAP. Rebalance deferred.")
+                if deferred >= self.config.TWAP_DEFER_WARN_CYCLES:
+                    print(f"WARNING: LP Position {token_id} is out of range and its rebalance was deferred for {deferred} cycles in a row. "
+                          f"Check the pool for a sustained price push, or TWAP_MAX_SPOT_DEVIATION.")
+                return False
+            self._deferred_rebalances.pop(token_id, None)
             print("Price is out of range (or near boundary). Rebalancing LP...")
-            # Decrease all liquidity from the current position.
-            liquidity_to_remove = position_info[7] # Get total liquidity from position info
-            
-            # Use the updated decrease_liquidity to get recovered amounts
-            recovered_token0_amount, recovered_token1_amount = self.lp_manager.decrease_liquidity(token_id, liquidity_to_remove)
-            self.lp_manager.collect_fees(token_id) # Collect fees before re-depositing
-
-            print(f"Recovered amounts: {recovered_token0_amount} {self.config.TOKEN0_ADDRESS_SYMBOL}, {recovered_token1_amount} {self.config.TOKEN1_ADDRESS_SYMBOL}")
-
-            # Calculate a new range: e.g., +/- 10% of the current price
+            # Pick the new range centred on the current price: the optimizer's winner, or +/- 10% of the price.
             # Always ensure the new range is valid (lower < upper) and aligned with tick spacing.
-            new_lower_price = current_price1_per_0 * Decimal("0.90")
-            new_upper_price = current_price1_per_0 * Decimal("1.10")
-
-            # Re-provide liquidity with the recovered tokens and the new range.
-            # IMPORTANT: After `decreaseLiquidity`, the `token_id` of the old position might be burned
-            # or the liquidity moved. A new `mint` operation will create a new `tokenId`.
-            # So, we should call `initial_setup` to get a new `tokenId` or update `self.position_token_id`.
-            
-            # Since `provide_liquidity` already returns a new tokenId, let's use that.
-            self.position_token_id = self.lp_manager.provide_liquidity(recovered_token0_amount, recovered_token1_amount,
-                                               new_lower_price, new_upper_price)
+            new_lower_price, new_upper_price, new_tick_range = self.choose_new_range(snapshot, current_price0_per_1)
+            # Decrease, collect and mint (+ burn) in a single transaction if the freed tokens fit the new range,
+            # otherwise remove, swap to the new range's token ratio and mint (see `rebalance_position`)
+            self.position_token_id, minted_ticks = self.lp_manager.rebalance_position(
+                token_id, position_info, snapshot.sqrt_price_x96, new_lower_price, new_upper_price,
+                burn_old=self.config.BURN_OLD_POSITIONS, tick_range=new_tick_range, atomic=self.config.ATOMIC_REBALANCE
+            )
             self._save_position_id(self.position_token_id) # Save new ID
+            self._record_rebalance(token_id, snapshot, current_price0_per_1, minted_ticks)
             print("LP rebalance completed and new position ID saved.")
+            return True
         else:
+            self._deferred_rebalances.pop(token_id, None)
             print("Price is within range. No LP rebalance needed.")
+            return False
 
-    def manage_delta_neutral(self, token_id: int):
-        """Manages the hedging position to maintain delta neutrality."""
+    def manage_delta_neutral(self, token_id: int, snapshot: CycleSnapshot | None = None) -> Decimal | None:
+        """
+        Manages the hedging position to maintain delta neutrality.
+        Returns the short position size after any adjustment, or None if the hedge could not be evaluated.
+        """
         print("Managing delta neutral strategy...")
+        if snapshot is None:
+            snapshot = self.read_cycle_state(token_id)
 
         # 1. Get the current estimated delta exposure of the LP position to the volatile token (TOKEN0).
-        lp_exposure_token0 = self.get_current_lp_exposure(token_id)
+        lp_exposure_token0 = self.get_current_lp_exposure(token_id, snapshot)
 
         # 2. Get the current price of the volatile token (TOKEN0) in USD, needed for derivatives trading.
-        token0_usd_price = self.price_oracle.get_token_price_usd(self.config.TOKEN0_ADDRESS)
+        # The Chainlink round comes from the cycle's batch or the feed's cache; the feed is read directly only if
+        # neither can be current (e.g. the batch's feed call reverted).
+        token0_usd_price = self.price_oracle.get_token_price_usd(self.config.TOKEN0_ADDRESS, snapshot.token0_round_data)
         if token0_usd_price == 0:
             print("Could not get Token0 USD price. Skipping delta hedge.")
-            return
+            return None
 
         # 3. Get the current size of your short position on the derivatives exchange.
-        # Note: get_position_size will return positive for long, negative for short.
-        current_short_position_size = self.derivatives_manager.get_position_size(self.config.SHORT_TOKEN_SYMBOL)
+        # Note: get_position_size returns positive for long, negative for short; get_short_size flips the sign.
+        # It comes from the executor's position view, so it costs no exchange request between reconciliations.
+        current_short_position_size = snapshot.hedge_position
+        if current_short_position_size is None:
+            current_short_position_size = self.derivatives_manager.get_short_size(self.config.SHORT_TOKEN_SYMBOL)
 
         # Calculate the target short amount to neutralize the LP's delta exposure.
         # If lp_exposure_token0 is positive (meaning your LP is effectively "long" token0),
@@ -857,46 +1740,205 @@ class LiquidityManagerBot:
         # you need to increase short by 7 ETH (5 - (-2) = 7).
         # If target_short_amount is 2 ETH and current_short_position_size is 5 ETH,
         # you need to decrease short by 3 ETH (2 - 5 = -3).
-        amount_to_adjust = target_short_amount - current_short_position_size
+        # Adjustments inside the strategy's hedge band (e.g. 0.001 ETH) come back as 0,
+        # which avoids tiny, fee-inefficient trades.
+        amount_to_adjust = self.config.STRATEGY.hedge_adjustment(target_short_amount, current_short_position_size)
 
         # Execute derivative trades to adjust the short position.
-        # Use a small threshold (e.g., 0.001) to avoid tiny, gas-inefficient trades.
-        HEDGE_THRESHOLD = Decimal("0.001") # Example: 0.001 ETH
+        self.derivatives_manager.adjust_short_position(self.config.SHORT_TOKEN_SYMBOL, amount_to_adjust)
+        hedged_short = current_short_position_size + amount_to_adjust
 
-        if amount_to_adjust > HEDGE_THRESHOLD: # Need to increase short position (or reduce existing long)
-            print(f"Need to increase net short position by {amount_to_adjust} {self.config.SHORT_TOKEN_SYMBOL}")
-            self.derivatives_manager.open_short_position(self.config.SHORT_TOKEN_SYMBOL, amount_to_adjust)
-        elif amount_to_adjust < -HEDGE_THRESHOLD: # Need to reduce short position (or increase existing long)
-            # Note: -amount_to_adjust is positive, representing the amount to reduce.
-            print(f"Need to reduce net short position by {-amount_to_adjust} {self.config.SHORT_TOKEN_SYMBOL}")
-            # The close_position function in DerivativesManager handles if it's currently short or long
-            self.derivatives_manager.close_position(self.config.SHORT_TOKEN_SYMBOL, -amount_to_adjust)
-        else:
-            print("Delta neutral hedge position stable. No significant adjustment needed.")
+        # Prices at which the LP delta will have drifted out of the hedge band around the new short,
+        # i.e. where the next hedge trade is due.
+        position_info = snapshot.position_info
+        decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
+        decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
+        low_x96, high_x96 = greeks.hedge_band_sqrt_prices(
+            position_info[5], position_info[6], position_info[7], hedged_short, self.config.STRATEGY.hedge_threshold, decimals0
+        )
+        next_low = tick_math.sqrt_price_x96_to_price(low_x96, decimals0, decimals1)
+        next_high = tick_math.sqrt_price_x96_to_price(high_x96, decimals0, decimals1) if high_x96 < tick_math.MAX_SQRT_RATIO else Decimal("Infinity")
+        print(f"Next hedge due when the price leaves {next_low:.2f} - {next_high:.2f} {self.config.TOKEN1_ADDRESS_SYMBOL} per {self.config.TOKEN0_ADDRESS_SYMBOL}.")
+        return hedged_short
+
+    def rebalance_or_report(self, token_id: int, snapshot: CycleSnapshot) -> bool:
+        """
+        `rebalance_lp`, with a failure reported instead of raised, so the cycle still hedges. Returns True if the
+        snapshot may no longer describe the position: it was rebalanced, or a failed rebalance may have changed it.
+        """
+        try:
+            return self.rebalance_lp(token_id, snapshot)
+        except Exception as e:
+            print(f"Error rebalancing position {token_id}: {e}")
+            return True
+
+    def run_cycle(self) -> tuple[CycleSnapshot, Decimal | None]:
+        """
+        Runs one rebalance + hedge cycle on the current position.
+        Returns the snapshot describing the position after the cycle and the resulting short size.
+        """
+        with tracing.cycle(), metrics.stage("cycle"):
+            # Read everything the cycle needs in one round trip, pinned to one block
+            with metrics.stage("read_cycle_state"):
+                snapshot = self.read_cycle_state(self.position_token_id)
+            # Perform LP rebalancing first
+            with metrics.stage("rebalance_lp"):
+                rebalanced = self.rebalance_or_report(self.position_token_id, snapshot)
+            if rebalanced:
+                # The position was replaced, so the snapshot no longer describes it
+                with metrics.stage("read_cycle_state"):
+                    snapshot = self.read_cycle_state(self.position_token_id)
+            # Then manage the delta neutral hedge
+            with metrics.stage("manage_delta_neutral"):
+                hedged_short = self.manage_delta_neutral(self.position_token_id, snapshot)
+            self.grow_observations(snapshot.twap)
+            with metrics.stage("record_cycle"):
+                self.record_cycle(snapshot, hedged_short)
+        metrics.LAST_CYCLE.set(time.time())
+        return snapshot, hedged_short
+
+    def grow_observations(self, twap: PoolTwap | None):
+        """
+        With TWAP_GROW_CARDINALITY, sends the transaction growing the pool's observation buffer if it can't cover the
+        longest TWAP window, by at most TWAP_CARDINALITY_MAX_GAS worth of observations at a time. It isn't waited for:
+        the buffer fills up as blocks are mined. Each target is requested once, so a failed request isn't repeated.
+        """
+        if twap is None or not self.config.TWAP_GROW_CARDINALITY:
+            return
+        target = self.twap.next_cardinality(twap, self.config.TWAP_CARDINALITY_MAX_GAS)
+        if target is None or target <= self._cardinality_requested:
+            return
+        self._cardinality_requested = target
+        try:
+            pending = self.blockchain_client.submit_transaction(self.twap.increase_cardinality_call(target))
+            print(f"Growing the pool's observation cardinality from {twap.cardinality_next} to {target}: {pending.tx_hash.hex()}")
+        except Exception as e:
+            print(f"Error growing the pool's observation cardinality: {e}")
+
+    def record_cycle(self, snapshot: CycleSnapshot, hedged_short: Decimal | None):
+        """Stores the cycle's snapshot and writes everything buffered during the cycle in one transaction."""
+        try:
+            self.state_store.record_snapshot(self.position_token_id, snapshot, hedged_short)
+            self.state_store.flush()
+        except Exception as e:
+            print(f"Error recording cycle state: {e}")
+        self.report_fees(snapshot)
+        round_data = snapshot.token0_round_data
+        token0_feed = self.price_oracle.feeds.feed(self.config.TOKEN0_ADDRESS)
+        self.record_block(snapshot.block_number, snapshot.sqrt_price_x96, snapshot.tick, snapshot.position_info, hedged_short,
+                          None if round_data is None else token0_feed.to_price(round_data[1]))
+
+    def report_fees(self, snapshot: CycleSnapshot):
+        """Prints the position's uncollected fees and the fee APR they imply since the previous cycle."""
+        if snapshot.uncollected_fees is None:
+            return
+        decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
+        decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
+        price = tick_math.sqrt_price_x96_to_price(snapshot.sqrt_price_x96, decimals0, decimals1)
+        fees0 = Decimal(snapshot.uncollected_fees[0]) / Decimal(10**decimals0)
+        fees1 = Decimal(snapshot.uncollected_fees[1]) / Decimal(10**decimals1)
+        fees_value = fees0 * price + fees1
+        message = f"Uncollected fees: {fees0:.6f} {self.config.TOKEN0_ADDRESS_SYMBOL} + {fees1:.6f} {self.config.TOKEN1_ADDRESS_SYMBOL}"
+        now = time.time()
+        previous = self._fee_reading
+        # A new position, or a collect since the last reading, restarts the measurement
+        if previous is not None and previous[0] == self.position_token_id and fees_value >= previous[2] and now > previous[1]:
+            position_info = snapshot.position_info
+            amount0, amount1 = tick_math.get_amounts_for_liquidity(
+                snapshot.sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(position_info[5]),
+                tick_math.get_sqrt_ratio_at_tick(position_info[6]), position_info[7]
+            )
+            position_value = Decimal(amount0) / Decimal(10**decimals0) * price + Decimal(amount1) / Decimal(10**decimals1)
+            if position_value > 0:
+                apr = (fees_value - previous[2]) / position_value * Decimal(365 * 24 * 3600) / Decimal(now - previous[1])
+                message += f" (fee APR over the last {(now - previous[1]) / 60:.0f} minutes: {apr:.2%})"
+        print(message + ".")
+        self._fee_reading = (self.position_token_id, now, fees_value)
+
+    def record_block(self, block_number: int, sqrt_price_x96: int, tick: int, position_info, hedged_short: Decimal | None,
+                     oracle_price: Decimal | None = None):
+        """Appends the pool price, the position's amounts at that price and the hedge to the per-block history."""
+        if self.recorder is None:
+            return
+        try:
+            decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
+            decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
+            liquidity = position_info[7]
+            amount0, amount1 = tick_math.get_amounts_for_liquidity(
+                sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(position_info[5]), tick_math.get_sqrt_ratio_at_tick(position_info[6]), liquidity
+            )
+            self.recorder.append(
+                block_number,
+                timestamp=time.time(),
+                tick=tick,
+                price=float(tick_math.sqrt_price_x96_to_price(sqrt_price_x96, decimals0, decimals1)),
+                oracle_price=None if oracle_price is None else float(oracle_price),
+                token_id=self.position_token_id,
+                liquidity=float(liquidity),
+                amount0=amount0 / 10**decimals0,
+                amount1=amount1 / 10**decimals1,
+                hedge_size=None if hedged_short is None else float(hedged_short)
+            )
+        except Exception as e:
+            print(f"Error recording block {block_number}: {e}")
+
+    def close(self):
+        """Publishes the recorded rows not flushed yet. Call it on shutdown."""
+        if self.recorder is not None:
+            self.recorder.flush()
+
+    def warm_start(self, trigger: CycleTrigger) -> bool:
+        """
+        Re-arms `trigger` from the last stored cycle of the position and replays the pool's Swap logs mined
+        since, fetched in chunks that adapt to the provider's eth_getLogs limits (log_ingester.fetch_logs).
+        Returns False (a full cycle is needed) if there is no recent stored cycle.
+        """
+        stored = self.state_store.last_snapshot(self.position_token_id)
+        if stored is None:
+            return False
+        latest_block = self.blockchain_client.w3.eth.block_number
+        if latest_block - stored.block_number > self.config.EVENT_WARM_START_MAX_BLOCKS:
+            print(f"Last stored cycle is {latest_block - stored.block_number} blocks old. Starting with a full cycle.")
+            return False
+        snapshot = CycleSnapshot(stored.block_number, stored.position_info, stored.sqrt_price_x96, stored.tick, None, stored.hedged_short)
+        trigger.arm(snapshot, stored.hedged_short)
+        pool_address = self.lp_manager.get_pool_address(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+        logs = log_ingester.fetch_logs(self.blockchain_client.w3, {
+            "address": Web3.to_checksum_address(pool_address),
+            "topics": [SWAP_TOPIC],
+        }, stored.block_number + 1, latest_block, self.config.INGEST_CHUNK_BLOCKS)
+        for log in logs:
+            trigger.update(decode_swap_log(log))
+        print(f"Warm start from the cycle stored at block {stored.block_number} ({len(logs)} Swaps replayed).")
+        return True
 
     def run(self):
         """Main execution loop for the bot."""
         print("Starting liquidity management and delta neutral bot...")
+        metrics.start_server(self.config.METRICS_HOST, self.config.METRICS_PORT)
+        configure_tracing(self.config)
 
-        # Load tokenId of existing positions if you already have them
-        self.position_token_id = self._load_position_id()
+        # Load tokenId of existing positions if you already have them, with the state of their last cycles
+        self.resume()
 
         # Set token symbols for clearer logging messages
         self.config.TOKEN0_ADDRESS_SYMBOL = "WETH"
         self.config.TOKEN1_ADDRESS_SYMBOL = "USDC"
 
+        if self.config.TRIGGER_MODE == "events":
+            if not self.position_token_id:
+                raise Exception("Event-driven mode needs an existing LP position. Run initial_setup first.")
+            return self.run_event_driven()
+
         # Continuous loop for bot operations
         while True:
             try:
                 if self.position_token_id:
                     print(f"\n--- Managing LP Position {self.position_token_id} ---")
-                    # Perform LP rebalancing first
-                    self.rebalance_lp(self.position_token_id)
-                    # Then manage the delta neutral hedge
-                    self.manage_delta_neutral(self.position_token_id)
+                    snapshot, _ = self.run_cycle()
 
-                    # You can also collect fees periodically
-                    # self.lp_manager.collect_fees(self.position_token_id)
+                    # You can also collect fees periodically. The snapshot carries the uncollected fees, so deciding costs no call.
+                    # self.lp_manager.collect_fees(self.position_token_id, snapshot.uncollected_fees)
                 else:
                     print("\nNo active LP position loaded. Attempting initial setup (if enabled)...")
                     # This will attempt to mint a new position if one isn't loaded.
@@ -908,7 +1950,7 @@ class LiquidityManagerBot:
                     
                     # If you're just testing the loop without minting, leave this commented.
                     # If you uncommented `initial_setup`, you must restart the bot after the first successful mint
-                    # to ensure the `position_token_id` is loaded from `position_id.txt`.
+                    # to ensure the `position_token_id` is loaded from the state store (STATE_DB_FILE).
                     
                     pass # Keep looping but don't try to manage non-existent position.
 
@@ -920,16 +1962,80 @@ class LiquidityManagerBot:
                 # In case of a critical error, you might want to stop the bot or implement a backoff.
                 # For now, just print and continue after a delay.
 
-            print("Waiting 5 minutes before next execution cycle...")
-            time.sleep(5 * 60) # Pause for 5 minutes (adjust as needed for your strategy and gas costs)
+            print(f"Waiting {self.config.CYCLE_INTERVAL_SECONDS} seconds before next execution cycle...")
+            time.sleep(self.config.CYCLE_INTERVAL_SECONDS) # Adjust as needed for your strategy and gas costs
+
+    def run_event_driven(self):
+        """
+        Main loop for TRIGGER_MODE="events": reacts to pool Swap logs within about one block,
+        and makes no cycle RPC calls while the price stays inside the range and the hedge band.
+        """
+        pool_address = self.lp_manager.get_pool_address(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+        if self.config.NODE_WS_URL:
+            source = WebsocketEventSource(self.config.NODE_WS_URL, pool_address)
+        else:
+            source = PollingEventSource(self.blockchain_client.w3, pool_address, self.config.EVENT_POLL_INTERVAL_SECONDS)
+        trigger = CycleTrigger(
+            self.config.STRATEGY,
+            self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS],
+            self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS],
+            self.config.EVENT_HEDGE_RETRY_SECONDS,
+            self.config.EVENT_REBALANCE_RETRY_SECONDS
+        )
+        source.start()
+
+        # When the trigger was last armed (by a full cycle or the warm start). None until then: a cycle is due.
+        armed_at = None
+        # Re-arm from the stored state if it is recent; otherwise (or if it is already due) start from a full cycle
+        try:
+            if self.warm_start(trigger) and not trigger.needs_rebalance() and not trigger.needs_hedge():
+                armed_at = time.monotonic()
+        except Exception as e:
+            print(f"Error during warm start: {e}")
+
+        while True:
+            event = None
+            if armed_at is not None:
+                # Events arrive every block, so the reconciliation deadline bounds the wait rather than an empty queue
+                try:
+                    event = source.events.get(timeout=max(self.config.EVENT_MAX_IDLE_SECONDS - (time.monotonic() - armed_at), 0))
+                except queue.Empty:
+                    pass
+            try:
+                reason = None
+                if armed_at is None:
+                    reason = "no armed trigger"
+                elif event is not None and trigger.update(event):
+                    self.state_store.set_last_block(event.block_number)
+                    if event.is_swap:
+                        # The trigger holds the armed position and hedge, so recording a Swap costs no RPC call
+                        self.record_block(event.block_number, trigger.sqrt_price_x96, trigger.tick, trigger.position_info, trigger.hedged_short)
+                    if trigger.needs_rebalance():
+                        reason = f"block {event.block_number}: price crossed the rebalance trigger"
+                    elif trigger.needs_hedge():
+                        reason = f"block {event.block_number}: exposure left the hedge band"
+                if reason is None and time.monotonic() - armed_at >= self.config.EVENT_MAX_IDLE_SECONDS:
+                    reason = "no trigger for a while, reconciling"
+                if reason is None:
+                    continue
+                print(f"\n--- {reason[0].upper() + reason[1:]} for LP Position {self.position_token_id} ---")
+                snapshot, hedged_short = self.run_cycle()
+                trigger.arm(snapshot, hedged_short, after_cycle=True)
+                armed_at = time.monotonic()
+            except Exception as e:
+                print(f"Error during bot execution: {e}")
+                # Back off before the next attempt: an unarmed trigger or an overdue reconciliation doesn't wait for
+                # events, so a persistent error would otherwise retry at once. Events queue up in the meantime.
+                time.sleep(self.config.EVENT_POLL_INTERVAL_SECONDS)
 
 
 # --- Bot Execution (Example Usage) ---
 if __name__ == "__main__":
     # BEFORE RUNNING:
     # 1. Create an 'abi' folder in the same directory as this script.
-    # 2. Download and save the ABIs for Uniswap V3 Factory, Pool, NonfungiblePositionManager, ERC20, and Chainlink AggregatorV3Interface into the 'abi' folder.
+    # 2. Download and save the ABIs for Uniswap V3 Factory, Pool, NonfungiblePositionManager, ERC20, Chainlink AggregatorV3Interface and Multicall3 into the 'abi' folder.
     #    - Chainlink AggregatorV3Interface ABI can be found on Chainlink's official documentation or Etherscan for any Chainlink price feed.
+    #    - Multicall3 ABI can be found at https://www.multicall3.com (save it as abi/Multicall3.json).
     # 3. Set your environment variables (NODE_URL, PRIVATE_KEY, WALLET_ADDRESS, DERIVATIVES_EXCHANGE_API_KEY, DERIVATIVES_EXCHANGE_API_SECRET).
     #    - Example for Linux/macOS:
     #      export NODE_URL="https://polygon-mainnet.infura.io/v3/YOUR_INFURA_PROJECT_ID"
@@ -939,15 +2045,20 @@ if __name__ == "__main__":
     #      export DERIVATIVES_EXCHANGE_API_SECRET="YOUR_CEX_API_SECRET"
     #    - Or hardcode them in Config, but BE AWARE OF THE SECURITY RISKS.
 
-    bot = LiquidityManagerBot()
-    
+    # Set ASYNC_IO=true to issue each cycle's chain and exchange reads concurrently (see async_bot.py).
+    if os.getenv("ASYNC_IO", "false").lower() == "true":
+        from async_bot import AsyncLiquidityManagerBot
+        bot = AsyncLiquidityManagerBot()
+    else:
+        bot = LiquidityManagerBot()
+
     # --- IMPORTANT ---
     # If you want to create a NEW LP position from scratch:
     # 1. Ensure your wallet has enough WETH and USDC (or your chosen tokens).
     # 2. Ensure the Uniswap V3 NFT Position Manager has **approval** to spend your WETH and USDC.
     #    The `provide_liquidity` function includes approval checks, but it's good to be aware.
     # 3. UNCOMMENT the `bot.initial_setup` line below and set desired amounts and price range.
-    #    After a successful mint, the `tokenId` will be saved to `position_id.txt`.
+    #    After a successful mint, the `tokenId` will be saved to the state store (STATE_DB_FILE).
     #    You should then **comment out `initial_setup` again** and restart the bot so it loads the existing ID.
     #
     # Example: 0.01 WETH, 25 USDC, target range for WETH: $2400-$2600.
@@ -959,4 +2070,7 @@ if __name__ == "__main__":
     #    This will tell the bot to manage that specific position.
     # bot.position_token_id = 123456789 # <--- REPLACE WITH YOUR ACTUAL LP NFT ID
 
-    bot.run()
+    try:
+        bot.run()
+    finally:
+        bot.close()
@@ -0,0 +1,724 @@
+"""
+In-process Uniswap V3 pool and position manager, for running the bot against a simulated market.
+
+`SimulatedPool` ports the state machine of UniswapV3Pool.sol onto the chain of mock_chain.py: swaps that walk
+the initialized ticks (SwapMath.computeSwapStep, crossing ticks with their liquidityNet and flipping the
+fee growth, seconds-per-liquidity and tick cumulatives outside them), mint/burn/collect of pool positions with
+Position.update's fee accounting, and the Oracle.sol ring buffer behind `observe`, grown by
+`increaseObservationCardinalityNext`. The pool holds the tokens of every position and swap. The protocol fee
+is left off. `SimulatedPositionManager` is the NonfungiblePositionManager on top of it: it pulls the mint amounts
+from the caller into the pool, and credits fees and burned principal from the pool position it shares between
+the NFTs of a range, like the real contract.
+
+`deploy_simulator` puts them at the addresses of a Config, next to the mock tokens, factory, Multicall3 and
+Chainlink feeds (`TrackingFeed`, which publishes a round on a deviation or heartbeat like the real
+aggregators), and adds a wide background position so swaps have depth. `MarketSimulation` then mines blocks:
+each one moves the price along a geometric Brownian motion (or a replayed price series) by swapping to it,
+trades some noise volume through the range, and updates the feeds. The unmodified bot reads the pool through
+`MockProvider` and trades against it between blocks:
+
+    with mock_chain.workspace():
+        config = Config() # with PRIVATE_KEY/WALLET_ADDRESS set to mock_chain's test account
+        chain = mock_chain.MockChain(start_time=1_700_000_000)
+        simulation = MarketSimulation(chain, deploy_simulator(chain, config, sqrt_price_x96), volatility=0.8)
+        bot = LiquidityManagerBot(BlockchainClient(config, provider=mock_chain.MockProvider(chain)), ...)
+        for _ in range(1000):
+            simulation.run(blocks=25)
+            bot.run_cycle()
+
+With the clock only moving by `advance` (`MockChain(start_time=...)`), replays are deterministic for a seed.
+"""
+import math
+import random
+from bisect import bisect_left, bisect_right, insort
+
+from eth_utils import keccak
+from web3 import Web3
+
+import tick_math
+from mock_chain import (MAX_UINT128, ZERO_ADDRESS, MockChain, MockChainlinkFeed, MockContract, MockERC20, MockFactory,
+                        MockMulticall3, MockPositionManager, MockSwapRouter, Revert, UniswapDeployment,
+                        _amounts_for_liquidity)
+from tick_math import MAX_SQRT_RATIO, MAX_TICK, MAX_UINT256, MIN_SQRT_RATIO, MIN_TICK, Q128, mul_div_rounding_up
+
+MAX_UINT160 = (1 << 160) - 1
+# Accounts of the simulated market, funded by `deploy_simulator`
+TRADER_ADDRESS = Web3.to_checksum_address(keccak(text="v3-simulator:trader")[-20:])
+LIQUIDITY_PROVIDER_ADDRESS = Web3.to_checksum_address(keccak(text="v3-simulator:liquidity-provider")[-20:])
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+
+# --- SqrtPriceMath / SwapMath ---
+
+def get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96: int, liquidity: int, amount: int, add: bool) -> int:
+    """SqrtPriceMath.getNextSqrtPriceFromAmount0RoundingUp."""
+    if amount == 0:
+        return sqrt_price_x96
+    numerator1 = liquidity << 96
+    product = amount * sqrt_price_x96
+    if add:
+        denominator = numerator1 + product
+        if product <= MAX_UINT256 and denominator <= MAX_UINT256:
+            return mul_div_rounding_up(numerator1, sqrt_price_x96, denominator)
+        # The contract's fallback when the product overflows, with its own rounding
+        return -(-numerator1 // (numerator1 // sqrt_price_x96 + amount))
+    if product > MAX_UINT256 or numerator1 <= product:
+        raise Revert("SqrtPriceMath: price underflow")
+    return mul_div_rounding_up(numerator1, sqrt_price_x96, numerator1 - product)
+
+
+def get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96: int, liquidity: int, amount: int, add: bool) -> int:
+    """SqrtPriceMath.getNextSqrtPriceFromAmount1RoundingDown."""
+    if add:
+        return sqrt_price_x96 + (amount << 96) // liquidity
+    quotient = -(-(amount << 96) // liquidity)
+    if sqrt_price_x96 <= quotient:
+        raise Revert("SqrtPriceMath: price underflow")
+    return sqrt_price_x96 - quotient
+
+
+def compute_swap_step(sqrt_price_x96: int, sqrt_target_x96: int, liquidity: int, amount_remaining: int,
+                      fee_pips: int) -> tuple[int, int, int, int]:
+    """
+    SwapMath.computeSwapStep: swaps `amount_remaining` (exact input if positive, exact output if negative)
+    towards `sqrt_target_x96` within one tick range. Returns (next sqrtPriceX96, amountIn, amountOut, feeAmount).
+    """
+    zero_for_one = sqrt_price_x96 >= sqrt_target_x96
+    exact_in = amount_remaining >= 0
+    if exact_in:
+        amount_remaining_less_fee = amount_remaining * (1_000_000 - fee_pips) // 1_000_000
+        if zero_for_one:
+            amount_in = tick_math.get_amount0_delta(sqrt_target_x96, sqrt_price_x96, liquidity, True)
+        else:
+            amount_in = tick_math.get_amount1_delta(sqrt_price_x96, sqrt_target_x96, liquidity, True)
+        if amount_remaining_less_fee >= amount_in:
+            sqrt_next_x96 = sqrt_target_x96
+        elif zero_for_one:
+            sqrt_next_x96 = get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount_remaining_less_fee, True)
+        else:
+            sqrt_next_x96 = get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount_remaining_less_fee, True)
+    else:
+        if zero_for_one:
+            amount_out = tick_math.get_amount1_delta(sqrt_target_x96, sqrt_price_x96, liquidity, False)
+        else:
+            amount_out = tick_math.get_amount0_delta(sqrt_price_x96, sqrt_target_x96, liquidity, False)
+        if -amount_remaining >= amount_out:
+            sqrt_next_x96 = sqrt_target_x96
+        elif zero_for_one:
+            sqrt_next_x96 = get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, -amount_remaining, False)
+        else:
+            sqrt_next_x96 = get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, -amount_remaining, False)
+
+    reached_target = sqrt_target_x96 == sqrt_next_x96
+    if zero_for_one:
+        if not (reached_target and exact_in):
+            amount_in = tick_math.get_amount0_delta(sqrt_next_x96, sqrt_price_x96, liquidity, True)
+        if not (reached_target and not exact_in):
+            amount_out = tick_math.get_amount1_delta(sqrt_next_x96, sqrt_price_x96, liquidity, False)
+    else:
+        if not (reached_target and exact_in):
+            amount_in = tick_math.get_amount1_delta(sqrt_price_x96, sqrt_next_x96, liquidity, True)
+        if not (reached_target and not exact_in):
+            amount_out = tick_math.get_amount0_delta(sqrt_price_x96, sqrt_next_x96, liquidity, False)
+    if not exact_in and amount_out > -amount_remaining:
+        amount_out = -amount_remaining
+    if exact_in and sqrt_next_x96 != sqrt_target_x96:
+        fee_amount = amount_remaining - amount_in # The remainder after the input is all fee
+    else:
+        fee_amount = mul_div_rounding_up(amount_in, fee_pips, 1_000_000 - fee_pips)
+    return sqrt_next_x96, amount_in, amount_out, fee_amount
+
+
+def _signed_amount0_delta(sqrt_a_x96: int, sqrt_b_x96: int, liquidity_delta: int) -> int:
+    """The signed getAmount0Delta: owed to the pool (rounded up) when adding liquidity, paid out (rounded down) when removing."""
+    if liquidity_delta < 0:
+        return -tick_math.get_amount0_delta(sqrt_a_x96, sqrt_b_x96, -liquidity_delta, False)
+    return tick_math.get_amount0_delta(sqrt_a_x96, sqrt_b_x96, liquidity_delta, True)
+
+
+def _signed_amount1_delta(sqrt_a_x96: int, sqrt_b_x96: int, liquidity_delta: int) -> int:
+    if liquidity_delta < 0:
+        return -tick_math.get_amount1_delta(sqrt_a_x96, sqrt_b_x96, -liquidity_delta, False)
+    return tick_math.get_amount1_delta(sqrt_a_x96, sqrt_b_x96, liquidity_delta, True)
+
+
+def _truncating_div(a: int, b: int) -> int:
+    """Solidity's signed division, which rounds towards zero."""
+    quotient = abs(a) // abs(b)
+    return quotient if (a >= 0) == (b > 0) else -quotient
+
+
+def max_liquidity_per_tick(tick_spacing: int) -> int:
+    """Tick.tickSpacingToMaxLiquidityPerTick."""
+    min_tick = -(-MIN_TICK // tick_spacing) * tick_spacing
+    max_tick = (MAX_TICK // tick_spacing) * tick_spacing
+    return MAX_UINT128 // ((max_tick - min_tick) // tick_spacing + 1)
+
+
+# --- Pool ---
+
+class SimulatedPool(MockContract):
+    """
+    UniswapV3Pool: swaps, positions, fee growth and the oracle, with the same integer math and state as the contract.
+    `mint`, `burn`, `collect` and `swap` are called from Python by the position manager and the simulation. The
+    token payments the contract asks for in its callbacks are pulled from the `payer` account instead.
+    """
+    ABI = "UniswapV3Pool.json"
+
+    def __init__(self, chain: MockChain, address: str, token0: str, token1: str, fee: int, sqrt_price_x96: int):
+        super().__init__(chain, address)
+        self._token0 = Web3.to_checksum_address(token0)
+        self._token1 = Web3.to_checksum_address(token1)
+        self._fee = fee
+        self._tick_spacing = tick_math.get_tick_spacing(fee)
+        self._max_liquidity_per_tick = max_liquidity_per_tick(self._tick_spacing)
+        # slot0 (UniswapV3Pool.initialize)
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick_math.get_tick_at_sqrt_ratio(sqrt_price_x96)
+        self.observation_index = 0
+        self.observation_cardinality = 1
+        self.observation_cardinality_next = 1
+        self.in_range_liquidity = 0
+        self.fee_growth_global = [0, 0]
+        # tick -> [liquidityGross, liquidityNet, feeGrowthOutside0X128, feeGrowthOutside1X128, tickCumulativeOutside,
+        #          secondsPerLiquidityOutsideX128, secondsOutside], for initialized ticks only
+        self.tick_infos = {}
+        self.initialized_ticks = [] # Sorted; stands in for the tick bitmap
+        # (owner, tickLower, tickUpper) -> [liquidity, feeGrowthInside0LastX128, feeGrowthInside1LastX128, tokensOwed0, tokensOwed1]
+        self.pool_positions = {}
+        # Oracle ring buffer: [blockTimestamp, tickCumulative, secondsPerLiquidityCumulativeX128, initialized]
+        self.observations = [[chain.timestamp, 0, 0, True]]
+
+    # --- Oracle.sol ---
+
+    def _transform(self, last: list, timestamp: int, tick: int, liquidity: int) -> list:
+        delta = timestamp - last[0]
+        return [timestamp, last[1] + tick * delta, (last[2] + (delta << 128) // max(liquidity, 1)) & MAX_UINT160, True]
+
+    def _write_observation(self, timestamp: int, tick: int, liquidity: int):
+        """Oracle.write: at most one observation per block, recording the tick and liquidity that held before it."""
+        last = self.observations[self.observation_index]
+        if last[0] == timestamp:
+            return
+        if self.observation_cardinality_next > self.observation_cardinality and self.observation_index == self.observation_cardinality - 1:
+            self.observation_cardinality = self.observation_cardinality_next
+        self.observation_index = (self.observation_index + 1) % self.observation_cardinality
+        self.observations[self.observation_index] = self._transform(last, timestamp, tick, liquidity)
+
+    def _observe_single(self, timestamp: int, seconds_ago: int) -> tuple[int, int]:
+        """Oracle.observeSingle: (tickCumulative, secondsPerLiquidityCumulativeX128) `seconds_ago` before `timestamp`."""
+        if seconds_ago == 0:
+            last = self.observations[self.observation_index]
+            if last[0] != timestamp:
+                last = self._transform(last, timestamp, self.tick, self.in_range_liquidity)
+            return last[1], last[2]
+        target = timestamp - seconds_ago
+        before, after = self._surrounding_observations(target)
+        if target == before[0]:
+            return before[1], before[2]
+        if target == after[0]:
+            return after[1], after[2]
+        observation_delta = after[0] - before[0]
+        target_delta = target - before[0]
+        return (before[1] + _truncating_div(after[1] - before[1], observation_delta) * target_delta,
+                before[2] + (after[2] - before[2]) * target_delta // observation_delta)
+
+    def _surrounding_observations(self, target: int) -> tuple[list, list]:
+        """Oracle.getSurroundingObservations, with the binary search over the ring buffer."""
+        newest = self.observations[self.observation_index]
+        if newest[0] <= target:
+            if newest[0] == target:
+                return newest, newest
+            return newest, self._transform(newest, target, self.tick, self.in_range_liquidity)
+        cardinality = self.observation_cardinality
+        oldest = self.observations[(self.observation_index + 1) % cardinality]
+        if not oldest[3]:
+            oldest = self.observations[0]
+        if target < oldest[0]:
+            raise Revert("OLD")
+        left = (self.observation_index + 1) % cardinality
+        right = left + cardinality - 1
+        while True:
+            middle = (left + right) // 2
+            before = self.observations[middle % cardinality]
+            if not before[3]:
+                left = middle + 1
+                continue
+            after = self.observations[(middle + 1) % cardinality]
+            if before[0] <= target <= after[0]:
+                return before, after
+            if before[0] > target:
+                right = middle - 1
+            else:
+                left = middle + 1
+
+    # --- Ticks and positions ---
+
+    def fee_growth_inside(self, tick_lower: int, tick_upper: int) -> tuple[int, int]:
+        """Tick.getFeeGrowthInside for both tokens."""
+        lower = self.tick_infos.get(tick_lower)
+        upper = self.tick_infos.get(tick_upper)
+        inside = []
+        for i in (0, 1):
+            global_growth = self.fee_growth_global[i]
+            lower_outside = lower[2 + i] if lower else 0
+            upper_outside = upper[2 + i] if upper else 0
+            below = lower_outside if self.tick >= tick_lower else global_growth - lower_outside
+            above = upper_outside if self.tick < tick_upper else global_growth - upper_outside
+            inside.append((global_growth - below - above) & MAX_UINT256)
+        return inside[0], inside[1]
+
+    def _update_tick(self, tick: int, liquidity_delta: int, upper: bool, tick_cumulative: int, seconds_per_liquidity: int) -> bool:
+        """Tick.update. Returns True if the tick flipped between initialized and uninitialized."""
+        info = self.tick_infos.get(tick)
+        gross_before = info[0] if info else 0
+        gross_after = gross_before + liquidity_delta
+        if gross_after > self._max_liquidity_per_tick:
+            raise Revert("LO")
+        if info is None:
+            # Growth below the current tick is taken to have happened outside (below) the new tick
+            if tick <= self.tick:
+                info = [0, 0, self.fee_growth_global[0], self.fee_growth_global[1], tick_cumulative, seconds_per_liquidity, self.chain.timestamp]
+            else:
+                info = [0, 0, 0, 0, 0, 0, 0]
+            self.tick_infos[tick] = info
+        info[0] = gross_after
+        info[1] += -liquidity_delta if upper else liquidity_delta
+        return (gross_after == 0) != (gross_before == 0)
+
+    def _cross_tick(self, tick: int, fee_growth0: int, fee_growth1: int, seconds_per_liquidity: int, tick_cumulative: int) -> int:
+        """Tick.cross: flips the values outside the tick to the other side. Returns its liquidityNet."""
+        info = self.tick_infos[tick]
+        info[2] = (fee_growth0 - info[2]) & MAX_UINT256
+        info[3] = (fee_growth1 - info[3]) & MAX_UINT256
+        info[4] = tick_cumulative - info[4]
+        info[5] = (seconds_per_liquidity - info[5]) & MAX_UINT160
+        info[6] = self.chain.timestamp - info[6]
+        return info[1]
+
+    def _check_ticks(self, tick_lower: int, tick_upper: int):
+        if tick_lower >= tick_upper:
+            raise Revert("TLU")
+        if tick_lower < MIN_TICK:
+            raise Revert("TLM")
+        if tick_upper > MAX_TICK:
+            raise Revert("TUM")
+        if tick_lower % self._tick_spacing or tick_upper % self._tick_spacing:
+            raise Revert("tick not spaced") # TickBitmap.flipTick's require, which has no message
+
+    def _modify_position(self, owner: str, tick_lower: int, tick_upper: int, liquidity_delta: int) -> tuple[int, int]:
+        """UniswapV3Pool._modifyPosition: updates the ticks and the position. Returns the signed token amounts owed to the pool."""
+        self._check_ticks(tick_lower, tick_upper)
+        key = (owner, tick_lower, tick_upper)
+        position = self.pool_positions.get(key)
+        if position is None:
+            if liquidity_delta <= 0:
+                raise Revert("NP") # Pokes of empty positions aren't allowed
+            position = self.pool_positions[key] = [0, 0, 0, 0, 0]
+
+        flipped_lower = flipped_upper = False
+        if liquidity_delta != 0:
+            tick_cumulative, seconds_per_liquidity = self._observe_single(self.chain.timestamp, 0)
+            flipped_lower = self._update_tick(tick_lower, liquidity_delta, False, tick_cumulative, seconds_per_liquidity)
+            flipped_upper = self._update_tick(tick_upper, liquidity_delta, True, tick_cumulative, seconds_per_liquidity)
+            for tick, flipped in ((tick_lower, flipped_lower), (tick_upper, flipped_upper)):
+                if flipped and self.tick_infos[tick][0] > 0:
+                    insort(self.initialized_ticks, tick)
+
+        # Position.update
+        if liquidity_delta == 0 and position[0] == 0:
+            raise Revert("NP")
+        inside = self.fee_growth_inside(tick_lower, tick_upper)
+        for i in (0, 1):
+            earned = ((inside[i] - position[1 + i]) & MAX_UINT256) * position[0] // Q128
+            position[3 + i] = (position[3 + i] + earned) & MAX_UINT128
+            position[1 + i] = inside[i]
+        position[0] += liquidity_delta
+
+        if liquidity_delta < 0:
+            # Removed liquidity may leave ticks with no positions, which are cleared
+            for tick, flipped in ((tick_lower, flipped_lower), (tick_upper, flipped_upper)):
+                if flipped:
+                    del self.tick_infos[tick]
+                    del self.initialized_ticks[bisect_left(self.initialized_ticks, tick)]
+
+        sqrt_lower = tick_math.get_sqrt_ratio_at_tick(tick_lower)
+        sqrt_upper = tick_math.get_sqrt_ratio_at_tick(tick_upper)
+        if self.tick < tick_lower:
+            return _signed_amount0_delta(sqrt_lower, sqrt_upper, liquidity_delta), 0
+        if self.tick < tick_upper:
+            self._write_observation(self.chain.timestamp, self.tick, self.in_range_liquidity)
+            self.in_range_liquidity += liquidity_delta
+            return (_signed_amount0_delta(self.sqrt_price_x96, sqrt_upper, liquidity_delta),
+                    _signed_amount1_delta(sqrt_lower, self.sqrt_price_x96, liquidity_delta))
+        return 0, _signed_amount1_delta(sqrt_lower, sqrt_upper, liquidity_delta)
+
+    def _pay(self, token: str, payer: str, amount: int):
+        """The mint/swap callback's payment: `amount` of `token` from `payer` into the pool."""
+        if amount > 0:
+            self.chain.contracts[token]._move(payer, self.address, amount)
+
+    def _send(self, token: str, recipient: str, amount: int):
+        if amount > 0:
+            self.chain.invoke(self.address, self.chain.contracts[token], "transfer", recipient, amount)
+
+    def mint(self, recipient: str, tick_lower: int, tick_upper: int, amount: int, payer: str) -> tuple[int, int]:
+        """Adds `amount` liquidity to the position of `recipient`, paid by `payer`. Returns the amounts paid."""
+        if amount <= 0:
+            raise Revert("mint amount is zero")
+        amount0, amount1 = self._modify_position(recipient, tick_lower, tick_upper, amount)
+        self._pay(self._token0, payer, amount0)
+        self._pay(self._token1, payer, amount1)
+        self.emit("Mint", self.chain.sender, recipient, tick_lower, tick_upper, amount, amount0, amount1)
+        return amount0, amount1
+
+    def burn(self, owner: str, tick_lower: int, tick_upper: int, amount: int) -> tuple[int, int]:
+        """Removes liquidity from the position of `owner` (0 pokes its fees) and credits the amounts to its tokensOwed."""
+        amount0, amount1 = self._modify_position(owner, tick_lower, tick_upper, -amount)
+        amount0, amount1 = -amount0, -amount1
+        position = self.pool_positions[(owner, tick_lower, tick_upper)]
+        if amount0 or amount1:
+            position[3] = (position[3] + amount0) & MAX_UINT128
+            position[4] = (position[4] + amount1) & MAX_UINT128
+        self.emit("Burn", owner, tick_lower, tick_upper, amount, amount0, amount1)
+        return amount0, amount1
+
+    def collect(self, owner: str, recipient: str, tick_lower: int, tick_upper: int, amount0_requested: int, amount1_requested: int) -> tuple[int, int]:
+        """Sends up to the requested amounts of the position's tokensOwed to `recipient`."""
+        position = self.pool_positions.get((owner, tick_lower, tick_upper), [0, 0, 0, 0, 0])
+        amount0 = min(amount0_requested, position[3])
+        amount1 = min(amount1_requested, position[4])
+        if amount0:
+            position[3] -= amount0
+            self._send(self._token0, recipient, amount0)
+        if amount1:
+            position[4] -= amount1
+            self._send(self._token1, recipient, amount1)
+        self.emit("Collect", owner, recipient, tick_lower, tick_upper, amount0, amount1)
+        return amount0, amount1
+
+    def _next_initialized_tick(self, tick: int, lte: bool) -> tuple[int, bool]:
+        """The next initialized tick at or below (`lte`) or above `tick`, else the end of the tick range."""
+        if lte:
+            index = bisect_right(self.initialized_ticks, tick)
+            return (self.initialized_ticks[index - 1], True) if index else (MIN_TICK, False)
+        index = bisect_right(self.initialized_ticks, tick)
+        return (self.initialized_ticks[index], True) if index < len(self.initialized_ticks) else (MAX_TICK, False)
+
+    def swap(self, recipient: str, zero_for_one: bool, amount_specified: int, sqrt_price_limit_x96: int, payer: str) -> tuple[int, int]:
+        """
+        UniswapV3Pool.swap: exact input if `amount_specified` is positive, exact output if negative, stopping at
+        `sqrt_price_limit_x96`. Returns the signed (amount0, amount1) of the pool: positive is paid in by `payer`.
+        """
+        if amount_specified == 0:
+            raise Revert("AS")
+        if zero_for_one:
+            if not MIN_SQRT_RATIO < sqrt_price_limit_x96 < self.sqrt_price_x96:
+                raise Revert("SPL")
+        elif not self.sqrt_price_x96 < sqrt_price_limit_x96 < MAX_SQRT_RATIO:
+            raise Revert("SPL")
+        timestamp = self.chain.timestamp
+        exact_input = amount_specified > 0
+        liquidity_start = liquidity = self.in_range_liquidity
+        remaining, calculated = amount_specified, 0
+        sqrt_price_x96, tick = self.sqrt_price_x96, self.tick
+        fee_growth = self.fee_growth_global[0 if zero_for_one else 1]
+        cumulatives = None # (tickCumulative, secondsPerLiquidity) now, computed at the first crossed tick
+
+        while remaining != 0 and sqrt_price_x96 != sqrt_price_limit_x96:
+            sqrt_start_x96 = sqrt_price_x96
+            tick_next, initialized = self._next_initialized_tick(tick, zero_for_one)
+            tick_next = min(max(tick_next, MIN_TICK), MAX_TICK)
+            sqrt_next_x96 = tick_math.get_sqrt_ratio_at_tick(tick_next)
+            if (sqrt_next_x96 < sqrt_price_limit_x96) if zero_for_one else (sqrt_next_x96 > sqrt_price_limit_x96):
+                sqrt_target_x96 = sqrt_price_limit_x96
+            else:
+                sqrt_target_x96 = sqrt_next_x96
+            sqrt_price_x96, amount_in, amount_out, fee_amount = compute_swap_step(sqrt_price_x96, sqrt_target_x96, liquidity, remaining, self._fee)
+            if exact_input:
+                remaining -= amount_in + fee_amount
+                calculated -= amount_out
+            else:
+                remaining += amount_out
+                calculated += amount_in + fee_amount
+            if liquidity > 0:
+                fee_growth = (fee_growth + fee_amount * Q128 // liquidity) & MAX_UINT256
+
+            if sqrt_price_x96 == sqrt_next_x96:
+                if initialized:
+                    if cumulatives is None:
+                        cumulatives = self._observe_single(timestamp, 0)
+                    fee_growth0, fee_growth1 = (fee_growth, self.fee_growth_global[1]) if zero_for_one else (self.fee_growth_global[0], fee_growth)
+                    liquidity_net = self._cross_tick(tick_next, fee_growth0, fee_growth1, cumulatives[1], cumulatives[0])
+                    liquidity += -liquidity_net if zero_for_one else liquidity_net
+                tick = tick_next - 1 if zero_for_one else tick_next
+            elif sqrt_price_x96 != sqrt_start_x96:
+                tick = tick_math.get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+        if tick != self.tick:
+            self._write_observation(timestamp, self.tick, liquidity_start)
+        self.sqrt_price_x96, self.tick = sqrt_price_x96, tick
+        self.in_range_liquidity = liquidity
+        self.fee_growth_global[0 if zero_for_one else 1] = fee_growth
+
+        if zero_for_one == exact_input:
+            amount0, amount1 = amount_specified - remaining, calculated
+        else:
+            amount0, amount1 = calculated, amount_specified - remaining
+        if zero_for_one:
+            self._send(self._token1, recipient, -amount1)
+            self._pay(self._token0, payer, amount0)
+        else:
+            self._send(self._token0, recipient, -amount0)
+            self._pay(self._token1, payer, amount1)
+        self.emit("Swap", self.chain.sender, recipient, amount0, amount1, sqrt_price_x96, liquidity, tick)
+        return amount0, amount1
+
+    # --- ABI ---
+
+    def slot0(self):
+        return (self.sqrt_price_x96, self.tick, self.observation_index, self.observation_cardinality,
+                self.observation_cardinality_next, 0, True)
+
+    def liquidity(self):
+        return self.in_range_liquidity
+
+    def feeGrowthGlobal0X128(self):
+        return self.fee_growth_global[0]
+
+    def feeGrowthGlobal1X128(self):
+        return self.fee_growth_global[1]
+
+    def ticks(self, tick):
+        info = self.tick_infos.get(tick)
+        if info is None:
+            return 0, 0, 0, 0, 0, 0, 0, False
+        return (*info, True)
+
+    def observe(self, seconds_agos):
+        timestamp = self.chain.timestamp
+        results = [self._observe_single(timestamp, seconds_ago) for seconds_ago in seconds_agos]
+        return [tick_cumulative for tick_cumulative, _ in results], [seconds_per_liquidity for _, seconds_per_liquidity in results]
+
+    def increaseObservationCardinalityNext(self, cardinality_next):
+        """Oracle.grow: the new (uninitialized) slots are used once the ring buffer wraps around to them."""
+        if cardinality_next > self.observation_cardinality_next:
+            self.observations.extend([[1, 0, 0, False] for _ in range(cardinality_next - self.observation_cardinality_next)])
+            self.observation_cardinality_next = cardinality_next
+
+    def token0(self):
+        return self._token0
+
+    def token1(self):
+        return self._token1
+
+    def fee(self):
+        return self._fee
+
+    def tickSpacing(self):
+        return self._tick_spacing
+
+
+# --- Position manager ---
+
+class SimulatedPositionManager(MockPositionManager):
+    """
+    NonfungiblePositionManager over `SimulatedPool`s. All its NFTs of a range share one pool position owned by
+    the manager; each NFT tracks its own share of the fees through its feeGrowthInside checkpoint.
+    """
+
+    def _pool_fee_growth_inside_last(self, pool: SimulatedPool, position: dict) -> tuple[int, int]:
+        pool_position = pool.pool_positions[(self.address, position["tick_lower"], position["tick_upper"])]
+        return pool_position[1], pool_position[2]
+
+    def _poke(self, position: dict, pool: SimulatedPool):
+        """Credits the NFT with the fees its liquidity earned since its last checkpoint, from the pool position's."""
+        inside = self._pool_fee_growth_inside_last(pool, position)
+        for i in (0, 1):
+            earned = ((inside[i] - position["fee_growth_inside_last"][i]) & MAX_UINT256) * position["liquidity"] // Q128
+            position["tokens_owed"][i] = (position["tokens_owed"][i] + earned) & MAX_UINT128
+        position["fee_growth_inside_last"] = list(inside)
+
+    def _add_liquidity(self, pool: SimulatedPool, tick_lower: int, tick_upper: int, amount0_desired: int, amount1_desired: int,
+                       amount0_min: int, amount1_min: int) -> tuple[int, int, int]:
+        """LiquidityManagement.addLiquidity: mints the most liquidity the amounts allow, paid by the caller."""
+        liquidity = tick_math.get_liquidity_for_amounts(pool.sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(tick_lower),
+                                                        tick_math.get_sqrt_ratio_at_tick(tick_upper), amount0_desired, amount1_desired)
+        if liquidity == 0:
+            raise Revert("liquidity is zero")
+        payer = self.chain.sender
+        # The callback pulls the payment with the allowance the caller gave the manager
+        amount0, amount1 = self.chain.invoke(self.address, pool, "_modify_position", self.address, tick_lower, tick_upper, liquidity)
+        if amount0 < amount0_min or amount1 < amount1_min:
+            raise Revert("Price slippage check")
+        for token, amount in ((pool._token0, amount0), (pool._token1, amount1)):
+            if amount:
+                self.chain.invoke(self.address, self.chain.contracts[token], "transferFrom", payer, pool.address, amount)
+        pool.emit("Mint", self.address, self.address, tick_lower, tick_upper, liquidity, amount0, amount1)
+        return liquidity, amount0, amount1
+
+    def decreaseLiquidity(self, params):
+        token_id, liquidity, amount0_min, amount1_min, deadline = params
+        self._check_deadline(deadline)
+        position = self._position(token_id)
+        if liquidity == 0 or liquidity > position["liquidity"]:
+            raise Revert("invalid liquidity")
+        pool = self._pool(position["token0"], position["token1"], position["fee"])
+        amount0, amount1 = self.chain.invoke(self.address, pool, "burn", self.address, position["tick_lower"], position["tick_upper"], liquidity)
+        if amount0 < amount0_min or amount1 < amount1_min:
+            raise Revert("Price slippage check")
+        self._poke(position, pool)
+        position["liquidity"] -= liquidity
+        position["tokens_owed"][0] = (position["tokens_owed"][0] + amount0) & MAX_UINT128
+        position["tokens_owed"][1] = (position["tokens_owed"][1] + amount1) & MAX_UINT128
+        self.emit("DecreaseLiquidity", token_id, liquidity, amount0, amount1)
+        return amount0, amount1
+
+    def collect(self, params):
+        token_id, recipient, amount0_max, amount1_max = params
+        if amount0_max == 0 and amount1_max == 0:
+            raise Revert("collect nothing")
+        position = self._position(token_id)
+        pool = self._pool(position["token0"], position["token1"], position["fee"])
+        if position["liquidity"] > 0:
+            self.chain.invoke(self.address, pool, "burn", self.address, position["tick_lower"], position["tick_upper"], 0)
+            self._poke(position, pool)
+        amount0 = min(amount0_max, position["tokens_owed"][0])
+        amount1 = min(amount1_max, position["tokens_owed"][1])
+        recipient = self.address if recipient == ZERO_ADDRESS else recipient
+        amount0, amount1 = self.chain.invoke(self.address, pool, "collect", self.address, recipient,
+                                             position["tick_lower"], position["tick_upper"], amount0, amount1)
+        position["tokens_owed"][0] -= amount0
+        position["tokens_owed"][1] -= amount1
+        self.emit("Collect", token_id, recipient, amount0, amount1)
+        return amount0, amount1
+
+
+# --- Chainlink ---
+
+class TrackingFeed(MockChainlinkFeed):
+    """A Chainlink aggregator that publishes a round when the answer moves `deviation` (0.005 = 0.5%) or `heartbeat` seconds pass."""
+
+    def __init__(self, chain: MockChain, address: str, answer: int, decimals: int = 8, description: str = "",
+                 deviation: float = 0.005, heartbeat: int = 3600):
+        super().__init__(chain, address, answer, decimals, description)
+        self.deviation = deviation
+        self.heartbeat = heartbeat
+
+    def track(self, answer: int) -> bool:
+        """Offers the feed a new off-chain answer. Returns True if it published a round."""
+        last_answer, updated_at = self.rounds[self.round_id]
+        if abs(answer - last_answer) >= abs(last_answer) * self.deviation or self.chain.timestamp - updated_at >= self.heartbeat:
+            self.set_answer(answer)
+            return True
+        return False
+
+
+# --- Deployment and market ---
+
+def deploy_simulator(chain: MockChain, config, sqrt_price_x96: int, decimals0: int = 18, decimals1: int = 6,
+                     token1_usd: int = 10**8, symbols: tuple = ("WETH", "USDC"), depth_token0: int | None = None,
+                     depth_width: float = 0.5, trader_funds: int = 10**40) -> UniswapDeployment:
+    """
+    Deploys the simulated pool and position manager with the mock tokens, factory, swap router, Multicall3 and tracking feeds
+    at the addresses in `config` (a uniswap_lp_bot.Config). A background position over
+    [price * (1 - depth_width), price / (1 - depth_width)] holding `depth_token0` of TOKEN0 (by default 1000 whole
+    tokens) plus the matching TOKEN1 gives swaps their depth. TRADER_ADDRESS gets `trader_funds` of both tokens.
+    """
+    token0 = chain.deploy(MockERC20(chain, config.TOKEN0_ADDRESS, symbols[0], decimals0))
+    token1 = chain.deploy(MockERC20(chain, config.TOKEN1_ADDRESS, symbols[1], decimals1))
+    factory = chain.deploy(MockFactory(chain, config.UNISWAP_FACTORY_ADDRESS))
+    pool_address = Web3.to_checksum_address(keccak(text=f"pool:{config.TOKEN0_ADDRESS}:{config.TOKEN1_ADDRESS}:{config.POOL_FEE}")[-20:])
+    pool = chain.deploy(SimulatedPool(chain, pool_address, config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE, sqrt_price_x96))
+    factory.add_pool(pool)
+    nft_manager = chain.deploy(SimulatedPositionManager(chain, config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, factory))
+    token0_usd = int(tick_math.sqrt_price_x96_to_price(sqrt_price_x96, decimals0, decimals1) * token1_usd)
+    token0_feed = chain.deploy(TrackingFeed(chain, config.CHAINLINK_ETH_USD_FEED, token0_usd, 8, f"{symbols[0]} / USD", 0.005, 3600))
+    token1_feed = chain.deploy(TrackingFeed(chain, config.CHAINLINK_USDC_USD_FEED, token1_usd, 8, f"{symbols[1]} / USD", 0.0025, 86400))
+    multicall = chain.deploy(MockMulticall3(chain, config.MULTICALL3_ADDRESS))
+    swap_router = chain.deploy(MockSwapRouter(chain, config.UNISWAP_SWAP_ROUTER_ADDRESS, factory))
+
+    for token in (token0, token1):
+        token.mint_to(TRADER_ADDRESS, trader_funds)
+    if depth_token0 is None:
+        depth_token0 = 1000 * 10**decimals0
+    if depth_token0:
+        spacing = pool.tickSpacing()
+        width_ticks = int(-math.log(1 - depth_width) / math.log(1.0001))
+        tick_lower = tick_math.align_tick(pool.tick - width_ticks, spacing)
+        tick_upper = tick_math.align_tick(pool.tick + width_ticks, spacing) + spacing
+        sqrt_upper = tick_math.get_sqrt_ratio_at_tick(tick_upper)
+        liquidity = tick_math.get_liquidity_for_amount0(sqrt_price_x96, sqrt_upper, depth_token0)
+        amount0, amount1 = _amounts_for_liquidity(sqrt_price_x96, tick_math.get_sqrt_ratio_at_tick(tick_lower), sqrt_upper, liquidity, round_up=True)
+        token0.mint_to(LIQUIDITY_PROVIDER_ADDRESS, amount0)
+        token1.mint_to(LIQUIDITY_PROVIDER_ADDRESS, amount1)
+        chain.execute(LIQUIDITY_PROVIDER_ADDRESS, pool.mint, LIQUIDITY_PROVIDER_ADDRESS, tick_lower, tick_upper, liquidity, LIQUIDITY_PROVIDER_ADDRESS)
+    return UniswapDeployment(chain, token0, token1, factory, pool, nft_manager, token0_feed, token1_feed, multicall, swap_router)
+
+
+class MarketSimulation:
+    """
+    Mines blocks of a simulated market on a `deploy_simulator` deployment. Each block the trader swaps the pool to
+    the next price of a geometric Brownian motion with the annualized `volatility` (or of a replayed series), then
+    trades a round trip of noise volume (exponentially distributed with mean `volume_per_block` raw TOKEN1) that
+    earns the in-range positions fees, and the TOKEN0 feed tracks the pool price.
+    """
+    def __init__(self, chain: MockChain, deployment: UniswapDeployment, volatility: float = 0.8, drift: float = 0.0,
+                 seconds_per_block: int = 12, volume_per_block: int = 0, seed: int = 0):
+        self.chain = chain
+        self.deployment = deployment
+        self.pool = deployment.pool
+        self.seconds_per_block = seconds_per_block
+        self.volume_per_block = volume_per_block
+        variance = volatility ** 2 * seconds_per_block / SECONDS_PER_YEAR
+        self._log_sigma = math.sqrt(variance)
+        self._log_drift = drift * seconds_per_block / SECONDS_PER_YEAR - variance / 2
+        self._random = random.Random(seed)
+        self._decimals = (deployment.token0.decimals(), deployment.token1.decimals())
+        self._token1_usd = deployment.token1_feed.rounds[deployment.token1_feed.round_id][0]
+
+    def swap(self, zero_for_one: bool, amount_specified: int, sqrt_price_limit_x96: int | None = None) -> tuple[int, int]:
+        """A swap by the trader in the current block (call from within a mined block, e.g. `on_block`)."""
+        if sqrt_price_limit_x96 is None:
+            sqrt_price_limit_x96 = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+        return self.pool.swap(TRADER_ADDRESS, zero_for_one, amount_specified, sqrt_price_limit_x96, TRADER_ADDRESS)
+
+    def swap_to(self, sqrt_price_x96: int):
+        """Swaps the pool's price to `sqrt_price_x96` (as far as its liquidity allows)."""
+        sqrt_price_x96 = min(max(sqrt_price_x96, MIN_SQRT_RATIO + 1), MAX_SQRT_RATIO - 1)
+        if sqrt_price_x96 != self.pool.sqrt_price_x96:
+            zero_for_one = sqrt_price_x96 < self.pool.sqrt_price_x96
+            self.swap(zero_for_one, 1 << 200, sqrt_price_x96)
+
+    def _block(self, sqrt_price_x96: int):
+        self.swap_to(sqrt_price_x96)
+        if self.volume_per_block:
+            amount1 = int(self._random.expovariate(1 / self.volume_per_block))
+            if amount1:
+                amount0, _ = self.swap(False, amount1) # TOKEN1 in, TOKEN0 out...
+                if amount0 < 0:
+                    self.swap(True, -amount0) # ...and back, paying the fee both ways
+        price = tick_math.sqrt_price_x96_to_price(self.pool.sqrt_price_x96, *self._decimals)
+        self.deployment.token0_feed.track(int(price * self._token1_usd))
+        self.deployment.token1_feed.track(self._token1_usd)
+
+    def next_sqrt_price(self) -> int:
+        """The next price of the random walk, from the pool's current price."""
+        step = self._log_drift + self._log_sigma * self._random.gauss(0, 1)
+        return int(self.pool.sqrt_price_x96 * math.exp(step / 2))
+
+    def run(self, blocks: int = 1, on_block=None):
+        """Mines `blocks` blocks of the random walk. `on_block(block_number)` runs after each one."""
+        for _ in range(blocks):
+            self.chain.advance(self.seconds_per_block, blocks=0)
+            self.chain.execute(TRADER_ADDRESS, self._block, self.next_sqrt_price())
+            if on_block is not None:
+                on_block(self.chain.block_number)
+
+    def replay(self, sqrt_prices, on_block=None):
+        """Mines one block per price of a recorded series (e.g. block_recorder's sqrt prices), swapping the pool to each."""
+        for sqrt_price_x96 in sqrt_prices:
+            self.chain.advance(self.seconds_per_block, blocks=0)
+            self.chain.execute(TRADER_ADDRESS, self._block, int(sqrt_price_x96))
+            if on_block is not None:
+                on_block(self.chain.block_number)